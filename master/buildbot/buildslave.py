@@ -49,7 +49,8 @@ class AbstractBuildSlave(pb.Avatar, service.MultiService):
 
     def __init__(self, name, password, max_builds=None,
                  notify_on_missing=[], missing_timeout=3600,
-                 properties={}, locks=None, keepalive_interval=3600):
+                 properties={}, locks=None, keepalive_interval=3600,
+                 compress_updates=False):
         """
         @param name: botname this machine will supply when it connects
         @param password: password this machine will supply when
@@ -63,6 +64,8 @@ class AbstractBuildSlave(pb.Avatar, service.MultiService):
         @param locks: A list of locks that must be acquired before this slave
                       can be used
         @type locks: dictionary
+        @param compress_updates: if true, ask the slave to compress the log
+                                 data it sends, if it can
         """
         service.MultiService.__init__(self)
         self.slavename = name
@@ -90,6 +93,9 @@ class AbstractBuildSlave(pb.Avatar, service.MultiService):
         self.missing_timeout = missing_timeout
         self.missing_timer = None
         self.keepalive_interval = keepalive_interval
+        self.compress_updates = compress_updates
+        self.update_bytes_compressed = 0
+        self.update_bytes_uncompressed = 0
 
         self.detached_subs = None
 
@@ -121,6 +127,7 @@ class AbstractBuildSlave(pb.Avatar, service.MultiService):
         self.notify_on_missing = new.notify_on_missing
         self.missing_timeout = new.missing_timeout
         self.keepalive_interval = new.keepalive_interval
+        self.compress_updates = new.compress_updates
 
         self.properties = Properties()
         self.properties.updateFromProperties(new.properties)
@@ -386,6 +393,22 @@ class AbstractBuildSlave(pb.Avatar, service.MultiService):
         self.lastMessageReceived = now
         self.slave_status.setLastMessageReceived(now)
 
+    def compressedUpdateReceived(self, compressed, uncompressed):
+        """
+        Record that a batch of updates whose log data took C{uncompressed}
+        bytes was received as C{compressed} bytes
+        """
+        self.update_bytes_compressed += compressed
+        self.update_bytes_uncompressed += uncompressed
+        prefix = 'BuildSlave.%s.' % self.slavename
+        metrics.MetricCountEvent.log(prefix + 'update_bytes_saved',
+                                     uncompressed - compressed)
+        if self.update_bytes_compressed:
+            ratio = (float(self.update_bytes_uncompressed)
+                     / self.update_bytes_compressed)
+            metrics.MetricCountEvent.log(prefix + 'update_compression_ratio',
+                                         ratio, absolute=True)
+
     def detached(self, mind):
         metrics.MetricCountEvent.log("AbstractBuildSlave.attached_slaves", -1)
         self.slave = None
@@ -690,10 +713,11 @@ class AbstractLatentBuildSlave(AbstractBuildSlave):
     def __init__(self, name, password, max_builds=None,
                  notify_on_missing=[], missing_timeout=60*20,
                  build_wait_timeout=60*10,
-                 properties={}, locks=None):
+                 properties={}, locks=None, compress_updates=False):
         AbstractBuildSlave.__init__(
             self, name, password, max_builds, notify_on_missing,
-            missing_timeout, properties, locks)
+            missing_timeout, properties, locks,
+            compress_updates=compress_updates)
         self.building = set()
         self.build_wait_timeout = build_wait_timeout
 
@@ -23,6 +23,7 @@ from twisted.internet import reactor
 from twisted.python import log
 from buildbot.db import base
 from buildbot.util import epoch2datetime
+from buildbot.status.results import SUCCESS, WARNINGS, FAILURE
 
 class AlreadyClaimedError(Exception):
     pass
@@ -89,7 +90,7 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
 
     @with_master_objectid
     def getBuildRequests(self, buildername=None, complete=None, claimed=None,
-            bsid=None, _master_objectid=None):
+            bsid=None, brids=None, min_brid=None, _master_objectid=None):
         """
         Get a list of build requests matching the given characteristics.  Note
         that C{unclaimed}, C{my_claimed}, and C{other_claimed} all default to
@@ -104,6 +105,13 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
         not complete.  If C{bsid} is specified, then only build requests for
         that buildset will be returned.
 
+        If C{brids} is specified, then only the build requests with those ids
+        will be returned; this is intended for short lists.  If C{min_brid} is
+        specified, then only build requests with an id greater than or equal
+        to C{min_brid} will be returned.  Together with C{claimed}, this allows
+        callers to find new build requests incrementally, without loading every
+        matching request.
+
         A build is considered completed if its C{complete} column is 1; the
         C{complete_at} column is not consulted.
 
@@ -121,6 +129,12 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
 
         @param bsid: see above
 
+        @param brids: see above
+        @type brids: list of integers
+
+        @param min_brid: see above
+        @type min_brid: integer
+
         @returns: List of build request dictionaries as above, via Deferred
         """
         def thd(conn):
@@ -148,6 +162,10 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
                     q = q.where(reqs_tbl.c.complete == 0)
             if bsid is not None:
                 q = q.where(reqs_tbl.c.buildsetid == bsid)
+            if brids is not None:
+                q = q.where(reqs_tbl.c.id.in_(brids))
+            if min_brid is not None:
+                q = q.where(reqs_tbl.c.id >= min_brid)
             res = conn.execute(q)
 
             return [ self._brdictFromRow(row, _master_objectid)
@@ -303,39 +321,51 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
         """
         def thd(conn):
             transaction = conn.begin()
+            try:
+                self._completeBuildRequests_thd(conn, brids, results,
+                                                _reactor.seconds())
+            except:
+                transaction.rollback()
+                raise
+            transaction.commit()
+        return self.db.pool.do(thd)
 
-            # the update here is simple, but a number of conditions are
-            # attached to ensure that we do not update a row inappropriately,
-            # Note that checking that the request is mine would require a
-            # subquery, so for efficiency that is not checed.
+    def completeBuildRequestsAndBuildsets(self, brids, results,
+                                          _reactor=reactor):
+        """
+        Complete a set of build requests as for L{completeBuildRequests}, and
+        then complete any of their buildsets which no longer have incomplete
+        build requests, all in a single transaction.  The buildsets are
+        completed with results of SUCCESS if all of their build requests
+        succeeded (with SUCCESS or WARNINGS), and FAILURE otherwise.
 
-            reqs_tbl = self.db.model.buildrequests
-            complete_at = _reactor.seconds()
+        This takes a constant number of queries for each batch of 100 build
+        requests, no matter how many buildsets are involved.
 
-            # we'll need to batch the brids into groups of 100, so that the
-            # parameter lists supported by the DBAPI aren't exhausted
-            iterator = iter(brids)
+        @param brids: build request IDs to complete
+        @type brids: list
 
-            while 1:
-                batch = list(itertools.islice(iterator, 100))
-                if not batch:
-                    break # success!
+        @param results: integer result code
+        @type results: integer
 
-                q = reqs_tbl.update()
-                q = q.where(reqs_tbl.c.id.in_(batch))
-                q = q.where(reqs_tbl.c.complete != 1)
-                res = conn.execute(q,
-                    complete=1,
-                    results=results,
-                    complete_at=complete_at)
+        @param _reactor: reactor to use (for testing)
 
-                # if an incorrect number of rows were updated, then we failed.
-                if res.rowcount != len(batch):
-                    log.msg("tried to complete %d buildreqests, "
-                        "but only completed %d" % (len(batch), res.rowcount))
-                    transaction.rollback()
-                    raise NotClaimedError
+        @returns: dictionary mapping the ID of each buildset completed by this
+        call to its cumulative results, via Deferred
+        """
+        def thd(conn):
+            transaction = conn.begin()
+            complete_at = _reactor.seconds()
+            try:
+                self._completeBuildRequests_thd(conn, brids, results,
+                                                complete_at)
+                completed = self._completeBuildsets_thd(conn, brids,
+                                                        complete_at)
+            except:
+                transaction.rollback()
+                raise
             transaction.commit()
+            return completed
         return self.db.pool.do(thd)
 
     def unclaimExpiredRequests(self, old, _reactor=reactor):
@@ -374,6 +404,96 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
         d.addCallback(log_nonzero_count)
         return d
 
+    def _completeBuildRequests_thd(self, conn, brids, results, complete_at):
+        # the update here is simple, but a number of conditions are
+        # attached to ensure that we do not update a row inappropriately,
+        # Note that checking that the request is mine would require a
+        # subquery, so for efficiency that is not checed.  The caller is
+        # responsible for the transaction.
+        reqs_tbl = self.db.model.buildrequests
+
+        # we'll need to batch the brids into groups of 100, so that the
+        # parameter lists supported by the DBAPI aren't exhausted
+        iterator = iter(brids)
+
+        while 1:
+            batch = list(itertools.islice(iterator, 100))
+            if not batch:
+                break # success!
+
+            q = reqs_tbl.update()
+            q = q.where(reqs_tbl.c.id.in_(batch))
+            q = q.where(reqs_tbl.c.complete != 1)
+            res = conn.execute(q,
+                complete=1,
+                results=results,
+                complete_at=complete_at)
+
+            # if an incorrect number of rows were updated, then we failed.
+            if res.rowcount != len(batch):
+                log.msg("tried to complete %d buildreqests, "
+                    "but only completed %d" % (len(batch), res.rowcount))
+                raise NotClaimedError
+
+    def _completeBuildsets_thd(self, conn, brids, complete_at):
+        # complete any incomplete buildsets containing the given build
+        # requests which have no incomplete build requests left, returning a
+        # dictionary mapping bsid to results.  The caller is responsible for
+        # the transaction.
+        reqs_tbl = self.db.model.buildrequests
+        bs_tbl = self.db.model.buildsets
+
+        # for each incomplete buildset containing one of these requests,
+        # count its incomplete and unsuccessful requests
+        num_incomplete = sa.func.sum(
+                sa.case([(reqs_tbl.c.complete == 1, 0)], else_=1))
+        num_failed = sa.func.sum(
+                sa.case([(reqs_tbl.c.results.in_([SUCCESS, WARNINGS]), 0)],
+                        else_=1))
+        bs_incomplete = ((bs_tbl.c.complete == None)
+                         | (bs_tbl.c.complete != 1))
+
+        completed = {}
+        iterator = iter(brids)
+        while 1:
+            batch = list(itertools.islice(iterator, 100))
+            if not batch:
+                break
+
+            bsids_q = sa.select([ reqs_tbl.c.buildsetid ],
+                    whereclause=reqs_tbl.c.id.in_(batch))
+            q = sa.select(
+                [ reqs_tbl.c.buildsetid, num_failed.label('num_failed') ],
+                whereclause=(
+                    (reqs_tbl.c.buildsetid.in_(bsids_q))
+                    & (bs_tbl.c.id == reqs_tbl.c.buildsetid)
+                    & bs_incomplete),
+                group_by=[ reqs_tbl.c.buildsetid ],
+                having=(num_incomplete == 0))
+            for row in conn.execute(q).fetchall():
+                if row.num_failed:
+                    completed[row.buildsetid] = FAILURE
+                else:
+                    completed[row.buildsetid] = SUCCESS
+
+        # then mark them complete, with one update for each result
+        for results in (SUCCESS, FAILURE):
+            bsids = [ bsid for bsid, res in completed.iteritems()
+                      if res == results ]
+            iterator = iter(bsids)
+            while 1:
+                batch = list(itertools.islice(iterator, 100))
+                if not batch:
+                    break
+                q = bs_tbl.update(whereclause=(
+                    bs_tbl.c.id.in_(batch) & bs_incomplete))
+                conn.execute(q,
+                    complete=1,
+                    results=results,
+                    complete_at=complete_at)
+
+        return completed
+
     def _brdictFromRow(self, row, master_objectid):
         claimed = mine = False
         claimed_at = None
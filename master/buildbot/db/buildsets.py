@@ -17,6 +17,7 @@
 Support for buildsets in the database
 """
 
+import itertools
 import sqlalchemy as sa
 from twisted.internet import reactor
 from buildbot.util import json
@@ -161,7 +162,7 @@ class BuildsetsConnectorComponent(base.DBConnectorComponent):
             return self._row2dict(row)
         return self.db.pool.do(thd)
 
-    def getBuildsets(self, complete=None):
+    def getBuildsets(self, complete=None, bsids=None):
         """
         Get a list of buildset dictionaries (see L{getBuildset}) matching
         the given criteria.
@@ -173,6 +174,9 @@ class BuildsetsConnectorComponent(base.DBConnectorComponent):
         return only incomplete buildsets; if None or omitted, return all
         buildsets
 
+        @param bsids: if given, return only buildsets with these IDs
+        @type bsids: iterable of integers
+
         @returns: list of dictionaries, via Deferred
         """
         def thd(conn):
@@ -184,8 +188,21 @@ class BuildsetsConnectorComponent(base.DBConnectorComponent):
                 else:
                     q = q.where((bs_tbl.c.complete == 0) |
                                 (bs_tbl.c.complete == None))
-            res = conn.execute(q)
-            return [ self._row2dict(row) for row in res.fetchall() ]
+            if bsids is None:
+                res = conn.execute(q)
+                return [ self._row2dict(row) for row in res.fetchall() ]
+
+            # batch the bsids so that the DBAPI's parameter limits aren't
+            # exhausted
+            rv = []
+            iterator = iter(bsids)
+            while 1:
+                batch = list(itertools.islice(iterator, 100))
+                if not batch:
+                    break
+                res = conn.execute(q.where(bs_tbl.c.id.in_(batch)))
+                rv.extend([ self._row2dict(row) for row in res.fetchall() ])
+            return rv
         return self.db.pool.do(thd)
 
     def getBuildsetProperties(self, buildsetid):
@@ -211,6 +228,37 @@ class BuildsetsConnectorComponent(base.DBConnectorComponent):
                           for row in conn.execute(q) ])
         return self.db.pool.do(thd)
 
+    def getBuildsetsProperties(self, bsids):
+        """
+        Return the properties for several buildsets at once, in a constant
+        number of queries.  This is the bulk equivalent of
+        L{getBuildsetProperties}.
+
+        @param bsids: buildset IDs
+        @type bsids: iterable of integers
+
+        @returns: dictionary mapping each buildset ID to a dictionary as
+        returned by L{getBuildsetProperties}, via Deferred
+        """
+        bsids = list(bsids)
+        def thd(conn):
+            bsp_tbl = self.db.model.buildset_properties
+            rv = dict([ (bsid, {}) for bsid in bsids ])
+            iterator = iter(bsids)
+            while 1:
+                batch = list(itertools.islice(iterator, 100))
+                if not batch:
+                    break
+                q = sa.select(
+                    [ bsp_tbl.c.buildsetid, bsp_tbl.c.property_name,
+                      bsp_tbl.c.property_value ],
+                    whereclause=(bsp_tbl.c.buildsetid.in_(batch)))
+                for row in conn.execute(q):
+                    rv[row.buildsetid][row.property_name] = \
+                            tuple(json.loads(row.property_value))
+            return rv
+        return self.db.pool.do(thd)
+
     def subscribeToBuildset(self, schedulerid, buildsetid):
         """
         Add a row to C{scheduler_upstream_buildsets} indicating that
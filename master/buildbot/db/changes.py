@@ -17,6 +17,7 @@
 Support for changes in the database
 """
 
+import itertools
 from buildbot.util import json
 import sqlalchemy as sa
 from twisted.internet import defer, reactor
@@ -188,18 +189,56 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
         """
         assert changeid >= 0
         def thd(conn):
-            # get the row from the 'changes' table
-            changes_tbl = self.db.model.changes
-            q = changes_tbl.select(whereclause=(changes_tbl.c.changeid == changeid))
-            rp = conn.execute(q)
-            row = rp.fetchone()
-            if not row:
-                return None
-            # and fetch the ancillary data (links, files, properties)
-            return self._chdict_from_change_row_thd(conn, row)
+            return self._getChanges_thd(conn, [ changeid ]).get(changeid)
         d = self.db.pool.do(thd)
         return d
 
+    def getChanges(self, changeids):
+        """
+        Get change dictionaries for all of the given changeids, using a
+        constant number of queries no matter how many changes are requested.
+        Changes that are already cached are not fetched again, and the
+        remainder are added to the cache used by L{getChange}.
+
+        @param changeids: the ids of the change instances to fetch
+        @type changeids: iterable of integers
+
+        @returns: list of change dictionaries, in the same order as
+        C{changeids}, with None for any change that does not exist, via
+        Deferred
+        """
+        changeids = list(changeids)
+        cache = self.getChange.cache
+
+        missing = set([ changeid for changeid in changeids
+                        if changeid not in cache ])
+        if missing:
+            def thd(conn):
+                return self._getChanges_thd(conn, list(missing))
+            d = self.db.pool.do(thd)
+        else:
+            d = defer.succeed({})
+
+        def fill_cache(fetched):
+            # use the cache for changes that we did not fetch, and add the
+            # fetched changes to it, taking care to return any existing
+            # cached instance in preference to a newly fetched copy.  The
+            # cached changes are taken first, as priming the cache may evict
+            # them; any evicted since the check above are fetched again.
+            ds = []
+            for changeid in changeids:
+                if changeid in missing:
+                    ds.append(None)
+                else:
+                    ds.append(cache.get(changeid))
+            for i, changeid in enumerate(changeids):
+                if changeid in missing:
+                    ds[i] = defer.succeed(
+                        cache.prime(changeid, fetched.get(changeid)))
+            return defer.gatherResults(ds)
+        d.addCallback(fill_cache)
+        return d
+
     def getChangeUids(self, changeid):
         """
         Get the uid associated with the given changeid or None if no
@@ -241,11 +280,36 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
             return list(reversed(changeids))
         d = self.db.pool.do(thd)
 
-        # then turn those into changes, using the cache
-        def get_changes(changeids):
-            return defer.gatherResults([ self.getChange(changeid)
-                                         for changeid in changeids ])
-        d.addCallback(get_changes)
+        # then turn those into changes, fetching them in bulk
+        d.addCallback(self.getChanges)
+        return d
+
+    def getChangesAfter(self, changeid, count=None):
+        """
+        Get the changes with ids greater than C{changeid}, in order, using a
+        single query to find the ids and then fetching the changes in bulk
+        with L{getChanges}.
+
+        @param changeid: fetch only changes with larger ids than this
+        @type changeid: integer
+
+        @param count: maximum number of changes to return, or None for no
+        limit
+
+        @returns: list of dictionaries via Deferred, ordered by changeid
+        """
+        def thd(conn):
+            changes_tbl = self.db.model.changes
+            q = sa.select([changes_tbl.c.changeid],
+                    whereclause=(changes_tbl.c.changeid > changeid),
+                    order_by=[changes_tbl.c.changeid],
+                    limit=count)
+            rp = conn.execute(q)
+            changeids = [ row.changeid for row in rp ]
+            rp.close()
+            return changeids
+        d = self.db.pool.do(thd)
+        d.addCallback(self.getChanges)
         return d
 
     def getLatestChangeid(self):
@@ -292,62 +356,90 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
                     table.delete(table.c.changeid.in_(ids_to_delete)))
         return self.db.pool.do(thd)
 
-    def _chdict_from_change_row_thd(self, conn, ch_row):
-        # This method must be run in a db.pool thread, and returns a chdict
-        # given a row from the 'changes' table
+    def _getChanges_thd(self, conn, changeids):
+        # This method must be run in a db.pool thread, and returns a
+        # dictionary mapping changeid to chdict for each of the given changeids
+        # that exists.  Each table is queried once per batch, rather than once
+        # per change.
+        changes_tbl = self.db.model.changes
         change_links_tbl = self.db.model.change_links
         change_files_tbl = self.db.model.change_files
         change_properties_tbl = self.db.model.change_properties
 
+        # and properties must be given without a source, so strip that, but
+        # be flexible in case users have used a development version where the
+        # change properties were recorded incorrectly
+        def split_vs(vs):
+            try:
+                v,s = vs
+                if s != "Change":
+                    v,s = vs, "Change"
+            except:
+                v,s = vs, "Change"
+            return v, s
+
+        chdicts = {}
+
+        # we'll need to batch the changeids into groups of 100, so that the
+        # parameter lists supported by the DBAPI aren't exhausted
+        iterator = iter(changeids)
+
+        while 1:
+            batch = list(itertools.islice(iterator, 100))
+            if not batch:
+                break # success!
+
+            query = changes_tbl.select(
+                    whereclause=(changes_tbl.c.changeid.in_(batch)))
+            batch_chdicts = {}
+            for r in conn.execute(query):
+                batch_chdicts[r.changeid] = self._chdict_from_change_row(r)
+            if not batch_chdicts:
+                continue
+
+            # and fetch the ancillary data (links, files, properties) for the
+            # changes that were found
+            found = batch_chdicts.keys()
+
+            query = change_links_tbl.select(
+                    whereclause=(change_links_tbl.c.changeid.in_(found)))
+            for r in conn.execute(query):
+                batch_chdicts[r.changeid]['links'].append(r.link)
+
+            query = change_files_tbl.select(
+                    whereclause=(change_files_tbl.c.changeid.in_(found)))
+            for r in conn.execute(query):
+                batch_chdicts[r.changeid]['files'].append(r.filename)
+
+            query = change_properties_tbl.select(
+                    whereclause=(change_properties_tbl.c.changeid.in_(found)))
+            for r in conn.execute(query):
+                v, s = split_vs(json.loads(r.property_value))
+                batch_chdicts[r.changeid]['properties'][r.property_name] = (v,s)
+
+            chdicts.update(batch_chdicts)
+
+        return chdicts
+
+    def _chdict_from_change_row(self, ch_row):
+        # returns a chdict given a row from the 'changes' table, with empty
+        # links, files, and properties; see _getChanges_thd
         def mkdt(epoch):
             if epoch:
                 return epoch2datetime(epoch)
 
-        chdict = ChDict(
+        return ChDict(
                 changeid=ch_row.changeid,
                 author=ch_row.author,
-                files=[], # see below
+                files=[],
                 comments=ch_row.comments,
                 is_dir=ch_row.is_dir,
-                links=[], # see below
+                links=[],
                 revision=ch_row.revision,
                 when_timestamp=mkdt(ch_row.when_timestamp),
                 branch=ch_row.branch,
                 category=ch_row.category,
                 revlink=ch_row.revlink,
-                properties={}, # see below
+                properties={},
                 repository=ch_row.repository,
                 project=ch_row.project)
-
-        query = change_links_tbl.select(
-                whereclause=(change_links_tbl.c.changeid == ch_row.changeid))
-        rows = conn.execute(query)
-        for r in rows:
-            chdict['links'].append(r.link)
-
-        query = change_files_tbl.select(
-                whereclause=(change_files_tbl.c.changeid == ch_row.changeid))
-        rows = conn.execute(query)
-        for r in rows:
-            chdict['files'].append(r.filename)
-
-        # and properties must be given without a source, so strip that, but
-        # be flexible in case users have used a development version where the
-        # change properties were recorded incorrectly
-        def split_vs(vs):
-            try:
-                v,s = vs
-                if s != "Change":
-                    v,s = vs, "Change"
-            except:
-                v,s = vs, "Change"
-            return v, s
-
-        query = change_properties_tbl.select(
-                whereclause=(change_properties_tbl.c.changeid == ch_row.changeid))
-        rows = conn.execute(query)
-        for r in rows:
-            v, s = split_vs(json.loads(r.property_value))
-            chdict['properties'][r.property_name] = (v,s)
-
-        return chdict
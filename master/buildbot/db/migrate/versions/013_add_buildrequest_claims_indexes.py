@@ -0,0 +1,49 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import sqlalchemy as sa
+
+def upgrade(migrate_engine):
+    metadata = sa.MetaData()
+    metadata.bind = migrate_engine
+
+    buildrequest_claims = sa.Table('buildrequest_claims', metadata,
+        sa.Column('brid', sa.Integer, index=True, unique=True),
+        sa.Column('objectid', sa.Integer, index=True, nullable=True),
+        sa.Column('claimed_at', sa.Integer, nullable=False),
+    )
+
+    # used to find expired claims without scanning the whole table
+    idx = sa.Index('buildrequest_claims_claimed_at',
+                   buildrequest_claims.c.claimed_at)
+    idx.create(migrate_engine)
+
+    buildrequests = sa.Table('buildrequests', metadata,
+        sa.Column('id', sa.Integer,  primary_key=True),
+        sa.Column('buildsetid', sa.Integer, nullable=False),
+        sa.Column('buildername', sa.String(length=256), nullable=False),
+        sa.Column('priority', sa.Integer, nullable=False,
+            server_default=sa.DefaultClause("0")),
+        sa.Column('complete', sa.Integer,
+            server_default=sa.DefaultClause("0")),
+        sa.Column('results', sa.SmallInteger),
+        sa.Column('submitted_at', sa.Integer, nullable=False),
+        sa.Column('complete_at', sa.Integer),
+    )
+
+    # used to find incomplete requests by id, when polling for new requests
+    idx = sa.Index('buildrequests_complete_id',
+                   buildrequests.c.complete, buildrequests.c.id)
+    idx.create(migrate_engine)
@@ -370,6 +370,10 @@ class Model(base.DBConnectorComponent):
     sa.Index('buildrequests_buildsetid', buildrequests.c.buildsetid)
     sa.Index('buildrequests_buildername', buildrequests.c.buildername)
     sa.Index('buildrequests_complete', buildrequests.c.complete)
+    sa.Index('buildrequests_complete_id', buildrequests.c.complete,
+            buildrequests.c.id)
+    sa.Index('buildrequest_claims_claimed_at',
+            buildrequest_claims.c.claimed_at)
     sa.Index('builds_number', builds.c.number)
     sa.Index('builds_brid', builds.c.brid)
     sa.Index('buildsets_complete', buildsets.c.complete)
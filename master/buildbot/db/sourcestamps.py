@@ -18,7 +18,9 @@ Support for creating and reading source stamps
 """
 
 import base64
+import itertools
 from twisted.python import log
+from twisted.internet import defer
 from buildbot.db import base
 
 class SsDict(dict):
@@ -91,46 +93,107 @@ class SourceStampsConnectorComponent(base.DBConnectorComponent):
         @returns: dictionary as above, or None, via Deferred
         """
         def thd(conn):
-            tbl = self.db.model.sourcestamps
-            q = tbl.select(whereclause=(tbl.c.id == ssid))
+            return self._getSourceStamps_thd(conn, [ssid]).get(ssid)
+        return self.db.pool.do(thd)
+
+    def getSourceStamps(self, ssids):
+        """
+        Get source stamp dictionaries (see L{getSourceStamp}) for all of the
+        given ssids, using a constant number of queries no matter how many
+        source stamps are requested.  Source stamps that are already cached
+        are not fetched again, and the remainder are added to the cache used
+        by L{getSourceStamp}.
+
+        @param ssids: the ids of the source stamps to fetch
+        @type ssids: iterable of integers
+
+        @returns: list of source stamp dictionaries, in the same order as
+        C{ssids}, with None for any source stamp that does not exist, via
+        Deferred
+        """
+        ssids = list(ssids)
+        cache = self.getSourceStamp.cache
+
+        missing = set([ ssid for ssid in ssids if ssid not in cache ])
+        if missing:
+            def thd(conn):
+                return self._getSourceStamps_thd(conn, list(missing))
+            d = self.db.pool.do(thd)
+        else:
+            d = defer.succeed({})
+
+        def fill_cache(fetched):
+            # as in getChanges, take the cached source stamps before priming
+            # the cache with the fetched ones, which may evict them
+            ds = []
+            for ssid in ssids:
+                if ssid in missing:
+                    ds.append(None)
+                else:
+                    ds.append(cache.get(ssid))
+            for i, ssid in enumerate(ssids):
+                if ssid in missing:
+                    ds[i] = defer.succeed(cache.prime(ssid, fetched.get(ssid)))
+            return defer.gatherResults(ds)
+        d.addCallback(fill_cache)
+        return d
+
+    def _getSourceStamps_thd(self, conn, ssids):
+        # This method must be run in a db.pool thread, and returns a
+        # dictionary mapping ssid to ssdict for each of the given ssids that
+        # exists.  Each table is queried once per batch of 100 ssids.
+        ss_tbl = self.db.model.sourcestamps
+        patches_tbl = self.db.model.patches
+        ss_changes_tbl = self.db.model.sourcestamp_changes
+
+        ssdicts = {}
+        iterator = iter(ssids)
+        while 1:
+            batch = list(itertools.islice(iterator, 100))
+            if not batch:
+                break
+
+            patchids = {}
+            q = ss_tbl.select(whereclause=(ss_tbl.c.id.in_(batch)))
             res = conn.execute(q)
-            row = res.fetchone()
-            if not row:
-                return None
-            ssdict = SsDict(ssid=ssid, branch=row.branch,
-                    revision=row.revision, patch_body=None, patch_level=None,
-                    patch_author=None, patch_comment=None, patch_subdir=None,
-                    repository=row.repository, project=row.project,
-                    changeids=set([]))
-            patchid = row.patchid
+            for row in res.fetchall():
+                ssdicts[row.id] = SsDict(ssid=row.id, branch=row.branch,
+                        revision=row.revision, patch_body=None,
+                        patch_level=None, patch_author=None,
+                        patch_comment=None, patch_subdir=None,
+                        repository=row.repository, project=row.project,
+                        changeids=set([]))
+                if row.patchid is not None:
+                    patchids.setdefault(row.patchid, []).append(row.id)
             res.close()
 
-            # fetch the patch, if necessary
-            if patchid is not None:
-                tbl = self.db.model.patches
-                q = tbl.select(whereclause=(tbl.c.id == patchid))
+            # fetch the patches, if necessary
+            if patchids:
+                q = patches_tbl.select(
+                        whereclause=(patches_tbl.c.id.in_(patchids.keys())))
                 res = conn.execute(q)
-                row = res.fetchone()
-                if row:
-                    # note the subtle renaming here
-                    ssdict['patch_level'] = row.patchlevel
-                    ssdict['patch_subdir'] = row.subdir
-                    ssdict['patch_author'] = row.patch_author
-                    ssdict['patch_comment'] = row.patch_comment
-                    body = base64.b64decode(row.patch_base64)
-                    ssdict['patch_body'] = body
-                else:
-                    log.msg('patchid %d, referenced from ssid %d, not found'
-                            % (patchid, ssid))
+                for row in res.fetchall():
+                    for ssid in patchids.pop(row.id):
+                        ssdict = ssdicts[ssid]
+                        # note the subtle renaming here
+                        ssdict['patch_level'] = row.patchlevel
+                        ssdict['patch_subdir'] = row.subdir
+                        ssdict['patch_author'] = row.patch_author
+                        ssdict['patch_comment'] = row.patch_comment
+                        body = base64.b64decode(row.patch_base64)
+                        ssdict['patch_body'] = body
                 res.close()
+                for patchid, missing_ssids in patchids.iteritems():
+                    for ssid in missing_ssids:
+                        log.msg('patchid %d, referenced from ssid %d, '
+                                'not found' % (patchid, ssid))
 
             # fetch change ids
-            tbl = self.db.model.sourcestamp_changes
-            q = tbl.select(whereclause=(tbl.c.sourcestampid == ssid))
+            q = ss_changes_tbl.select(
+                    whereclause=(ss_changes_tbl.c.sourcestampid.in_(batch)))
             res = conn.execute(q)
-            for row in res:
-                ssdict['changeids'].add(row.changeid)
+            for row in res.fetchall():
+                ssdicts[row.sourcestampid]['changeids'].add(row.changeid)
             res.close()
 
-            return ssdict
-        return self.db.pool.do(thd)
+        return ssdicts
@@ -392,7 +392,10 @@ class IBuilderStatus(Interface):
 
         @type finished_before: int: a timestamp, seconds since the epoch
         @param finished_before: if provided, do not produce any builds that
-                                finished after the given timestamp.
+                                finished after the given timestamp. The
+                                builds are then found through the history's
+                                ordering by finish time, and produced in the
+                                order they finished.
 
         @type max_search: int
         @param max_search: this method may have to examine a lot of builds
@@ -807,6 +810,12 @@ class IStatusLog(Interface):
         trailing newline).
         """
 
+    def iterLines(channels=[LOG_CHANNEL_STDOUT, LOG_CHANNEL_STDERR]):
+        """Read lines from the given channels of the logfile, merged as
+        getText() merges them. This returns an iterator like readlines(),
+        which reads the log incrementally rather than all at once.
+        """
+
     def getTextWithHeaders():
         """Return one big string with the contents of the Log. This merges
         all chunks (including headers) together."""
@@ -31,6 +31,7 @@ import buildbot.pbmanager
 from buildbot.util import safeTranslate, subscription, epoch2datetime
 from buildbot.process.builder import Builder
 from buildbot.status.master import Status
+from buildbot.status.compression import compressionPool
 from buildbot.changes import changes
 from buildbot.changes.manager import ChangeManager
 from buildbot import interfaces, locks
@@ -81,6 +82,14 @@ class BuildMaster(service.MultiService):
     # database poll operation.
     WARNING_UNCLAIMED_COUNT = 10000
 
+    # interval at which the incremental polling for unclaimed build requests
+    # is checked against the full set of unclaimed requests in the database
+    UNCLAIMED_RESYNC_INTERVAL = 10*60
+
+    # maximum number of changes fetched from the database and delivered to
+    # subscribers in each step of a database poll
+    CHANGE_POLL_BATCH_SIZE = 100
+
     def __init__(self, basedir, configFileName="master.cfg"):
         service.MultiService.__init__(self)
         self.setName("buildmaster")
@@ -145,6 +154,10 @@ class BuildMaster(service.MultiService):
         # local cache for this master's object ID
         self._object_id = None
 
+        # ids of changes added on this master and already delivered to
+        # subscribers, so that pollDatabaseChanges can skip them
+        self._locally_delivered_changeids = set()
+
     def startService(self):
         # first, apply all monkeypatches
         monkeypatches.patch_all()
@@ -241,8 +254,9 @@ class BuildMaster(service.MultiService):
                           "eventHorizon", "buildCacheSize", "changeCacheSize",
                           "logHorizon", "buildHorizon", "changeHorizon",
                           "logMaxSize", "logMaxTailSize", "logCompressionMethod",
+                          "logCompressionStreaming", "logCompressionThreads",
                           "db_url", "multiMaster", "db_poll_interval",
-                          "metrics", "caches"
+                          "metrics", "caches", "buildStartConcurrency"
                           )
             for k in config.keys():
                 if k not in known_keys:
@@ -293,6 +307,14 @@ class BuildMaster(service.MultiService):
             logCompressionMethod = config.get('logCompressionMethod', "bz2")
             if logCompressionMethod not in ('bz2', 'gz'):
                 raise ValueError("logCompressionMethod needs to be 'bz2', or 'gz'")
+            logCompressionStreaming = config.get('logCompressionStreaming',
+                                                 False)
+            if logCompressionStreaming not in (True, False):
+                raise ValueError("logCompressionStreaming needs to be a bool")
+            logCompressionThreads = config.get('logCompressionThreads', 2)
+            if (not isinstance(logCompressionThreads, int)
+                or logCompressionThreads < 1):
+                raise ValueError("logCompressionThreads must be a positive int")
             logMaxSize = config.get('logMaxSize')
             if logMaxSize is not None and not \
                    isinstance(logMaxSize, int):
@@ -308,6 +330,10 @@ class BuildMaster(service.MultiService):
             prioritizeBuilders = config.get('prioritizeBuilders')
             if prioritizeBuilders is not None and not callable(prioritizeBuilders):
                 raise ValueError("prioritizeBuilders must be callable")
+            buildStartConcurrency = config.get('buildStartConcurrency', 1)
+            if (not isinstance(buildStartConcurrency, int)
+                or buildStartConcurrency < 1):
+                raise ValueError("buildStartConcurrency must be a positive int")
             changeHorizon = config.get("changeHorizon")
             if changeHorizon is not None and not isinstance(changeHorizon, int):
                 raise ValueError("changeHorizon needs to be an int")
@@ -506,6 +532,8 @@ class BuildMaster(service.MultiService):
 
             self.status.logCompressionLimit = logCompressionLimit
             self.status.logCompressionMethod = logCompressionMethod
+            self.status.logCompressionStreaming = logCompressionStreaming
+            compressionPool.setMaxThreads(logCompressionThreads)
             self.status.logMaxSize = logMaxSize
             self.status.logMaxTailSize = logMaxTailSize
             # Update any of our existing builders with the current log parameters.
@@ -514,6 +542,8 @@ class BuildMaster(service.MultiService):
             for builder in self.botmaster.builders.values():
                 builder.builder_status.setLogCompressionLimit(logCompressionLimit)
                 builder.builder_status.setLogCompressionMethod(logCompressionMethod)
+                builder.builder_status.setLogCompressionStreaming(
+                                                    logCompressionStreaming)
                 builder.builder_status.setLogMaxSize(logMaxSize)
                 builder.builder_status.setLogMaxTailSize(logMaxTailSize)
 
@@ -521,6 +551,7 @@ class BuildMaster(service.MultiService):
                 self.botmaster.mergeRequests = mergeRequests
             if prioritizeBuilders is not None:
                 self.botmaster.prioritizeBuilders = prioritizeBuilders
+            self.botmaster.buildStartConcurrency = buildStartConcurrency
 
             self.buildCacheSize = buildCacheSize
             self.changeCacheSize = changeCacheSize
@@ -973,9 +1004,16 @@ class BuildMaster(service.MultiService):
         def notify(change):
             msg = u"added change %s to database" % change
             log.msg(msg.encode('utf-8', 'replace'))
-            # only deliver messages immediately if we're not polling
+            # deliver changes added on this master immediately.  If we're
+            # polling, the poll only needs to find changes from other masters,
+            # so remember that this one has been delivered -- unless the poll
+            # has beaten us to it.
             if not self.db_poll_interval:
                 self._change_subs.deliver(change)
+            elif (self._last_processed_change is None
+                  or change.number > self._last_processed_change):
+                self._locally_delivered_changeids.add(change.number)
+                self._change_subs.deliver(change)
             return change
         d.addCallback(notify)
         return d
@@ -1063,6 +1101,28 @@ class BuildMaster(service.MultiService):
         # and deliver to any listeners
         self._buildsetComplete(bsid, cumulative_results)
 
+    def completeBuildRequests(self, brids, results):
+        """
+        Mark the given build requests as complete with the given results, and
+        complete any buildsets which are complete as a result, notifying
+        subscribers of those buildset completions.  This is equivalent to
+        completing the build requests and then calling
+        L{maybeBuildsetComplete} for each of their buildsets, but uses a
+        single database transaction.
+
+        @param brids: build request IDs to complete
+        @param results: integer result code
+
+        @returns: Deferred
+        """
+        d = self.db.buildrequests.completeBuildRequestsAndBuildsets(brids,
+                                                                    results)
+        def notify(completed):
+            for bsid in sorted(completed):
+                self._buildsetComplete(bsid, completed[bsid])
+        d.addCallback(notify)
+        return d
+
     def _buildsetComplete(self, bsid, results):
         self._complete_buildset_subs.deliver(bsid, results)
 
@@ -1159,27 +1219,51 @@ class BuildMaster(service.MultiService):
             timer.stop()
             return
 
+        # fetch all of the new changes, a batch at a time, and deliver each
+        # one that was not already delivered by addChange on this master
         while True:
-            changeid = self._last_processed_change + 1
             wfd = defer.waitForDeferred(
-                self.db.changes.getChange(changeid))
+                self.db.changes.getChangesAfter(self._last_processed_change,
+                                        count=self.CHANGE_POLL_BATCH_SIZE))
             yield wfd
-            chdict = wfd.getResult()
+            chdicts = wfd.getResult()
 
-            # if there's no such change, we've reached the end and can
-            # stop polling
-            if not chdict:
+            # if there are no more changes, we've reached the end and can stop
+            # polling
+            if not chdicts:
                 break
 
             wfd = defer.waitForDeferred(
-                changes.Change.fromChdict(self, chdict))
+                defer.gatherResults([ changes.Change.fromChdict(self, chdict)
+                                      for chdict in chdicts ]))
             yield wfd
-            change = wfd.getResult()
+            new_changes = wfd.getResult()
 
-            self._change_subs.deliver(change)
+            local = self._locally_delivered_changeids
+            for change in new_changes:
+                if change.number in local:
+                    local.discard(change.number)
+                    continue
+                self._change_subs.deliver(change)
 
-            self._last_processed_change = changeid
-            need_setState = True
+            self._last_processed_change = chdicts[-1]['changeid']
+
+            # write back the updated state once for each batch
+            wfd = defer.waitForDeferred(
+                self._setState('last_processed_change',
+                               self._last_processed_change))
+            yield wfd
+            wfd.getResult()
+            need_setState = False
+
+            if len(chdicts) < self.CHANGE_POLL_BATCH_SIZE:
+                break
+
+        # forget about any locally-delivered changes that the poll has already
+        # passed, e.g., those added before the first poll
+        lpc = self._last_processed_change
+        self._locally_delivered_changeids = set(
+                [ id for id in self._locally_delivered_changeids if id > lpc ])
 
         # write back the updated state, if it's changed
         if need_setState:
@@ -1190,7 +1274,9 @@ class BuildMaster(service.MultiService):
             wfd.getResult()
         timer.stop()
 
-    _last_unclaimed_brids_set = None
+    _last_seen_brid = None
+    _last_claimed_brids_set = None
+    _last_unclaimed_resync = 0
     _last_claim_cleanup = 0
     @defer.deferredGenerator
     def pollDatabaseBuildRequests(self):
@@ -1211,36 +1297,72 @@ class BuildMaster(service.MultiService):
 
             self._last_claim_cleanup = reactor.seconds()
 
-        # _last_unclaimed_brids_set tracks the state of unclaimed build
-        # requests; whenever it sees a build request which was not claimed on
-        # the last poll, it notifies the subscribers.  It only tracks that
-        # state within the master instance, though; on startup, it notifies for
-        # all unclaimed requests in the database.
+        # Build requests become available to be claimed in two ways: they are
+        # added to the database, or a claimed request is unclaimed.  The first
+        # case is tracked with _last_seen_brid, the highest brid seen so far,
+        # and the second with _last_claimed_brids_set, the set of claimed,
+        # incomplete requests at the last poll.  Both of these queries are
+        # proportional to new activity and running builds, rather than to the
+        # number of queued requests.
+        #
+        # Since ids may not be committed in order when several masters add
+        # build requests, every UNCLAIMED_RESYNC_INTERVAL the master notifies
+        # for all unclaimed requests in the database, as it does on startup.
+
+        if (reactor.seconds() - self._last_unclaimed_resync
+                            >= self.UNCLAIMED_RESYNC_INTERVAL):
+            self._last_seen_brid = None
+
+        if self._last_seen_brid is None:
+            wfd = defer.waitForDeferred(
+                self.db.buildrequests.getBuildRequests(claimed=False))
+            yield wfd
+            new_unclaimed_brdicts = wfd.getResult()
+            self._last_unclaimed_resync = reactor.seconds()
 
-        last_unclaimed = self._last_unclaimed_brids_set or set()
-        if len(last_unclaimed) > self.WARNING_UNCLAIMED_COUNT:
-            log.msg("WARNING: %d unclaimed buildrequests - is a scheduler "
-                    "producing builds for which no builder is running?"
-                    % len(last_unclaimed))
+            if len(new_unclaimed_brdicts) > self.WARNING_UNCLAIMED_COUNT:
+                log.msg("WARNING: %d unclaimed buildrequests - is a scheduler "
+                        "producing builds for which no builder is running?"
+                        % len(new_unclaimed_brdicts))
+        else:
+            wfd = defer.waitForDeferred(
+                self.db.buildrequests.getBuildRequests(claimed=False,
+                                        min_brid=self._last_seen_brid + 1))
+            yield wfd
+            new_unclaimed_brdicts = wfd.getResult()
 
-        # get the current set of unclaimed buildrequests
+        # get the claimed, incomplete requests, and look for any that were
+        # claimed on the last poll but have since been unclaimed
         wfd = defer.waitForDeferred(
-            self.db.buildrequests.getBuildRequests(claimed=False))
+            self.db.buildrequests.getBuildRequests(claimed=True,
+                                                   complete=False))
         yield wfd
-        now_unclaimed_brdicts = wfd.getResult()
-        now_unclaimed = set([ brd['brid'] for brd in now_unclaimed_brdicts ])
+        claimed_brdicts = wfd.getResult()
+        now_claimed = set([ brd['brid'] for brd in claimed_brdicts ])
+
+        last_claimed = self._last_claimed_brids_set or set()
+        maybe_unclaimed = last_claimed - now_claimed
+        if maybe_unclaimed:
+            wfd = defer.waitForDeferred(
+                self.db.buildrequests.getBuildRequests(claimed=False,
+                        complete=False, brids=list(maybe_unclaimed)))
+            yield wfd
+            new_unclaimed_brdicts.extend(wfd.getResult())
 
         # and store that for next time
-        self._last_unclaimed_brids_set = now_unclaimed
-
-        # see what's new, and notify if anything is
-        new_unclaimed = now_unclaimed - last_unclaimed
-        if new_unclaimed:
-            brdicts = dict((brd['brid'], brd) for brd in now_unclaimed_brdicts)
-            for brid in new_unclaimed:
-                brd = brdicts[brid]
-                self.buildRequestAdded(brd['buildsetid'], brd['brid'],
-                                       brd['buildername'])
+        self._last_claimed_brids_set = now_claimed
+        seen_brids = [ brd['brid']
+                       for brd in new_unclaimed_brdicts + claimed_brdicts ]
+        self._last_seen_brid = max([ self._last_seen_brid or 0 ] + seen_brids)
+
+        # notify for anything that is new
+        notified = set()
+        for brd in new_unclaimed_brdicts:
+            if brd['brid'] in notified:
+                continue
+            notified.add(brd['brid'])
+            self.buildRequestAdded(brd['buildsetid'], brd['brid'],
+                                   brd['buildername'])
         timer.stop()
 
     ## state maintenance (private)
@@ -23,6 +23,7 @@ from twisted.application import service
 from buildbot.process.builder import Builder
 from buildbot import interfaces, locks
 from buildbot.process import metrics
+from buildbot.process.buildrequestqueue import BuildRequestQueue
 
 class BotMaster(service.MultiService):
 
@@ -60,6 +61,10 @@ class BotMaster(service.MultiService):
         # traversal
         self.prioritizeBuilders = None
 
+        # self.buildStartConcurrency is the number of builders that may be
+        # trying to start builds at the same time; see BuildRequestDistributor
+        self.buildStartConcurrency = 1
+
         self.shuttingDown = False
 
         self.lastSlavePortnum = None
@@ -71,6 +76,9 @@ class BotMaster(service.MultiService):
         self.brd = BuildRequestDistributor(self)
         self.brd.setServiceParent(self)
 
+        # an in-memory index of unclaimed build requests for each builder
+        self.brqueue = BuildRequestQueue(master)
+
     def cleanShutdown(self, _reactor=reactor):
         """Shut down the entire process, once all currently-running builds are
         complete."""
@@ -233,6 +241,7 @@ class BotMaster(service.MultiService):
     def setBuilders(self, builders):
         # TODO: diff against previous list of builders instead of replacing
         # wholesale?
+        old_names = self.builderNames
         self.builders = {}
         self.builderNames = []
         d = defer.DeferredList([b.disownServiceParent() for b in list(self)
@@ -248,6 +257,9 @@ class BotMaster(service.MultiService):
                 self.builderNames.append(b.name)
                 b.setBotmaster(self)
                 b.setServiceParent(self)
+            # forget the requests of builders that are gone
+            for name in set(old_names) - set(self.builderNames):
+                self.brqueue.invalidate(name)
         d.addCallback(_add)
         d.addCallback(lambda ign: self._updateAllSlaves())
         # N.B. this takes care of starting all builders at master startup
@@ -290,6 +302,7 @@ class BotMaster(service.MultiService):
 
     def startService(self):
         def buildRequestAdded(notif):
+            self.brqueue.addRequests(notif['buildername'], [ notif['brid'] ])
             self.maybeStartBuildsForBuilder(notif['buildername'])
         self.buildrequest_sub = \
             self.master.subscribeToBuildRequests(buildRequestAdded)
@@ -354,6 +367,11 @@ class BuildRequestDistributor(service.Service):
     are still working on the previous build request, then this class will
     correctly re-prioritize invocations of builders' C{maybeStartBuild}
     methods.
+
+    Up to C{botmaster.buildStartConcurrency} builders may be running their
+    C{maybeStartBuild} methods at once, as long as they do not compete for
+    the same slaves or locks.  Builders that do compete are invoked one at a
+    time, in priority order.
     """
 
     def __init__(self, botmaster):
@@ -369,12 +387,23 @@ class BuildRequestDistributor(service.Service):
         self.activity_lock = defer.DeferredLock()
         self.active = False
 
+        # builders whose maybeStartBuild method is currently running, mapped
+        # to a Deferred that fires when it finishes and the resources it uses
+        self._running_builders = {}
+
+        # Deferred that the activity loop waits on when it cannot start any
+        # more builders; fired when that may have changed
+        self._wakeup = None
+
     def stopService(self):
         # let the parent stopService succeed between activity; then the loop
-        # will stop calling itself, since self.running is false
+        # will stop calling itself, since self.running is false.  Builders
+        # that are already running are allowed to finish.
         d = self.activity_lock.acquire()
         d.addCallback(lambda _ : service.Service.stopService(self))
         d.addBoth(lambda _ : self.activity_lock.release())
+        d.addCallback(lambda _ : defer.DeferredList(
+            [ f for f, r in self._running_builders.values() ]))
         return d
 
     @defer.deferredGenerator
@@ -412,9 +441,12 @@ class BuildRequestDistributor(service.Service):
             yield wfd
             self._pending_builders = wfd.getResult()
 
-            # start the activity loop, if we aren't already working on that.
+            # start the activity loop, if we aren't already working on that,
+            # or let it know there may be more to do
             if not self.active:
                 self._activityLoop()
+            else:
+                self._wakeActivityLoop()
         except:
             log.err(Failure(),
                     "while attempting to start builds on %s" % self.name)
@@ -503,31 +535,97 @@ class BuildRequestDistributor(service.Service):
             yield wfd
             wfd.getResult()
 
-            # bail out if we shouldn't keep looping
-            if not self.running or not self._pending_builders:
+            # bail out if we shouldn't keep looping, once any running
+            # builders are finished
+            if not self._running_builders and (not self.running
+                                            or not self._pending_builders):
                 self.pending_builders_lock.release()
                 self.activity_lock.release()
                 break
 
-            bldr_name = self._pending_builders.pop(0)
+            bldr_name = None
+            if self.running:
+                bldr_name = self._nextStartableBuilder()
+            if bldr_name is not None:
+                self._pending_builders.remove(bldr_name)
+            else:
+                # nothing can start right now, so wait for a running
+                # builder to finish or for new builders to be added
+                self._wakeup = defer.Deferred()
             self.pending_builders_lock.release()
 
-            try:
-                wfd = defer.waitForDeferred(
-                    self._callABuilder(bldr_name))
+            if bldr_name is not None:
+                self._startABuilder(bldr_name)
+                self.activity_lock.release()
+            else:
+                wakeup = self._wakeup
+                self.activity_lock.release()
+                wfd = defer.waitForDeferred(wakeup)
                 yield wfd
                 wfd.getResult()
-            except:
-                log.err(Failure(),
-                        "from maybeStartBuild for builder '%s'" % (bldr_name,))
-
-            self.activity_lock.release()
 
         timer.stop()
 
         self.active = False
         self._quiet()
 
+    def _wakeActivityLoop(self):
+        if self._wakeup:
+            d, self._wakeup = self._wakeup, None
+            d.callback(None)
+
+    def _nextStartableBuilder(self):
+        # return the name of the highest-priority pending builder that can be
+        # started now, or None.  A builder cannot start if it is already
+        # running, or if it shares a slave or lock with a running builder or
+        # with a higher-priority builder that is still waiting.
+        limit = self.botmaster.buildStartConcurrency
+        if len(self._running_builders) >= limit:
+            return None
+
+        busy = set()
+        for _, resources in self._running_builders.itervalues():
+            busy.update(resources)
+
+        for bldr_name in self._pending_builders:
+            resources = self._getBuilderResources(bldr_name)
+            if bldr_name in self._running_builders or busy & resources:
+                busy.update(resources)
+                continue
+            return bldr_name
+
+    def _getBuilderResources(self, bldr_name):
+        # the set of slaves and locks that this builder may compete for
+        bldr = self.botmaster.builders.get(bldr_name)
+        if not bldr:
+            return set()
+        resources = set([ ('slave', slavename)
+                          for slavename in bldr.slavenames ])
+        for lock in bldr.locks:
+            # locks may be given as a LockAccess or a bare lock id
+            resources.add(('lock', getattr(lock, 'lockid', lock)))
+        return resources
+
+    def _startABuilder(self, bldr_name):
+        timer = metrics.Timer(
+                "BuildRequestDistributor.maybeStartBuild(%s)" % (bldr_name,))
+        timer.start()
+
+        finished = defer.Deferred()
+        self._running_builders[bldr_name] = (finished,
+                                    self._getBuilderResources(bldr_name))
+
+        d = defer.maybeDeferred(self._callABuilder, bldr_name)
+        d.addErrback(log.err,
+                "from maybeStartBuild for builder '%s'" % (bldr_name,))
+        def done(_):
+            timer.stop()
+            del self._running_builders[bldr_name]
+            # let stopService know before the loop goes around again
+            finished.callback(None)
+            self._wakeActivityLoop()
+        d.addCallback(done)
+
     def _callABuilder(self, bldr_name):
         # get the actual builder object
         bldr = self.botmaster.builders.get(bldr_name)
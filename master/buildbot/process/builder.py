@@ -190,7 +190,6 @@ class Builder(pb.Referenceable, service.MultiService):
     def __repr__(self):
         return "<Builder '%r' at %d>" % (self.name, id(self))
 
-    @defer.deferredGenerator
     def getOldestRequestTime(self):
 
         """Returns the submitted_at of the oldest unclaimed build request for
@@ -198,18 +197,7 @@ class Builder(pb.Referenceable, service.MultiService):
 
         @returns: datetime instance or None, via Deferred
         """
-        wfd = defer.waitForDeferred(
-            self.master.db.buildrequests.getBuildRequests(
-                        buildername=self.name, claimed=False))
-        yield wfd
-        unclaimed = wfd.getResult()
-
-        if unclaimed:
-            unclaimed = [ brd['submitted_at'] for brd in unclaimed ]
-            unclaimed.sort()
-            yield unclaimed[0]
-        else:
-            yield None
+        return self.botmaster.brqueue.getOldestRequestTime(self.name)
 
     def consumeTheSoulOfYourPredecessor(self, old):
         """Suck the brain out of an old Builder.
@@ -569,10 +557,7 @@ class Builder(pb.Referenceable, service.MultiService):
             self._resubmit_buildreqs(build).addErrback(log.err)
         else:
             brids = [br.id for br in build.requests]
-            db = self.master.db
-            d = db.buildrequests.completeBuildRequests(brids, results)
-            d.addCallback(
-                lambda _ : self._maybeBuildsetsComplete(build.requests))
+            d = self.master.completeBuildRequests(brids, results)
             # nothing in particular to do with this deferred, so just log it if
             # it fails..
             d.addErrback(log.err, 'while marking build requests as completed')
@@ -582,18 +567,14 @@ class Builder(pb.Referenceable, service.MultiService):
 
         self.updateBigStatus()
 
-    @defer.deferredGenerator
-    def _maybeBuildsetsComplete(self, requests):
-        # inform the master that we may have completed a number of buildsets
-        for br in requests:
-            wfd = defer.waitForDeferred(
-                self.master.maybeBuildsetComplete(br.bsid))
-            yield wfd
-            wfd.getResult()
-
     def _resubmit_buildreqs(self, build):
         brids = [br.id for br in build.requests]
-        return self.db.buildrequests.unclaimBuildRequests(brids)
+        d = self.db.buildrequests.unclaimBuildRequests(brids)
+        def requeue(_):
+            self.botmaster.brqueue.addRequests(self.name, brids)
+            self.botmaster.maybeStartBuildsForBuilder(self.name)
+        d.addCallback(requeue)
+        return d
 
     def setExpectations(self, progress):
         """Mark the build as successful and update expectations for the next
@@ -634,10 +615,11 @@ class Builder(pb.Referenceable, service.MultiService):
             self.updateBigStatus()
             return
 
-        # now, get the available build requests
+        # now, get the available build requests, sorted by submitted_at so
+        # the first is the oldest
+        brqueue = self.botmaster.brqueue
         wfd = defer.waitForDeferred(
-                self.master.db.buildrequests.getBuildRequests(
-                        buildername=self.name, claimed=False))
+                brqueue.getUnclaimedRequests(self.name))
         yield wfd
         unclaimed_requests = wfd.getResult()
 
@@ -645,9 +627,6 @@ class Builder(pb.Referenceable, service.MultiService):
             self.updateBigStatus()
             return
 
-        # sort by submitted_at, so the first is the oldest
-        unclaimed_requests.sort(key=lambda brd : brd['submitted_at'])
-
         # get the mergeRequests function for later
         mergeRequests_fn = self._getMergeRequestsFn()
 
@@ -697,19 +676,22 @@ class Builder(pb.Referenceable, service.MultiService):
                 yield wfd
                 wfd.getResult()
             except buildrequests.AlreadyClaimedError:
-                # one or more of the build requests was already claimed;
-                # re-fetch the now-partially-claimed build requests and keep
-                # trying to match them
+                # one or more of the build requests was already claimed,
+                # probably by another master; re-load the now-partially-claimed
+                # build requests from the database and keep trying to match
+                # them
                 self._breakBrdictRefloops(unclaimed_requests)
+                brqueue.invalidate(self.name)
                 wfd = defer.waitForDeferred(
-                        self.master.db.buildrequests.getBuildRequests(
-                                buildername=self.name, claimed=False))
+                        brqueue.getUnclaimedRequests(self.name))
                 yield wfd
                 unclaimed_requests = wfd.getResult()
 
                 # go around the loop again
                 continue
 
+            brqueue.removeRequests(self.name, brids)
+
             # claim was successful, so initiate a build for this set of
             # requests.  Note that if the build fails from here on out (e.g.,
             # because a slave has failed), it will be handled outside of this
@@ -717,8 +699,7 @@ class Builder(pb.Referenceable, service.MultiService):
 
             # _startBuildFor expects BuildRequest objects, so cook some up
             wfd = defer.waitForDeferred(
-                    defer.gatherResults([ self._brdictToBuildRequest(brdict)
-                                          for brdict in brdicts ]))
+                    self._brdictsToBuildRequests(brdicts))
             yield wfd
             breqs = wfd.getResult()
 
@@ -733,6 +714,7 @@ class Builder(pb.Referenceable, service.MultiService):
                     self.master.db.buildrequests.unclaimBuildRequests(brids))
                 yield wfd
                 wfd.getResult()
+                brqueue.addRequests(self.name, brids)
 
                 # and try starting builds again.  If we still have a working slave,
                 # then this may re-claim the same buildrequests
@@ -778,8 +760,7 @@ class Builder(pb.Referenceable, service.MultiService):
         if self.nextBuild:
             # nextBuild expects BuildRequest objects, so instantiate them here
             # and cache them in the dictionaries
-            d = defer.gatherResults([ self._brdictToBuildRequest(brdict)
-                                      for brdict in buildrequests ])
+            d = self._brdictsToBuildRequests(buildrequests)
             d.addCallback(lambda requestobjects :
                     self.nextBuild(self, requestobjects))
             def to_brdict(brobj):
@@ -820,15 +801,29 @@ class Builder(pb.Referenceable, service.MultiService):
             yield [ breq ]
             return
 
+        # the default merge function never merges requests for different
+        # repositories, branches, or projects, so weed those out before
+        # going to the trouble of building BuildRequest objects for them
+        candidates = unclaimed_requests
+        if mergeRequests_fn == Builder._defaultMergeRequestFn:
+            wfd = defer.waitForDeferred(
+                self._getSourceStampKeys(unclaimed_requests))
+            yield wfd
+            sskeys = wfd.getResult()
+            breq_sskey = sskeys[breq['brid']]
+            candidates = [ brdict for brdict in unclaimed_requests
+                           if sskeys[brdict['brid']] == breq_sskey ]
+            if len(candidates) == 1:
+                yield [ breq ]
+                return
+
         # we'll need BuildRequest objects, so get those first
         wfd = defer.waitForDeferred(
-            defer.gatherResults(
-                [ self._brdictToBuildRequest(brdict)
-                  for brdict in unclaimed_requests ]))
+            self._brdictsToBuildRequests(candidates))
         yield wfd
         unclaimed_request_objects = wfd.getResult()
         breq_object = unclaimed_request_objects.pop(
-                unclaimed_requests.index(breq))
+                candidates.index(breq))
 
         # gather the mergeable requests
         merged_request_objects = [breq_object]
@@ -868,6 +863,60 @@ class Builder(pb.Referenceable, service.MultiService):
         d.addCallback(keep)
         return d
 
+    def _brdictsToBuildRequests(self, brdicts):
+        """
+        Convert a list of build request dictionaries to
+        L{buildrequest.BuildRequest} objects, as for L{_brdictToBuildRequest},
+        but using L{buildrequest.BuildRequest.fromBrdicts} to fetch the data
+        for all of the unconverted dictionaries at once.
+
+        @param brdicts: list of dictionaries to convert
+
+        @returns: list of L{buildrequest.BuildRequest} via Deferred
+        """
+        unconverted = [ brdict for brdict in brdicts if 'brobj' not in brdict ]
+        if unconverted:
+            d = buildrequest.BuildRequest.fromBrdicts(self.master, unconverted)
+        else:
+            d = defer.succeed([])
+        def keep(buildrequests):
+            for brdict, br in zip(unconverted, buildrequests):
+                brdict['brobj'] = br
+                br.brdict = brdict
+            return [ brdict['brobj'] for brdict in brdicts ]
+        d.addCallback(keep)
+        return d
+
+    @defer.deferredGenerator
+    def _getSourceStampKeys(self, brdicts):
+        """
+        Get a (repository, branch, project) tuple describing the source stamp
+        of each of the given build request dictionaries, using only the
+        buildsets and sourcestamps tables.
+
+        @param brdicts: list of build request dictionaries
+
+        @returns: dictionary mapping brid to tuple, via Deferred
+        """
+        bsids = list(set([ brdict['buildsetid'] for brdict in brdicts ]))
+        wfd = defer.waitForDeferred(
+            self.master.db.buildsets.getBuildsets(bsids=bsids))
+        yield wfd
+        ssids = dict([ (bsdict['bsid'], bsdict['sourcestampid'])
+                       for bsdict in wfd.getResult() ])
+
+        wfd = defer.waitForDeferred(
+            self.master.db.sourcestamps.getSourceStamps(
+                list(set(ssids.values()))))
+        yield wfd
+        sskeys = dict([ (ssdict['ssid'], (ssdict['repository'],
+                                          ssdict['branch'],
+                                          ssdict['project']))
+                        for ssdict in wfd.getResult() ])
+
+        yield dict([ (brdict['brid'], sskeys[ssids[brdict['buildsetid']]])
+                     for brdict in brdicts ])
+
     def _breakBrdictRefloops(self, requests):
         """Break the reference loops created by L{_brdictToBuildRequest}"""
         for brdict in requests:
@@ -91,35 +91,115 @@ class BuildRequest(object):
 
     @classmethod
     @defer.deferredGenerator
-    def _make_br(cls, brid, brdict, master):
-        buildrequest = cls()
-        buildrequest.id = brid
-        buildrequest.bsid = brdict['buildsetid']
-        buildrequest.buildername = brdict['buildername']
-        buildrequest.priority = brdict['priority']
-        dt = brdict['submitted_at']
-        buildrequest.submittedAt = dt and calendar.timegm(dt.utctimetuple())
-        buildrequest.master = master
+    def fromBrdicts(cls, master, brdicts):
+        """
+        Construct L{BuildRequest} objects for a list of dictionaries as
+        returned by L{BuildRequestsConnectorComponent.getBuildRequests}.
+
+        This is equivalent to calling L{fromBrdict} for each dictionary, but
+        the buildsets, buildset properties, source stamps and changes for all
+        of the requests that are not already cached are fetched together,
+        using a handful of queries rather than several per request.
+
+        @param master: current build master
+        @param brdicts: list of build request dictionaries
+
+        @returns: list of L{BuildRequest}, in the same order as C{brdicts},
+        via Deferred
+        """
+        brdicts = list(brdicts)
+        cache = master.caches.get_cache("BuildRequests", cls._make_br)
+
+        missing = [ brdict for brdict in brdicts
+                    if brdict['brid'] not in cache ]
+        made = {}
+        if missing:
+            wfd = defer.waitForDeferred(
+                cls._make_brs(master, missing))
+            yield wfd
+            made = wfd.getResult()
+
+        # add the new objects to the cache, preferring any existing instance
+        ds = []
+        for brdict in brdicts:
+            brid = brdict['brid']
+            if brid in made:
+                ds.append(defer.succeed(cache.prime(brid, made[brid])))
+            else:
+                ds.append(cache.get(brid, brdict=brdict, master=master))
+        wfd = defer.waitForDeferred(defer.gatherResults(ds))
+        yield wfd
+        yield wfd.getResult()
+
+    @classmethod
+    @defer.deferredGenerator
+    def _make_brs(cls, master, brdicts):
+        # fetch the buildsets and their properties
+        bsids = list(set([ brdict['buildsetid'] for brdict in brdicts ]))
+        wfd = defer.waitForDeferred(
+            master.db.buildsets.getBuildsets(bsids=bsids))
+        yield wfd
+        buildsets = dict([ (bsdict['bsid'], bsdict)
+                           for bsdict in wfd.getResult() ])
+
+        wfd = defer.waitForDeferred(
+            master.db.buildsets.getBuildsetsProperties(bsids))
+        yield wfd
+        buildsets_properties = wfd.getResult()
+
+        # fetch the sourcestamp dictionaries
+        ssids = list(set([ bsdict['sourcestampid']
+                           for bsdict in buildsets.itervalues() ]))
+        wfd = defer.waitForDeferred(
+            master.db.sourcestamps.getSourceStamps(ssids))
+        yield wfd
+        ssdicts = wfd.getResult()
+        assert None not in ssdicts # db schema should enforce this anyway
+
+        # fetch all of the changes at once, so that building each SourceStamp
+        # finds them in the cache; keep a reference to them until then
+        changeids = set()
+        for ssdict in ssdicts:
+            changeids.update(ssdict['changeids'])
+        wfd = defer.waitForDeferred(
+            master.db.changes.getChanges(sorted(changeids)))
+        yield wfd
+        chdicts = wfd.getResult()
 
+        # and turn them into SourceStamps
+        wfd = defer.waitForDeferred(
+            defer.gatherResults([ sourcestamp.SourceStamp.fromSsdict(master,
+                                                                     ssdict)
+                                  for ssdict in ssdicts ]))
+        yield wfd
+        sources = dict(zip(ssids, wfd.getResult()))
+        del chdicts
+
+        made = {}
+        for brdict in brdicts:
+            buildset = buildsets[brdict['buildsetid']]
+            made[brdict['brid']] = cls._fill_br(brdict['brid'], brdict,
+                    master, buildset,
+                    buildsets_properties[brdict['buildsetid']],
+                    sources[buildset['sourcestampid']])
+        yield made
+
+    @classmethod
+    @defer.deferredGenerator
+    def _make_br(cls, brid, brdict, master):
         # fetch the buildset to get the reason
         wfd = defer.waitForDeferred(
             master.db.buildsets.getBuildset(brdict['buildsetid']))
         yield wfd
         buildset = wfd.getResult()
         assert buildset # schema should guarantee this
-        buildrequest.reason = buildset['reason']
 
-        # fetch the buildset properties, and convert to Properties
+        # fetch the buildset properties
         wfd = defer.waitForDeferred(
             master.db.buildsets.getBuildsetProperties(brdict['buildsetid']))
         yield wfd
         buildset_properties = wfd.getResult()
 
-        pr = properties.Properties()
-        for name, (value, source) in buildset_properties.iteritems():
-            pr.setProperty(name, value, source)
-        buildrequest.properties = pr
-
         # fetch the sourcestamp dictionary
         wfd = defer.waitForDeferred(
             master.db.sourcestamps.getSourceStamp(buildset['sourcestampid']))
@@ -131,9 +211,32 @@ class BuildRequest(object):
         wfd = defer.waitForDeferred(
             sourcestamp.SourceStamp.fromSsdict(master, ssdict))
         yield wfd
-        buildrequest.source = wfd.getResult()
+        source = wfd.getResult()
 
-        yield buildrequest # return value
+        yield cls._fill_br(brid, brdict, master, buildset,
+                           buildset_properties, source) # return value
+
+    @classmethod
+    def _fill_br(cls, brid, brdict, master, buildset, buildset_properties,
+                 ss):
+        buildrequest = cls()
+        buildrequest.id = brid
+        buildrequest.bsid = brdict['buildsetid']
+        buildrequest.buildername = brdict['buildername']
+        buildrequest.priority = brdict['priority']
+        dt = brdict['submitted_at']
+        buildrequest.submittedAt = dt and calendar.timegm(dt.utctimetuple())
+        buildrequest.master = master
+        buildrequest.reason = buildset['reason']
+
+        # convert the buildset properties to Properties
+        pr = properties.Properties()
+        for name, (value, source) in buildset_properties.iteritems():
+            pr.setProperty(name, value, source)
+        buildrequest.properties = pr
+
+        buildrequest.source = ss
+        return buildrequest
 
     def canBeMergedWith(self, other):
         return self.source.canBeMergedWith(other.source)
@@ -165,20 +268,19 @@ class BuildRequest(object):
             log.msg("build request already claimed; cannot cancel")
             return
 
+        self.master.botmaster.brqueue.removeRequests(self.buildername,
+                                                     [self.id])
+
         # then complete it with 'FAILURE'; this is the closest we can get to
         # cancelling a request without running into trouble with dangling
-        # references.
+        # references.  The master completes the enclosing buildset, too, if
+        # this was its last incomplete request.
         wfd = defer.waitForDeferred(
-            self.master.db.buildrequests.completeBuildRequests([self.id],
-                                                                FAILURE))
+            self.master.completeBuildRequests([self.id], FAILURE))
         yield wfd
         wfd.getResult()
 
-        # and let the master know that the enclosing buildset may be complete
-        wfd = defer.waitForDeferred(
-                self.master.maybeBuildsetComplete(self.bsid))
-        yield wfd
-        wfd.getResult()
+        self.master.status.buildRequestsChanged(self.buildername)
 
 class BuildRequestControl:
     implements(interfaces.IBuildRequestControl)
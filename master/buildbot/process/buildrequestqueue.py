@@ -0,0 +1,188 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from twisted.internet import defer, reactor
+from buildbot.db import buildrequests
+from buildbot.process import metrics
+
+class BuildRequestQueue(object):
+    """
+    An in-memory index of the unclaimed build requests for each builder,
+    available at C{master.botmaster.brqueue}.
+
+    The unclaimed requests for a builder are loaded from the database the
+    first time they are needed, and are then kept current from build request
+    notifications and from this master's own claims and unclaims.  Newly
+    announced requests are fetched in a single query the next time the
+    builder's requests are needed.  Requests claimed by other masters are not
+    seen until an attempt to claim them fails, at which point the builder's
+    requests should be invalidated with L{invalidate}.  As a safety net, each
+    builder's requests are re-loaded from the database after
+    C{RECONCILE_INTERVAL} seconds.
+
+    Build request dictionaries returned from this class are copies, so callers
+    are free to modify them.
+    """
+
+    # maximum age, in seconds, of the requests loaded for a builder before
+    # they are re-loaded from the database
+    RECONCILE_INTERVAL = 5*60
+
+    def __init__(self, master, _reactor=reactor):
+        self.master = master
+        self._reactor = _reactor
+
+        # buildername : { brid : brdict }, for builders that are loaded
+        self._requests = {}
+        # buildername : time at which its requests were loaded
+        self._loaded_at = {}
+        # buildername : set of brids announced but not yet fetched, for
+        # builders that are loaded or being loaded
+        self._pending = {}
+        # buildername : number of loads under way
+        self._loading = {}
+
+    def getUnclaimedRequests(self, buildername):
+        """
+        Get the unclaimed build requests for the given builder, sorted by
+        C{submitted_at} so that the first is the oldest.
+
+        @param buildername: name of the builder
+        @returns: list of build request dictionaries, via Deferred
+        """
+        d = self._getRequests(buildername)
+        def copy_and_sort(requests):
+            brdicts = [ buildrequests.BrDict(brdict)
+                        for brdict in requests.itervalues() ]
+            brdicts.sort(key=lambda brd : brd['submitted_at'])
+            return brdicts
+        d.addCallback(copy_and_sort)
+        return d
+
+    def getOldestRequestTime(self, buildername):
+        """
+        Get the C{submitted_at} time of the oldest unclaimed build request for
+        the given builder, or None if there are no unclaimed requests.
+
+        @param buildername: name of the builder
+        @returns: datetime instance or None, via Deferred
+        """
+        d = self._getRequests(buildername)
+        def oldest(requests):
+            if not requests:
+                return None
+            return min([ brd['submitted_at']
+                         for brd in requests.itervalues() ])
+        d.addCallback(oldest)
+        return d
+
+    def addRequests(self, buildername, brids):
+        """
+        Note that the given build requests may now be unclaimed, either because
+        they are new or because they have been unclaimed.  They will be fetched
+        the next time this builder's requests are needed.
+
+        @param buildername: name of the builder
+        @param brids: build request ids
+        """
+        # requests for a builder that is not loaded will be found when it is;
+        # but a load that is already under way may have read the database
+        # before they were added
+        if buildername in self._requests or buildername in self._loading:
+            self._pending.setdefault(buildername, set()).update(brids)
+
+    def removeRequests(self, buildername, brids):
+        """
+        Note that the given build requests have been claimed or completed, and
+        should no longer be returned.
+
+        @param buildername: name of the builder
+        @param brids: build request ids
+        """
+        requests = self._requests.get(buildername)
+        pending = self._pending.get(buildername)
+        for brid in brids:
+            if requests:
+                requests.pop(brid, None)
+            if pending:
+                pending.discard(brid)
+
+    def invalidate(self, buildername=None):
+        """
+        Forget the requests for the given builder, or for all builders if
+        C{buildername} is None, so that they are re-loaded from the database
+        the next time they are needed.
+
+        @param buildername: name of the builder, or None
+        """
+        if buildername is None:
+            self._requests.clear()
+            self._loaded_at.clear()
+            self._pending.clear()
+        else:
+            self._requests.pop(buildername, None)
+            self._loaded_at.pop(buildername, None)
+            self._pending.pop(buildername, None)
+
+    @defer.deferredGenerator
+    def _getRequests(self, buildername):
+        # returns the dictionary of requests for this builder, loading it or
+        # fetching pending requests as necessary
+        db = self.master.db
+
+        loaded_at = self._loaded_at.get(buildername)
+        if (loaded_at is not None and
+            self._reactor.seconds() - loaded_at >= self.RECONCILE_INTERVAL):
+            self.invalidate(buildername)
+
+        if buildername not in self._requests:
+            metrics.MetricCountEvent.log("BuildRequestQueue.loads", 1)
+            loaded_at = self._reactor.seconds()
+            self._loading[buildername] = self._loading.get(buildername, 0) + 1
+            try:
+                wfd = defer.waitForDeferred(
+                    db.buildrequests.getBuildRequests(buildername=buildername,
+                                                      claimed=False))
+                yield wfd
+                brdicts = wfd.getResult()
+            finally:
+                self._loading[buildername] -= 1
+                if not self._loading[buildername]:
+                    del self._loading[buildername]
+
+            self._requests[buildername] = dict(
+                    [ (brd['brid'], brd) for brd in brdicts ])
+            self._loaded_at[buildername] = loaded_at
+            # only the pending requests that the load found are fetched;
+            # others were announced too late for it, or have been claimed
+            pending = self._pending.get(buildername)
+            if pending:
+                pending.difference_update(self._requests[buildername])
+
+        pending = self._pending.pop(buildername, None)
+        if pending:
+            wfd = defer.waitForDeferred(
+                db.buildrequests.getBuildRequests(buildername=buildername,
+                        claimed=False, brids=list(pending)))
+            yield wfd
+            brdicts = wfd.getResult()
+
+            # the builder may have been invalidated while we waited
+            requests = self._requests.get(buildername)
+            if requests is not None:
+                for brd in brdicts:
+                    requests[brd['brid']] = brd
+
+        yield self._requests.get(buildername, {})
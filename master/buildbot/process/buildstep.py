@@ -15,10 +15,10 @@
 
 
 import re
+import zlib
 
 from zope.interface import implements
 from twisted.internet import reactor, defer, error
-from twisted.protocols import basic
 from twisted.spread import pb
 from twisted.python import log, components
 from twisted.python.failure import Failure
@@ -26,6 +26,7 @@ from twisted.web.util import formatFailure
 from twisted.python.reflect import accumulateClassList
 
 from buildbot import interfaces, locks, util
+from buildbot.util.lines import LineSplitter
 from buildbot.status import progress
 from buildbot.status.results import SUCCESS, WARNINGS, FAILURE, SKIPPED, \
      EXCEPTION, RETRY, worst_status
@@ -66,6 +67,7 @@ class RemoteCommand(pb.Referenceable):
     commandCounter = 0
 
     active = False
+    decompressor = None
 
     def __init__(self, remote_command, args, ignore_updates=False):
         """
@@ -127,6 +129,15 @@ class RemoteCommand(pb.Referenceable):
             cmd_args = cmd_args.copy()
             cmd_args["logfiles"] = self.step.build.render(cmd_args["logfiles"])
 
+        # slaves from command version 2.17 can compress the log data in their
+        # updates, as a zlib stream for the whole command
+        if getattr(self.buildslave, 'compress_updates', False) is True and \
+                not self.step.slaveVersionIsOlderThan(self.remote_command,
+                                                      "2.17"):
+            cmd_args = cmd_args.copy()
+            cmd_args["compress_updates"] = True
+            self.decompressor = zlib.decompressobj()
+
         # This method only initiates the remote command.
         # We will receive remote_update messages as the command runs.
         # We will get a single remote_complete when it finishes.
@@ -177,8 +188,12 @@ class RemoteCommand(pb.Referenceable):
         @param updates: list of updates from the remote command
         """
         self.buildslave.messageReceivedFromSlave()
+        if self.decompressor:
+            # decompress even if the updates are ignored, to keep the
+            # decompressor in step with the slave's compressor
+            updates = self._decompressUpdates(updates)
         max_updatenum = 0
-        for (update, num) in updates:
+        for (update, num) in self.mergeUpdates(updates):
             #log.msg("update[%d]:" % num)
             try:
                 if self.active and not self.ignore_updates:
@@ -192,6 +207,47 @@ class RemoteCommand(pb.Referenceable):
                 max_updatenum = num
         return max_updatenum
 
+    def _decompressUpdates(self, updates):
+        # a compressed batch is a single update, {'compressed': (zdata,
+        # templates)}.  zdata holds the batch's log data, and each template
+        # is a list of the entries of one update: (key, value) entries are
+        # used as they are, while (key, logname, length) entries take their
+        # data from zdata, in order.
+        result = []
+        for (update, num) in updates:
+            if 'compressed' not in update:
+                result.append((update, num))
+                continue
+            zdata, templates = update['compressed']
+            data = self.decompressor.decompress(zdata)
+            self.buildslave.compressedUpdateReceived(len(zdata), len(data))
+            pos = 0
+            for template in templates:
+                update = {}
+                for entry in template:
+                    if len(entry) == 2:
+                        update[entry[0]] = entry[1]
+                        continue
+                    k, logname, length = entry
+                    value = data[pos:pos+length]
+                    pos += length
+                    if k == 'log':
+                        value = (logname, value)
+                    update[k] = value
+                result.append((update, num))
+        return result
+
+    def mergeUpdates(self, updates):
+        """
+        Combine a batch of updates from the slave before they are passed, one
+        at a time, to L{remoteUpdate}.  By default the updates are unchanged;
+        subclasses can merge updates that are cheaper to handle together.
+
+        @param updates: list of (update, num) pairs, in the order sent
+        @returns: list of (update, num) pairs
+        """
+        return updates
+
     def remoteUpdate(self, update):
         raise NotImplementedError("You must implement this in a subclass")
 
@@ -360,6 +416,36 @@ class LoggedRemoteCommand(RemoteCommand):
         else:
             log.msg("%s.addToLog: no such log %s" % (self, logname))
 
+    def mergeUpdates(self, updates):
+        # a chatty command's output arrives as many small updates; merge each
+        # run of updates that only add data to the same log, so that the run
+        # is added to the logfile as a single entry
+        runs = []
+        for (update, num) in updates:
+            key = data = None
+            if len(update) == 1:
+                k, v = update.items()[0]
+                # (str and unicode data are not mixed)
+                if k in ('stdout', 'stderr', 'header'):
+                    key, data = (k, None, type(v)), v
+                elif k == 'log':
+                    key, data = (k, v[0], type(v[1])), v[1]
+            if key is not None and runs and runs[-1][0] == key:
+                runs[-1][2].append(data)
+                runs[-1][3] = max(runs[-1][3], num)
+            else:
+                runs.append([key, update, [data], num])
+
+        merged = []
+        for key, update, data, num in runs:
+            if len(data) > 1:
+                if key[0] == 'log':
+                    update = {'log': (key[1], "".join(data))}
+                else:
+                    update = {key[0]: "".join(data)}
+            merged.append((update, num))
+        return merged
+
     @metrics.countMethod('LoggedRemoteCommand.remoteUpdate()')
     def remoteUpdate(self, update):
         if self.debug:
@@ -436,17 +522,18 @@ class LogObserver:
 
 
 class LogLineObserver(LogObserver):
-    def __init__(self):
-        self.stdoutParser = basic.LineOnlyReceiver()
-        self.stdoutParser.delimiter = "\n"
-        self.stdoutParser.lineReceived = self.outLineReceived
-        self.stdoutParser.transport = self # for the .disconnecting attribute
-        self.disconnecting = False
+    """
+    A L{LogObserver} that receives complete lines.  Each chunk of log data is
+    split into lines once, and the complete lines are passed to
+    L{outLinesReceived} or L{errLinesReceived} as a list, so observers that
+    can handle many lines at once (for example with a
+    L{buildbot.util.lines.LineMatcher}) should override those.  By default,
+    they call L{outLineReceived} or L{errLineReceived} for each line.
+    """
 
-        self.stderrParser = basic.LineOnlyReceiver()
-        self.stderrParser.delimiter = "\n"
-        self.stderrParser.lineReceived = self.errLineReceived
-        self.stderrParser.transport = self
+    def __init__(self):
+        self.stdoutSplitter = LineSplitter()
+        self.stderrSplitter = LineSplitter()
 
     def setMaxLineLength(self, max_length):
         """
@@ -454,14 +541,32 @@ class LogLineObserver(LogObserver):
         dropped.  Default is 16384 bytes.  Use sys.maxint for effective
         infinity.
         """
-        self.stdoutParser.MAX_LENGTH = max_length
-        self.stderrParser.MAX_LENGTH = max_length
+        self.stdoutSplitter.max_length = max_length
+        self.stderrSplitter.max_length = max_length
 
     def outReceived(self, data):
-        self.stdoutParser.dataReceived(data)
+        received = self.stdoutSplitter.split(data)
+        if received:
+            self.outLinesReceived(received)
 
     def errReceived(self, data):
-        self.stderrParser.dataReceived(data)
+        received = self.stderrSplitter.split(data)
+        if received:
+            self.errLinesReceived(received)
+
+    def outLinesReceived(self, lines):
+        """This will be called with a list of the complete stdout lines (not
+        including the delimiter) in each chunk. Override this in your observer
+        to handle them all at once."""
+        for line in lines:
+            self.outLineReceived(line)
+
+    def errLinesReceived(self, lines):
+        """This will be called with a list of the complete stderr lines (not
+        including the delimiter) in each chunk. Override this in your observer
+        to handle them all at once."""
+        for line in lines:
+            self.errLineReceived(line)
 
     def outLineReceived(self, line):
         """This will be called with complete stdout lines (not including the
@@ -32,6 +32,7 @@ class CacheManager(object):
     def __init__(self):
         self.config = {}
         self._caches = {}
+        self._default_sizes = {}
 
     def get_cache(self, cache_name, miss_fn):
         """
@@ -54,13 +55,40 @@ class CacheManager(object):
             c = self._caches[cache_name] = lru.AsyncLRUCache(miss_fn, max_size)
             return c
 
+    def get_sized_cache(self, cache_name, size_fn, default_max_size):
+        """
+        Get a L{SizedLRUCache} object with the given name, creating it if
+        necessary.  As with L{get_cache}, the cache is permanent.  Its maximum
+        size is the total size of the values in the cache, as measured by
+        C{size_fn}, and defaults to C{default_max_size} if the cache is not
+        configured.
+
+        @param cache_name: name of the cache
+        @param size_fn: size function for the cache; see L{SizedLRUCache}
+        constructor.
+        @param default_max_size: maximum size if not given in the config
+        @returns: L{SizedLRUCache} instance
+        """
+        try:
+            return self._caches[cache_name]
+        except KeyError:
+            self._default_sizes[cache_name] = default_max_size
+            max_size = self.config.get(cache_name, default_max_size)
+            assert max_size >= 1
+            c = self._caches[cache_name] = lru.SizedLRUCache(size_fn, max_size)
+            return c
+
     def load_config(self, new_config):
         self.config = new_config
         for name, cache in self._caches.iteritems():
-            cache.set_max_size(new_config.get(name, self.DEFAULT_CACHE_SIZE))
+            default = self._default_sizes.get(name, self.DEFAULT_CACHE_SIZE)
+            cache.set_max_size(new_config.get(name, default))
 
     def get_metrics(self):
-        return dict([
-            (n, dict(hits=c.hits, refhits=c.refhits,
-                     misses=c.misses, max_size=c.max_size))
-            for n, c in self._caches.iteritems()])
+        metrics = {}
+        for n, c in self._caches.iteritems():
+            metrics[n] = dict(hits=c.hits, refhits=c.refhits,
+                              misses=c.misses, max_size=c.max_size)
+            if isinstance(c, lru.SizedLRUCache):
+                metrics[n].update(evictions=c.evictions, size=c.size)
+        return metrics
@@ -452,6 +452,10 @@ class MetricLogObserver(service.MultiService):
         retval = {}
         for interface, handler in self.handlers.iteritems():
             retval.update(handler.asDict())
+        # include the statistics kept by the master's caches
+        caches = getattr(self.parent, 'caches', None)
+        if caches:
+            retval['caches'] = caches.get_metrics()
         return retval
 
     def report(self):
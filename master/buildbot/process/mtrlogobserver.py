@@ -19,6 +19,7 @@ from twisted.python import log
 from twisted.internet import defer
 from twisted.enterprise import adbapi
 from buildbot.process.buildstep import LogLineObserver
+from buildbot.util.lines import LineMatcher
 from buildbot.steps.shell import Test
 
 class EqConnectionPool(adbapi.ConnectionPool):
@@ -98,46 +99,60 @@ class MtrLogObserver(LogLineObserver):
         self.warnList = []
         LogLineObserver.__init__(self)
 
+        # a test result, warnings, or anything else that ends the output of a
+        # failed test; the separator only does so if a test has failed
+        patterns = [ self._line_re, self._line_re3,
+                     self._line_re2, self._line_re4, self._line_re5,
+                     "^" + re.escape("Test suite timeout! Terminating...") + "$",
+                     "^" + re.escape("mysql-test-run: *** ERROR: Not all tests completed"),
+                     "^" + "-" * 60 ]
+        self.separatorIndex = len(patterns) - 1
+        self.lineMatcher = LineMatcher(patterns)
+
     def setLog(self, loog):
         LogLineObserver.setLog(self, loog)
         d= loog.waitUntilFinished()
         d.addCallback(lambda l: self.closeTestFail())
 
-    def outLineReceived(self, line):
-        stripLine = line.strip("\r\n")
-        m = self._line_re.search(stripLine)
-        if m:
-            testname, variant, worker, result, info = m.groups()
-            self.closeTestFail()
-            self.numTests += 1
-            self.step.setProgress('tests', self.numTests)
-
-            if result == "fail":
-                if variant == None:
-                    variant = ""
-                else:
-                    variant = variant[2:-1]
-                self.openTestFail(testname, variant, result, info, stripLine + "\n")
+    def outLinesReceived(self, lines):
+        lines = [ line.strip("\r\n") for line in lines ]
+        done = 0
+        for n, i, m in self.lineMatcher.matchLines(lines):
+            for stripLine in lines[done:n]:
+                self.addTestFailOutput(stripLine + "\n")
+            done = n + 1
+            stripLine = lines[n]
 
-        else:
-            m = self._line_re3.search(stripLine)
-            if m:
+            if i == 0:
+                testname, variant, worker, result, info = m.groups()
+                self.closeTestFail()
+                self.numTests += 1
+                self.step.setProgress('tests', self.numTests)
+
+                if result == "fail":
+                    if variant == None:
+                        variant = ""
+                    else:
+                        variant = variant[2:-1]
+                    self.openTestFail(testname, variant, result, info, stripLine + "\n")
+
+            elif i == 1:
                 stuff = m.group(1)
                 self.closeTestFail()
                 testList = stuff.split(" ")
                 self.doCollectWarningTests(testList)
 
-            elif (self._line_re2.search(stripLine) or
-                  self._line_re4.search(stripLine) or
-                  self._line_re5.search(stripLine) or
-                  stripLine == "Test suite timeout! Terminating..." or
-                  stripLine.startswith("mysql-test-run: *** ERROR: Not all tests completed") or
-                  (stripLine.startswith("------------------------------------------------------------")
-                   and self.testFail != None)):
-                self.closeTestFail()
+            elif i == self.separatorIndex and self.testFail == None:
+                self.addTestFailOutput(stripLine + "\n")
 
             else:
-                self.addTestFailOutput(stripLine + "\n")
+                self.closeTestFail()
+
+        for stripLine in lines[done:]:
+            self.addTestFailOutput(stripLine + "\n")
+
+    def outLineReceived(self, line):
+        self.outLinesReceived([line])
 
     def openTestFail(self, testname, variant, result, info, line):
         self.testFail = MtrTestFailData(testname, variant, result, info, line, self.doCollectTestFail)
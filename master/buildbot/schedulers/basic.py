@@ -151,15 +151,18 @@ class BaseBasicScheduler(base.BaseScheduler):
         yield wfd
         classifications = wfd.getResult()
 
-        # call gotChange for each change, after first fetching it from the db
-        for changeid, important in classifications.iteritems():
-            wfd = defer.waitForDeferred(
-                self.master.db.changes.getChange(changeid))
-            yield wfd
-            chdict = wfd.getResult()
+        # call gotChange for each change, after first fetching them all from
+        # the db
+        changeids = classifications.keys()
+        wfd = defer.waitForDeferred(
+            self.master.db.changes.getChanges(changeids))
+        yield wfd
+        chdicts = wfd.getResult()
 
+        for changeid, chdict in zip(changeids, chdicts):
             if not chdict:
                 continue
+            important = classifications[changeid]
 
             wfd = defer.waitForDeferred(
                 changes.Change.fromChdict(self.master, chdict))
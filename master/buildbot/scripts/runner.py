@@ -340,6 +340,16 @@ class Maker:
                 except Exception, e:
                     print "Error moving %s to %s: %s" % (source, dest, str(e))
 
+    def index_build_history(self):
+        # add the pickled builds in each builder directory (those containing
+        # a 'builder' pickle) to that builder's build history
+        from buildbot.status.history import upgradeBuilderDirectory
+        for dirname in sorted(os.listdir(self.basedir)):
+            builderdir = os.path.join(self.basedir, dirname)
+            if not os.path.isfile(os.path.join(builderdir, "builder")):
+                continue
+            upgradeBuilderDirectory(builderdir, quiet=self.quiet)
+
     def upgrade_public_html(self, files):
         webdir = os.path.join(self.basedir, "public_html")
         if not os.path.exists(webdir):
@@ -506,6 +516,9 @@ def upgradeMaster(config):
         yield wfd
         wfd.getResult()
 
+        if not config['quiet']: print "indexing build history"
+        m.index_build_history()
+
         if not config['quiet']: print "upgrade complete"
         yield 0
     else:
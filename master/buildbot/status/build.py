@@ -50,6 +50,8 @@ class BuildStatus(styles.Versioned, properties.PropertiesMixin):
     updates = {}
     finishedWatchers = []
     testResults = {}
+    # counts the changes to this build's status, including its steps'
+    generation = 0
 
     def __init__(self, parent, number):
         """
@@ -224,6 +226,13 @@ class BuildStatus(styles.Versioned, properties.PropertiesMixin):
 
     # methods for the base.Build to invoke
 
+    def bumpGeneration(self):
+        """Note that this build's status has changed; this changes the
+        builder's generation, too."""
+        self.generation += 1
+        if self.builder:
+            self.builder.bumpGeneration()
+
     def addStepWithName(self, name):
         """The Build is setting up, and has added a new BuildStep to its
         list. Create a BuildStepStatus object to which it can send status
@@ -253,6 +262,7 @@ class BuildStatus(styles.Versioned, properties.PropertiesMixin):
         be safely queried, so it is time to announce the new build."""
 
         self.started = util.now()
+        self.bumpGeneration()
         # now that we're ready to report status, let the BuilderStatus tell
         # the world about us
         self.builder.buildStarted(self)
@@ -263,12 +273,15 @@ class BuildStatus(styles.Versioned, properties.PropertiesMixin):
     def setText(self, text):
         assert isinstance(text, (list, tuple))
         self.text = text
+        self.bumpGeneration()
     def setResults(self, results):
         self.results = results
+        self.bumpGeneration()
 
     def buildFinished(self):
         self.currentStep = None
         self.finished = util.now()
+        self.bumpGeneration()
 
         for r in self.updates.keys():
             if self.updates[r] is not None:
@@ -284,6 +297,7 @@ class BuildStatus(styles.Versioned, properties.PropertiesMixin):
 
     def stepStarted(self, step):
         self.currentStep = step
+        self.bumpGeneration()
         for w in self.watchers:
             receiver = w.stepStarted(self, step)
             if receiver:
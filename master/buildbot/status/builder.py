@@ -14,8 +14,7 @@
 # Copyright Buildbot Team Members
 
 
-import weakref
-import os, re, itertools
+import os, re
 from cPickle import load, dump
 
 from zope.interface import implements
@@ -23,9 +22,11 @@ from twisted.python import log, runtime
 from twisted.persisted import styles
 from buildbot.process import metrics
 from buildbot import interfaces, util
+from buildbot.util import lru
 from buildbot.status.event import Event
 from buildbot.status.build import BuildStatus
 from buildbot.status.buildrequest import BuildRequestStatus
+from buildbot.status.history import BuildHistory
 
 # user modules expect these symbols to be present here
 from buildbot.status.results import SUCCESS, WARNINGS, FAILURE, SKIPPED
@@ -33,6 +34,24 @@ from buildbot.status.results import EXCEPTION, RETRY, Results, worst_status
 _hush_pyflakes = [ SUCCESS, WARNINGS, FAILURE, SKIPPED,
                    EXCEPTION, RETRY, Results, worst_status ]
 
+# rough estimates of the memory used by a build, and by each of its steps and
+# logfiles, in bytes
+BUILD_SIZE_ESTIMATE = 2048
+STEP_SIZE_ESTIMATE = 1024
+LOG_SIZE_ESTIMATE = 512
+
+# default memory budget, in bytes, for the build cache shared by all builders
+DEFAULT_BUILD_CACHE_SIZE = 50 * 1024 * 1024
+
+def estimateBuildSize(build):
+    """Estimate the memory used by the given L{BuildStatus}, based on its
+    numbers of steps and logs; this is the size function for the build
+    cache."""
+    size = BUILD_SIZE_ESTIMATE
+    for step in build.getSteps():
+        size += STEP_SIZE_ESTIMATE + LOG_SIZE_ESTIMATE * len(step.getLogs())
+    return size
+
 class BuilderStatus(styles.Versioned):
     """I handle status information for a single process.build.Builder object.
     That object sends status changes to me (frequently as Events), and I
@@ -50,6 +69,10 @@ class BuilderStatus(styles.Versioned):
     @type  category: string
     @ivar  category: user-defined category this builder belongs to; can be
                      used to filter on in status clients
+
+    @type  generation: int
+    @ivar  generation: counts the changes to this builder's status, including
+                       those of its builds and their pending requests
     """
 
     implements(interfaces.IBuilderStatus, interfaces.IEventSource)
@@ -70,6 +93,8 @@ class BuilderStatus(styles.Versioned):
     category = None
     currentBigState = "offline" # or idle/waiting/interlocked/building
     basedir = None # filled in by our parent
+    history = None # created from basedir on first use
+    generation = 0
 
     def __init__(self, buildername, category=None):
         self.name = buildername
@@ -85,10 +110,10 @@ class BuilderStatus(styles.Versioned):
         self.currentBuilds = []
         self.nextBuild = None
         self.watchers = []
-        self.buildCache = weakref.WeakValueDictionary()
-        self.buildCache_LRU = []
+        self.buildCache = self._makeBuildCache()
         self.logCompressionLimit = False # default to no compression for tests
         self.logCompressionMethod = "bz2"
+        self.logCompressionStreaming = False
         self.logMaxSize = None # No default limit
         self.logMaxTailSize = None # No tail buffering
 
@@ -102,7 +127,6 @@ class BuilderStatus(styles.Versioned):
         d = styles.Versioned.__getstate__(self)
         d['watchers'] = []
         del d['buildCache']
-        del d['buildCache_LRU']
         for b in self.currentBuilds:
             b.saveYourself()
             # TODO: push a 'hey, build was interrupted' event
@@ -110,6 +134,7 @@ class BuilderStatus(styles.Versioned):
         d.pop('pendingBuilds', None)
         del d['currentBigState']
         del d['basedir']
+        d.pop('history', None)
         del d['status']
         del d['nextBuildNumber']
         return d
@@ -118,8 +143,7 @@ class BuilderStatus(styles.Versioned):
         # when loading, re-initialize the transient stuff. Remember that
         # upgradeToVersion1 and such will be called after this finishes.
         styles.Versioned.__setstate__(self, d)
-        self.buildCache = weakref.WeakValueDictionary()
-        self.buildCache_LRU = []
+        self.buildCache = self._makeBuildCache()
         self.currentBuilds = []
         self.watchers = []
         self.slavenames = []
@@ -132,6 +156,24 @@ class BuilderStatus(styles.Versioned):
         if buildmaster.buildCacheSize is not None:
             self.buildCacheSize = buildmaster.buildCacheSize
 
+    def _makeBuildCache(self):
+        # a private cache, used until our parent supplies the shared one
+        return lru.SizedLRUCache(estimateBuildSize, DEFAULT_BUILD_CACHE_SIZE)
+
+    def setBuildCache(self, cache):
+        """Use the given L{SizedLRUCache}, which may be shared with other
+        builders, for this builder's builds.  Keys are (buildername, number)
+        tuples."""
+        for (name, number), build in self.buildCache.items():
+            cache.put((name, number), build)
+        self.buildCache = cache
+
+    def getCachedBuilds(self):
+        """Return the builds of this builder that are currently in memory,
+        other than those in progress."""
+        return [ build for (name, number), build in self.buildCache.items()
+                 if name == self.name ]
+
     def upgradeToVersion1(self):
         if hasattr(self, 'slavename'):
             self.slavenames = [self.slavename]
@@ -161,6 +203,9 @@ class BuilderStatus(styles.Versioned):
         assert method in ("bz2", "gz")
         self.logCompressionMethod = method
 
+    def setLogCompressionStreaming(self, streaming):
+        self.logCompressionStreaming = streaming
+
     def setLogMaxSize(self, upperLimit):
         self.logMaxSize = upperLimit
 
@@ -192,11 +237,27 @@ class BuilderStatus(styles.Versioned):
     def makeBuildFilename(self, number):
         return os.path.join(self.basedir, "%d" % number)
 
+    def getBuildHistory(self):
+        """Return the L{BuildHistory} holding summaries of this builder's
+        finished builds."""
+        if self.history is None or self.history.basedir != self.basedir:
+            self.history = BuildHistory(self.basedir)
+        return self.history
+
+    def _addToBuildHistory(self, build):
+        try:
+            self.getBuildHistory().addBuild(build)
+        except:
+            log.msg("unable to add build %s-#%d to the build history"
+                    % (self.name, build.number))
+            log.err()
+
     def touchBuildCache(self, build):
-        self.buildCache[build.number] = build
-        if build in self.buildCache_LRU:
-            self.buildCache_LRU.remove(build)
-        self.buildCache_LRU = self.buildCache_LRU[-(self.buildCacheSize-1):] + [ build ]
+        evictions = self.buildCache.evictions
+        self.buildCache.put((self.name, build.number), build)
+        if self.buildCache.evictions > evictions:
+            metrics.MetricCountEvent.log("buildCache.evictions",
+                    self.buildCache.evictions - evictions)
         return build
 
     def getBuildByNumber(self, number):
@@ -206,9 +267,10 @@ class BuilderStatus(styles.Versioned):
                 return self.touchBuildCache(b)
 
         # then in the buildCache
-        if number in self.buildCache:
+        build = self.buildCache.get((self.name, number))
+        if build is not None:
             metrics.MetricCountEvent.log("buildCache.hits", 1)
-            return self.touchBuildCache(self.buildCache[number])
+            return build
         metrics.MetricCountEvent.log("buildCache.misses", 1)
 
         # then fall back to loading it from disk
@@ -232,6 +294,12 @@ class BuilderStatus(styles.Versioned):
 
             # check that logfiles exist
             build.checkLogfiles()
+
+            # builds pickled before the history existed are added as they
+            # are loaded (upgrade-master adds them all at once)
+            if build.isFinished() and \
+                    not self.getBuildHistory().hasBuild(number):
+                self._addToBuildHistory(build)
             return self.touchBuildCache(build)
         except IOError:
             raise IndexError("no such build %d" % number)
@@ -262,6 +330,12 @@ class BuilderStatus(styles.Versioned):
         if earliest_build == 0:
             return
 
+        try:
+            self.getBuildHistory().prune(earliest_build)
+        except:
+            log.msg("unable to prune the build history for %s" % self.name)
+            log.err()
+
         # skim the directory and delete anything that shouldn't be there anymore
         build_re = re.compile(r"^([0-9]+)$")
         build_log_re = re.compile(r"^([0-9]+)-.*$")
@@ -282,7 +356,7 @@ class BuilderStatus(styles.Versioned):
                     is_logfile = True
 
             if num is None: continue
-            if num in self.buildCache: continue
+            if (self.name, num) in self.buildCache: continue
 
             if (is_logfile and num < earliest_log) or num < earliest_build:
                 pathname = os.path.join(self.basedir, filename)
@@ -345,18 +419,48 @@ class BuilderStatus(styles.Versioned):
                                max_buildnum=None,
                                finished_before=None,
                                max_search=200):
+        history = self.getBuildHistory()
+        if max_buildnum is not None and max_buildnum < 0:
+            max_buildnum += self.nextBuildNumber
+        if max_buildnum is None or max_buildnum >= self.nextBuildNumber:
+            max_buildnum = self.nextBuildNumber - 1
+
+        def candidates():
+            # the numbers of the builds to examine, most recent first
+            if finished_before is None:
+                for number in xrange(max_buildnum, -1, -1):
+                    yield number
+                return
+            # go straight to the builds that finished before the given time,
+            # using the history's ordering by finish time, and then look at
+            # any builds that are not yet in the history
+            for number in history.generateNumbersFinishedBefore(
+                                                        finished_before):
+                if number <= max_buildnum:
+                    yield number
+            for number in xrange(max_buildnum, -1, -1):
+                if not history.hasBuild(number):
+                    yield number
+
         got = 0
-        for Nb in itertools.count(1):
-            if Nb > self.nextBuildNumber:
-                break
-            if Nb > max_search:
+        searched = 0
+        for number in candidates():
+            searched += 1
+            if searched > max_search:
                 break
-            build = self.getBuild(-Nb)
+            # use the build's summary, if it has one, to skip builds that
+            # will not match without loading them from disk
+            summary = history.getSummary(number)
+            if summary is not None:
+                if finished_before is not None:
+                    if summary.getTimes()[1] >= finished_before:
+                        continue
+                if branches:
+                    if summary.getBranch() not in branches:
+                        continue
+            build = self.getBuild(number)
             if build is None:
                 continue
-            if max_buildnum is not None:
-                if build.getNumber() > max_buildnum:
-                    continue
             if not build.isFinished():
                 continue
             if finished_before is not None:
@@ -386,9 +490,20 @@ class BuilderStatus(styles.Versioned):
         # interleave two event streams (one from self.getBuild and the other
         # from self.getEvent), which would be simpler than this control flow
 
+        history = self.getBuildHistory()
         eventIndex = -1
         e = self.getEvent(eventIndex)
         for Nb in range(1, self.nextBuildNumber+1):
+            # as in generateFinishedBuilds, consult the build's summary
+            # before loading it from disk
+            summary = history.getSummary(self.nextBuildNumber - Nb)
+            if summary is not None:
+                if summary.getTimes()[0] < minTime:
+                    break
+                if branches and not summary.getBranch() in branches:
+                    continue
+                if categories and not self.getCategory() in categories:
+                    continue
             b = self.getBuild(-Nb)
             if not b:
                 # HACK: If this is the first build we are looking at, it is
@@ -438,8 +553,13 @@ class BuilderStatus(styles.Versioned):
 
     ## Builder interface (methods called by the Builder which feeds us)
 
+    def bumpGeneration(self):
+        """Note that this builder's status has changed."""
+        self.generation += 1
+
     def setSlavenames(self, names):
         self.slavenames = names
+        self.bumpGeneration()
 
     def addEvent(self, text=[]):
         # this adds a duration event. When it is done, the user should call
@@ -466,6 +586,7 @@ class BuilderStatus(styles.Versioned):
         needToUpdate = state != self.currentBigState
         self.currentBigState = state
         if needToUpdate:
+            self.bumpGeneration()
             self.publishState()
 
     def publishState(self, target=None):
@@ -505,6 +626,7 @@ class BuilderStatus(styles.Versioned):
         assert s not in self.currentBuilds
         self.currentBuilds.append(s)
         self.touchBuildCache(s)
+        self.bumpGeneration()
 
         # now that the BuildStatus is prepared to answer queries, we can
         # announce the new build to all our watchers
@@ -526,7 +648,9 @@ class BuilderStatus(styles.Versioned):
     def _buildFinished(self, s):
         assert s in self.currentBuilds
         s.saveYourself()
+        self._addToBuildHistory(s)
         self.currentBuilds.remove(s)
+        self.bumpGeneration()
 
         name = self.getName()
         results = s.getResults()
@@ -614,7 +738,8 @@ class BuilderStatus(styles.Versioned):
         # Collect build numbers.
         # Important: Only grab the *cached* builds numbers to reduce I/O.
         current_builds = [b.getNumber() for b in self.currentBuilds]
-        cached_builds = list(set(self.buildCache.keys() + current_builds))
+        cached_builds = [b.getNumber() for b in self.getCachedBuilds()]
+        cached_builds = list(set(cached_builds + current_builds))
         cached_builds.sort()
         result['cachedBuilds'] = cached_builds
         result['currentBuilds'] = current_builds
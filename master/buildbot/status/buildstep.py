@@ -41,6 +41,8 @@ class BuildStepStatus(styles.Versioned):
     @ivar logs: logs of steps
     @type statistics: dict
     @ivar statistics: results from running this step
+    @type generation: int
+    @ivar generation: counts the changes to this step's status
     """
     # note that these are created when the Build is set up, before each
     # corresponding BuildStep has started.
@@ -58,6 +60,7 @@ class BuildStepStatus(styles.Versioned):
     watchers = []
     updates = {}
     finishedWatchers = []
+    generation = 0
     statistics = {}
     step_number = None
 
@@ -198,6 +201,13 @@ class BuildStepStatus(styles.Versioned):
 
     # methods to be invoked by the BuildStep
 
+    def bumpGeneration(self):
+        """Note that this step's status has changed; this changes the
+        build's generation, too."""
+        self.generation += 1
+        if self.build:
+            self.build.bumpGeneration()
+
     def setName(self, stepname):
         self.name = stepname
 
@@ -209,6 +219,7 @@ class BuildStepStatus(styles.Versioned):
 
     def stepStarted(self):
         self.started = util.now()
+        self.bumpGeneration()
         if self.build:
             self.build.stepStarted(self)
 
@@ -219,7 +230,12 @@ class BuildStepStatus(styles.Versioned):
         log.logMaxSize = self.build.builder.logMaxSize
         log.logMaxTailSize = self.build.builder.logMaxTailSize
         log.compressMethod = self.build.builder.logCompressionMethod
+        if self.build.builder.logCompressionStreaming:
+            limit = self.build.builder.logCompressionLimit
+            if limit is not False:
+                log.streamCompressionLimit = limit or 0
         self.logs.append(log)
+        self.bumpGeneration()
         for w in self.watchers:
             receiver = w.logStarted(self.build, self, log)
             if receiver:
@@ -235,23 +251,28 @@ class BuildStepStatus(styles.Versioned):
         logfilename = self.build.generateLogfileName(self.name, name)
         log = HTMLLogFile(self, name, logfilename, html)
         self.logs.append(log)
+        self.bumpGeneration()
         for w in self.watchers:
             w.logStarted(self.build, self, log)
             w.logFinished(self.build, self, log)
 
     def logFinished(self, log):
+        self.bumpGeneration()
         for w in self.watchers:
             w.logFinished(self.build, self, log)
 
     def addURL(self, name, url):
         self.urls[name] = url
+        self.bumpGeneration()
 
     def setText(self, text):
         self.text = text
+        self.bumpGeneration()
         for w in self.watchers:
             w.stepTextChanged(self.build, self, text)
     def setText2(self, text):
         self.text2 = text
+        self.bumpGeneration()
         for w in self.watchers:
             w.stepText2Changed(self.build, self, text)
 
@@ -259,6 +280,7 @@ class BuildStepStatus(styles.Versioned):
         """Set the given statistic.  Usually called by subclasses.
         """
         self.statistics[name] = value
+        self.bumpGeneration()
 
     def setSkipped(self, skipped):
         self.skipped = skipped
@@ -266,6 +288,7 @@ class BuildStepStatus(styles.Versioned):
     def stepFinished(self, results):
         self.finished = util.now()
         self.results = results
+        self.bumpGeneration()
         cld = [] # deferreds for log compression
         logCompressionLimit = self.build.builder.logCompressionLimit
         for loog in self.logs:
@@ -274,7 +297,7 @@ class BuildStepStatus(styles.Versioned):
             # if log compression is on, and it's a real LogFile,
             # HTMLLogFiles aren't files
             if logCompressionLimit is not False and \
-                    isinstance(loog, LogFile):
+                    isinstance(loog, LogFile) and not loog.writtenCompressed:
                 if os.path.getsize(loog.getFilename()) > logCompressionLimit:
                     loog_deferred = loog.compressLog()
                     if loog_deferred:
@@ -0,0 +1,152 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+
+"""
+A dedicated pool of threads for compressing finished logfiles.
+"""
+
+import time
+from twisted.python import failure, threadpool
+from twisted.internet import defer, reactor
+from buildbot.process import metrics
+
+class CompressionPool(object):
+    """
+    I run log compression jobs in a small pool of threads of my own, so that a
+    burst of finished builds neither competes with the database for the
+    reactor's thread pool nor compresses dozens of logs at once.  Jobs wait in
+    a queue, in the order they were submitted, until one of at most
+    C{maxthreads} threads is free.
+
+    Queue depth, compressed bytes and compression times are reported as
+    metrics under the C{CompressionPool} prefix.
+    """
+
+    def __init__(self, maxthreads=2, _reactor=reactor):
+        self.maxthreads = maxthreads
+        self._reactor = _reactor
+        self.queue = [] # (name, size, fn, args, kwargs, deferred)
+        self.active = []
+        self.completed = 0
+        self.failed = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+        self.threadpool = None
+        self._stop_evt = None
+
+    def compress(self, name, size, fn, *args, **kwargs):
+        """
+        Queue a call to C{fn(*args, **kwargs)}, to be made in one of my
+        threads.
+
+        @param name: name of the job (usually the log's filename), for
+        L{getQueue}
+        @param size: number of bytes the job will compress, for throughput
+        metrics
+        @returns: Deferred that fires with the result of C{fn}
+        """
+        d = defer.Deferred()
+        self.queue.append((name, size, fn, args, kwargs, d))
+        self._logQueued()
+        self._runQueue()
+        return d
+
+    def getQueue(self):
+        """
+        Return the names of the jobs waiting for a thread, in the order they
+        will run.
+        """
+        return [ job[0] for job in self.queue ]
+
+    def getActive(self):
+        """Return the names of the jobs currently running."""
+        return self.active[:]
+
+    def getMetrics(self):
+        return dict(queued=len(self.queue), active=len(self.active),
+                    completed=self.completed, failed=self.failed,
+                    bytes=self.bytes, elapsed=self.elapsed)
+
+    def setMaxThreads(self, maxthreads):
+        assert maxthreads >= 1
+        self.maxthreads = maxthreads
+        if self.threadpool:
+            self.threadpool.adjustPoolsize(0, maxthreads)
+        self._runQueue()
+
+    def shutdown(self):
+        """Stop my threads.  This is only necessary from tests, as the pool
+        stops itself when the reactor stops."""
+        if self._stop_evt:
+            self._reactor.removeSystemEventTrigger(self._stop_evt)
+            self._stop()
+
+    def _start(self):
+        self.threadpool = threadpool.ThreadPool(minthreads=0,
+                maxthreads=self.maxthreads, name='CompressionPool')
+        self.threadpool.start()
+        self._stop_evt = self._reactor.addSystemEventTrigger(
+                'during', 'shutdown', self._stop)
+
+    def _stop(self):
+        self._stop_evt = None
+        self.threadpool.stop()
+        self.threadpool = None
+
+    def _logQueued(self):
+        metrics.MetricCountEvent.log('CompressionPool.queued',
+                                     len(self.queue), absolute=True)
+
+    def _runQueue(self):
+        while self.queue and len(self.active) < self.maxthreads:
+            name, size, fn, args, kwargs, d = self.queue.pop(0)
+            self._logQueued()
+            self.active.append(name)
+            if not self.threadpool:
+                self._start()
+            self._runJob(name, size, fn, args, kwargs, d)
+
+    def _runJob(self, name, size, fn, args, kwargs, d):
+        def thd():
+            start = time.time()
+            try:
+                rv = fn(*args, **kwargs)
+            except:
+                self._reactor.callFromThread(done, failure.Failure(), None)
+            else:
+                self._reactor.callFromThread(done, rv, time.time() - start)
+        def done(rv, elapsed):
+            self.active.remove(name)
+            if isinstance(rv, failure.Failure):
+                self.failed += 1
+            else:
+                self.completed += 1
+                self.bytes += size
+                self.elapsed += elapsed
+                metrics.MetricCountEvent.log('CompressionPool.bytes', size)
+                metrics.MetricTimeEvent.log('CompressionPool.compress',
+                                            elapsed)
+            # start the next job before running callbacks, which may queue
+            # more jobs
+            self._runQueue()
+            if isinstance(rv, failure.Failure):
+                d.errback(rv)
+            else:
+                d.callback(rv)
+        self.threadpool.callInThread(thd)
+
+# the pool shared by all logfiles
+compressionPool = CompressionPool()
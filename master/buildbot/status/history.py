@@ -0,0 +1,359 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+An append-only, indexed store of finished-build summaries for a builder, used
+to list and filter builds without unpickling the full L{BuildStatus} for each.
+"""
+
+import os, re, struct
+from bisect import bisect_left, insort
+from cPickle import load
+from twisted.python import log, runtime
+from twisted.persisted import styles
+from buildbot.util import json
+
+class BuildSummary(object):
+    """
+    A summary of a finished build, as recorded in a L{BuildHistory}.  The
+    number, times and results come from the index; the remaining information
+    is read from the data file the first time it is needed.
+    """
+
+    def __init__(self, history, number, started, finished, results,
+                 offset, length):
+        self.history = history
+        self.number = number
+        self.started = started
+        self.finished = finished
+        self.results = results
+        self.offset = offset
+        self.length = length
+        self._data = None
+
+    def __repr__(self):
+        return "<%s #%s>" % (self.__class__.__name__, self.number)
+
+    def _getData(self):
+        if self._data is None:
+            self._data = self.history._readData(self.offset, self.length)
+        return self._data
+
+    def getNumber(self):
+        return self.number
+
+    def getTimes(self):
+        return (self.started, self.finished)
+
+    def getResults(self):
+        return self.results
+
+    def getBranch(self):
+        return self._getData()['branch']
+
+    def getRevision(self):
+        return self._getData()['revision']
+
+    def getSlavename(self):
+        return self._getData()['slavename']
+
+    def getReason(self):
+        return self._getData()['reason']
+
+    def getText(self):
+        return self._getData()['text']
+
+    def getStepSummaries(self):
+        """Return a list of dictionaries, one per step, with keys C{name},
+        C{text}, C{results}, and C{times}."""
+        return self._getData()['steps']
+
+
+class BuildHistory(object):
+    """
+    I keep a compact history of a builder's finished builds in two files in
+    the builder's directory.  The index, C{builds.idx}, holds one fixed-size
+    record per build number, giving the build's times and results and the
+    location of its summary in the data file.  The data file, C{builds.dat},
+    is appended to as builds finish, and holds the remaining summary
+    information as JSON.
+
+    The index is small, so it is kept in memory; the data file is only read
+    when a summary's details are requested.  A list of the builds ordered by
+    finish time is derived from it when first needed, for time-based queries.
+    """
+
+    INDEX_FILENAME = "builds.idx"
+    DATA_FILENAME = "builds.dat"
+
+    # flags, results, number, started, finished, data offset, data length
+    RECORD = struct.Struct("<BbxxiddQI")
+    PRESENT = 1
+
+    # compact the data file when less than this fraction of it is in use
+    COMPACT_RATIO = 0.5
+
+    def __init__(self, basedir):
+        self.basedir = basedir
+        self.index_filename = os.path.join(basedir, self.INDEX_FILENAME)
+        self.data_filename = os.path.join(basedir, self.DATA_FILENAME)
+        self._index = None
+        self._byFinish = None
+
+    def _loadIndex(self):
+        if self._index is None:
+            try:
+                f = open(self.index_filename, "rb")
+                try:
+                    self._index = bytearray(f.read())
+                finally:
+                    f.close()
+            except IOError:
+                self._index = bytearray()
+            # ignore any partial record left by an interrupted write
+            del self._index[len(self._index) -
+                            len(self._index) % self.RECORD.size:]
+        return self._index
+
+    def _readData(self, offset, length):
+        f = open(self.data_filename, "rb")
+        try:
+            f.seek(offset)
+            return json.loads(f.read(length))
+        finally:
+            f.close()
+
+    def _writeRecords(self, first, records):
+        # write the given packed records to the in-memory index and to disk,
+        # starting at build number FIRST
+        index = self._loadIndex()
+        pos = first * self.RECORD.size
+        data = "".join(records)
+        if len(index) < pos:
+            index.extend("\0" * (pos - len(index)))
+        index[pos:pos+len(data)] = data
+
+        mode = os.path.exists(self.index_filename) and "r+b" or "wb"
+        f = open(self.index_filename, mode)
+        try:
+            f.seek(pos)
+            f.write(data)
+        finally:
+            f.close()
+
+    def _summarize(self, build):
+        # return the JSON-encoded data record for a build
+        ss = build.getSourceStamp()
+        steps = []
+        for step in build.getSteps():
+            steps.append(dict(name=step.getName(), text=step.getText(),
+                              results=step.getResults()[0],
+                              times=step.getTimes()))
+        data = dict(branch=ss and ss.branch, revision=ss and ss.revision,
+                    slavename=build.getSlavename(),
+                    reason=build.getReason(), text=build.getText(),
+                    steps=steps)
+        try:
+            return json.dumps(data)
+        except UnicodeDecodeError:
+            # strings from a build are not necessarily UTF-8, but latin-1
+            # can represent any byte string
+            return json.dumps(data, encoding='latin-1')
+
+    # public methods
+
+    def addBuild(self, build):
+        """
+        Add the given finished build to the history, replacing any existing
+        summary with the same number.
+
+        @param build: L{buildbot.status.build.BuildStatus} instance
+        """
+        started, finished = build.getTimes()
+        assert finished is not None, "only finished builds can be added"
+        results = build.getResults()
+        if results is None:
+            results = -1
+        data = self._summarize(build)
+
+        f = open(self.data_filename, "ab")
+        try:
+            f.seek(0, 2)
+            offset = f.tell()
+            f.write(data)
+        finally:
+            f.close()
+
+        old = self.getSummary(build.getNumber())
+        self._writeRecords(build.getNumber(), [
+            self.RECORD.pack(self.PRESENT, results, build.getNumber(),
+                             started or 0, finished, offset, len(data)) ])
+
+        if self._byFinish is not None:
+            # copy, rather than modify, the list, so that it does not change
+            # under generateNumbersFinishedBefore
+            byFinish = self._byFinish[:]
+            if old is not None:
+                byFinish.remove((old.finished, old.number))
+            insort(byFinish, (finished, build.getNumber()))
+            self._byFinish = byFinish
+
+    def hasBuild(self, number):
+        return self.getSummary(number) is not None
+
+    def getSummary(self, number):
+        """
+        Get the summary for the given build number.
+
+        @returns: L{BuildSummary} instance, or None if the build is not in the
+        history
+        """
+        index = self._loadIndex()
+        pos = number * self.RECORD.size
+        if number < 0 or pos + self.RECORD.size > len(index):
+            return None
+        (flags, results, num, started, finished,
+         offset, length) = self.RECORD.unpack_from(buffer(index), pos)
+        if not flags & self.PRESENT:
+            return None
+        if results == -1:
+            results = None
+        return BuildSummary(self, num, started, finished, results,
+                            offset, length)
+
+    def getNumbers(self):
+        """Return a sorted list of the build numbers in the history."""
+        index = self._loadIndex()
+        size = self.RECORD.size
+        return [ pos // size for pos in xrange(0, len(index), size)
+                 if index[pos] & self.PRESENT ]
+
+    def generateNumbersFinishedBefore(self, finished_before=None):
+        """
+        Generate the numbers of the builds in the history that finished before
+        the given time (or all of them, if it is None), starting with the most
+        recently finished.  This finds the first build with a bisection of the
+        builds ordered by finish time, rather than by examining each later
+        build.
+        """
+        if self._byFinish is None:
+            index = self._loadIndex()
+            size = self.RECORD.size
+            byFinish = []
+            for pos in xrange(0, len(index), size):
+                if index[pos] & self.PRESENT:
+                    fields = self.RECORD.unpack_from(buffer(index), pos)
+                    byFinish.append((fields[4], fields[2]))
+            byFinish.sort()
+            self._byFinish = byFinish
+
+        byFinish = self._byFinish
+        if finished_before is None:
+            i = len(byFinish)
+        else:
+            i = bisect_left(byFinish, (finished_before,))
+        while i > 0:
+            i -= 1
+            yield byFinish[i][1]
+
+    def prune(self, earliest_build):
+        """
+        Forget all builds numbered below C{earliest_build}, and compact the
+        data file if much of it is no longer used.
+        """
+        index = self._loadIndex()
+        size = self.RECORD.size
+        limit = min(earliest_build * size, len(index))
+        if [ pos for pos in xrange(0, limit, size)
+             if index[pos] & self.PRESENT ]:
+            self._writeRecords(0, [ "\0" * limit ])
+            self._byFinish = None
+
+        # see how much of the data file is still in use
+        live = [ self.getSummary(number) for number in self.getNumbers() ]
+        live_bytes = sum([ s.length for s in live ])
+        try:
+            data_bytes = os.path.getsize(self.data_filename)
+        except OSError:
+            return
+        if live_bytes < data_bytes * self.COMPACT_RATIO:
+            self._compact(live)
+
+    def _compact(self, live):
+        # rewrite the data file to contain only the given summaries, and
+        # rewrite their index records to match
+        tmpfilename = self.data_filename + ".tmp"
+        records = {}
+        src = open(self.data_filename, "rb")
+        dst = open(tmpfilename, "wb")
+        try:
+            for s in live:
+                src.seek(s.offset)
+                data = src.read(s.length)
+                results = s.results
+                if results is None:
+                    results = -1
+                records[s.number] = self.RECORD.pack(self.PRESENT, results,
+                        s.number, s.started, s.finished, dst.tell(), len(data))
+                dst.write(data)
+        finally:
+            src.close()
+            dst.close()
+
+        if runtime.platformType == 'win32':
+            # windows cannot rename a file on top of an existing one
+            os.unlink(self.data_filename)
+        os.rename(tmpfilename, self.data_filename)
+
+        for number, record in records.iteritems():
+            self._writeRecords(number, [ record ])
+
+
+def upgradeBuilderDirectory(basedir, quiet=False):
+    """
+    Add any finished builds pickled in the builder directory C{basedir} that
+    are not already in its L{BuildHistory}.  This is used by
+    C{buildbot upgrade-master}; builds are also added as they are loaded by a
+    running master.
+
+    @returns: number of builds added
+    """
+    history = BuildHistory(basedir)
+    numbers = [ int(f) for f in os.listdir(basedir) if re.match(r"^\d+$", f) ]
+    numbers.sort()
+
+    added = 0
+    for number in numbers:
+        if history.hasBuild(number):
+            continue
+        filename = os.path.join(basedir, "%d" % number)
+        try:
+            f = open(filename, "rb")
+            try:
+                build = load(f)
+            finally:
+                f.close()
+            styles.doUpgrade()
+        except:
+            log.msg("unable to load build pickle %s" % filename)
+            log.err()
+            continue
+        if not build.isFinished():
+            continue
+        history.addBuild(build)
+        added += 1
+    if added and not quiet:
+        print "indexed %d builds in %s" % (added, basedir)
+    return added
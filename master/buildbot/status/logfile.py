@@ -13,17 +13,16 @@
 #
 # Copyright Buildbot Team Members
 
-import os
-from cStringIO import StringIO
-from bz2 import BZ2File
-from gzip import GzipFile
+import os, struct, zlib
+from bz2 import BZ2Compressor, BZ2Decompressor
 
 from zope.interface import implements
 from twisted.python import log, runtime
-from twisted.internet import defer, threads, reactor
+from twisted.internet import defer, reactor
 from buildbot.util import netstrings
 from buildbot.util.eventual import eventually
 from buildbot import interfaces
+from buildbot.status.compression import compressionPool
 
 STDOUT = interfaces.LOG_CHANNEL_STDOUT
 STDERR = interfaces.LOG_CHANNEL_STDERR
@@ -41,6 +40,196 @@ class LogFileScanner(netstrings.NetstringParser):
         if not self.channels or (channel in self.channels):
             self.chunk_cb((channel, line[1:]))
 
+def _trimChunks(chunks, textpos, start, end, channels, onlyText):
+    # filter the given (channel, text) chunks, which begin at position
+    # TEXTPOS of the stdout and stderr text, to the text between START and END
+    for channel, text in chunks:
+        if end is not None and textpos >= end:
+            return
+        if channel in (STDOUT, STDERR):
+            chunkpos = textpos
+            textpos += len(text)
+            if textpos <= start:
+                continue
+            if chunkpos < start or (end is not None and textpos > end):
+                if end is None:
+                    text = text[start-chunkpos:]
+                else:
+                    text = text[max(0, start-chunkpos):end-chunkpos]
+        elif textpos < start:
+            continue
+        if channels and channel not in channels:
+            continue
+        if onlyText:
+            yield text
+        else:
+            yield (channel, text)
+
+def _newCompressor(method):
+    # each compressed block of a log is a complete bz2 or gzip stream
+    if method == "bz2":
+        return BZ2Compressor()
+    return zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+class LogFileIndex:
+    """
+    I am the index of a logfile, stored beside it with an C{.idx} suffix.  I
+    have a fixed-size record for each chunk in the logfile, giving
+
+     - the offset of the chunk in the (uncompressed) logfile;
+     - the position of the chunk in the stdout and stderr text of the log
+       (that is, the text returned by L{LogFile.getText}), and the number of
+       newlines in that text before the chunk;
+     - for a compressed logfile, the offset in the compressed file of the
+       block containing the chunk, and the uncompressed offset at which that
+       block begins; and
+     - the length and channel of the chunk.
+
+    Records are read from disk as needed, so finding a chunk takes a few
+    seeks, no matter how large the log is.
+    """
+
+    RECORD = struct.Struct("<QQQQQIB3x")
+    POS, TEXTPOS, LINES, BLOCK_OFFSET, BLOCK_POS, SIZE, CHANNEL = range(7)
+
+    def __init__(self, f):
+        self.f = f
+        f.seek(0, 2)
+        self.count = f.tell() // self.RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("no such index record")
+        self.f.seek(i * self.RECORD.size)
+        return self.RECORD.unpack(self.f.read(self.RECORD.size))
+
+    def find(self, field, value):
+        """
+        Find the last record for which C{field} is no larger than C{value}.
+        All fields but C{SIZE} and C{CHANNEL} increase monotonically.
+
+        @returns: record tuple, or None
+        """
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self[mid][field] > value:
+                hi = mid
+            else:
+                lo = mid + 1
+        if lo == 0:
+            return None
+        return self[lo-1]
+
+class CompressedLogReader:
+    """
+    A read-only file-like object for a compressed logfile, which may be made
+    up of several independently compressed blocks (see
+    L{LogFile.compressLog}).  If the logfile has an index, seeking begins
+    decompressing at the block containing the new position, rather than at
+    the beginning of the file.
+    """
+
+    BUFFERSIZE = 64*1024
+
+    def __init__(self, filename, method, getIndex=None, flush=None):
+        self.raw = open(filename, "rb")
+        self.method = method
+        self.getIndex = getIndex
+        self.flush = flush
+        self._restart(0, 0)
+
+    def _newDecompressor(self):
+        if self.method == "bz2":
+            return BZ2Decompressor()
+        return zlib.decompressobj(16 + zlib.MAX_WBITS) # gzip format
+
+    def _restart(self, block_offset, block_pos):
+        self.raw.seek(block_offset)
+        self.decompressor = self._newDecompressor()
+        self.buffer = ""
+        self.bufpos = 0
+        self.pos = block_pos
+
+    def _fill(self):
+        # decompress more data into the buffer; returns False at EOF
+        if self.flush:
+            # the log is still being written, so make sure everything it
+            # holds is in the file, and clear any end-of-file condition
+            self.flush()
+            self.raw.seek(0, 1)
+        data = self.raw.read(self.BUFFERSIZE)
+        if not data:
+            return False
+        output = [ self.buffer[self.bufpos:] ]
+        while data:
+            try:
+                output.append(self.decompressor.decompress(data))
+            except EOFError:
+                # bz2 complains about data after the end of a block
+                unused = data
+            else:
+                unused = self.decompressor.unused_data
+            if unused:
+                # the block ended, and another begins
+                self.decompressor = self._newDecompressor()
+            data = unused
+        self.buffer = "".join(output)
+        self.bufpos = 0
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) - self.bufpos < size:
+            if not self._fill():
+                break
+        if size < 0:
+            size = len(self.buffer) - self.bufpos
+        data = self.buffer[self.bufpos:self.bufpos+size]
+        self.bufpos += len(data)
+        self.pos += len(data)
+        return data
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos, whence=0):
+        if whence == 1:
+            pos += self.pos
+        elif whence != 0:
+            raise IOError("cannot seek relative to the end of a compressed log")
+
+        if pos < self.pos or pos > self.pos + len(self.buffer) - self.bufpos:
+            record = None
+            if self.getIndex:
+                index = self.getIndex()
+                if index:
+                    record = index.find(LogFileIndex.POS, pos)
+            if record and (pos < self.pos or
+                           record[LogFileIndex.BLOCK_POS] > self.pos):
+                self._restart(record[LogFileIndex.BLOCK_OFFSET],
+                              record[LogFileIndex.BLOCK_POS])
+            elif pos < self.pos:
+                self._restart(0, 0)
+
+        # read forward to the requested position
+        while self.pos < pos:
+            avail = len(self.buffer) - self.bufpos
+            if not avail:
+                if not self._fill():
+                    break
+                continue
+            skip = min(avail, pos - self.pos)
+            self.bufpos += skip
+            self.pos += skip
+
+    def close(self):
+        self.raw.close()
+
 class LogFileProducer:
     """What's the plan?
 
@@ -79,15 +268,24 @@ class LogFileProducer:
     subscribed = False
     BUFFERSIZE = 2048
 
-    def __init__(self, logfile, consumer):
+    def __init__(self, logfile, consumer, start=0, end=None):
         self.logfile = logfile
         self.consumer = consumer
+        self.start = start
+        self.end = end
         self.chunkGenerator = self.getChunks()
         consumer.registerProducer(self, True)
 
     def getChunks(self):
+        if not self.start and self.end is None:
+            return self._getChunks(0)
+        offset, textpos, lines = self.logfile._locate(LogFileIndex.TEXTPOS,
+                                                      self.start)
+        return _trimChunks(self._getChunks(offset), textpos,
+                           self.start, self.end, [], False)
+
+    def _getChunks(self, offset):
         f = self.logfile.getFile()
-        offset = 0
         chunks = []
         p = LogFileScanner(chunks.append)
         f.seek(offset)
@@ -160,6 +358,9 @@ class LogFileProducer:
         except StopIteration:
             # if the generator finished, it will have done releaseFile
             self.chunkGenerator = None
+            if self.end is not None:
+                # a range of a finished log is done as soon as it is read
+                self.logfileFinished(self.logfile)
         # now everything goes through the subscription, and they don't get to
         # pause anymore
 
@@ -184,6 +385,10 @@ class LogFile:
 
     @ivar length: length of the data in the logfile (sum of chunk sizes; not
     the length of the on-disk encoding)
+
+    As chunks are written, they are also recorded in an index (see
+    L{LogFileIndex}), so that parts of a large log can be read without reading
+    all of it.
     """
 
     implements(interfaces.IStatusLog, interfaces.ILogFile)
@@ -202,9 +407,26 @@ class LogFile:
     runEntries = [] # provided so old pickled builds will getChunks() ok
     entries = None
     BUFFERSIZE = 2048
+    # lines longer than this are split by iterLines
+    MAX_LINE_LENGTH = 64*1024
     filename = None # relative to the Builder's basedir
     openfile = None
+    indexfile = None
+    indexTextPos = 0
+    indexLines = 0
     compressMethod = "bz2"
+    compressBlockSize = 512*1024
+    # if not None, the log is compressed as it is written once it is larger
+    # than this many bytes
+    streamCompressionLimit = None
+    writtenCompressed = False
+    streamfile = None
+    compressor = None
+    streamPos = 0 # uncompressed bytes written to streamfile
+    streamDirty = False
+    blockOffset = 0
+    blockPos = 0
+    compressionPool = compressionPool
 
     def __init__(self, parent, name, logfilename):
         """
@@ -229,6 +451,7 @@ class LogFile:
         if not os.path.exists(dirname):
             os.makedirs(dirname)
         self.openfile = open(fn, "w+")
+        self.indexfile = open(fn + ".idx", "wb")
         self.runEntries = []
         self.watchers = []
         self.finishedWatchers = []
@@ -306,18 +529,40 @@ class LogFile:
             # this is the filehandle we're using to write to the log, so
             # don't close it!
             return self.openfile
+        if self.streamfile:
+            # the log is being written compressed; the reader flushes the
+            # compressor whenever it needs more data
+            return CompressedLogReader(
+                    self.getFilename() + "." + self.compressMethod,
+                    self.compressMethod, self.getIndex, self._flushStream)
         # otherwise they get their own read-only handle
         # try a compressed log first
         try:
-            return BZ2File(self.getFilename() + ".bz2", "r")
+            return CompressedLogReader(self.getFilename() + ".bz2", "bz2",
+                                       self.getIndex)
         except IOError:
             pass
         try:
-            return GzipFile(self.getFilename() + ".gz", "r")
+            return CompressedLogReader(self.getFilename() + ".gz", "gz",
+                                       self.getIndex)
         except IOError:
             pass
         return open(self.getFilename(), "r")
 
+    def getIndex(self):
+        """
+        Get the index of this log's chunks.  Logs written by older versions of
+        Buildbot do not have an index.
+
+        @returns: L{LogFileIndex} instance, or None
+        """
+        if self.indexfile:
+            self.indexfile.flush()
+        try:
+            return LogFileIndex(open(self.getFilename() + ".idx", "rb"))
+        except IOError:
+            return None
+
     def getText(self):
         # this produces one ginormous string
         return "".join(self.getChunks([STDOUT, STDERR], onlyText=True))
@@ -341,8 +586,7 @@ class LogFile:
         f = self.getFile()
         if not self.finished:
             offset = 0
-            f.seek(0, 2)
-            remaining = f.tell()
+            remaining = self._getWrittenLength(f)
         else:
             offset = 0
             remaining = None
@@ -393,15 +637,141 @@ class LogFile:
             else:
                 yield leftover
 
+    def _getWrittenLength(self, f):
+        # the length of the (uncompressed) log written so far
+        if self.streamfile:
+            return self.streamPos
+        f.seek(0, 2)
+        return f.tell()
+
+    def _locate(self, field, value=None):
+        # find the (file offset, text position, newlines) of the last indexed
+        # chunk for which FIELD is no larger than VALUE, or of the last chunk
+        # if VALUE is None.  Without an index, this is the start of the log.
+        index = self.getIndex()
+        record = None
+        if index:
+            if value is None:
+                record = index[-1]
+            else:
+                record = index.find(field, value)
+        if record is None:
+            return (0, 0, 0)
+        return (record[LogFileIndex.POS], record[LogFileIndex.TEXTPOS],
+                record[LogFileIndex.LINES])
+
+    def _getChunksAt(self, offset):
+        # like getChunks, but start reading at the given file offset, which
+        # must be the beginning of a chunk
+        f = self.getFile()
+        if not self.finished:
+            remaining = self._getWrittenLength(f) - offset
+        else:
+            remaining = None
+
+        leftover = None
+        if self.runEntries:
+            leftover = (self.runEntries[0][0],
+                        "".join([c[1] for c in self.runEntries]))
+        return self._generateChunks(f, offset, remaining, leftover, [], False)
+
+    def getChunksFrom(self, start, end=None, channels=[], onlyText=False):
+        """
+        Like L{getChunks}, but only generate the chunks between positions
+        C{start} and C{end} of the log's stdout and stderr text (the text
+        returned by L{getText}), trimming the first and last chunks to fit.
+        Header chunks do not count toward these positions, but those within
+        the range are included.  If the log has an index, only the requested
+        part of the log is read.
+
+        @param start: position of the first character
+        @param end: position after the last character, or None for the end of
+        the log
+        """
+        offset, textpos, lines = self._locate(LogFileIndex.TEXTPOS, start)
+        return _trimChunks(self._getChunksAt(offset), textpos, start, end,
+                           channels, onlyText)
+
+    def getTextLength(self):
+        """
+        Return the length of the log's stdout and stderr text (the text
+        returned by L{getText}).
+        """
+        offset, textpos, lines = self._locate(LogFileIndex.POS)
+        for channel, text in self._getChunksAt(offset):
+            if channel in (STDOUT, STDERR):
+                textpos += len(text)
+        return textpos
+
+    def getTailOffset(self, numLines):
+        """
+        Return the position in the log's stdout and stderr text at which its
+        last C{numLines} lines begin, suitable for L{getChunksFrom}.  A final
+        line without a trailing newline counts as a line.
+        """
+        # count the lines in the log, starting from its last indexed chunk
+        offset, textpos, lines = self._locate(LogFileIndex.POS)
+        lasttext = ""
+        for channel, text in self._getChunksAt(offset):
+            if channel in (STDOUT, STDERR) and text:
+                lines += text.count("\n")
+                lasttext = text
+        if lasttext and not lasttext.endswith("\n"):
+            lines += 1
+
+        # then find the end of the last line that is *not* wanted
+        skip = lines - numLines
+        if skip <= 0:
+            return 0
+        offset, textpos, lines = self._locate(LogFileIndex.LINES, skip - 1)
+        for channel, text in self._getChunksAt(offset):
+            if channel not in (STDOUT, STDERR):
+                continue
+            count = text.count("\n")
+            if lines + count >= skip:
+                i = -1
+                for _ in xrange(skip - lines):
+                    i = text.index("\n", i + 1)
+                return textpos + i + 1
+            lines += count
+            textpos += len(text)
+        return textpos
+
+    def iterLines(self, channels=[STDOUT, STDERR]):
+        """
+        Generate the newline-terminated lines of the text in the given
+        channels, as it would be joined by L{getText}.  The log is read a
+        chunk at a time, and no more than one partial line is held in memory;
+        lines longer than C{MAX_LINE_LENGTH} are generated in pieces.  The
+        last line lacks a newline if the log does not end with one.
+
+        @param channels: channels to read, or an empty list for all channels
+        including headers
+        """
+        maxlen = self.MAX_LINE_LENGTH
+        partial = ""
+        for text in self.getChunks(channels, onlyText=True):
+            if partial:
+                text = partial + text
+            start = 0
+            while 1:
+                end = text.find("\n", start, start + maxlen)
+                if end != -1:
+                    yield text[start:end+1]
+                    start = end + 1
+                elif len(text) - start >= maxlen:
+                    yield text[start:start+maxlen]
+                    start += maxlen
+                else:
+                    break
+            partial = text[start:]
+        if partial:
+            yield partial
+
     def readlines(self, channel=STDOUT):
         """Return an iterator that produces newline-terminated lines,
         excluding header chunks."""
-        # TODO: make this memory-efficient, by turning it into a generator
-        # that retrieves chunks as necessary, like a pull-driven version of
-        # twisted.protocols.basic.LineReceiver
-        alltext = "".join(self.getChunks([channel], onlyText=True))
-        io = StringIO(alltext)
-        return io.readlines()
+        return self.iterLines([channel])
 
     def subscribe(self, receiver, catchup):
         if self.finished:
@@ -417,8 +787,8 @@ class LogFile:
         if receiver in self.watchers:
             self.watchers.remove(receiver)
 
-    def subscribeConsumer(self, consumer):
-        p = LogFileProducer(self, consumer)
+    def subscribeConsumer(self, consumer, start=0, end=None):
+        p = LogFileProducer(self, consumer, start, end)
         p.resumeProducing()
 
     # interface used by the build steps to add things to the log
@@ -429,20 +799,113 @@ class LogFile:
         if not self.runEntries:
             return
         channel = self.runEntries[0][0]
-        text = "".join([c[1] for c in self.runEntries])
+        if len(self.runEntries) == 1:
+            text = self.runEntries[0][1]
+        else:
+            text = "".join([c[1] for c in self.runEntries])
         assert channel < 10, "channel number must be a single decimal digit"
-        f = self.openfile
-        f.seek(0, 2)
+        if self.openfile and self.streamCompressionLimit is not None and \
+                self.compressMethod in ("bz2", "gz"):
+            self.openfile.seek(0, 2)
+            if self.openfile.tell() + len(text) > self.streamCompressionLimit:
+                self._startStream()
+
+        # the text is split into netstring frames of at most chunkSize bytes.
+        # The body of each frame is a buffer() onto the text rather than a
+        # copy of it, and the frames of the whole run are written at once.
+        frames = []
+        if self.streamfile:
+            pos = self.streamPos
+        else:
+            f = self.openfile
+            f.seek(0, 2)
+            pos = f.tell()
         offset = 0
         while offset < len(text):
             size = min(len(text)-offset, self.chunkSize)
-            f.write("%d:%d" % (1 + size, channel))
-            f.write(text[offset:offset+size])
-            f.write(",")
+            if size == len(text):
+                chunk = text
+            else:
+                chunk = buffer(text, offset, size)
+            header = "%d:%d" % (1 + size, channel)
+            if self.streamfile:
+                if pos - self.blockPos >= self.compressBlockSize:
+                    self._writeStream(frames, pos)
+                    frames = []
+                    self._endBlock()
+            self._indexChunk(pos, channel, text, offset, size)
+            frames.extend((header, chunk, ","))
+            pos += len(header) + size + 1
             offset += size
+        if self.streamfile:
+            self._writeStream(frames, pos)
+        else:
+            f.writelines(frames)
         self.runEntries = []
         self.runLength = 0
 
+    def _writeStream(self, frames, pos):
+        compress = self.compressor.compress
+        self.streamfile.write("".join([compress(d) for d in frames]))
+        self.streamPos = pos
+        self.streamDirty = True
+
+    def _startStream(self):
+        # switch to writing the log compressed, beginning with what has been
+        # written so far, and remove the uncompressed file
+        filename = self.getFilename()
+        self.streamfile = open(filename + "." + self.compressMethod, "wb")
+        self.compressor = _newCompressor(self.compressMethod)
+        self.blockOffset = self.blockPos = 0
+        f = self.openfile
+        f.seek(0)
+        while 1:
+            data = f.read(1024*1024)
+            if not data:
+                break
+            self.streamfile.write(self.compressor.compress(data))
+        self.streamPos = f.tell()
+        self.streamDirty = True
+        # readers may still be using the old file handle, so don't close it
+        self.openfile = None
+        self.writtenCompressed = True
+        _tryremove(filename, 1, 5)
+
+    def _endBlock(self):
+        # finish the current compressed block; the next chunk will begin
+        # another, so that readers can start decompressing there
+        self.streamfile.write(self.compressor.flush())
+        self.streamfile.flush()
+        self.blockOffset = self.streamfile.tell()
+        self.blockPos = self.streamPos
+        self.compressor = _newCompressor(self.compressMethod)
+        self.streamDirty = False
+
+    def _flushStream(self):
+        # make everything written so far readable from the compressed file
+        if not self.streamfile or not self.streamDirty:
+            return
+        if self.compressMethod == "gz":
+            self.streamfile.write(self.compressor.flush(zlib.Z_SYNC_FLUSH))
+            self.streamfile.flush()
+            self.streamDirty = False
+        else:
+            # a bz2 stream cannot be flushed without ending it
+            self._endBlock()
+
+    def _indexChunk(self, offset, channel, text, start=0, size=None):
+        # index the chunk text[start:start+size], without copying it
+        if not self.indexfile:
+            return
+        if size is None:
+            size = len(text) - start
+        self.indexfile.write(LogFileIndex.RECORD.pack(offset,
+                    self.indexTextPos, self.indexLines, self.blockOffset,
+                    self.blockPos, size, channel))
+        if channel in (STDOUT, STDERR):
+            self.indexTextPos += size
+            self.indexLines += text.count("\n", start, start + size)
+
     def addEntry(self, channel, text, _no_watchers=False):
         """
         Add an entry to the logfile.  The C{channel} is one of L{STDOUT},
@@ -559,6 +1022,14 @@ class LogFile:
             # filehandle will be released and automatically closed.
             self.openfile.flush()
             self.openfile = None
+        if self.streamfile:
+            self.streamfile.write(self.compressor.flush())
+            self.streamfile.close()
+            self.streamfile = None
+            self.compressor = None
+        if self.indexfile:
+            self.indexfile.close()
+            self.indexfile = None
         self.finished = True
         watchers = self.finishedWatchers
         self.finishedWatchers = []
@@ -568,7 +1039,10 @@ class LogFile:
 
 
     def compressLog(self):
-        # bail out if there's no compression support
+        # bail out if there's no compression support, or if the log was
+        # already compressed as it was written
+        if self.writtenCompressed:
+            return defer.succeed(None)
         if self.compressMethod == "bz2":
             compressed = self.getFilename() + ".bz2.tmp"
         elif self.compressMethod == "gz":
@@ -576,20 +1050,62 @@ class LogFile:
         else:
             return defer.succeed(None)
 
+        indexfile = self.getFilename() + ".idx"
+        compressed_index = indexfile + ".tmp"
+
         def _compressLog():
+            # the log is compressed in independent blocks, each beginning
+            # with a chunk, so that a reader can use the index to begin
+            # decompressing near the part of the log it wants
+            index = self.getIndex()
+            records = []
+            if index:
+                records = [ index[i] for i in xrange(len(index)) ]
+
+            starts = [ 0 ]
+            for record in records:
+                if record[LogFileIndex.POS] - starts[-1] >= \
+                        self.compressBlockSize:
+                    starts.append(record[LogFileIndex.POS])
+
             infile = self.getFile()
-            if self.compressMethod == "bz2":
-                cf = BZ2File(compressed, 'w')
-            elif self.compressMethod == "gz":
-                cf = GzipFile(compressed, 'w')
+            cf = open(compressed, 'wb')
+            offsets = []
             bufsize = 1024*1024
-            while True:
-                buf = infile.read(bufsize)
-                cf.write(buf)
-                if len(buf) < bufsize:
-                    break
+            for i, start in enumerate(starts):
+                if i + 1 < len(starts):
+                    remaining = starts[i+1] - start
+                else:
+                    remaining = None
+                offsets.append(cf.tell())
+                compressor = _newCompressor(self.compressMethod)
+                while remaining is None or remaining > 0:
+                    if remaining is None:
+                        buf = infile.read(bufsize)
+                    else:
+                        buf = infile.read(min(remaining, bufsize))
+                        remaining -= len(buf)
+                    if not buf:
+                        break
+                    cf.write(compressor.compress(buf))
+                cf.write(compressor.flush())
             cf.close()
-        d = threads.deferToThread(_compressLog)
+
+            if records:
+                # record the block containing each chunk in the index
+                f = open(compressed_index, 'wb')
+                block = 0
+                for record in records:
+                    while block + 1 < len(starts) and \
+                            starts[block+1] <= record[LogFileIndex.POS]:
+                        block += 1
+                    record = list(record)
+                    record[LogFileIndex.BLOCK_OFFSET] = offsets[block]
+                    record[LogFileIndex.BLOCK_POS] = starts[block]
+                    f.write(LogFileIndex.RECORD.pack(*record))
+                f.close()
+        d = self.compressionPool.compress(self.getFilename(),
+                os.path.getsize(self.getFilename()), _compressLog)
 
         def _renameCompressedLog(rv):
             if self.compressMethod == "bz2":
@@ -604,13 +1120,20 @@ class LogFile:
                 if os.path.exists(filename):
                     os.unlink(filename)
             os.rename(compressed, filename)
+            # until the new index is in place, readers will find the old one,
+            # which treats the whole log as a single block
+            if os.path.exists(compressed_index):
+                if runtime.platformType  == 'win32':
+                    os.unlink(indexfile)
+                os.rename(compressed_index, indexfile)
             _tryremove(self.getFilename(), 1, 5)
         d.addCallback(_renameCompressedLog)
 
         def _cleanupFailedCompress(failure):
             log.msg("failed to compress %s" % self.getFilename())
-            if os.path.exists(compressed):
-                _tryremove(compressed, 1, 5)
+            for filename in compressed, compressed_index:
+                if os.path.exists(filename):
+                    _tryremove(filename, 1, 5)
             failure.trap() # reraise the failure
         d.addErrback(_cleanupFailedCompress)
         return d
@@ -627,6 +1150,9 @@ class LogFile:
             del d['finished']
         if d.has_key('openfile'):
             del d['openfile']
+        d.pop('indexfile', None)
+        d.pop('streamfile', None)
+        d.pop('compressor', None)
         return d
 
     def __setstate__(self, d):
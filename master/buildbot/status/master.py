@@ -13,7 +13,7 @@
 #
 # Copyright Buildbot Team Members
 
-import os, urllib
+import os, urllib, heapq
 from cPickle import load
 from twisted.python import log
 from twisted.persisted import styles
@@ -40,6 +40,7 @@ class Status:
         # compress logs bigger than 4k, a good default on linux
         self.logCompressionLimit = 4*1024
         self.logCompressionMethod = "bz2"
+        self.logCompressionStreaming = False
         # No default limit to the log size
         self.logMaxSize = None
         self.logMaxTailSize = None
@@ -194,53 +195,36 @@ class Status:
                          for bn in self.getBuilderNames()
                          if want_builder(bn)]
 
-        # 'sources' is a list of generators, one for each Builder we're
-        # using. When the generator is exhausted, it is replaced in this list
-        # with None.
-        sources = []
-        for bn in builder_names:
+        # 'heap' holds the next build from each Builder we're using, keyed so
+        # that the most recently finished build comes first, along with the
+        # generator that produced it.  When a generator is exhausted, it
+        # drops out of the heap.
+        heap = []
+        def push(i, g):
+            try:
+                build = g.next()
+            except StopIteration:
+                return
+            heapq.heappush(heap, (-build.getTimes()[1], i, build, g))
+
+        for i, bn in enumerate(builder_names):
             b = self.getBuilder(bn)
             g = b.generateFinishedBuilds(branches,
                                          finished_before=finished_before,
                                          max_search=max_search)
-            sources.append(g)
-
-        # next_build the next build from each source
-        next_build = [None] * len(sources)
-
-        def refill():
-            for i,g in enumerate(sources):
-                if next_build[i]:
-                    # already filled
-                    continue
-                if not g:
-                    # already exhausted
-                    continue
-                try:
-                    next_build[i] = g.next()
-                except StopIteration:
-                    next_build[i] = None
-                    sources[i] = None
+            push(i, g)
 
         got = 0
-        while True:
-            refill()
-            # find the latest build among all the candidates
-            candidates = [(i, b, b.getTimes()[1])
-                          for i,b in enumerate(next_build)
-                          if b is not None]
-            candidates.sort(lambda x,y: cmp(x[2], y[2]))
-            if not candidates:
-                return
-
-            # and remove it from the list
-            i, build, finshed_time = candidates[-1]
-            next_build[i] = None
+        while heap:
+            # take the latest build among all the candidates, and replace it
+            # with the next build from the same Builder
+            finished, i, build, g = heapq.heappop(heap)
             got += 1
             yield build
             if num_builds is not None:
                 if got >= num_builds:
                     return
+            push(i, g)
 
     def subscribe(self, target):
         self.watchers.append(target)
@@ -294,6 +278,9 @@ class Status:
         builder_status.basedir = os.path.join(self.basedir, basedir)
         builder_status.name = name # it might have been updated
         builder_status.status = self
+        builder_status.setBuildCache(self.master.caches.get_sized_cache(
+                "Builds", builder.estimateBuildSize,
+                builder.DEFAULT_BUILD_CACHE_SIZE))
 
         if not os.path.isdir(builder_status.basedir):
             os.makedirs(builder_status.basedir)
@@ -302,6 +289,7 @@ class Status:
         builder_status.setBigState("offline")
         builder_status.setLogCompressionLimit(self.logCompressionLimit)
         builder_status.setLogCompressionMethod(self.logCompressionMethod)
+        builder_status.setLogCompressionStreaming(self.logCompressionStreaming)
         builder_status.setLogMaxSize(self.logMaxSize)
         builder_status.setLogMaxTailSize(self.logMaxTailSize)
 
@@ -398,8 +386,15 @@ class Status:
     def _buildsetCompletionCallback(self, bsid, result):
         self._maybeBuildsetFinished(bsid)
 
+    def buildRequestsChanged(self, buildername):
+        """The pending build requests for the given builder have changed."""
+        bldr = self.botmaster.builders.get(buildername)
+        if bldr is not None:
+            bldr.builder_status.bumpGeneration()
+
     def _buildRequestCallback(self, notif):
         buildername = notif['buildername']
+        self.buildRequestsChanged(buildername)
         if buildername in self._builder_observers:
             brs = buildrequest.BuildRequestStatus(buildername,
                                                 notif['brid'], self)
@@ -27,6 +27,8 @@ class SlaveStatus:
     version = None
     connected = False
     graceful_shutdown = False
+    # counts the changes to this slave's status
+    generation = 0
 
     def __init__(self, name):
         self.name = name
@@ -55,16 +57,25 @@ class SlaveStatus:
         then = time.time() - 3600
         return len([ t for t in self.connect_times if t > then ])
 
+    def bumpGeneration(self):
+        """Note that this slave's status has changed."""
+        self.generation += 1
+
     def setAdmin(self, admin):
         self.admin = admin
+        self.bumpGeneration()
     def setHost(self, host):
         self.host = host
+        self.bumpGeneration()
     def setAccessURI(self, access_uri):
         self.access_uri = access_uri
+        self.bumpGeneration()
     def setVersion(self, version):
         self.version = version
+        self.bumpGeneration()
     def setConnected(self, isConnected):
         self.connected = isConnected
+        self.bumpGeneration()
     def setLastMessageReceived(self, when):
         self._lastMessageReceived = when
 
@@ -75,8 +86,10 @@ class SlaveStatus:
 
     def buildStarted(self, build):
         self.runningBuilds.append(build)
+        self.bumpGeneration()
     def buildFinished(self, build):
         self.runningBuilds.remove(build)
+        self.bumpGeneration()
 
     def getGraceful(self):
         """Return the graceful shutdown flag"""
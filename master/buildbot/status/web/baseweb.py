@@ -37,6 +37,7 @@ from buildbot.status.web.builder import BuildersResource
 from buildbot.status.web.buildstatus import BuildStatusStatusResource
 from buildbot.status.web.slaves import BuildSlavesResource
 from buildbot.status.web.status_json import JsonStatusResource
+from buildbot.status.web.events import EventsResource
 from buildbot.status.web.about import AboutBuildbot
 from buildbot.status.web.authz import Authz
 from buildbot.status.web.auth import AuthFailResource
@@ -90,6 +91,8 @@ class WebStatus(service.MultiService):
      /one_line_per_build : summarize the last few builds, one line each
      /one_line_per_build/BUILDERNAME : same, but only for a single builder
      /about : describe this buildmaster (Buildbot and support library versions)
+     /events : status events as they happen, as server-sent events or, with
+               mode=poll, as long-polled JSON batches
      /change_hook[/DIALECT] : accepts changes from external sources, optionally
                               choosing the dialect that will be permitted
                               (i.e. github format, etc..)
@@ -355,6 +358,7 @@ class WebStatus(service.MultiService):
                       OneLinePerBuild(numbuilds=numbuilds))
         self.putChild("about", AboutBuildbot())
         self.putChild("authfail", AuthFailResource())
+        self.putChild("events", EventsResource())
 
 
     def __repr__(self):
@@ -471,6 +475,10 @@ class WebStatus(service.MultiService):
                 log.msg("WebStatus.stopService: error while disconnecting"
                         " leftover clients")
                 log.err()
+        # stop the pages that keep models of the status up to date
+        for child in self.childrenToBeAdded.values():
+            if hasattr(child, 'stopModel'):
+                child.stopModel()
         return service.MultiService.stopService(self)
 
     def getStatus(self):
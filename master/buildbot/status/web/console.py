@@ -20,6 +20,7 @@ import urllib
 from twisted.internet import defer
 from buildbot import util
 from buildbot.status import builder
+from buildbot.status.base import StatusReceiver
 from buildbot.status.web.base import HtmlResource
 from buildbot.changes import changes
 
@@ -88,6 +89,256 @@ class DevBuild:
         self.source = build.getSourceStamp()
 
 
+class ConsoleModel(StatusReceiver):
+    """
+    The console's matrix of revisions and builders.  This holds a L{DevBuild}
+    for each recent build of each builder, kept up to date from status
+    events, and the cells of the matrix computed from them: for each
+    revision shown, the first build of each builder that included it and the
+    build before that.  A cell is computed once and reused until its
+    builder's builds change, so a request costs about one lookup per cell
+    shown, and does not load builds or logs that were already seen.
+
+    The failure details of each build are taken when the build is held here,
+    and builds that are still running are refreshed on each request, so that
+    their results and ETAs stay current.
+    """
+
+    # the most builds held for each builder; pages asking for more builds
+    # are limited to this many
+    MAX_BUILDS = 200
+    # the most revisions whose cells are kept
+    MAX_REVISIONS = 200
+
+    def __init__(self, status, comparator):
+        self.status = status
+        self.comparator = comparator
+        self.builderStatuses = {}
+        self.builds = {}  # {builderName: {number: DevBuild, or None}}
+        self.oldest = {}  # {builderName: oldest build number looked at}
+        self.running = {} # {builderName: {number: BuildStatus}}
+        self.order = {} # {builderName: [DevBuild, newest first]}
+        self.lastResults = {} # {builderName: results of last finished build}
+        self.matrix = {} # {revision key: {builderName: (number, number)}}
+        status.subscribe(self)
+
+    def stop(self):
+        self.status.unsubscribe(self)
+        for builderStatus in self.builderStatuses.values():
+            builderStatus.unsubscribe(self)
+        self.builderStatuses = {}
+        self.builds = {}
+        self.oldest = {}
+        self.running = {}
+        self.order = {}
+        self.lastResults = {}
+        self.matrix = {}
+
+    # building the matrix
+
+    def getBuildDetails(self, builderName, build):
+        """Returns a list of failures for a given build.  The logs are given
+        by their path relative to the root of the web status."""
+        details = {}
+        if not build.getLogs():
+            return details
+
+        for step in build.getSteps():
+            (result, reason) = step.getResults()
+            if result == builder.FAILURE:
+                name = step.getName()
+
+                # Remove html tags from the error text.
+                stripHtml = re.compile(r'<.*?>')
+                strippedDetails = stripHtml.sub('', ' '.join(step.getText()))
+
+                details['buildername'] = builderName
+                details['status'] = strippedDetails
+                details['reason'] = reason
+                logs = details['logs'] = []
+
+                if step.getLogs():
+                    for log in step.getLogs():
+                        logname = log.getName()
+                        logpath = "builders/%s/builds/%s/steps/%s/logs/%s" % \
+                            (urllib.quote(builderName),
+                             build.getNumber(),
+                             urllib.quote(name),
+                             urllib.quote(logname))
+                        logs.append(dict(path=logpath, name=logname))
+        return details
+
+    def makeDevBuild(self, builderName, build):
+        """Return the L{DevBuild} for this build, or None if the build has no
+        usable revision."""
+        # Get the last revision in this build.
+        # We first try "got_revision", but if it does not work, then
+        # we try "revision".
+        got_rev = build.getProperty("got_revision",
+                                    build.getProperty("revision", -1))
+        if got_rev != -1 and not self.comparator.isValidRevision(got_rev):
+            got_rev = -1
+
+        # We ignore all builds that don't have last revisions.
+        # TODO(nsylvain): If the build is over, maybe it was a problem
+        # with the update source step. We need to find a way to tell the
+        # user that his change might have broken the source update.
+        if got_rev == -1:
+            return None
+        return DevBuild(got_rev, build,
+                        self.getBuildDetails(builderName, build))
+
+    def loadBuilds(self, builderStatus, lastRevision, numBuilds, debugInfo):
+        """Make sure the builds needed to show the given builder as far back
+        as lastRevision are held, looking at no more than numBuilds builds
+        back from the most recent one."""
+        name = builderStatus.getName()
+        self.refreshRunning(name)
+
+        if self.getCell(name, lastRevision)[1] is not None:
+            # the first build without lastRevision is already held
+            return
+
+        limit = max(0, builderStatus.nextBuildNumber -
+                       min(numBuilds, self.MAX_BUILDS))
+        oldest = self.oldest.get(name, builderStatus.nextBuildNumber)
+        while oldest > limit:
+            oldest -= 1
+            debugInfo["builds_scanned"] += 1
+            build = builderStatus.getBuild(oldest)
+            if build is None:
+                continue
+            devBuild = self._updateBuild(name, build)
+            if devBuild and \
+                    self.comparator.isRevisionEarlier(devBuild, lastRevision):
+                break
+        self.oldest[name] = oldest
+
+    def refreshRunning(self, builderName):
+        """Take the current state of the builds still running."""
+        for build in self.running.get(builderName, {}).values():
+            self._updateBuild(builderName, build)
+
+    def getBuilds(self, builderName):
+        """Return the L{DevBuild}s held for this builder, newest first."""
+        order = self.order.get(builderName)
+        if order is None:
+            builds = self.builds.get(builderName, {})
+            numbers = [ n for n in builds if builds[n] is not None ]
+            numbers.sort(reverse=True)
+            order = self.order[builderName] = [ builds[n] for n in numbers ]
+        return order
+
+    def getCell(self, builderName, revision):
+        """Return the first build of this builder that included the given
+        L{DevRevision}, and the build before that, either of which may be
+        None."""
+        key = (revision.revision, revision.when)
+        row = self.matrix.get(key)
+        if row is None:
+            if len(self.matrix) >= self.MAX_REVISIONS:
+                self.matrix = {}
+            row = self.matrix[key] = {}
+
+        if builderName not in row:
+            introducedIn = None
+            firstNotIn = None
+            # Find the first build that does not include the revision.
+            for build in self.getBuilds(builderName):
+                if self.comparator.isRevisionEarlier(build, revision):
+                    firstNotIn = build.number
+                    break
+                else:
+                    introducedIn = build.number
+            row[builderName] = (introducedIn, firstNotIn)
+
+        # the builds are looked up again, as they may have been refreshed
+        # since the cell was computed
+        builds = self.builds.get(builderName, {})
+        return [ builds.get(n) for n in row[builderName] ]
+
+    def getLastResults(self, builderStatus):
+        """Return the results of the last finished build of this builder, or
+        None if it has none."""
+        name = builderStatus.getName()
+        if name not in self.lastResults:
+            build = builderStatus.getBuild(-1)
+            # HACK: Work around #601, the head build may be None if it is
+            # locked.
+            if build is None:
+                build = builderStatus.getBuild(-2)
+            while build and not build.isFinished():
+                build = build.getPreviousBuild()
+            results = None
+            if build:
+                results = build.getResults()
+            self.lastResults[name] = results
+        return self.lastResults[name]
+
+    def _updateBuild(self, builderName, build):
+        builds = self.builds.setdefault(builderName, {})
+        running = self.running.setdefault(builderName, {})
+        number = build.getNumber()
+
+        devBuild = self.makeDevBuild(builderName, build)
+        old = builds.get(number)
+        builds[number] = devBuild
+        if build.isFinished():
+            running.pop(number, None)
+        else:
+            running[number] = build
+
+        self.order.pop(builderName, None)
+        # the cells only change if the build's revision does
+        if (old is None) != (devBuild is None) or \
+                (old and old.revision != devBuild.revision):
+            self._invalidate(builderName)
+        return devBuild
+
+    def _invalidate(self, builderName):
+        for row in self.matrix.itervalues():
+            row.pop(builderName, None)
+
+    # IStatusReceiver
+
+    def builderAdded(self, builderName, builder):
+        self.builderStatuses[builderName] = builder
+        self.builds[builderName] = {}
+        self.oldest[builderName] = builder.nextBuildNumber
+        self.running[builderName] = {}
+        self.order.pop(builderName, None)
+        self.lastResults.pop(builderName, None)
+        self._invalidate(builderName)
+        return self
+
+    def builderRemoved(self, builderName):
+        self.builderStatuses.pop(builderName, None)
+        self.builds.pop(builderName, None)
+        self.oldest.pop(builderName, None)
+        self.running.pop(builderName, None)
+        self.order.pop(builderName, None)
+        self.lastResults.pop(builderName, None)
+        self._invalidate(builderName)
+
+    def buildStarted(self, builderName, build):
+        self._updateBuild(builderName, build)
+        builds = self.builds[builderName]
+        number = build.getNumber()
+        pruned = [ n for n in builds if n <= number - self.MAX_BUILDS ]
+        for old in pruned:
+            del builds[old]
+            self.running[builderName].pop(old, None)
+        self.oldest[builderName] = max(self.oldest.get(builderName, number),
+                                       number - self.MAX_BUILDS + 1)
+        if pruned:
+            self.order.pop(builderName, None)
+            self._invalidate(builderName)
+
+    def buildFinished(self, builderName, build, results):
+        self._updateBuild(builderName, build)
+        self.lastResults[builderName] = results
+
+
 class ConsoleStatusResource(HtmlResource):
     """Main console class. It displays a user-oriented status page.
     Every change is a line in the page, and it shows the result of the first
@@ -97,12 +348,23 @@ class ConsoleStatusResource(HtmlResource):
         HtmlResource.__init__(self)
 
         self.status = None
+        self.model = None
 
         if orderByTime:
             self.comparator = TimeRevisionComparator()
         else:
             self.comparator = IntegerRevisionComparator()
 
+    def getModel(self, request):
+        if self.model is None:
+            self.model = ConsoleModel(self.getStatus(request), self.comparator)
+        return self.model
+
+    def stopModel(self):
+        if self.model is not None:
+            self.model.stop()
+            self.model = None
+
     def getPageTitle(self, request):
         status = self.getStatus(request)
         title = status.getTitle()
@@ -193,109 +455,21 @@ class ConsoleStatusResource(HtmlResource):
 
         yield allChanges
 
-    def getBuildDetails(self, request, builderName, build):
-        """Returns an HTML list of failures for a given build."""
-        details = {}
-        if not build.getLogs():
-            return details
-        
-        for step in build.getSteps():
-            (result, reason) = step.getResults()
-            if result == builder.FAILURE:
-                name = step.getName()
-
-                # Remove html tags from the error text.
-                stripHtml = re.compile(r'<.*?>')
-                strippedDetails = stripHtml.sub('', ' '.join(step.getText()))
-                
-                details['buildername'] = builderName
-                details['status'] = strippedDetails
-                details['reason'] = reason
-                logs = details['logs'] = []
-
-                if step.getLogs():
-                    for log in step.getLogs():
-                        logname = log.getName()
-                        logurl = request.childLink(
-                          "../builders/%s/builds/%s/steps/%s/logs/%s" % 
-                            (urllib.quote(builderName),
-                             build.getNumber(),
-                             urllib.quote(name),
-                             urllib.quote(logname)))
-                        logs.append(dict(url=logurl, name=logname))
-        return details
-
-    def getBuildsForRevision(self, request, builder, builderName, lastRevision,
-                             numBuilds, debugInfo):
-        """Return the list of all the builds for a given builder that we will
-        need to be able to display the console page. We start by the most recent
-        build, and we go down until we find a build that was built prior to the
-        last change we are interested in."""
-
-        revision = lastRevision 
-
-        builds = []
-        build = self.getHeadBuild(builder)
-        number = 0
-        while build and number < numBuilds:
-            debugInfo["builds_scanned"] += 1
-            number += 1
-
-            # Get the last revision in this build.
-            # We first try "got_revision", but if it does not work, then
-            # we try "revision".
-            got_rev = build.getProperty("got_revision", build.getProperty("revision", -1))
-            if got_rev != -1 and not self.comparator.isValidRevision(got_rev):
-                got_rev = -1
-
-            # We ignore all builds that don't have last revisions.
-            # TODO(nsylvain): If the build is over, maybe it was a problem
-            # with the update source step. We need to find a way to tell the
-            # user that his change might have broken the source update.
-            if got_rev != -1:
-                details = self.getBuildDetails(request, builderName, build)
-                devBuild = DevBuild(got_rev, build, details)
-                builds.append(devBuild)
-
-                # Now break if we have enough builds.
-                current_revision = self.getChangeForBuild(
-                    build, revision)
-                if self.comparator.isRevisionEarlier(
-                    devBuild, current_revision):
-                    break
-
-            build = build.getPreviousBuild()
-
-        return builds
-
-    def getChangeForBuild(self, build, revision):
-        if not build or not build.getChanges(): # Forced build
-            return DevBuild(revision, build, None)
-        
-        for change in build.getChanges():
-            if change.revision == revision:
-                return change
-
-        # No matching change, return the last change in build.
-        changes = list(build.getChanges())
-        changes.sort(key=self.comparator.getSortingKey())
-        return changes[-1]
-    
     def getAllBuildsForRevision(self, status, request, lastRevision, numBuilds,
                                 categories, builders, debugInfo):
-        """Returns a dictionary of builds we need to inspect to be able to
-        display the console page. The key is the builder name, and the value is
-        an array of build we care about. We also returns a dictionary of
-        builders we care about. The key is it's category.
+        """Returns a dictionary of builders we care about, and the
+        L{ConsoleModel} holding the builds we need to display the console
+        page. The key of the dictionary is the builder's category.
  
-        lastRevision is the last revision we want to display in the page.
+        lastRevision is the last L{DevRevision} we want to display in the
+            page.
         categories is a list of categories to display. It is coming from the
             HTTP GET parameters.
         builders is a list of builders to display. It is coming from the HTTP
             GET parameters.
         """
 
-        allBuilds = dict()
+        model = self.getModel(request)
 
         # List of all builders in the dictionary.
         builderList = dict()
@@ -325,15 +499,10 @@ class ConsoleStatusResource(HtmlResource):
 
             # Append this builder to the dictionary of builders.
             builderList[category].append(builderName)
-            # Set the list of builds for this builder.
-            allBuilds[builderName] = self.getBuildsForRevision(request,
-                                                               builder,
-                                                               builderName,
-                                                               lastRevision,
-                                                               numBuilds,
-                                                               debugInfo)
+            # Make sure the builds for this builder are held.
+            model.loadBuilds(builder, lastRevision, numBuilds, debugInfo)
 
-        return (builderList, allBuilds)
+        return (builderList, model)
 
 
     ##
@@ -365,7 +534,7 @@ class ConsoleStatusResource(HtmlResource):
             
         return cs
 
-    def displaySlaveLine(self, status, builderList, debugInfo):
+    def displaySlaveLine(self, status, model, builderList, debugInfo):
         """Display a line the shows the current status for all the builders we
         care about."""
 
@@ -391,26 +560,22 @@ class ConsoleStatusResource(HtmlResource):
                 s["color"] = "notstarted"
                 s["pageTitle"] = builder
                 s["url"] = "./builders/%s" % urllib.quote(builder)
-                state, builds = status.getBuilder(builder).getState()
+                builderStatus = status.getBuilder(builder)
+                state, builds = builderStatus.getState()
                 # Check if it's offline, if so, the box is purple.
                 if state == "offline":
                     s["color"] = "offline"
                 else:
                     # If not offline, then display the result of the last
                     # finished build.
-                    build = self.getHeadBuild(status.getBuilder(builder))
-                    while build and not build.isFinished():
-                        build = build.getPreviousBuild()
-
-                    if build:
-                        s["color"] = getResultsClass(build.getResults(), None,
-                                                      False)
+                    s["color"] = getResultsClass(
+                            model.getLastResults(builderStatus), None, False)
 
                 slaves[category].append(s)
 
         return slaves
 
-    def displayStatusLine(self, builderList, allBuilds, revision, debugInfo):
+    def displayStatusLine(self, builderList, model, revision, debugInfo):
         """Display the boxes that represent the status of each builder in the
         first build "revision" was in. Returns an HTML list of errors that
         happened during these builds."""
@@ -433,17 +598,8 @@ class ConsoleStatusResource(HtmlResource):
             
             # Display the boxes for each builder in this category.
             for builder in builderList[category]:
-                introducedIn = None
-                firstNotIn = None
+                (introducedIn, firstNotIn) = model.getCell(builder, revision)
 
-                # Find the first build that does not include the revision.
-                for build in allBuilds[builder]:
-                    if self.comparator.isRevisionEarlier(build, revision):
-                        firstNotIn = build
-                        break
-                    else:
-                        introducedIn = build
-                        
                 # Get the results of the first build with the revision, and the
                 # first build that does not include the revision.
                 results = None
@@ -525,7 +681,16 @@ class ConsoleStatusResource(HtmlResource):
                 except DoesNotPassFilter:
                     pass
 
-    def displayPage(self, request, status, builderList, allBuilds, revisions,
+    def linkDetails(self, request, details):
+        """Add the links to the logs of the failures of a build, as given by
+        L{ConsoleModel.getBuildDetails}."""
+        details = details.copy()
+        details['logs'] = [ dict(url=request.childLink("../" + l['path']),
+                                 name=l['name'])
+                            for l in details.get('logs', []) ]
+        return details
+
+    def displayPage(self, request, status, builderList, model, revisions,
                     categories, repository, project, branch, debugInfo):
         """Display the console page."""
         # Build the main template directory with all the informations we have.
@@ -542,7 +707,8 @@ class ConsoleStatusResource(HtmlResource):
 
         if builderList:
             subs["categories"] = self.displayCategories(builderList, debugInfo)
-            subs['slaves'] = self.displaySlaveLine(status, builderList, debugInfo)
+            subs['slaves'] = self.displaySlaveLine(status, model, builderList,
+                                                   debugInfo)
         else:
             subs["categories"] = []
 
@@ -563,11 +729,11 @@ class ConsoleStatusResource(HtmlResource):
 
             # Display the status for all builders.
             (builds, details) = self.displayStatusLine(builderList,
-                                            allBuilds,
+                                            model,
                                             revision,
                                             debugInfo)
             r['builds'] = builds
-            r['details'] = details
+            r['details'] = [ self.linkDetails(request, d) for d in details ]
 
             # Calculate the td span for the comment and the details.
             r["span"] = len(builderList) + 2            
@@ -657,12 +823,12 @@ class ConsoleStatusResource(HtmlResource):
             # Fetch all the builds for all builders until we get the next build
             # after lastRevision.
             builderList = None
-            allBuilds = None
+            model = None
             if revisions:
-                lastRevision = revisions[len(revisions) - 1].revision
-                debugInfo["last_revision"] = lastRevision
+                lastRevision = revisions[len(revisions) - 1]
+                debugInfo["last_revision"] = lastRevision.revision
 
-                (builderList, allBuilds) = self.getAllBuildsForRevision(status,
+                (builderList, model) = self.getAllBuildsForRevision(status,
                                                     request,
                                                     lastRevision,
                                                     numBuilds,
@@ -673,7 +839,7 @@ class ConsoleStatusResource(HtmlResource):
             debugInfo["added_blocks"] = 0
 
             cxt.update(self.displayPage(request, status, builderList,
-                                        allBuilds, revisions, categories,
+                                        model, revisions, categories,
                                         repository, project, branch, debugInfo))
 
             templates = request.site.buildbot_service.templates
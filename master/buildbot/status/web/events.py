@@ -0,0 +1,415 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+
+"""Status events pushed to web clients, as server-sent events or long polls."""
+
+from zope.interface import implements
+from twisted.internet import reactor
+from twisted.internet.interfaces import IPushProducer
+from twisted.web import resource, server
+
+from buildbot import util
+from buildbot.status.base import StatusReceiver
+from buildbot.status.web.base import AccessorMixin
+from buildbot.status.web.status_json import FilterOut
+from buildbot.util import json
+
+
+class StatusEvent(object):
+    """
+    One status event, serialized once for all of the clients it goes to.
+
+    @ivar coalesce: events with the same (non-None) key replace each other
+    in a client's queue, as only the latest of them is of interest
+    """
+
+    def __init__(self, id, event, builderName, category, data, coalesce=None):
+        self.id = id
+        self.event = event
+        self.builderName = builderName
+        self.category = category
+        self.data = data
+        self.coalesce = coalesce
+
+
+class EventClient(object):
+    """
+    One client of the events page.  Events matching its filters are queued
+    here until the hub flushes them to the client; the queue is bounded, and
+    if the client falls too far behind the oldest events are dropped and the
+    client is told to reload its state instead.
+    """
+
+    MAX_QUEUE = 100
+
+    def __init__(self, builders=None, categories=None, events=None):
+        self.builders = builders
+        self.categories = categories
+        self.events = events
+        self.hub = None
+        self.queue = []
+        self.overflowed = False
+
+    def matches(self, event):
+        if self.events and event.event not in self.events:
+            return False
+        if self.builders and event.builderName not in self.builders:
+            return False
+        if self.categories and event.category not in self.categories:
+            return False
+        return True
+
+    def deliver(self, event):
+        if event.coalesce is not None:
+            for i in range(len(self.queue)):
+                if self.queue[i].coalesce == event.coalesce:
+                    del self.queue[i]
+                    break
+        self.queue.append(event)
+        if len(self.queue) > self.MAX_QUEUE:
+            del self.queue[0]
+            self.overflowed = True
+
+    def takeEvents(self):
+        events, self.queue = self.queue, []
+        overflowed, self.overflowed = self.overflowed, False
+        return events, overflowed
+
+    def isReady(self):
+        return True
+
+    def flush(self):
+        """Send the queued events; return True if the client is done."""
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+
+class ServerSentEventsClient(EventClient):
+    """
+    Streams events to an EventSource as they happen.  The client is the
+    producer for its request, so a slow reader pauses the flushes and its
+    events are coalesced in the queue rather than buffered in the transport.
+    """
+
+    implements(IPushProducer)
+
+    def __init__(self, request, **kwargs):
+        EventClient.__init__(self, **kwargs)
+        self.request = request
+        self.paused = False
+        request.setHeader("content-type", "text/event-stream")
+        request.setHeader("cache-control", "no-cache")
+        request.registerProducer(self, True)
+        # send the headers now, so that the EventSource opens
+        request.write(":\n\n")
+
+    def isReady(self):
+        return not self.paused
+
+    def flush(self):
+        events, overflowed = self.takeEvents()
+        lines = []
+        if overflowed:
+            lines.append("event: reset\ndata: {}\n\n")
+        for event in events:
+            lines.append("id: %d\nevent: %s\ndata: %s\n\n"
+                         % (event.id, event.event, event.data))
+        if lines:
+            self.request.write("".join(lines))
+        return False
+
+    def close(self):
+        self.request.unregisterProducer()
+        self.request.finish()
+
+    # IPushProducer
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        if self.hub is not None:
+            self.hub.schedule(self)
+
+    def stopProducing(self):
+        if self.hub is not None:
+            self.hub.removeClient(self)
+
+
+class LongPollClient(EventClient):
+    """
+    Answers one long poll with a batch of events, as soon as there are any,
+    or with an empty batch after L{TIMEOUT} seconds.
+    """
+
+    TIMEOUT = 30
+
+    def __init__(self, request, **kwargs):
+        EventClient.__init__(self, **kwargs)
+        self.request = request
+        self.lastId = None
+        request.setHeader("content-type", "application/json")
+        request.setHeader("cache-control", "no-cache")
+
+    def flush(self):
+        events, overflowed = self.takeEvents()
+        if not events and not overflowed:
+            return False
+        self.finish(events, overflowed)
+        return True
+
+    def finish(self, events=[], overflowed=False):
+        last = self.lastId
+        if events:
+            last = events[-1].id
+        self.request.write('{"events":[%s],"last":%s,"reset":%s}'
+                % (",".join([ e.data for e in events ]), json.dumps(last),
+                   json.dumps(overflowed)))
+        self.request.finish()
+
+    def close(self):
+        self.finish()
+
+
+class StatusEventHub(StatusReceiver):
+    """
+    The source of events for the events page.  Each status event is turned
+    into a packet like those of L{buildbot.status.status_push.StatusPush} and
+    serialized once; it is then queued for the clients whose filters it
+    matches, and the queues are flushed together a moment later, so that a
+    burst of events costs one write per client rather than one per event.
+    The last L{MAX_HISTORY} events are kept for clients that reconnect.
+    """
+
+    MAX_HISTORY = 500
+    FLUSH_DELAY = 0.2
+
+    def __init__(self, status, filter=True):
+        self.status = status
+        self.filter = filter
+        self.started = str(util.now())
+        self.nextId = 1
+        self.history = []
+        self.clients = set()
+        self.pending = set()
+        self.flushTimer = None
+        self.categories = {}
+        self._reactor = reactor # seam for tests to use t.i.t.Clock
+        status.subscribe(self)
+
+    def stop(self):
+        self.status.unsubscribe(self)
+        if self.flushTimer is not None:
+            self.flushTimer.cancel()
+            self.flushTimer = None
+        for client in list(self.clients):
+            self.removeClient(client)
+            client.close()
+        self.history = []
+
+    # clients
+
+    def addClient(self, client, since=None):
+        """
+        Start sending events to CLIENT.  If SINCE is given, the events after
+        that id are sent first; if some of them are no longer kept the client
+        is told to reset instead.
+        """
+        client.hub = self
+        self.clients.add(client)
+        if since is None:
+            return
+        if since < self.nextId - 1 and \
+                (not self.history or self.history[0].id > since + 1):
+            client.overflowed = True
+        for event in self.history:
+            if event.id > since and client.matches(event):
+                client.deliver(event)
+        if client.queue or client.overflowed:
+            self.schedule(client)
+
+    def removeClient(self, client):
+        self.clients.discard(client)
+        self.pending.discard(client)
+
+    def schedule(self, client):
+        self.pending.add(client)
+        if self.flushTimer is None:
+            self.flushTimer = self._reactor.callLater(self.FLUSH_DELAY,
+                                                      self.flush)
+
+    def flush(self):
+        self.flushTimer = None
+        for client in list(self.pending):
+            if not client.isReady():
+                continue
+            self.pending.discard(client)
+            if client.flush():
+                self.removeClient(client)
+
+    def push(self, event, builderName=None, coalesce=None, **objs):
+        packet = {}
+        packet['id'] = self.nextId
+        packet['timestamp'] = str(util.now())
+        packet['started'] = self.started
+        packet['event'] = event
+        packet['payload'] = {}
+        if builderName is not None:
+            packet['payload']['builderName'] = builderName
+        for obj_name, obj in objs.items():
+            if hasattr(obj, 'asDict'):
+                obj = obj.asDict()
+            if self.filter:
+                obj = FilterOut(obj)
+            packet['payload'][obj_name] = obj
+        data = json.dumps(packet, separators=(',',':'))
+        if coalesce is not None:
+            coalesce = (event,) + coalesce
+        e = StatusEvent(self.nextId, event, builderName,
+                        self.categories.get(builderName), data, coalesce)
+        self.nextId += 1
+
+        self.history.append(e)
+        if len(self.history) > self.MAX_HISTORY:
+            del self.history[0]
+        for client in self.clients:
+            if client.matches(e):
+                client.deliver(e)
+                self.schedule(client)
+
+    # IStatusReceiver
+
+    def requestSubmitted(self, request):
+        name = request.getBuilderName()
+        self.push('requestSubmitted', builderName=name, request=request)
+
+    def builderAdded(self, builderName, builder):
+        self.categories[builderName] = builder.getCategory()
+        self.push('builderAdded', builderName=builderName,
+                  builder=builder)
+        return self
+
+    def builderChangedState(self, builderName, state):
+        self.push('builderChangedState', builderName=builderName,
+                  coalesce=(builderName,), state=state)
+
+    def buildStarted(self, builderName, build):
+        self.push('buildStarted', builderName=builderName, build=build)
+        return self
+
+    def stepStarted(self, build, step):
+        name = build.getBuilder().getName()
+        self.push('stepStarted', builderName=name,
+                  buildNumber=build.getNumber(), step=step)
+        return self
+
+    def stepTextChanged(self, build, step, text):
+        name = build.getBuilder().getName()
+        self.push('stepTextChanged', builderName=name,
+                  coalesce=(name, build.getNumber(), step.getName()),
+                  buildNumber=build.getNumber(), step=step)
+
+    def stepText2Changed(self, build, step, text2):
+        name = build.getBuilder().getName()
+        self.push('stepText2Changed', builderName=name,
+                  coalesce=(name, build.getNumber(), step.getName()),
+                  buildNumber=build.getNumber(), step=step)
+
+    def stepFinished(self, build, step, results):
+        name = build.getBuilder().getName()
+        self.push('stepFinished', builderName=name,
+                  buildNumber=build.getNumber(), step=step)
+
+    def buildFinished(self, builderName, build, results):
+        self.push('buildFinished', builderName=builderName, build=build)
+
+    def builderRemoved(self, builderName):
+        self.push('builderRemoved', builderName=builderName)
+        self.categories.pop(builderName, None)
+
+    def changeAdded(self, change):
+        self.push('changeAdded', change=change)
+
+    def slaveConnected(self, slavename):
+        self.push('slaveConnected', slave=self.status.getSlave(slavename))
+
+    def slaveDisconnected(self, slavename):
+        self.push('slaveDisconnected', slavename=slavename)
+
+
+class EventsResource(resource.Resource, AccessorMixin):
+    """
+    /events: status events as they happen.  By default the response is a
+    stream of server-sent events; with mode=poll it is a JSON batch of the
+    events after the 'since' argument, held open until there is one.  The
+    builder=, category= and event= arguments (each may be repeated) limit
+    the events sent; builder= and category= leave out the events that do
+    not belong to a builder.
+    """
+
+    isLeaf = True
+
+    def __init__(self):
+        resource.Resource.__init__(self)
+        self.model = None
+
+    def getModel(self, request):
+        if self.model is None:
+            self.model = StatusEventHub(self.getStatus(request))
+        return self.model
+
+    def stopModel(self):
+        if self.model is not None:
+            self.model.stop()
+            self.model = None
+
+    def render_GET(self, request):
+        filters = dict(builders=request.args.get("builder"),
+                       categories=request.args.get("category"),
+                       events=request.args.get("event"))
+        since = request.args.get("since", [None])[0]
+        if since is None:
+            since = request.getHeader("last-event-id")
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                request.setResponseCode(400)
+                return "invalid 'since' argument\n"
+
+        hub = self.getModel(request)
+        if request.args.get("mode", ["sse"])[0] == "poll":
+            client = LongPollClient(request, **filters)
+            if since is None:
+                since = hub.nextId - 1
+            client.lastId = since
+            def timeout():
+                if client in hub.clients:
+                    hub.removeClient(client)
+                    client.close()
+            timer = hub._reactor.callLater(client.TIMEOUT, timeout)
+            def cancel(_):
+                if timer.active():
+                    timer.cancel()
+            request.notifyFinish().addBoth(cancel)
+        else:
+            client = ServerSentEventsClient(request, **filters)
+        request.notifyFinish().addBoth(lambda _ : hub.removeClient(client))
+        hub.addClient(client, since)
+        return server.NOT_DONE_YET
@@ -124,46 +124,29 @@ class FeedResource(XmlResource):
 
         failures_only = request.args.get("failures_only", "false")
 
-        maxFeeds = 25
-
-        # Copy all failed builds in a new list.
-        # This could clearly be implemented much better if we had
-        # access to a global list of builds.
-        for b in builders:
-            lastbuild = b.getLastFinishedBuild()
-            if lastbuild is None:
-                continue
-
-            lastnr = lastbuild.getNumber()
-
-            totalbuilds = 0
-            i = lastnr
-            while i >= 0:
-                build = b.getBuild(i)
-                i -= 1
-                if not build:
-                    continue
-
-                results = build.getResults()
-
-                if failures_only == "false" or results == FAILURE:
-                    totalbuilds += 1
-                    builds.append(build)
-
-                # stop for this builder when our total nr. of feeds is reached
-                if totalbuilds >= maxFeeds:
+        # a page of the feed holds the builds that finished before=, which
+        # clients can set to the finish time of the last build of the
+        # previous page
+        maxFeeds = int(request.args.get("limit", [25])[0])
+        finished_before = request.args.get("before", [None])[0]
+        if finished_before is not None:
+            finished_before = float(finished_before)
+
+        if not builders:
+            return builds
+
+        # the status merges the builders' builds, most recently finished
+        # first, starting from each builder's index of finish times
+        g = self.status.generateFinishedBuilds(
+                builders=[b.getName() for b in builders],
+                finished_before=finished_before)
+        for build in g:
+            results = build.getResults()
+            if failures_only == "false" or results == FAILURE:
+                builds.append(build)
+                # stop when our total nr. of feeds is reached
+                if len(builds) >= maxFeeds:
                     break
-
-        # Sort build list by date, youngest first.
-        # To keep compatibility with python < 2.4, use this for sorting instead:
-        # We apply Decorate-Sort-Undecorate
-        deco = [(build.getTimes(), build) for build in builds]
-        deco.sort()
-        deco.reverse()
-        builds = [build for (b1, build) in deco]
-
-        if builds:
-            builds = builds[:min(len(builds), maxFeeds)]
         return builds
 
     def content(self, request):
@@ -17,7 +17,7 @@
 from zope.interface import implements
 from twisted.python import components
 from twisted.spread import pb
-from twisted.web import server
+from twisted.web import server, http
 from twisted.web.resource import Resource
 from twisted.web.error import NoResource
 
@@ -94,15 +94,89 @@ class TextLog(Resource):
 
     def render_HEAD(self, req):
         self._setContentType(req)
+        if self.asText and self.original.isFinished():
+            req.setHeader("accept-ranges", "bytes")
 
         # vague approximation, ignores markup
         req.setHeader("content-length", self.original.length)
         return ''
 
+    def _getIntArg(self, req, name):
+        try:
+            value = int(req.args.get(name, [None])[0])
+        except (TypeError, ValueError):
+            return None
+        if value < 0:
+            return None
+        return value
+
+    def _parseRange(self, header, length):
+        # parse a single 'bytes' range, returning (start, end) where end is
+        # exclusive, or None if the range is not satisfiable.  Raises
+        # ValueError for ranges that should be ignored.
+        unit, spec = header.split("=", 1)
+        if unit.strip().lower() != "bytes" or "," in spec:
+            raise ValueError("unsupported range")
+        first, last = [ s.strip() for s in spec.split("-", 1) ]
+        if not first:
+            # a suffix range, giving the number of bytes at the end
+            suffix = int(last)
+            if suffix <= 0 or length == 0:
+                return None
+            return (max(0, length - suffix), length)
+        start = int(first)
+        end = length
+        if last:
+            end = int(last) + 1
+            if end <= start:
+                raise ValueError("invalid range")
+        if start >= length:
+            return None
+        return (start, min(end, length))
+
+    def _getRange(self, req):
+        # Determine the part of the log's text to send, from a Range header
+        # (only for the text of a finished log) or the 'tail' and 'offset'
+        # arguments, and set up the response to match.  Returns (start, end),
+        # where end may be None, or None if the range cannot be satisfied.
+        if self.asText and self.original.isFinished():
+            req.setHeader("accept-ranges", "bytes")
+            header = req.getHeader("range")
+            if header:
+                length = self.original.getTextLength()
+                try:
+                    rng = self._parseRange(header, length)
+                except ValueError:
+                    rng = (0, None) # ignore the header
+                if rng is None:
+                    req.setResponseCode(http.REQUESTED_RANGE_NOT_SATISFIABLE)
+                    req.setHeader("content-range", "bytes */%d" % length)
+                    return None
+                if rng[1] is not None:
+                    req.setResponseCode(http.PARTIAL_CONTENT)
+                    req.setHeader("content-range", "bytes %d-%d/%d"
+                                  % (rng[0], rng[1] - 1, length))
+                    req.setHeader("content-length", rng[1] - rng[0])
+                    return rng
+
+        tail = self._getIntArg(req, "tail")
+        if tail is not None:
+            return (self.original.getTailOffset(tail), None)
+        offset = self._getIntArg(req, "offset")
+        if offset is not None:
+            return (offset, None)
+        return (0, None)
+
     def render_GET(self, req):
         self._setContentType(req)
         self.req = req
 
+        rng = self._getRange(req)
+        if rng is None:
+            self.req = None
+            return ''
+        start, end = rng
+
         if not self.asText:
             self.template = req.site.buildbot_service.templates.get_template("logs.html")                
             
@@ -113,7 +187,7 @@ class TextLog(Resource):
             data = data.encode('utf-8')                   
             req.write(data)
 
-        self.original.subscribeConsumer(ChunkConsumer(req, self))
+        self.original.subscribeConsumer(ChunkConsumer(req, self), start, end)
         return server.NOT_DONE_YET
 
     def _setContentType(self, req):
@@ -17,11 +17,14 @@
 """Simple JSON exporter."""
 
 import datetime
+import itertools
 import os
 import re
+import time
 
 from twisted.internet import defer
-from twisted.web import html, resource, server
+from twisted.python.hashlib import md5
+from twisted.web import html, http, resource, server
 
 from buildbot.status.web.base import HtmlResource
 from buildbot.util import json
@@ -64,6 +67,11 @@ EXAMPLES = """\
     - All *cached* builds.
   - /json/builders/<A_BUILDER>/builds/_all
     - All builds. Warning, reads all previous build data.
+  - /json/builders/<A_BUILDER>/builds/_all?before=<A_BUILD>&limit=20
+    - The 20 finished builds before build number <A_BUILD>.
+  - /json/builders/<A_BUILDER>/builds/_all?before=1318000000.0&limit=20
+    - The 20 builds that finished last before the given time, written with a
+      decimal point.
   - /json/builders/<A_BUILDER>/builds/<A_BUILD>
     - Where <A_BUILD> is either positive, a build number, or negative, a past
       build.
@@ -117,6 +125,44 @@ def FilterOut(data):
         return data
 
 
+class JsonResponse(object):
+    """A serialized response, as held in a L{JsonResponseCache}."""
+
+    def __init__(self, data):
+        self.data = data
+
+
+class JsonResponseCache(object):
+    """Serialized responses of a L{JsonStatusResource} and its children, kept
+    in the master's C{JsonResponses} cache.  A response is keyed by the path
+    and arguments of its request and by the version of the data it shows (see
+    L{JsonResource.getVersion}), and is tagged with a digest of that key, so
+    that neither the response nor its tag need the data to be rendered."""
+
+    # the default total size, in bytes, of the responses kept
+    DEFAULT_MAX_SIZE = 4 * 1024 * 1024
+
+    _counter = itertools.count()
+
+    def __init__(self, cache):
+        self.cache = cache
+        # keeps the keys and tags of these responses apart from those of
+        # other instances (after a reconfig) and of earlier processes
+        self.nonce = '%d.%d' % (time.time(), self._counter.next())
+
+    def getETag(self, key):
+        return '"%s"' % md5(repr((self.nonce, key))).hexdigest()
+
+    def get(self, key):
+        response = self.cache.get((self.nonce, key))
+        if response is None:
+            return None
+        return response.data
+
+    def put(self, key, data):
+        self.cache.put((self.nonce, key), JsonResponse(data))
+
+
 class JsonResource(resource.Resource):
     """Base class for json data."""
 
@@ -125,6 +171,7 @@ class JsonResource(resource.Resource):
     help = None
     pageTitle = None
     level = 0
+    responses = None # set by the JsonStatusResource above us
 
     def __init__(self, status):
         """Adds transparent lazy-child initialization."""
@@ -152,6 +199,7 @@ class JsonResource(resource.Resource):
 
         def RecurseFix(res, level):
             res.level = level + 1
+            res.responses = self.responses
             for c in res.children.itervalues():
                 RecurseFix(c, res.level)
 
@@ -160,7 +208,15 @@ class JsonResource(resource.Resource):
 
     def render_GET(self, request):
         """Renders a HTTP GET at the http request level."""
-        d = defer.maybeDeferred(lambda : self.content(request))
+        key = self.getResponseKey(request)
+        if key is None:
+            d = defer.maybeDeferred(lambda : self.content(request))
+        elif request.setETag(self.responses.getETag(key)) == http.CACHED:
+            # The client already has this response.
+            d = defer.succeed('')
+        else:
+            d = defer.maybeDeferred(lambda :
+                    self.getCachedContent(request, key))
         def handle(data):
             if isinstance(data, unicode):
                 data = data.encode("utf-8")
@@ -189,6 +245,92 @@ class JsonResource(resource.Resource):
         d.addCallbacks(ok, fail)
         return server.NOT_DONE_YET
 
+    def getResponseKey(self, request):
+        """Returns the key of the response to this request in the response
+        cache, or None if it can't be cached."""
+        if self.responses is None:
+            return None
+        select = request.args.get('select')
+        if select is None:
+            version = self.getVersion(request)
+        else:
+            version = []
+            for path, child in self.getSelected(request, select):
+                if hasattr(child, 'getVersion'):
+                    version.append((tuple(path), child.getVersion(request)))
+                else:
+                    version.append((tuple(path), None))
+            if None in [ v for (path, v) in version ]:
+                version = None
+            else:
+                version = tuple(version)
+        if version is None:
+            return None
+        args = [ (arg, tuple(values))
+                 for (arg, values) in request.args.iteritems() ]
+        args.sort()
+        return (request.path, tuple(args), version)
+
+    def getCachedContent(self, request, key):
+        """Returns the response to this request from the response cache,
+        rendering it if it is not there."""
+        data = self.responses.get(key)
+        if data is not None:
+            return data
+        d = defer.maybeDeferred(lambda : self.content(request))
+        def keep(data):
+            self.responses.put(key, data)
+            return data
+        d.addCallback(keep)
+        return d
+
+    def getVersion(self, request):
+        """Returns a value that identifies the data rendered by asDict, and
+        changes whenever that data may change, or None if that can't be
+        told.  Responses are only cached when it can."""
+        return None
+
+    def getChildrenVersion(self, request):
+        """Returns the version of the data rendered by the default asDict,
+        from those of the children."""
+        versions = []
+        names = self.children.keys()
+        names.sort()
+        for name in names:
+            child = self.getChildWithDefault(name, request)
+            if isinstance(child, JsonResource):
+                version = child.getVersion(request)
+                if version is None:
+                    return None
+                versions.append((name, version))
+        return tuple(versions)
+
+    def getSelected(self, request, select):
+        """Walks to the children selected by the given sub-urls, yielding the
+        path elements and the child of each.  While the caller handles a
+        child, the request's paths are set as if the child were requested."""
+        # Remove superfluous /
+        select = [s.strip('/') for s in select]
+        select.sort(cmp=lambda x,y: cmp(x.count('/'), y.count('/')),
+                    reverse=True)
+        for item in select:
+            # Implementation similar to twisted.web.resource.getChildForRequest
+            # but with a hacked up request.
+            path = []
+            child = self
+            prepath = request.prepath[:]
+            postpath = request.postpath[:]
+            request.postpath = filter(None, item.split('/'))
+            while request.postpath and not child.isLeaf:
+                pathElement = request.postpath.pop(0)
+                path.append(pathElement)
+                request.prepath.append(pathElement)
+                child = child.getChildWithDefault(pathElement, request)
+            yield path, child
+
+            request.prepath = prepath
+            request.postpath = postpath
+
     @defer.deferredGenerator
     def content(self, request):
         """Renders the json dictionaries."""
@@ -204,25 +346,12 @@ class JsonResource(resource.Resource):
             del request.args['select']
             # Do not render self.asDict()!
             data = {}
-            # Remove superfluous /
-            select = [s.strip('/') for s in select]
-            select.sort(cmp=lambda x,y: cmp(x.count('/'), y.count('/')),
-                        reverse=True)
-            for item in select:
+            for path, child in self.getSelected(request, select):
                 # Start back at root.
                 node = data
-                # Implementation similar to twisted.web.resource.getChildForRequest
-                # but with a hacked up request.
-                child = self
-                prepath = request.prepath[:]
-                postpath = request.postpath[:]
-                request.postpath = filter(None, item.split('/'))
-                while request.postpath and not child.isLeaf:
-                    pathElement = request.postpath.pop(0)
+                for pathElement in path:
                     node[pathElement] = {}
                     node = node[pathElement]
-                    request.prepath.append(pathElement)
-                    child = child.getChildWithDefault(pathElement, request)
 
                 # some asDict methods return a Deferred, so handle that
                 # properly
@@ -237,9 +366,6 @@ class JsonResource(resource.Resource):
                         'error' : 'Not available',
                     }
                 node.update(child_dict)
-
-                request.prepath = prepath
-                request.postpath = postpath
         else:
             wfd = defer.waitForDeferred(
                     defer.maybeDeferred(lambda :
@@ -372,6 +498,11 @@ class BuilderPendingBuildsJsonResource(JsonResource):
         d.addCallback(to_dict)
         return d
 
+    def getVersion(self, request):
+        # the builder's generation changes with its pending requests
+        return ('builder', self.builder_status.getName(),
+                self.builder_status.generation)
+
 
 class BuilderJsonResource(JsonResource):
     help = """Describe a single builder.
@@ -392,6 +523,10 @@ class BuilderJsonResource(JsonResource):
         # buildbot.status.builder.BuilderStatus
         return self.builder_status.asDict_async()
 
+    def getVersion(self, request):
+        return ('builder', self.builder_status.getName(),
+                self.builder_status.generation)
+
 
 class BuildersJsonResource(JsonResource):
     help = """List of all the builders defined on a master.
@@ -405,6 +540,9 @@ class BuildersJsonResource(JsonResource):
                           BuilderJsonResource(status,
                                               status.getBuilder(builder_name)))
 
+    def getVersion(self, request):
+        return self.getChildrenVersion(request)
+
 
 class BuilderSlavesJsonResources(JsonResource):
     help = """Describe the slaves attached to a single builder.
@@ -419,6 +557,9 @@ class BuilderSlavesJsonResources(JsonResource):
                           SlaveJsonResource(status,
                                             self.status.getSlave(slave_name)))
 
+    def getVersion(self, request):
+        return self.getChildrenVersion(request)
+
 
 class BuildJsonResource(JsonResource):
     help = """Describe a single build.
@@ -436,6 +577,10 @@ class BuildJsonResource(JsonResource):
     def asDict(self, request):
         return self.build_status.asDict()
 
+    def getVersion(self, request):
+        return ('build', self.build_status.getBuilder().getName(),
+                self.build_status.getNumber(), self.build_status.generation)
+
 
 class AllBuildsJsonResource(JsonResource):
     help = """All the builds that were run on a builder.
@@ -464,8 +609,35 @@ class AllBuildsJsonResource(JsonResource):
                 return child
         return JsonResource.getChild(self, path, request)
 
+    def getPage(self, request):
+        """Returns the finished builds selected by the before= and limit=
+        arguments, most recent first.  before= is either a build number or,
+        written with a decimal point, a time."""
+        limit = int(RequestArg(request, 'limit',
+                               self.builder_status.buildCacheSize))
+        before = RequestArg(request, 'before', None)
+        max_buildnum = None
+        finished_before = None
+        if before is None:
+            pass
+        elif _IS_INT.match(before):
+            if int(before) <= 0:
+                return []
+            max_buildnum = int(before) - 1
+        else:
+            finished_before = float(before)
+        return self.builder_status.generateFinishedBuilds(
+                num_builds=limit, max_buildnum=max_buildnum,
+                finished_before=finished_before, max_search=max(limit, 200))
+
     def asDict(self, request):
         results = {}
+        if 'before' in request.args or 'limit' in request.args:
+            for build_status in self.getPage(request):
+                child = self.getChildWithDefault(build_status.getNumber(),
+                                                 request)
+                results[build_status.getNumber()] = child.asDict(request)
+            return results
         # If max > buildCacheSize, it'll trash the cache...
         max = int(RequestArg(request, 'max',
                              self.builder_status.buildCacheSize))
@@ -476,6 +648,11 @@ class AllBuildsJsonResource(JsonResource):
             results[child.build_status.getNumber()] = child.asDict(request)
         return results
 
+    def getVersion(self, request):
+        # the builder's generation changes with those of its builds
+        return ('builder', self.builder_status.getName(),
+                self.builder_status.generation)
+
 
 class BuildsJsonResource(AllBuildsJsonResource):
     help = """Builds that were run on a builder.
@@ -517,6 +694,12 @@ class BuildStepJsonResource(JsonResource):
     def asDict(self, request):
         return self.build_step_status.asDict()
 
+    def getVersion(self, request):
+        build_status = self.build_step_status.getBuild()
+        return ('step', build_status.getBuilder().getName(),
+                build_status.getNumber(), self.build_step_status.step_number,
+                self.build_step_status.generation)
+
 
 class BuildStepsJsonResource(JsonResource):
     help = """A list of build steps that occurred during a build.
@@ -557,6 +740,10 @@ class BuildStepsJsonResource(JsonResource):
             index += 1
         return results
 
+    def getVersion(self, request):
+        return ('build', self.build_status.getBuilder().getName(),
+                self.build_status.getNumber(), self.build_status.generation)
+
 
 class ChangeJsonResource(JsonResource):
     help = """Describe a single change that originates from a change source.
@@ -658,6 +845,14 @@ class SlaveJsonResource(JsonResource):
             results['builders'][builderName] = builds
         return results
 
+    def getVersion(self, request):
+        # the builds listed for each builder change with its generation
+        builders = [ (builderName,
+                      self.status.getBuilder(builderName).generation)
+                     for builderName in self.getBuilders() ]
+        return ('slave', self.name, self.slave_status.generation,
+                tuple(builders))
+
 
 class SlavesJsonResource(JsonResource):
     help = """List the registered slaves.
@@ -671,6 +866,9 @@ class SlavesJsonResource(JsonResource):
                           SlaveJsonResource(status,
                                             status.getSlave(slave_name)))
 
+    def getVersion(self, request):
+        return self.getChildrenVersion(request)
+
 
 class SourceStampJsonResource(JsonResource):
     help = """Describe the sources for a SourceStamp.
@@ -719,6 +917,10 @@ For help on any sub directory, use url /child/help
     def __init__(self, status):
         JsonResource.__init__(self, status)
         self.level = 1
+        self.responses = JsonResponseCache(
+                status.master.caches.get_sized_cache("JsonResponses",
+                        lambda response : len(response.data),
+                        JsonResponseCache.DEFAULT_MAX_SIZE))
         self.putChild('builders', BuildersJsonResource(status))
         self.putChild('change_sources', ChangeSourcesJsonResource(status))
         self.putChild('project', ProjectJsonResource(status))
@@ -733,6 +935,15 @@ For help on any sub directory, use url /child/help
         request.path = 'buildbot'
         return result
 
+    def getCachedContent(self, request, key):
+        result = JsonResource.getCachedContent(self, request, key)
+        # As above, for responses from the cache.
+        request.path = 'buildbot'
+        return result
+
+    def getVersion(self, request):
+        return self.getChildrenVersion(request)
+
     def hackExamples(self):
         global EXAMPLES
         # Find the first builder with a previous build or select the last one.
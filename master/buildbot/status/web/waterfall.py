@@ -24,6 +24,7 @@ import operator
 
 from buildbot import interfaces, util
 from buildbot.status import builder, buildstep, build
+from buildbot.status.base import StatusReceiver
 from buildbot.changes import changes
 
 from buildbot.status.web.base import Box, HtmlResource, IBox, ICurrentBox, \
@@ -246,7 +247,7 @@ def insertGaps(g, showEvents, lastEventTime, idleGap=2):
 
     while 1:
         e = g.next()
-        if not showEvents and isinstance(e, builder.Event):
+        if not showEvents and isBuilderEvent(e):
             continue
         starts, finishes = e.getTimes()
         if debug: log.msg("E2", starts, finishes)
@@ -326,6 +327,269 @@ class ChangeEventSource(object):
                 continue
             yield change
 
+class WaterfallEvent(object):
+    """
+    A build, step or builder Event as the waterfall lays it out: just its
+    times, and what the waterfall filters on.  The build or step itself is
+    looked up again, through the builder's build cache, only to draw it.
+    """
+    implements(interfaces.IStatusEvent)
+
+    def __init__(self, builderStatus, e):
+        self.builderStatus = builderStatus
+        self.started, self.finished = e.getTimes()
+        self.event = None
+        self.number = self.step = None
+        if isinstance(e, builder.Event):
+            self.event = e
+            self.key = ('event', id(e))
+            return
+        if isinstance(e, buildstep.BuildStepStatus):
+            b = e.getBuild()
+            self.step = e.step_number
+        else:
+            b = e
+        self.number = b.getNumber()
+        self.key = ('build', self.number, self.step)
+        self.buildStarted = b.getTimes()[0]
+        self.branch = b.getSourceStamp().branch
+        self.committers = set([ c.who for c in b.getChanges() ])
+
+    def getTimes(self):
+        if self.event is not None:
+            # builder Events finish without a status event
+            return self.event.getTimes()
+        return (self.started, self.finished)
+
+    def getText(self):
+        original = self.resolve()
+        if original is None:
+            return []
+        return original.getText()
+
+    def resolve(self):
+        """Return the build, step or Event, or None if it is gone"""
+        if self.event is not None:
+            return self.event
+        b = self.builderStatus.getBuild(self.number)
+        if b is None or self.step is None:
+            return b
+        steps = b.getSteps()
+        if self.step < len(steps):
+            return steps[self.step]
+        return None
+
+class WaterfallEventBox(components.Adapter):
+    implements(IBox)
+
+    def getBox(self, req):
+        original = self.original.resolve()
+        if original is None:
+            # this can happen if you delete part of the build history
+            return Box(["?"], align="center")
+        return IBox(original).getBox(req)
+components.registerAdapter(WaterfallEventBox, WaterfallEvent, IBox)
+
+def isBuilderEvent(e):
+    if isinstance(e, WaterfallEvent):
+        return e.event is not None
+    return isinstance(e, builder.Event)
+
+class BuilderColumn(object):
+    """
+    The events of one builder, newest first, supplying the IEventSource
+    interface from memory.  The events are read from the builder as far back
+    as the waterfall has been asked to show, and when a build changes, only
+    the events from that build onwards are read again.
+    """
+
+    # the most events held; pages reaching further back read the rest from
+    # the builder each time
+    MAX_EVENTS = 1000
+
+    def __init__(self, builderStatus):
+        self.builderStatus = builderStatus
+        self.events = []
+        self.exhausted = False
+        # the builder's events beyond self.events, while still valid
+        self.source = None
+        # the oldest build that has changed since self.events was read
+        self.dirtyFrom = None
+        self.latestEvent = None
+
+    def buildChanged(self, number):
+        if self.dirtyFrom is None or number < self.dirtyFrom:
+            self.dirtyFrom = number
+        # the builder's event generator counts back from the newest build
+        self.source = None
+
+    def eventGenerator(self, branches, categories, committers, minTime):
+        self._refresh()
+        # as in BuilderStatus.eventGenerator: builds stop at the first one
+        # started before minTime, after which the builder's Events go on
+        # until one started before minTime
+        builds = not categories or \
+                self.builderStatus.getCategory() in categories
+        first = True
+        for e in self._iterEvents():
+            if e.number is None:
+                if not builds:
+                    if not first and e.started < minTime:
+                        return
+                    first = False
+                yield e
+                continue
+            if not builds:
+                continue
+            if e.buildStarted < minTime:
+                builds = False
+                continue
+            if branches and e.branch not in branches:
+                continue
+            if committers and not e.committers.intersection(committers):
+                continue
+            yield e
+
+    def _refresh(self):
+        # builder Events are added without a status event, so look for a new
+        # one
+        latestEvent = id(self.builderStatus.getEvent(-1))
+        if latestEvent != self.latestEvent:
+            self.latestEvent = latestEvent
+            self.buildChanged(self.builderStatus.nextBuildNumber)
+        if self.dirtyFrom is None:
+            return
+        dirtyFrom, self.dirtyFrom = self.dirtyFrom, None
+
+        # read the builder's events up to the first of a build that has not
+        # changed, and keep the events held from there on
+        head = []
+        clean = None
+        for e in self.builderStatus.eventGenerator():
+            e = WaterfallEvent(self.builderStatus, e)
+            if e.number is not None and e.number < dirtyFrom:
+                clean = e
+                break
+            head.append(e)
+        if clean is None:
+            self.events = head
+            self.exhausted = True
+            return
+        for i, e in enumerate(self.events):
+            if e.key == clean.key:
+                self.events = head + self.events[i:]
+                return
+        self.events = head
+        self.exhausted = False
+
+    def _walk(self, after):
+        # the builder's events following the one with key AFTER
+        gen = self.builderStatus.eventGenerator()
+        if after is not None:
+            for e in gen:
+                if WaterfallEvent(self.builderStatus, e).key == after:
+                    break
+        for e in gen:
+            yield WaterfallEvent(self.builderStatus, e)
+
+    def _iterEvents(self):
+        for e in self.events:
+            yield e
+        if self.exhausted:
+            return
+        if self.source is None:
+            after = None
+            if self.events:
+                after = self.events[-1].key
+            self.source = self._walk(after)
+        source = self.source
+        while len(self.events) < self.MAX_EVENTS:
+            try:
+                e = source.next()
+            except StopIteration:
+                self.exhausted = True
+                self.source = None
+                return
+            if self.source is not source:
+                # the column changed while a page was being laid out from it
+                return
+            self.events.append(e)
+            yield e
+        # too far back to hold; read the rest just for this page
+        for e in self._walk(self.events[-1].key):
+            yield e
+
+class WaterfallModel(StatusReceiver):
+    """
+    The recent changes, and a column of events for each builder, as the
+    waterfall shows them.  These are kept up to date from status events, so
+    that each request lays out and filters the waterfall from memory; a
+    build's events are read from the builder again only when it changes.
+    """
+
+    MAX_CHANGES = 40
+
+    def __init__(self, status):
+        self.status = status
+        self.builderStatuses = {}
+        self.columns = {}
+        self.changes = None # until they are first loaded
+        status.subscribe(self)
+
+    def stop(self):
+        self.status.unsubscribe(self)
+        for builderStatus in self.builderStatuses.values():
+            builderStatus.unsubscribe(self)
+        self.builderStatuses = {}
+        self.columns = {}
+
+    # building the waterfall
+
+    def getColumn(self, builderStatus):
+        name = builderStatus.getName()
+        column = self.columns.get(name)
+        if column is None or column.builderStatus is not builderStatus:
+            column = self.columns[name] = BuilderColumn(builderStatus)
+        return column
+
+    def setChanges(self, changes):
+        if self.changes is None:
+            self.changes = changes[-self.MAX_CHANGES:]
+
+    def _buildChanged(self, build):
+        column = self.columns.get(build.getBuilder().getName())
+        if column is not None:
+            column.buildChanged(build.getNumber())
+
+    # IStatusReceiver
+
+    def builderAdded(self, builderName, builder):
+        self.builderStatuses[builderName] = builder
+        self.columns.pop(builderName, None)
+        return self
+
+    def builderRemoved(self, builderName):
+        self.builderStatuses.pop(builderName, None)
+        self.columns.pop(builderName, None)
+
+    def buildStarted(self, builderName, build):
+        self._buildChanged(build)
+        return self
+
+    def stepStarted(self, build, step):
+        self._buildChanged(build)
+
+    def stepFinished(self, build, step, results):
+        self._buildChanged(build)
+
+    def buildFinished(self, builderName, build, results):
+        self._buildChanged(build)
+
+    def changeAdded(self, change):
+        if self.changes is not None:
+            self.changes = (self.changes + [ change ])[-self.MAX_CHANGES:]
+
+
 class WaterfallStatusResource(HtmlResource):
     """This builds the main status page, with the waterfall display, and
     all child pages."""
@@ -335,8 +599,19 @@ class WaterfallStatusResource(HtmlResource):
         self.categories = categories
         self.num_events=num_events
         self.num_events_max=num_events_max
+        self.model = None
         self.putChild("help", WaterfallHelp(categories))
 
+    def getModel(self, request):
+        if self.model is None:
+            self.model = WaterfallModel(self.getStatus(request))
+        return self.model
+
+    def stopModel(self):
+        if self.model is not None:
+            self.model.stop()
+            self.model = None
+
     def getPageTitle(self, request):
         status = self.getStatus(request)
         p = status.getTitle()
@@ -396,15 +671,21 @@ class WaterfallStatusResource(HtmlResource):
 
         results = {}
 
-        # recent changes
-        changes_d = master.db.changes.getRecentChanges(40)
-        def to_changes(chdicts):
-            return defer.gatherResults([
-                changes.Change.fromChdict(master, chdict)
-                for chdict in chdicts ])
-        changes_d.addCallback(to_changes)
+        # recent changes, which the model keeps once they have been loaded
+        model = self.getModel(request)
+        if model.changes is not None:
+            changes_d = defer.succeed(model.changes)
+        else:
+            changes_d = master.db.changes.getRecentChanges(model.MAX_CHANGES)
+            def to_changes(chdicts):
+                return defer.gatherResults([
+                    changes.Change.fromChdict(master, chdict)
+                    for chdict in chdicts ])
+            changes_d.addCallback(to_changes)
+            changes_d.addCallback(lambda changes :
+                    model.setChanges(changes) or changes)
         def keep_changes(changes):
-            results['changes'] = changes
+            results['changes'] = list(changes)
         changes_d.addCallback(keep_changes)
 
         # build request counts for each builder
@@ -533,7 +814,6 @@ class WaterfallStatusResource(HtmlResource):
     
     def buildGrid(self, request, builders, changes):
         debug = False
-        # TODO: see if we can use a cached copy
 
         showEvents = False
         if request.args.get("show_events", ["false"])[0].lower() == "true":
@@ -558,6 +838,9 @@ class WaterfallStatusResource(HtmlResource):
         else:
             maxPageLen = req_events
 
+        changeNames = ["changes"]
+        builderNames = map(lambda builder: builder.getName(), builders)
+
         # first step is to walk backwards in time, asking each column
         # (commit, all builders) if they have any events there. Build up the
         # array of events, and stop when we have a reasonable number.
@@ -565,9 +848,8 @@ class WaterfallStatusResource(HtmlResource):
         commit_source = ChangeEventSource(changes)
 
         lastEventTime = util.now()
-        sources = [commit_source] + builders
-        changeNames = ["changes"]
-        builderNames = map(lambda builder: builder.getName(), builders)
+        model = self.getModel(request)
+        sources = [commit_source] + [ model.getColumn(b) for b in builders ]
         sourceNames = changeNames + builderNames
         sourceEvents = []
         sourceGenerators = []
@@ -576,12 +858,12 @@ class WaterfallStatusResource(HtmlResource):
             try:
                 while True:
                     e = g.next()
-                    # e might be builder.BuildStepStatus,
-                    # builder.BuildStatus, builder.Event,
-                    # waterfall.Spacer(builder.Event), or changes.Change .
+                    # e might be a WaterfallEvent (for a build, step or
+                    # builder.Event), waterfall.Spacer(builder.Event), or
+                    # changes.Change .
                     # The showEvents=False flag means we should hide
                     # builder.Event .
-                    if not showEvents and isinstance(e, builder.Event):
+                    if not showEvents and isBuilderEvent(e):
                         continue
                     break
                 event = interfaces.IStatusEvent(e)
@@ -136,7 +136,7 @@ class Blocker(BuildStep):
         # needed information. When that is implemented, then Blocker
         # needs to be adapted to use it, and *then* Blocker should be
         # safe to use.
-        all_builds = (builderStatus.buildCache.values() +
+        all_builds = (builderStatus.getCachedBuilds() +
                       builderStatus.getCurrentBuilds())
 
         for buildStatus in all_builds:
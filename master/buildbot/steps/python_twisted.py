@@ -17,6 +17,7 @@
 from twisted.python import log
 
 from buildbot.status import testresult
+from buildbot.status.logfile import STDOUT, STDERR
 from buildbot.status.results import SUCCESS, FAILURE, WARNINGS, SKIPPED
 from buildbot.process.buildstep import LogLineObserver, OutputProgressObserver
 from buildbot.steps.shell import ShellCommand
@@ -78,8 +79,8 @@ class HLint(ShellCommand):
         # submitted to hlint) because it is available in the logfile and
         # mostly exists to give the user an idea of how long the step will
         # take anyway).
-        lines = cmd.logs['stdio'].getText().split("\n")
-        warningLines = filter(lambda line:':' in line, lines)
+        warningLines = [ line for line in cmd.logs['stdio'].iterLines()
+                         if ':' in line ]
         if warningLines:
             self.addCompleteLog("warnings", "".join(warningLines))
         warnings = len(warningLines)
@@ -411,7 +412,11 @@ class Trial(ShellCommand):
 
         # 'cmd' is the original trial command, so cmd.logs['stdio'] is the
         # trial output. We don't have access to test.log from here.
-        output = cmd.logs['stdio'].getText()
+        # only the end of the output is needed to count the tests
+        stdio = cmd.logs['stdio']
+        start = max(0, stdio.getTextLength() - 10000)
+        output = "".join(stdio.getChunksFrom(start, channels=[STDOUT, STDERR],
+                                             onlyText=True))
         counts = countFailedTests(output)
 
         total = counts['total']
@@ -500,14 +505,10 @@ class Trial(ShellCommand):
         self.build.build_status.addTestResult(tr)
 
     def createSummary(self, loog):
-        output = loog.getText()
         problems = ""
-        sio = StringIO.StringIO(output)
+        lines = loog.iterLines()
         warnings = {}
-        while 1:
-            line = sio.readline()
-            if line == "":
-                break
+        for line in lines:
             if line.find(" exceptions.DeprecationWarning: ") != -1:
                 # no source
                 warning = line # TODO: consider stripping basedir prefix here
@@ -515,15 +516,17 @@ class Trial(ShellCommand):
             elif (line.find(" DeprecationWarning: ") != -1 or
                 line.find(" UserWarning: ") != -1):
                 # next line is the source
-                warning = line + sio.readline()
+                try:
+                    warning = line + lines.next()
+                except StopIteration:
+                    warning = line
                 warnings[warning] = warnings.get(warning, 0) + 1
             elif line.find("Warning: ") != -1:
                 warning = line
                 warnings[warning] = warnings.get(warning, 0) + 1
 
             if line.find("=" * 60) == 0 or line.find("-" * 60) == 0:
-                problems += line
-                problems += sio.read()
+                problems = line + "".join(lines)
                 break
 
         if problems:
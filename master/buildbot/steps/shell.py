@@ -20,6 +20,7 @@ from twisted.spread import pb
 from buildbot.process import buildstep
 from buildbot.status.results import SUCCESS, WARNINGS, FAILURE
 from buildbot.status.logfile import STDOUT, STDERR
+from buildbot.util.lines import LineSplitter, LineMatcher
 
 # for existing configurations that import WithProperties from here.  We like
 # to move this class around just to keep our readers guessing.
@@ -515,26 +516,39 @@ class WarningCountingShellCommand(ShellCommand):
 
         # Check if each line in the output from this command matched our
         # warnings regular expressions. If did, bump the warnings count and
-        # add the line to the collection of lines with warnings
-        warnings = []
-        # TODO: use log.readlines(), except we need to decide about stdout vs
-        # stderr
-        for line in log.getText().split("\n"):
-            if directoryEnterRe:
-                match = directoryEnterRe.search(line)
-                if match:
+        # add the line to the collection of lines with warnings.  The lines
+        # are matched a chunk at a time, against all of the patterns at once.
+        patterns = []
+        enterIndex = leaveIndex = None
+        if directoryEnterRe:
+            enterIndex = len(patterns)
+            patterns.append(directoryEnterRe)
+        if directoryLeaveRe:
+            leaveIndex = len(patterns)
+            patterns.append(directoryLeaveRe)
+        patterns.append(wre)
+        matcher = LineMatcher(patterns, anchored=[len(patterns)-1])
+        def linesReceived(lines):
+            for n, i, match in matcher.matchLines(lines):
+                line = lines[n]
+                if i == enterIndex:
                     self.directoryStack.append(match.group(1))
                     continue
-            if (directoryLeaveRe and
-                self.directoryStack and
-                directoryLeaveRe.search(line)):
-                    self.directoryStack.pop()
-                    continue
-
-            match = wre.match(line)
-            if match:
+                if i == leaveIndex:
+                    if self.directoryStack:
+                        self.directoryStack.pop()
+                        continue
+                    match = wre.match(line)
+                    if not match:
+                        continue
                 self.maybeAddWarning(warnings, line, match)
 
+        warnings = []
+        splitter = LineSplitter(max_length=None)
+        for text in log.getChunks([STDOUT, STDERR], onlyText=True):
+            linesReceived(splitter.split(text))
+        linesReceived(splitter.flush())
+
         # If there were any warnings, make the log if lines with warnings
         # available
         if self.warnCount:
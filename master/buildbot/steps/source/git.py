@@ -230,7 +230,7 @@ class Git(Source):
     def parseGotRevision(self, _):
         d = self._dovccmd(['rev-parse', 'HEAD'])
         def setrev(res):
-            revision = self.getLog('stdio').readlines()[-1].strip()
+            revision = list(self.getLog('stdio').readlines())[-1].strip()
             if len(revision) != 40:
                 raise failure.Failure
             log.msg("Got Git revision %s" % (revision, ))
@@ -255,7 +255,7 @@ class SVN(Source):
         cmd.useLog(self.stdio_log, False)
         d = self.runCommand(cmd)
         def _setrev(res):
-            output = self.getLog('stdio').readlines()[-1].strip()
+            output = list(self.getLog('stdio').readlines())[-1].strip()
             revision = output.rstrip('MS')
             revision = revision.split(':')[-1]
             try:
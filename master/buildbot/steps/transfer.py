@@ -14,15 +14,15 @@
 # Copyright Buildbot Team Members
 
 
-import os.path, tarfile, tempfile
+import os.path, tarfile, tempfile, Queue
 try:
     from cStringIO import StringIO
     assert StringIO
 except ImportError:
     from StringIO import StringIO
-from twisted.internet import reactor
+from twisted.internet import reactor, defer, threads
 from twisted.spread import pb
-from twisted.python import log
+from twisted.python import log, failure, threadpool
 from buildbot.process.buildstep import RemoteCommand, BuildStep
 from buildbot.process.buildstep import SUCCESS, FAILURE, SKIPPED
 from buildbot.interfaces import BuildSlaveTooOldError
@@ -45,7 +45,7 @@ class _FileWriter(pb.Referenceable):
         self.mode = mode
         fd, self.tmpname = tempfile.mkstemp(dir=dirname)
         self.fp = os.fdopen(fd, 'wb')
-        self.remaining = maxsize
+        self.remaining = self.maxsize = maxsize
 
     def remote_write(self, data):
         """
@@ -63,6 +63,23 @@ class _FileWriter(pb.Referenceable):
         else:
             self.fp.write(data)
 
+    def remote_writeAt(self, offset, data):
+        """
+        Called from remote slave to write L{data} at position L{offset} of
+        L{fp}, within boundaries of L{maxsize}.  Slaves that keep several
+        blocks in flight use this rather than L{remote_write}, so the blocks
+        may arrive in any order.
+
+        @type  offset: C{integer}
+        @param offset: position in the file of the first byte of L{data}
+        @type  data: C{string}
+        @param data: String of data to write
+        """
+        if self.maxsize is not None:
+            data = data[:max(0, self.maxsize - offset)]
+        self.fp.seek(offset)
+        self.fp.write(data)
+
     def remote_utime(self, accessed_modified):
         os.utime(self.destfile,accessed_modified)
 
@@ -167,6 +184,224 @@ class _DirectoryWriter(_FileWriter):
         os.remove(self.tarname)
 
 
+class _BlockQueue:
+    """
+    A file-like object that is read in one thread from blocks of data queued
+    in another.  Each block is queued with a Deferred, which is fired in the
+    reactor thread once the reader has taken the block.
+    """
+
+    def __init__(self):
+        self.queue = Queue.Queue()
+        self.data = ''
+        self.eof = False
+
+    def put(self, data, d):
+        self.queue.put((data, d))
+
+    def putEOF(self):
+        self.queue.put((None, None))
+
+    def read(self, size):
+        while not self.data and not self.eof:
+            data, d = self.queue.get()
+            if d is None:
+                self.eof = True
+            else:
+                reactor.callFromThread(d.callback, None)
+                self.data = data
+        data, self.data = self.data[:size], self.data[size:]
+        return data
+
+    def drain(self, failure=None):
+        """
+        Fire the Deferreds of any blocks the reader did not take
+        """
+        while True:
+            try:
+                data, d = self.queue.get_nowait()
+            except Queue.Empty:
+                return
+            if d is None:
+                continue
+            if failure:
+                d.errback(failure)
+            else:
+                d.callback(None)
+
+
+class _UnpackPool(object):
+    """
+    The threads in which streamed directory uploads are unpacked.  An
+    unpacker spends most of its time waiting for the slave, so unpackers are
+    kept out of the reactor's thread pool, where they would hold up its other
+    users; uploads beyond C{maxthreads} wait for a thread to become free.
+    """
+
+    def __init__(self, maxthreads=4, _reactor=reactor):
+        self.maxthreads = maxthreads
+        self._reactor = _reactor
+        self.writers = set()
+        self.threadpool = None
+        self._stop_evt = None
+
+    def unpack(self, writer):
+        """
+        Call C{writer._unpack} in one of my threads
+
+        @returns: Deferred that fires when it returns
+        """
+        if not self.threadpool:
+            self._start()
+        self.writers.add(writer)
+        d = threads.deferToThreadPool(self._reactor, self.threadpool,
+                                      writer._unpack)
+        def done(res):
+            self.writers.discard(writer)
+            return res
+        d.addBoth(done)
+        return d
+
+    def shutdown(self):
+        """Stop my threads.  This is only necessary from tests, as the pool
+        stops itself when the reactor stops."""
+        if self._stop_evt:
+            self._reactor.removeSystemEventTrigger(self._stop_evt)
+            self._stop()
+
+    def _start(self):
+        self.threadpool = threadpool.ThreadPool(minthreads=0,
+                maxthreads=self.maxthreads, name='DirectoryUpload')
+        self.threadpool.start()
+        self._stop_evt = self._reactor.addSystemEventTrigger(
+                'during', 'shutdown', self._stop)
+
+    def _stop(self):
+        self._stop_evt = None
+        # end the archives that are still arriving, so that no thread is
+        # left waiting for the slave
+        for writer in list(self.writers):
+            writer.cancel()
+        self.threadpool.stop()
+        self.threadpool = None
+
+# the pool shared by all streamed directory uploads
+_unpackPool = _UnpackPool()
+
+
+class _DirectoryStreamWriter(pb.Referenceable):
+    """
+    Writer for DirectoryUpload from slaves that send the archive as they
+    produce it.  The archive is unpacked in a thread while it arrives, rather
+    than being written to a temporary file and unpacked at the end.  The
+    slave's writes are acknowledged only once the unpacker has taken them,
+    so at most a window's worth of the archive is held in memory.
+    """
+
+    def __init__(self, destroot, maxsize, compress, mode):
+        self.destroot = destroot
+        self.maxsize = maxsize
+        if compress:
+            self.tarmode = 'r|' + compress
+        else:
+            self.tarmode = 'r|'
+
+        self.offset = 0
+        self.pending = {}
+        self.blocks = None
+        self.done = False
+        self.failure = None
+        self.waiters = []
+
+    def _start(self):
+        if self.blocks is None:
+            self.blocks = _BlockQueue()
+            d = _unpackPool.unpack(self)
+            d.addBoth(self._unpacked)
+
+    def _unpack(self):
+        # Support old python
+        if not hasattr(tarfile.TarFile, 'extractall'):
+            tarfile.TarFile.extractall = _extractall
+
+        archive = tarfile.open(mode=self.tarmode, fileobj=self.blocks)
+        archive.extractall(path=self.destroot)
+        archive.close()
+
+    def _unpacked(self, res):
+        self.done = True
+        if isinstance(res, failure.Failure):
+            log.msg("DirectoryUpload: error unpacking archive:")
+            log.err(res)
+            self.failure = res
+        self.blocks.drain(self.failure)
+        for d, data in self.pending.values():
+            d.callback(None)
+        self.pending = {}
+        waiters, self.waiters = self.waiters, []
+        for d in waiters:
+            if self.failure:
+                d.errback(self.failure)
+            else:
+                d.callback(None)
+
+    def remote_write(self, data):
+        """
+        Called from remote slave to pass the next block of the archive
+        """
+        return self.remote_writeAt(self.offset, data)
+
+    def remote_writeAt(self, offset, data):
+        """
+        Called from remote slave to pass the block of the archive starting at
+        L{offset}.  Blocks are unpacked in order, so one that arrives early
+        is held until those before it have arrived.
+
+        @returns: Deferred that fires when the unpacker has taken the block
+        """
+        if self.done:
+            if self.failure:
+                return defer.fail(self.failure)
+            return None
+        if self.maxsize is not None:
+            data = data[:max(0, self.maxsize - offset)]
+        if not data:
+            return None
+        self._start()
+
+        d = defer.Deferred()
+        self.pending[offset] = (d, data)
+        while self.offset in self.pending:
+            d1, data1 = self.pending.pop(self.offset)
+            self.blocks.put(data1, d1)
+            self.offset += len(data1)
+        return d
+
+    def remote_unpack(self):
+        """
+        Called by remote slave to state that no more data will be transfered
+
+        @returns: Deferred that fires when the archive has been unpacked
+        """
+        if self.done:
+            if self.failure:
+                return defer.fail(self.failure)
+            return None
+        self._start()
+        d = defer.Deferred()
+        self.waiters.append(d)
+        self.blocks.putEOF()
+        return d
+
+    def cancel(self):
+        """
+        Stop unpacking, if the transfer ended without a call to
+        L{remote_unpack}
+        """
+        if self.blocks is not None and not self.done:
+            self.blocks.putEOF()
+
+
 class StatusRemoteCommand(RemoteCommand):
     def __init__(self, remote_command, args):
         RemoteCommand.__init__(self, remote_command, args)
@@ -197,6 +432,12 @@ class _TransferBuildStep(BuildStep):
         if self.workdir is None:
             self.workdir = workdir
 
+    def _addWindow(self, command, args):
+        # slaves from command version 2.15 can keep several blocks in flight
+        if self.window > 1 and \
+                not self.slaveVersionIsOlderThan(command, "2.15"):
+            args['window'] = self.window
+
     def _getWorkdir(self):
         if self.workdir is None:
             workdir = self.DEFAULT_WORKDIR
@@ -236,6 +477,8 @@ class FileUpload(_TransferBuildStep):
                      base dir, default 'build'
     - ['maxsize']    maximum size of the file, default None (=unlimited)
     - ['blocksize']  maximum size of each block being transfered
+    - ['window']     number of blocks in flight at once, for slaves that
+                     support it
     - ['mode']       file access mode for the resulting master-side file.
                      The default (=None) is to leave it up to the umask of
                      the buildmaster process.
@@ -248,7 +491,8 @@ class FileUpload(_TransferBuildStep):
     renderables = [ 'slavesrc', 'masterdest' ]
 
     def __init__(self, slavesrc, masterdest,
-                 workdir=None, maxsize=None, blocksize=16*1024, mode=None, keepstamp=False,
+                 workdir=None, maxsize=None, blocksize=16*1024, window=4, mode=None,
+                 keepstamp=False,
                  **buildstep_kwargs):
         BuildStep.__init__(self, **buildstep_kwargs)
         self.addFactoryArguments(slavesrc=slavesrc,
@@ -256,6 +500,7 @@ class FileUpload(_TransferBuildStep):
                                  workdir=workdir,
                                  maxsize=maxsize,
                                  blocksize=blocksize,
+                                 window=window,
                                  mode=mode,
                                  keepstamp=keepstamp,
                                  )
@@ -265,6 +510,7 @@ class FileUpload(_TransferBuildStep):
         self.workdir = workdir
         self.maxsize = maxsize
         self.blocksize = blocksize
+        self.window = window
         assert isinstance(mode, (int, type(None)))
         self.mode = mode
         self.keepstamp = keepstamp
@@ -306,6 +552,7 @@ class FileUpload(_TransferBuildStep):
             'keepstamp': self.keepstamp,
             }
 
+        self._addWindow('uploadFile', args)
         self.cmd = StatusRemoteCommand('uploadFile', args)
         d = self.runCommand(self.cmd)
         d.addCallback(self.finished).addErrback(self.failed)
@@ -324,7 +571,11 @@ class DirectoryUpload(_TransferBuildStep):
     - ['maxsize']    maximum size of the compressed tarfile containing the
                      whole directory
     - ['blocksize']  maximum size of each block being transfered
+    - ['window']     number of blocks in flight at once, for slaves that
+                     support it
     - ['compress']   compression type to use: one of [None, 'gz', 'bz2']
+    - ['stream']     if True, slaves that support it archive the directory
+                     as it is sent, and the master unpacks it as it arrives
 
     """
 
@@ -332,16 +583,20 @@ class DirectoryUpload(_TransferBuildStep):
 
     renderables = [ 'slavesrc', 'masterdest' ]
 
+    dirWriter = None
+
     def __init__(self, slavesrc, masterdest,
-                 workdir=None, maxsize=None, blocksize=16*1024,
-                 compress=None, **buildstep_kwargs):
+                 workdir=None, maxsize=None, blocksize=16*1024, window=4,
+                 compress=None, stream=True, **buildstep_kwargs):
         BuildStep.__init__(self, **buildstep_kwargs)
         self.addFactoryArguments(slavesrc=slavesrc,
                                  masterdest=masterdest,
                                  workdir=workdir,
                                  maxsize=maxsize,
                                  blocksize=blocksize,
+                                 window=window,
                                  compress=compress,
+                                 stream=stream,
                                  )
 
         self.slavesrc = slavesrc
@@ -349,8 +604,10 @@ class DirectoryUpload(_TransferBuildStep):
         self.workdir = workdir
         self.maxsize = maxsize
         self.blocksize = blocksize
+        self.window = window
         assert compress in (None, 'gz', 'bz2')
         self.compress = compress
+        self.stream = stream
 
     def start(self):
         version = self.slaveVersion("uploadDirectory")
@@ -371,8 +628,19 @@ class DirectoryUpload(_TransferBuildStep):
 
         self.step_status.setText(['uploading', os.path.basename(source)])
         
+        # slaves from command version 2.16 can archive the directory as they
+        # send it, so that it can be unpacked as it arrives
+        stream = self.stream and \
+                not self.slaveVersionIsOlderThan("uploadDirectory", "2.16")
+
         # we use maxsize to limit the amount of data on both sides
-        dirWriter = _DirectoryWriter(masterdest, self.maxsize, self.compress, 0600)
+        if stream:
+            dirWriter = _DirectoryStreamWriter(masterdest, self.maxsize,
+                                               self.compress, 0600)
+        else:
+            dirWriter = _DirectoryWriter(masterdest, self.maxsize,
+                                         self.compress, 0600)
+        self.dirWriter = dirWriter
 
         # default arguments
         args = {
@@ -383,9 +651,17 @@ class DirectoryUpload(_TransferBuildStep):
             'blocksize': self.blocksize,
             'compress': self.compress
             }
+        if stream:
+            args['stream'] = True
 
+        self._addWindow('uploadDirectory', args)
         self.cmd = StatusRemoteCommand('uploadDirectory', args)
         d = self.runCommand(self.cmd)
+        if stream:
+            def cancel(res):
+                dirWriter.cancel()
+                return res
+            d.addBoth(cancel)
         d.addCallback(self.finished).addErrback(self.failed)
 
     def finished(self, result):
@@ -397,6 +673,13 @@ class DirectoryUpload(_TransferBuildStep):
         if self.cmd.stderr != '':
             self.addCompleteLog('stderr', self.cmd.stderr)
 
+        # a streamed archive may have failed to unpack, even though the
+        # slave sent all of it
+        unpack_failure = getattr(self.dirWriter, 'failure', None)
+        if unpack_failure is not None:
+            self.addCompleteLog('unpack', unpack_failure.getTraceback())
+            return BuildStep.finished(self, FAILURE)
+
         if self.cmd.rc is None or self.cmd.rc == 0:
             return BuildStep.finished(self, SUCCESS)
         return BuildStep.finished(self, FAILURE)
@@ -428,6 +711,26 @@ class _FileReader(pb.Referenceable):
         data = self.fp.read(maxlength)
         return data
 
+    def remote_readAt(self, offset, maxlength):
+        """
+        Called from remote slave to read at most L{maxlength} bytes of data,
+        starting at position L{offset}.  Slaves that keep several blocks in
+        flight use this rather than L{remote_read}.
+
+        @type  offset: C{integer}
+        @param offset: position in the file of the first byte to read
+        @type  maxlength: C{integer}
+        @param maxlength: Maximum number of data bytes that can be returned
+
+        @return: Data read from L{fp}
+        @rtype: C{string} of bytes read from file
+        """
+        if self.fp is None:
+            return ''
+
+        self.fp.seek(offset)
+        return self.fp.read(maxlength)
+
     def remote_close(self):
         """
         Called by remote slave to state that no more data will be transfered
@@ -450,6 +753,8 @@ class FileDownload(_TransferBuildStep):
                    base dir, default 'build'
      ['maxsize']   maximum size of the file, default None (=unlimited)
      ['blocksize'] maximum size of each block being transfered
+     ['window']    number of blocks in flight at once, for slaves that
+                   support it
      ['mode']      use this to set the access permissions of the resulting
                    buildslave-side file. This is traditionally an octal
                    integer, like 0644 to be world-readable (but not
@@ -464,14 +769,15 @@ class FileDownload(_TransferBuildStep):
     renderables = [ 'mastersrc', 'slavedest' ]
 
     def __init__(self, mastersrc, slavedest,
-                 workdir=None, maxsize=None, blocksize=16*1024, mode=None,
-                 **buildstep_kwargs):
+                 workdir=None, maxsize=None, blocksize=16*1024, window=4,
+                 mode=None, **buildstep_kwargs):
         BuildStep.__init__(self, **buildstep_kwargs)
         self.addFactoryArguments(mastersrc=mastersrc,
                                  slavedest=slavedest,
                                  workdir=workdir,
                                  maxsize=maxsize,
                                  blocksize=blocksize,
+                                 window=window,
                                  mode=mode,
                                  )
 
@@ -480,6 +786,7 @@ class FileDownload(_TransferBuildStep):
         self.workdir = workdir
         self.maxsize = maxsize
         self.blocksize = blocksize
+        self.window = window
         assert isinstance(mode, (int, type(None)))
         self.mode = mode
 
@@ -522,6 +829,7 @@ class FileDownload(_TransferBuildStep):
             'mode': self.mode,
             }
 
+        self._addWindow('downloadFile', args)
         self.cmd = StatusRemoteCommand('downloadFile', args)
         d = self.runCommand(self.cmd)
         d.addCallback(self.finished).addErrback(self.failed)
@@ -539,6 +847,8 @@ class StringDownload(_TransferBuildStep):
                    base dir, default 'build'
      ['maxsize']   maximum size of the file, default None (=unlimited)
      ['blocksize'] maximum size of each block being transfered
+     ['window']    number of blocks in flight at once, for slaves that
+                   support it
      ['mode']      use this to set the access permissions of the resulting
                    buildslave-side file. This is traditionally an octal
                    integer, like 0644 to be world-readable (but not
@@ -552,14 +862,15 @@ class StringDownload(_TransferBuildStep):
     renderables = [ 'slavedest', 's' ]
 
     def __init__(self, s, slavedest,
-                 workdir=None, maxsize=None, blocksize=16*1024, mode=None,
-                 **buildstep_kwargs):
+                 workdir=None, maxsize=None, blocksize=16*1024, window=4,
+                 mode=None, **buildstep_kwargs):
         BuildStep.__init__(self, **buildstep_kwargs)
         self.addFactoryArguments(s=s,
                                  slavedest=slavedest,
                                  workdir=workdir,
                                  maxsize=maxsize,
                                  blocksize=blocksize,
+                                 window=window,
                                  mode=mode,
                                  )
 
@@ -568,6 +879,7 @@ class StringDownload(_TransferBuildStep):
         self.workdir = workdir
         self.maxsize = maxsize
         self.blocksize = blocksize
+        self.window = window
         assert isinstance(mode, (int, type(None)))
         self.mode = mode
 
@@ -599,6 +911,7 @@ class StringDownload(_TransferBuildStep):
             'mode': self.mode,
             }
 
+        self._addWindow('downloadFile', args)
         self.cmd = StatusRemoteCommand('downloadFile', args)
         d = self.runCommand(self.cmd)
         d.addCallback(self.finished).addErrback(self.failed)
@@ -0,0 +1,436 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+
+"""
+Benchmarks for the ingestion of log data by the master.
+
+Each benchmark feeds a synthetic log through the real code, and reports its
+throughput, the latency of each chunk and the peak RSS of the process as a
+JSON object on a line of its own, so that the results can be collected and
+compared between releases.  Run them with::
+
+    python -m buildbot.test.benchmark.logs --help
+
+Peak RSS is that of the whole process, so run a single benchmark per process
+(with --benchmark) to attribute it to that benchmark.
+"""
+
+import sys, time, random, shutil, tempfile
+try:
+    import resource
+except ImportError:
+    resource = None # not on Windows
+
+from twisted.python import usage
+from twisted.internet import defer, reactor
+from twisted.spread import pb
+
+from buildbot.util import json
+from buildbot.status import logfile
+from buildbot.process import buildstep
+
+try:
+    # only available when the buildslave is installed alongside
+    from buildslave import runprocess
+except ImportError:
+    runprocess = None
+
+
+class FakeBuilder:
+    def __init__(self, basedir):
+        self.basedir = basedir
+
+class FakeBuild:
+    def __init__(self, basedir):
+        self.builder = FakeBuilder(basedir)
+
+class FakeStep:
+    """
+    Just enough of a L{BuildStepStatus} for a L{LogFile}
+    """
+    def __init__(self, basedir):
+        self.build = FakeBuild(basedir)
+
+class FakeBuildSlave:
+    def messageReceivedFromSlave(self):
+        pass
+
+class LineCounter(buildstep.LogLineObserver):
+    lines = 0
+    def outLineReceived(self, line):
+        self.lines += 1
+    def errLineReceived(self, line):
+        self.lines += 1
+
+
+def generateChunks(options):
+    """
+    Generate the synthetic log described by C{options}, as (channel, text)
+    pairs.  Lines are assigned to stderr at random, in the proportion given
+    by options['stderr'], and consecutive lines on the same channel are
+    collected into chunks of at most options['chunk-size'] bytes.
+    """
+    rnd = random.Random(options['seed'])
+    length = max(options['line-length'], 1)
+    words = [ "".join([ rnd.choice("abcdefghijklmnopqrstuvwxyz")
+                        for i in range(rnd.randint(1, 12)) ])
+              for i in range(200) ]
+    lines = []
+    for i in range(64):
+        line = []
+        while len(line) < length:
+            line.extend(rnd.choice(words) + " ")
+        lines.append("".join(line[:length-1]) + "\n")
+
+    size = int(options['size'] * 1024 * 1024)
+    chunk_size = options['chunk-size']
+    produced = 0
+    pending = []
+    pending_channel = logfile.STDOUT
+    pending_length = 0
+    while produced < size:
+        line = rnd.choice(lines)
+        if rnd.random() < options['stderr']:
+            channel = logfile.STDERR
+        else:
+            channel = logfile.STDOUT
+        if pending and (channel != pending_channel
+                        or pending_length + len(line) > chunk_size):
+            yield pending_channel, "".join(pending)
+            pending = []
+            pending_length = 0
+        pending_channel = channel
+        pending.append(line)
+        pending_length += len(line)
+        produced += len(line)
+    if pending:
+        yield pending_channel, "".join(pending)
+
+
+class Results:
+    """
+    Collects the time taken to handle each chunk of a benchmark
+    """
+
+    def __init__(self, name, options):
+        self.name = name
+        self.options = options
+        self.latencies = []
+        self.bytes = 0
+        self.started = time.time()
+
+    def record(self, nbytes, elapsed):
+        self.bytes += nbytes
+        self.latencies.append(elapsed)
+
+    def report(self, **extra):
+        """
+        Return the results as a dictionary.  Throughput is measured over the
+        whole benchmark, but excludes the time taken to generate the log.
+        """
+        seconds = sum(self.latencies)
+        latencies = sorted(self.latencies) or [0]
+        def percentile(p):
+            return latencies[min(len(latencies)-1, int(len(latencies)*p))]
+        result = dict(
+            benchmark=self.name,
+            bytes=self.bytes,
+            seconds=seconds,
+            mb_per_s=seconds and self.bytes / seconds / (1024*1024),
+            chunks=len(self.latencies),
+            latency_mean_us=seconds / len(latencies) * 1e6,
+            latency_p50_us=percentile(0.5) * 1e6,
+            latency_p99_us=percentile(0.99) * 1e6,
+            latency_max_us=latencies[-1] * 1e6,
+            peak_rss_kb=peakRSS(),
+            options=dict([ (k, self.options[k]) for k in OPTION_NAMES ]))
+        result.update(extra)
+        return result
+
+def peakRSS():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def makeLogFile(basedir):
+    return logfile.LogFile(FakeStep(basedir), 'stdio', 'bench-stdio')
+
+def benchLogFile(options, basedir):
+    """
+    Add each chunk to a L{LogFile} with addEntry
+    """
+    results = Results('logfile', options)
+    lf = makeLogFile(basedir)
+    for channel, text in generateChunks(options):
+        start = time.time()
+        lf.addEntry(channel, text)
+        results.record(len(text), time.time() - start)
+    start = time.time()
+    lf.finish()
+    results.record(0, time.time() - start)
+    return results.report()
+
+def benchLogLineObserver(options, basedir):
+    """
+    Add each chunk to a L{LogFile} watched by a L{LogLineObserver}
+    """
+    results = Results('loglineobserver', options)
+    lf = makeLogFile(basedir)
+    observer = LineCounter()
+    lf.subscribe(observer, False)
+    for channel, text in generateChunks(options):
+        start = time.time()
+        lf.addEntry(channel, text)
+        results.record(len(text), time.time() - start)
+    start = time.time()
+    lf.finish()
+    results.record(0, time.time() - start)
+    return results.report(lines=observer.lines)
+
+def makeCommand(basedir):
+    lf = makeLogFile(basedir)
+    cmd = buildstep.LoggedRemoteCommand('shell', {})
+    cmd.buildslave = FakeBuildSlave()
+    cmd.active = True
+    cmd.updates = {}
+    cmd.useLog(lf, False, 'stdio')
+    return cmd, lf
+
+def generateBatches(options):
+    """
+    Group the chunks of the synthetic log into batches of updates, as the
+    slave sends them
+    """
+    batch = []
+    nbytes = 0
+    for channel, text in generateChunks(options):
+        if channel == logfile.STDERR:
+            batch.append([{'stderr': text}, 0])
+        else:
+            batch.append([{'stdout': text}, 0])
+        nbytes += len(text)
+        if len(batch) >= options['batch']:
+            yield batch, nbytes
+            batch = []
+            nbytes = 0
+    if batch:
+        yield batch, nbytes
+
+def benchRemoteUpdate(options, basedir):
+    """
+    Pass batches of updates to L{LoggedRemoteCommand.remote_update}
+    """
+    results = Results('remoteupdate', options)
+    cmd, lf = makeCommand(basedir)
+    for batch, nbytes in generateBatches(options):
+        start = time.time()
+        cmd.remote_update(batch)
+        results.record(nbytes, time.time() - start)
+    lf.finish()
+    return results.report()
+
+class CommandRoot(pb.Root):
+    def __init__(self, cmd):
+        self.cmd = cmd
+    def remote_getCommand(self):
+        return self.cmd
+
+class ServerFactory(pb.PBServerFactory):
+    def clientConnectionMade(self, broker):
+        self.broker = broker
+
+@defer.deferredGenerator
+def benchPB(options, basedir):
+    """
+    Send batches of updates to L{LoggedRemoteCommand.remote_update} over a
+    loopback PB connection, keeping options['window'] batches in flight.
+    Latency is measured from sending each batch to its acknowledgement, and
+    throughput over the whole transfer.
+    """
+    results = Results('pb', options)
+    cmd, lf = makeCommand(basedir)
+    serverFactory = ServerFactory(CommandRoot(cmd))
+    port = reactor.listenTCP(0, serverFactory, interface="127.0.0.1")
+    clientFactory = pb.PBClientFactory()
+    reactor.connectTCP("127.0.0.1", port.getHost().port, clientFactory)
+
+    wfd = defer.waitForDeferred(clientFactory.getRootObject())
+    yield wfd
+    root = wfd.getResult()
+    wfd = defer.waitForDeferred(root.callRemote("getCommand"))
+    yield wfd
+    remoteCmd = wfd.getResult()
+
+    done = defer.Deferred()
+    batches = generateBatches(options)
+    state = dict(outstanding=0, finished=False)
+    def sendBatches():
+        while not state['finished'] and \
+                state['outstanding'] < options['window']:
+            try:
+                batch, nbytes = batches.next()
+            except StopIteration:
+                state['finished'] = True
+                break
+            state['outstanding'] += 1
+            d = remoteCmd.callRemote("update", batch)
+            d.addCallback(acked, nbytes, time.time())
+            d.addErrback(done.errback)
+        if state['finished'] and not state['outstanding'] and not done.called:
+            done.callback(None)
+    def acked(res, nbytes, start):
+        results.record(nbytes, time.time() - start)
+        state['outstanding'] -= 1
+        sendBatches()
+
+    started = time.time()
+    sendBatches()
+    wfd = defer.waitForDeferred(done)
+    yield wfd
+    wfd.getResult()
+    elapsed = time.time() - started
+    lf.finish()
+
+    # shut the connection down cleanly
+    disconnected = defer.Deferred()
+    serverFactory.broker.notifyOnDisconnect(lambda : disconnected.callback(None))
+    clientFactory.disconnect()
+    wfd = defer.waitForDeferred(disconnected)
+    yield wfd
+    wfd.getResult()
+    wfd = defer.waitForDeferred(defer.maybeDeferred(port.stopListening))
+    yield wfd
+    wfd.getResult()
+
+    # the per-batch latencies overlap, so measure throughput over the
+    # whole transfer instead
+    report = results.report()
+    report['seconds'] = elapsed
+    report['mb_per_s'] = elapsed and results.bytes / elapsed / (1024*1024)
+    yield report
+
+class FakeSlaveBuilder:
+    """
+    Just enough of a slave-side SlaveBuilder for a L{RunProcess}
+    """
+    usePTY = False
+    def __init__(self, basedir):
+        self.basedir = basedir
+        self.updates = 0
+    def sendUpdate(self, data):
+        self.updates += 1
+
+def benchSendBuffers(options, basedir):
+    """
+    Buffer each chunk in a slave-side L{RunProcess}, which sends the buffers
+    to the slave builder as they fill
+    """
+    results = Results('sendbuffers', options)
+    builder = FakeSlaveBuilder(basedir)
+    rp = runprocess.RunProcess(builder, ['true'], basedir)
+    for channel, text in generateChunks(options):
+        if channel == logfile.STDERR:
+            name = 'stderr'
+        else:
+            name = 'stdout'
+        start = time.time()
+        rp._addToBuffers(name, text)
+        results.record(len(text), time.time() - start)
+    start = time.time()
+    rp._sendBuffers()
+    results.record(0, time.time() - start)
+    return results.report(updates=builder.updates)
+
+benchmarks = [
+    ('logfile', benchLogFile),
+    ('loglineobserver', benchLogLineObserver),
+    ('remoteupdate', benchRemoteUpdate),
+    ('pb', benchPB),
+]
+if runprocess:
+    benchmarks.append(('sendbuffers', benchSendBuffers))
+
+
+class Options(usage.Options):
+    optParameters = [
+        ["size", "s", 10.0, "Megabytes of log data for each benchmark",
+            float],
+        ["line-length", "l", 80, "Length of each line, in bytes", int],
+        ["stderr", "e", 0.1, "Fraction of the lines written to stderr",
+            float],
+        ["chunk-size", "c", 4096, "Maximum size of each chunk, in bytes",
+            int],
+        ["batch", "b", 16, "Number of chunks in each batch of updates", int],
+        ["window", "w", 4, "Number of batches in flight over PB", int],
+        ["seed", None, 0, "Seed for the random generation of the log", int],
+        ["benchmark", "B", None,
+            "Run only this benchmark (one of %s)"
+            % ", ".join([ n for n, f in benchmarks ])],
+    ]
+
+    def postOptions(self):
+        names = [ n for n, f in benchmarks ]
+        if self['benchmark'] and self['benchmark'] not in names:
+            raise usage.UsageError("unknown benchmark %r" % self['benchmark'])
+
+OPTION_NAMES = [ 'size', 'line-length', 'stderr', 'chunk-size', 'batch',
+                 'window', 'seed' ]
+
+
+@defer.deferredGenerator
+def runBenchmarks(options, report):
+    """
+    Run the benchmarks selected by C{options}, passing the results of each to
+    C{report}
+    """
+    for name, fn in benchmarks:
+        if options['benchmark'] and name != options['benchmark']:
+            continue
+        basedir = tempfile.mkdtemp()
+        try:
+            wfd = defer.waitForDeferred(defer.maybeDeferred(fn, options,
+                                                            basedir))
+            yield wfd
+            report(wfd.getResult())
+        finally:
+            shutil.rmtree(basedir)
+
+def main(argv=None):
+    options = Options()
+    try:
+        options.parseOptions(argv)
+    except usage.UsageError, e:
+        print >>sys.stderr, "%s\n%s" % (options, e)
+        sys.exit(1)
+
+    def report(result):
+        print json.dumps(result, sort_keys=True)
+        sys.stdout.flush()
+    failures = []
+    def run():
+        d = runBenchmarks(options, report)
+        d.addErrback(failures.append)
+        d.addBoth(lambda _ : reactor.stop())
+    # the benchmarks may finish without waiting on the reactor
+    reactor.callWhenRunning(run)
+    reactor.run()
+    if failures:
+        failures[0].printTraceback()
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
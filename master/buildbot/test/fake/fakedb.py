@@ -25,6 +25,7 @@ from twisted.python import failure
 from twisted.internet import defer, reactor
 from buildbot.db import buildrequests
 from buildbot.process import properties
+from buildbot.status.results import SUCCESS, WARNINGS, FAILURE
 
 # Fake DB Rows
 
@@ -395,6 +396,16 @@ class FakeChangesComponent(FakeDBComponent):
             ch = None
         return defer.succeed(self._ch2chdict(ch))
 
+    def getChanges(self, changeids):
+        return defer.succeed([ self._ch2chdict(self.changes.get(changeid))
+                               for changeid in changeids ])
+
+    def getChangesAfter(self, changeid, count=None):
+        changeids = sorted(id for id in self.changes if id > changeid)
+        if count is not None:
+            changeids = changeids[:count]
+        return self.getChanges(changeids)
+
     def getChangeUids(self, changeid):
         try:
             ch_uids = [self.changes[changeid].uid]
@@ -583,6 +594,10 @@ class FakeSourceStampsComponent(FakeDBComponent):
         else:
             return defer.succeed(None)
 
+    def getSourceStamps(self, ssids):
+        return defer.gatherResults([ self.getSourceStamp(ssid)
+                                     for ssid in ssids ])
+
 
 class FakeBuildsetsComponent(FakeDBComponent):
 
@@ -660,9 +675,11 @@ class FakeBuildsetsComponent(FakeDBComponent):
         row = self.buildsets[bsid]
         return defer.succeed(self._row2dict(row))
 
-    def getBuildsets(self, complete=None):
+    def getBuildsets(self, complete=None, bsids=None):
         rv = []
         for bs in self.buildsets.itervalues():
+            if bsids is not None and bs['id'] not in bsids:
+                continue
             if complete is not None:
                 if complete and bs['complete']:
                     rv.append(self._row2dict(bs))
@@ -692,6 +709,15 @@ class FakeBuildsetsComponent(FakeDBComponent):
         else:
             return defer.succeed({})
 
+    def getBuildsetsProperties(self, bsids):
+        rv = {}
+        for bsid in bsids:
+            if bsid in self.buildsets:
+                rv[bsid] = self.buildsets[bsid]['properties']
+            else:
+                rv[bsid] = {}
+        return defer.succeed(rv)
+
     # fake methods
 
     def fakeBuildsetCompletion(self, bsid, result):
@@ -866,7 +892,7 @@ class FakeBuildRequestsComponent(FakeDBComponent):
             return defer.succeed(None)
 
     def getBuildRequests(self, buildername=None, complete=None, claimed=None,
-                         bsid=None):
+                         bsid=None, brids=None, min_brid=None):
         rv = []
         for br in self.reqs.itervalues():
             if buildername and br.buildername != buildername:
@@ -890,6 +916,10 @@ class FakeBuildRequestsComponent(FakeDBComponent):
             if bsid is not None:
                 if br.buildsetid != bsid:
                     continue
+            if brids is not None and br.id not in brids:
+                continue
+            if min_brid is not None and br.id < min_brid:
+                continue
             rv.append(self._brdictFromRow(br))
         return defer.succeed(rv)
 
@@ -916,6 +946,40 @@ class FakeBuildRequestsComponent(FakeDBComponent):
                 objectid=self.MASTER_ID, claimed_at=self._reactor.seconds())
         return defer.succeed(None)
 
+    def completeBuildRequests(self, brids, results):
+        for brid in brids:
+            if brid not in self.reqs or self.reqs[brid].complete:
+                return defer.fail(
+                        failure.Failure(buildrequests.NotClaimedError))
+        for brid in brids:
+            self.reqs[brid].complete = 1
+            self.reqs[brid].results = results
+            self.reqs[brid].complete_at = self._reactor.seconds()
+        return defer.succeed(None)
+
+    def completeBuildRequestsAndBuildsets(self, brids, results):
+        d = self.completeBuildRequests(brids, results)
+        def complete_buildsets(_):
+            buildsets = self.db.buildsets.buildsets
+            completed = {}
+            bsids = set([ self.reqs[brid].buildsetid for brid in brids ])
+            for bsid in bsids:
+                if bsid not in buildsets or buildsets[bsid]['complete']:
+                    continue
+                reqs = [ br for br in self.reqs.itervalues()
+                         if br.buildsetid == bsid ]
+                if [ br for br in reqs if not br.complete ]:
+                    continue
+                if [ br for br in reqs
+                     if br.results not in (SUCCESS, WARNINGS) ]:
+                    completed[bsid] = FAILURE
+                else:
+                    completed[bsid] = SUCCESS
+                self.db.buildsets.completeBuildset(bsid, completed[bsid])
+            return completed
+        d.addCallback(complete_buildsets)
+        return d
+
     # Code copied from buildrequests.BuildRequestConnectorComponent
     def _brdictFromRow(self, row):
         claimed = mine = False
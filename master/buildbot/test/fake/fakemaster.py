@@ -16,6 +16,7 @@
 import weakref
 from twisted.internet import defer
 from buildbot.test.fake import fakedb
+from buildbot.process import buildrequestqueue
 import mock
 
 class FakeCache(object):
@@ -34,6 +35,14 @@ class FakeCache(object):
         d.addCallback(mkref)
         return d
 
+    def __contains__(self, key):
+        return False
+
+    def prime(self, key, value):
+        if value is not None:
+            weakref.ref(value)
+        return value
+
 
 def make_master(master_id=fakedb.FakeBuildRequestsComponent.MASTER_ID):
     """
@@ -41,6 +50,8 @@ def make_master(master_id=fakedb.FakeBuildRequestsComponent.MASTER_ID):
     implementations:
 
     - Non-caching implementation for C{self.caches}
+    - A real L{BuildRequestQueue} for C{self.botmaster.brqueue}, reading
+      from C{self.db}
     """
 
     fakemaster = mock.Mock(name="fakemaster")
@@ -48,6 +59,10 @@ def make_master(master_id=fakedb.FakeBuildRequestsComponent.MASTER_ID):
     # set up caches
     fakemaster.caches.get_cache = FakeCache
 
+    # and the build request queue
+    fakemaster.botmaster.brqueue = \
+            buildrequestqueue.BuildRequestQueue(fakemaster)
+
     # and a getObjectId method
     fakemaster.getObjectId = (lambda : defer.succeed(master_id))
 
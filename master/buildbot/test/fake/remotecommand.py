@@ -13,8 +13,10 @@
 #
 # Copyright Buildbot Team Members
 
+from StringIO import StringIO
 from twisted.internet import defer
 from twisted.python import failure
+from buildbot.status import logfile
 from buildbot.status.logfile import STDOUT, STDERR, HEADER
 
 
@@ -84,12 +86,24 @@ class FakeLogFile(object):
         self.stderr += data
         self.chunks.append((STDERR, data))
 
-    def readlines(self): # TODO: remove channel arg from logfile.py
-        return self.stdout.split('\n')
+    def readlines(self, channel=STDOUT):
+        return self.iterLines([channel])
+
+    def iterLines(self, channels=[STDOUT, STDERR]):
+        text = "".join(self.getChunks(channels, onlyText=True))
+        return iter(StringIO(text).readlines())
 
     def getText(self):
         return self.stdout
 
+    def getTextLength(self):
+        return len(self.stdout) + len(self.stderr)
+
+    def getChunksFrom(self, start, end=None, channels=[], onlyText=False):
+        # positions count the stdout and stderr text, as in the real LogFile
+        return list(logfile._trimChunks(self.chunks, 0, start, end,
+                                        channels, onlyText))
+
     def getChunks(self, channels=[], onlyText=False):
         if onlyText:
             return [ data
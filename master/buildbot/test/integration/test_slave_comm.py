@@ -73,6 +73,7 @@ class FakeBuilder(object):
         self.name = 'bldr'
         self.slavebuilddir = 'bldr'
         self.slavenames = [ 'testslave' ]
+        self.locks = []
         self.builder_status = mock.Mock()
 
     def attached(self, slave, remote, commands):
@@ -0,0 +1,67 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+
+import shutil, tempfile
+from twisted.trial import unittest
+
+from buildbot.status import logfile
+from buildbot.test.benchmark import logs
+
+class TestLogBenchmarks(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.options = logs.Options()
+        self.options.parseOptions(['--size', '0.01', '--chunk-size', '512'])
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_generateChunks(self):
+        chunks = list(logs.generateChunks(self.options))
+        self.assertEqual(sum([ len(t) for c, t in chunks ]),
+                         len("".join([ t for c, t in chunks ])))
+        self.assertTrue(sum([ len(t) for c, t in chunks ])
+                        >= 0.01 * 1024 * 1024)
+        for channel, text in chunks:
+            self.assertTrue(len(text) <= 512)
+            self.assertTrue(text.endswith("\n"))
+        channels = set([ c for c, t in chunks ])
+        self.assertEqual(channels, set([logfile.STDOUT, logfile.STDERR]))
+        # the log is reproducible
+        self.assertEqual(list(logs.generateChunks(self.options)), chunks)
+
+    def test_badBenchmark(self):
+        self.assertRaises(logs.usage.UsageError,
+                self.options.parseOptions, ['--benchmark', 'nosuch'])
+
+    def test_benchmarks(self):
+        results = []
+        d = logs.runBenchmarks(self.options, results.append)
+        def check(_):
+            self.assertEqual([ r['benchmark'] for r in results ],
+                             [ n for n, f in logs.benchmarks ])
+            size = sum([ len(t) for c, t
+                         in logs.generateChunks(self.options) ])
+            for r in results:
+                self.assertEqual(r['bytes'], size)
+                for key in ('seconds', 'mb_per_s', 'chunks', 'latency_p50_us',
+                            'latency_p99_us', 'latency_max_us', 'peak_rss_kb',
+                            'options'):
+                    self.assertTrue(key in r, (r['benchmark'], key))
+                self.assertEqual(r['options']['chunk-size'], 512)
+        d.addCallback(check)
+        return d
@@ -35,6 +35,7 @@ class AbstractBuildSlave(unittest.TestCase):
         self.assertEqual(bs.properties.getProperty('slavename'), 'bot')
         self.assertEqual(bs.access, [])
         self.assertEqual(bs.keepalive_interval, 3600)
+        self.assertEqual(bs.compress_updates, False)
 
     def test_constructor_full(self):
         lock1, lock2 = mock.Mock(name='lock1'), mock.Mock(name='lock2')
@@ -44,13 +45,15 @@ class AbstractBuildSlave(unittest.TestCase):
                 missing_timeout=120,
                 properties={'a':'b'},
                 locks=[lock1, lock2],
-                keepalive_interval=60)
+                keepalive_interval=60,
+                compress_updates=True)
         self.assertEqual(bs.max_builds, 2)
         self.assertEqual(bs.notify_on_missing, ['me@me.com'])
         self.assertEqual(bs.missing_timeout, 120)
         self.assertEqual(bs.properties.getProperty('a'), 'b')
         self.assertEqual(bs.access, [lock1, lock2])
         self.assertEqual(bs.keepalive_interval, 60)
+        self.assertEqual(bs.compress_updates, True)
 
     def test_constructor_notify_on_missing_not_list(self):
         bs = self.ConcreteBuildSlave('bot', 'pass',
@@ -85,13 +88,15 @@ class AbstractBuildSlave(unittest.TestCase):
                 notify_on_missing=['her@me.com'],
                 missing_timeout=121,
                 properties={'a':'c'},
-                keepalive_interval=61)
+                keepalive_interval=61,
+                compress_updates=True)
         old.update(new)
         self.assertEqual(old.max_builds, 3)
         self.assertEqual(old.notify_on_missing, ['her@me.com'])
         self.assertEqual(old.missing_timeout, 121)
         self.assertEqual(old.properties.getProperty('a'), 'c')
         self.assertEqual(old.keepalive_interval, 61)
+        self.assertEqual(old.compress_updates, True)
 
     def test_setBotmaster(self):
         bs = self.ConcreteBuildSlave('bot', 'pass')
@@ -141,3 +146,21 @@ class AbstractBuildSlave(unittest.TestCase):
         bs.stopMissingTimer()
         self.assertEqual(bs.missing_timer, None)
 
+
+    def test_compressedUpdateReceived(self):
+        bs = self.ConcreteBuildSlave('bot', 'pass', compress_updates=True)
+        bs.compressedUpdateReceived(10, 100)
+        bs.compressedUpdateReceived(30, 100)
+        self.assertEqual(bs.update_bytes_compressed, 40)
+        self.assertEqual(bs.update_bytes_uncompressed, 200)
+
+class AbstractLatentBuildSlave(unittest.TestCase):
+
+    class ConcreteBuildSlave(buildslave.AbstractLatentBuildSlave):
+        pass
+
+    def test_constructor_compress_updates(self):
+        bs = self.ConcreteBuildSlave('bot', 'pass')
+        self.assertEqual(bs.compress_updates, False)
+        bs = self.ConcreteBuildSlave('bot', 'pass', compress_updates=True)
+        self.assertEqual(bs.compress_updates, True)
@@ -151,6 +151,31 @@ class TestBuildsetsConnectorComponent(
                 claimed=False,
                 expected=[52])
 
+    def test_getBuildRequests_unclaimed_min_brid(self):
+        return self.do_test_getBuildRequests_claim_args(
+                claimed=False, min_brid=52,
+                expected=[52])
+
+    def test_getBuildRequests_unclaimed_min_brid_none_left(self):
+        return self.do_test_getBuildRequests_claim_args(
+                claimed=False, min_brid=53,
+                expected=[])
+
+    def test_getBuildRequests_min_brid(self):
+        return self.do_test_getBuildRequests_claim_args(
+                min_brid=51,
+                expected=[51, 52, 53])
+
+    def test_getBuildRequests_brids(self):
+        return self.do_test_getBuildRequests_claim_args(
+                brids=[50, 52, 99],
+                expected=[50, 52])
+
+    def test_getBuildRequests_unclaimed_brids(self):
+        return self.do_test_getBuildRequests_claim_args(
+                claimed=False, brids=[50, 51, 52, 53],
+                expected=[52])
+
     def do_test_getBuildRequests_buildername_arg(self, **kwargs):
         expected = kwargs.pop('expected')
         d = self.insertTestData([
@@ -578,6 +603,105 @@ class TestBuildsetsConnectorComponent(
             ], 1300305712,
             expfailure=buildrequests.NotClaimedError)
 
+    def do_test_completeBuildRequestsAndBuildsets(self, rows, brids,
+            expected_completed, expected_buildsets, results=7):
+        clock = task.Clock()
+        clock.advance(1300305712)
+
+        d = self.insertTestData(rows)
+        d.addCallback(lambda _ :
+            self.db.buildrequests.completeBuildRequestsAndBuildsets(
+                brids=brids, results=results, _reactor=clock))
+        def check(completed):
+            self.assertEqual(completed, expected_completed)
+            def thd(conn):
+                tbl = self.db.model.buildsets
+                q = sa.select([ tbl.c.id, tbl.c.complete,
+                                 tbl.c.results, tbl.c.complete_at ])
+                results = conn.execute(q).fetchall()
+                self.assertEqual(sorted(map(tuple, results)),
+                                 sorted(expected_buildsets))
+            return self.db.pool.do(thd)
+        d.addCallback(check)
+        return d
+
+    def test_completeBuildRequestsAndBuildsets_incomplete(self):
+        # 45 is still incomplete, so the buildset is not complete
+        return self.do_test_completeBuildRequestsAndBuildsets([
+            fakedb.BuildRequest(id=44, buildsetid=self.BSID),
+            fakedb.BuildRequest(id=45, buildsetid=self.BSID),
+            ], [44], {},
+            [ (self.BSID, 0, -1, None) ])
+
+    def test_completeBuildRequestsAndBuildsets_success(self):
+        return self.do_test_completeBuildRequestsAndBuildsets([
+            fakedb.BuildRequest(id=44, buildsetid=self.BSID),
+            fakedb.BuildRequest(id=45, buildsetid=self.BSID,
+                complete=1, results=1, complete_at=1300104190),
+            ], [44], { self.BSID : 0 },
+            [ (self.BSID, 1, 0, 1300305712) ], results=0)
+
+    def test_completeBuildRequestsAndBuildsets_failure(self):
+        # 45 failed earlier, so the buildset fails
+        return self.do_test_completeBuildRequestsAndBuildsets([
+            fakedb.BuildRequest(id=44, buildsetid=self.BSID),
+            fakedb.BuildRequest(id=45, buildsetid=self.BSID,
+                complete=1, results=2, complete_at=1300104190),
+            ], [44], { self.BSID : 2 },
+            [ (self.BSID, 1, 2, 1300305712) ], results=0)
+
+    def test_completeBuildRequestsAndBuildsets_multiple(self):
+        return self.do_test_completeBuildRequestsAndBuildsets([
+            fakedb.Buildset(id=self.BSID2, sourcestampid=234),
+            fakedb.Buildset(id=5671, sourcestampid=234),
+            fakedb.Buildset(id=5672, sourcestampid=234, complete=1,
+                results=0, complete_at=1300104190),
+            fakedb.BuildRequest(id=44, buildsetid=self.BSID),
+            fakedb.BuildRequest(id=45, buildsetid=self.BSID2),
+            fakedb.BuildRequest(id=46, buildsetid=self.BSID2),
+            fakedb.BuildRequest(id=47, buildsetid=5671),
+            fakedb.BuildRequest(id=48, buildsetid=5671),
+            fakedb.BuildRequest(id=49, buildsetid=5672),
+            ], [44, 45, 46, 47, 49], { self.BSID : 2, self.BSID2 : 2 },
+            [ (self.BSID, 1, 2, 1300305712),
+              (self.BSID2, 1, 2, 1300305712),
+              (5671, 0, -1, None),
+              (5672, 1, 0, 1300104190) ])
+
+    def test_completeBuildRequestsAndBuildsets_stress(self):
+        return self.do_test_completeBuildRequestsAndBuildsets([
+                fakedb.Buildset(id=bsid, sourcestampid=234)
+                for bsid in range(1000, 1140)
+            ] + [
+                fakedb.BuildRequest(id=id, buildsetid=1000 + id // 2)
+                for id in range(0, 280)
+            ], range(0, 280),
+            dict([ (bsid, 0) for bsid in range(1000, 1140) ]),
+            [ (self.BSID, 0, -1, None) ] + [
+              (bsid, 1, 0, 1300305712) for bsid in range(1000, 1140) ],
+            results=0)
+
+    def test_completeBuildRequestsAndBuildsets_already_completed(self):
+        d = self.do_test_completeBuildRequestsAndBuildsets([
+            fakedb.BuildRequest(id=44, buildsetid=self.BSID),
+            fakedb.BuildRequest(id=45, buildsetid=self.BSID,
+                complete=1, complete_at=1300104190),
+            ], [44, 45], None, None)
+        def check(_):
+            self.fail("unexpected success")
+        def check_failure(f):
+            f.trap(buildrequests.NotClaimedError)
+            # and nothing was changed
+            def thd(conn):
+                tbl = self.db.model.buildrequests
+                q = sa.select([ tbl.c.id, tbl.c.complete ])
+                results = conn.execute(q).fetchall()
+                self.assertEqual(sorted(map(tuple, results)),
+                                 [ (44, 0), (45, 1) ])
+            return self.db.pool.do(thd)
+        d.addCallbacks(check, check_failure)
+        return d
+
     def do_test_unclaimMethod(self, method, expected):
         d = self.insertTestData([
             # 44: a complete build (should not be unclaimed)
@@ -261,6 +261,30 @@ class TestBuildsetsConnectorComponent(
         "returns an empty dict even if no such buildset exists"
         return self.do_test_getBuildsetProperties(91, [], dict())
 
+    def test_getBuildsetsProperties(self):
+        d = self.insertTestData([
+            fakedb.Buildset(id=91, sourcestampid=234, complete=0,
+                    results=-1, submitted_at=0),
+            fakedb.Buildset(id=92, sourcestampid=234, complete=0,
+                    results=-1, submitted_at=0),
+            fakedb.BuildsetProperty(buildsetid=91, property_name='prop1',
+                    property_value='["one", "fake1"]'),
+            fakedb.BuildsetProperty(buildsetid=92, property_name='prop1',
+                    property_value='["two", "fake2"]'),
+            fakedb.BuildsetProperty(buildsetid=92, property_name='prop2',
+                    property_value='["three", "fake3"]'),
+        ])
+        d.addCallback(lambda _ :
+                self.db.buildsets.getBuildsetsProperties([91, 92, 93]))
+        def check(props):
+            self.assertEqual(props, {
+                91 : dict(prop1=("one", "fake1")),
+                92 : dict(prop1=("two", "fake2"), prop2=("three", "fake3")),
+                93 : dict(),
+            })
+        d.addCallback(check)
+        return d
+
     def test_getBuildset_incomplete_None(self):
         d = self.insertTestData([
             fakedb.Buildset(id=91, sourcestampid=234, complete=0,
@@ -396,6 +420,27 @@ class TestBuildsetsConnectorComponent(
         d.addCallback(check)
         return d
 
+    def test_getBuildsets_bsids(self):
+        d = self.insert_test_getBuildsets_data()
+        d.addCallback(lambda _ :
+                self.db.buildsets.getBuildsets(bsids=[92, 93]))
+        def check(bsdictlist):
+            self.assertEqual([ bsdict['bsid'] for bsdict in bsdictlist ],
+                             [92])
+        d.addCallback(check)
+        return d
+
+    def test_getBuildsets_bsids_incomplete(self):
+        d = self.insert_test_getBuildsets_data()
+        d.addCallback(lambda _ :
+                self.db.buildsets.getBuildsets(complete=False,
+                                               bsids=[91, 92]))
+        def check(bsdictlist):
+            self.assertEqual([ bsdict['bsid'] for bsdict in bsdictlist ],
+                             [91])
+        d.addCallback(check)
+        return d
+
     def test_completeBuildset(self):
         d = self.insert_test_getBuildsets_data()
         d.addCallback(lambda _ :
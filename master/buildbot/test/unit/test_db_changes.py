@@ -20,6 +20,7 @@ from twisted.trial import unittest
 from twisted.internet import defer, task
 from buildbot.changes.changes import Change
 from buildbot.db import changes
+from buildbot.process import cache
 from buildbot.test.util import connector_component
 from buildbot.test.fake import fakedb
 from buildbot.util import epoch2datetime
@@ -160,6 +161,107 @@ class TestChangesConnectorComponent(
         d.addCallback(check14)
         return d
 
+    def test_getChanges(self):
+        d = self.insertTestData(self.change13_rows + self.change14_rows)
+        d.addCallback(lambda _ :
+                self.db.changes.getChanges([14, 13]))
+        def check(chdicts):
+            self.assertEqual([ c['changeid'] for c in chdicts ], [14, 13])
+            self.assertEqual(chdicts[0], self.change14_dict)
+            self.assertEqual(sorted(chdicts[1]['files']),
+                        sorted(['master/README.txt', 'slave/README.txt']))
+            self.assertEqual(sorted(chdicts[1]['links']),
+                        sorted(['http://buildbot.net',
+                                'http://sf.net/projects/buildbot']))
+            self.assertEqual(chdicts[1]['properties'],
+                        { 'notest' : ('no', 'Change') })
+        d.addCallback(check)
+        return d
+
+    def test_getChanges_missing(self):
+        d = self.insertTestData(self.change14_rows)
+        d.addCallback(lambda _ :
+                self.db.changes.getChanges([13, 14, 15]))
+        def check(chdicts):
+            self.assertEqual(chdicts, [None, self.change14_dict, None])
+        d.addCallback(check)
+        return d
+
+    def test_getChanges_cached(self):
+        # with a real cache of the default size, priming the fetched changes
+        # evicts the one that was already cached
+        self.db.master.caches = cache.CacheManager()
+        self.db.changes = changes.ChangesConnectorComponent(self.db)
+        d = self.insertTestData(self.change13_rows + self.change14_rows)
+        d.addCallback(lambda _ : self.db.changes.getChange(13))
+        d.addCallback(lambda _ :
+                self.db.changes.getChanges([14, 13]))
+        def check(chdicts):
+            self.assertEqual([ c and c['changeid'] for c in chdicts ],
+                             [14, 13])
+        d.addCallback(check)
+        return d
+
+    def test_getChanges_empty(self):
+        d = self.db.changes.getChanges([])
+        def check(chdicts):
+            self.assertEqual(chdicts, [])
+        d.addCallback(check)
+        return d
+
+    def test_getChanges_many(self):
+        # more changes than fit in a single batch
+        d = self.insertTestData([ fakedb.Change(changeid=i)
+                                  for i in range(1, 251) ] +
+                                [ fakedb.ChangeFile(changeid=i,
+                                        filename='f%d' % i)
+                                  for i in range(1, 251) ])
+        d.addCallback(lambda _ :
+                self.db.changes.getChanges(range(1, 251)))
+        def check(chdicts):
+            self.assertEqual([ c['changeid'] for c in chdicts ],
+                             range(1, 251))
+            self.assertEqual([ c['files'] for c in chdicts ],
+                             [ [ 'f%d' % i ] for i in range(1, 251) ])
+        d.addCallback(check)
+        return d
+
+    def test_getChangesAfter(self):
+        d = self.insertTestData([
+            fakedb.Change(changeid=8),
+            fakedb.Change(changeid=9),
+            fakedb.Change(changeid=10),
+        ] + self.change13_rows + self.change14_rows)
+        d.addCallback(lambda _ :
+                self.db.changes.getChangesAfter(9))
+        def check(chdicts):
+            self.assertEqual([ c['changeid'] for c in chdicts ], [10, 13, 14])
+            self.assertEqual(chdicts[2], self.change14_dict)
+        d.addCallback(check)
+        return d
+
+    def test_getChangesAfter_count(self):
+        d = self.insertTestData([
+            fakedb.Change(changeid=8),
+            fakedb.Change(changeid=9),
+            fakedb.Change(changeid=10),
+        ] + self.change13_rows + self.change14_rows)
+        d.addCallback(lambda _ :
+                self.db.changes.getChangesAfter(8, count=2))
+        def check(chdicts):
+            self.assertEqual([ c['changeid'] for c in chdicts ], [9, 10])
+        d.addCallback(check)
+        return d
+
+    def test_getChangesAfter_none(self):
+        d = self.insertTestData(self.change13_rows)
+        d.addCallback(lambda _ :
+                self.db.changes.getChangesAfter(13))
+        def check(chdicts):
+            self.assertEqual(chdicts, [])
+        d.addCallback(check)
+        return d
+
     def test_getLatestChangeid(self):
         d = self.insertTestData(self.change13_rows)
         def get(_):
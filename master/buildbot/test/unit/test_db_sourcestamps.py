@@ -16,6 +16,7 @@
 from twisted.trial import unittest
 from twisted.internet import defer
 from buildbot.db import sourcestamps
+from buildbot.process import cache
 from buildbot.test.util import connector_component
 from buildbot.test.fake import fakedb
 
@@ -199,3 +200,59 @@ class TestSourceStampsConnectorComponent(
             self.assertEqual(ssdict, None)
         d.addCallback(check)
         return d
+
+    def test_getSourceStamps(self):
+        d = self.insertTestData([
+            fakedb.Change(changeid=16),
+            fakedb.Change(changeid=20),
+            fakedb.Patch(id=99, patch_base64='aGVsbG8sIHdvcmxk',
+                patch_author='bar', patch_comment='foo', subdir='/foo',
+                patchlevel=3),
+            fakedb.SourceStamp(id=234, branch='br'),
+            fakedb.SourceStamp(id=235, patchid=99),
+            fakedb.SourceStamp(id=236, patchid=99),
+            fakedb.SourceStampChange(sourcestampid=234, changeid=16),
+            fakedb.SourceStampChange(sourcestampid=234, changeid=20),
+        ])
+        d.addCallback(lambda _ :
+                self.db.sourcestamps.getSourceStamps([236, 999, 234, 235]))
+        def check(ssdicts):
+            self.assertEqual(ssdicts[1], None)
+            self.assertEqual([ ssdict and ssdict['ssid']
+                               for ssdict in ssdicts ],
+                             [236, None, 234, 235])
+            self.assertEqual(ssdicts[2]['branch'], 'br')
+            self.assertEqual(ssdicts[2]['changeids'], set([16,20]))
+            self.assertEqual(ssdicts[2]['patch_body'], None)
+            self.assertEqual(ssdicts[3]['changeids'], set())
+            self.assertEqual(ssdicts[0]['patch_body'], 'hello, world')
+            self.assertEqual(ssdicts[3]['patch_level'], 3)
+        d.addCallback(check)
+        return d
+
+    def test_getSourceStamps_cached(self):
+        # with a real cache of the default size, priming the fetched source
+        # stamps evicts the one that was already cached
+        self.db.master.caches = cache.CacheManager()
+        self.db.sourcestamps = \
+                sourcestamps.SourceStampsConnectorComponent(self.db)
+        d = self.insertTestData([
+            fakedb.SourceStamp(id=1),
+            fakedb.SourceStamp(id=2),
+            fakedb.SourceStamp(id=3),
+        ])
+        d.addCallback(lambda _ : self.db.sourcestamps.getSourceStamp(3))
+        d.addCallback(lambda _ :
+                self.db.sourcestamps.getSourceStamps([1, 2, 3]))
+        def check(ssdicts):
+            self.assertEqual([ ss and ss['ssid'] for ss in ssdicts ],
+                             [1, 2, 3])
+        d.addCallback(check)
+        return d
+
+    def test_getSourceStamps_empty(self):
+        d = self.db.sourcestamps.getSourceStamps([])
+        def check(ssdicts):
+            self.assertEqual(ssdicts, [])
+        d.addCallback(check)
+        return d
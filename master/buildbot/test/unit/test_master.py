@@ -210,6 +210,30 @@ class Subscriptions(dirs.DirsMixin, unittest.TestCase):
         # assert the notification sub was called correctly
         cb.assert_called_with(938593, 999)
 
+    def test_completeBuildRequests(self):
+        self.master.db = fakedb.FakeDBConnector(self)
+        self.master.db.insertTestData([
+            fakedb.SourceStamp(id=234),
+            fakedb.Buildset(id=30, sourcestampid=234),
+            fakedb.Buildset(id=31, sourcestampid=234),
+            fakedb.Buildset(id=32, sourcestampid=234),
+            fakedb.BuildRequest(id=19, buildsetid=30),
+            fakedb.BuildRequest(id=20, buildsetid=31),
+            fakedb.BuildRequest(id=21, buildsetid=31, complete=1, results=2),
+            fakedb.BuildRequest(id=22, buildsetid=32),
+            fakedb.BuildRequest(id=23, buildsetid=32),
+        ])
+
+        cb = mock.Mock()
+        self.master.subscribeToBuildsetCompletions(cb)
+
+        d = self.master.completeBuildRequests([19, 20, 22], 0)
+        def check(_):
+            self.assertEqual(cb.call_args_list, [ ((30, 0), {}),
+                                                  ((31, 2), {}) ])
+        d.addCallback(check)
+        return d
+
 class Polling(dirs.DirsMixin, unittest.TestCase):
 
     def setUp(self):
@@ -326,6 +350,86 @@ class Polling(dirs.DirsMixin, unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_pollDatabaseChanges_batches(self):
+        self.master.CHANGE_POLL_BATCH_SIZE = 2
+        self.db.insertTestData([
+            fakedb.Object(id=53, name='master',
+                          class_name='buildbot.master.BuildMaster'),
+            fakedb.ObjectState(objectid=53, name='last_processed_change',
+                               value_json='10'),
+        ] + [ fakedb.Change(changeid=i) for i in range(10, 16) ])
+        setState_calls = []
+        real_setState = self.master._setState
+        def _setState(name, value):
+            setState_calls.append((name, value))
+            return real_setState(name, value)
+        self.master._setState = _setState
+        d = self.master.pollDatabaseChanges()
+        def check(_):
+            self.assertEqual([ ch.number for ch in self.gotten_changes],
+                             [ 11, 12, 13, 14, 15 ])
+            # state is written once per batch
+            self.assertEqual(setState_calls, [
+                ('last_processed_change', 12),
+                ('last_processed_change', 14),
+                ('last_processed_change', 15),
+            ])
+            self.db.state.assertState(53, last_processed_change=15)
+        d.addCallback(check)
+        return d
+
+    def test_pollDatabaseChanges_skips_local_changes(self):
+        self.db.insertTestData([
+            fakedb.Object(id=53, name='master',
+                          class_name='buildbot.master.BuildMaster'),
+            fakedb.ObjectState(objectid=53, name='last_processed_change',
+                               value_json='10'),
+            fakedb.Change(changeid=10),
+            fakedb.Change(changeid=11),
+        ])
+        def addChange(**kwargs):
+            # another master's change arrives before ours does
+            self.db.insertTestData([
+                fakedb.Change(changeid=12),
+            ])
+            return defer.succeed(12)
+        self.db.changes.addChange = addChange
+
+        d = self.master.pollDatabaseChanges()
+        def add_local(_):
+            self.gotten_changes.append('MARK')
+            return self.master.addChange(author=u'me')
+        d.addCallback(add_local)
+        def add_remote(_):
+            self.gotten_changes.append('MARK')
+            self.db.insertTestData([
+                fakedb.Change(changeid=13),
+            ])
+        d.addCallback(add_remote)
+        d.addCallback(lambda _ : self.master.pollDatabaseChanges())
+        def check(_):
+            self.assertEqual([ getattr(ch, 'number', ch)
+                               for ch in self.gotten_changes],
+                             [ 11, 'MARK', 12, 'MARK', 13 ])
+            self.assertEqual(self.master._locally_delivered_changeids, set())
+            self.db.state.assertState(53, last_processed_change=13)
+        d.addCallback(check)
+        return d
+
+    def test_addChange_already_polled(self):
+        self.master._last_processed_change = 12
+        self.db.insertTestData([
+            fakedb.Change(changeid=12),
+        ])
+        self.db.changes.addChange = lambda **kwargs : defer.succeed(12)
+        d = self.master.addChange(author=u'me')
+        def check(_):
+            # the poll already delivered this change
+            self.assertEqual(self.gotten_changes, [])
+            self.assertEqual(self.master._locally_delivered_changeids, set())
+        d.addCallback(check)
+        return d
+
     def test_pollDatabaseBuildRequests_empty(self):
         d = self.master.pollDatabaseBuildRequests()
         def check(_):
@@ -386,3 +490,65 @@ class Polling(dirs.DirsMixin, unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_pollDatabaseBuildRequests_incremental_queries(self):
+        self.db.insertTestData([
+            fakedb.BuildRequest(id=11, buildsetid=9, buildername='eleventy'),
+            fakedb.BuildRequest(id=12, buildsetid=9, buildername='twelve'),
+        ])
+        calls = []
+        real_getBuildRequests = self.db.buildrequests.getBuildRequests
+        def getBuildRequests(**kwargs):
+            calls.append(kwargs)
+            return real_getBuildRequests(**kwargs)
+        self.db.buildrequests.getBuildRequests = getBuildRequests
+
+        d = self.master.pollDatabaseBuildRequests()
+        def claim_and_add(_):
+            del calls[:]
+            self.db.buildrequests.fakeClaimBuildRequest(12)
+            self.db.insertTestData([
+                fakedb.BuildRequest(id=13, buildsetid=9,
+                                        buildername='thirteen'),
+            ])
+        d.addCallback(claim_and_add)
+        d.addCallback(lambda _ : self.master.pollDatabaseBuildRequests())
+        def check(_):
+            # the second poll only asked for new requests and for claimed
+            # requests, not for all unclaimed requests
+            self.assertEqual(calls, [
+                dict(claimed=False, min_brid=13),
+                dict(claimed=True, complete=False),
+            ])
+            self.assertEqual(sorted(self.gotten_buildrequest_additions), [
+                dict(bsid=9, brid=11, buildername='eleventy'),
+                dict(bsid=9, brid=12, buildername='twelve'),
+                dict(bsid=9, brid=13, buildername='thirteen'),
+            ])
+        d.addCallback(check)
+        return d
+
+    def test_pollDatabaseBuildRequests_resync(self):
+        self.master.UNCLAIMED_RESYNC_INTERVAL = 0
+        self.db.insertTestData([
+            fakedb.BuildRequest(id=11, buildsetid=9, buildername='eleventy'),
+        ])
+        d = self.master.pollDatabaseBuildRequests()
+        def insert_lower(_):
+            self.gotten_buildrequest_additions.append('MARK')
+            # another master commits a lower brid after a higher one
+            self.db.insertTestData([
+                fakedb.BuildRequest(id=10, buildsetid=9, buildername='ten'),
+            ])
+        d.addCallback(insert_lower)
+        d.addCallback(lambda _ : self.master.pollDatabaseBuildRequests())
+        def check(_):
+            self.assertEqual(self.gotten_buildrequest_additions[:2], [
+                dict(bsid=9, brid=11, buildername='eleventy'),
+                'MARK',
+            ])
+            self.assertEqual(sorted(self.gotten_buildrequest_additions[2:]), [
+                dict(bsid=9, brid=10, buildername='ten'),
+                dict(bsid=9, brid=11, buildername='eleventy'),
+            ])
+        d.addCallback(check)
+        return d
@@ -134,3 +134,18 @@ class TestBotMaster(unittest.TestCase):
 
         brd.maybeStartBuildsOn.assert_called_once_with(['frank', 'larry'])
 
+
+    def test_setBuilders_forgets_removed_requests(self):
+        self.botmaster.brd = mock.Mock()
+        brqueue = self.botmaster.brqueue = mock.Mock()
+        self.botmaster.builderNames = ['frank', 'larry']
+        frank = mock.Mock()
+        frank.name = 'frank'
+        frank.slavenames = []
+
+        d = self.botmaster.setBuilders([frank])
+        def check(_):
+            self.assertEqual(self.botmaster.builderNames, ['frank'])
+            brqueue.invalidate.assert_called_once_with('larry')
+        d.addCallback(check)
+        return d
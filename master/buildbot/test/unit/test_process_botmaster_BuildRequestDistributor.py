@@ -18,7 +18,8 @@ from twisted.trial import unittest
 from twisted.internet import defer, reactor
 from twisted.python import failure
 from buildbot.test.util import compat
-from buildbot.process import botmaster
+from buildbot import locks
+from buildbot.process import botmaster, metrics
 from buildbot.util import epoch2datetime
 
 class Test(unittest.TestCase):
@@ -30,6 +31,7 @@ class Test(unittest.TestCase):
             # simple sort-by-name by default
             return sorted(builders, lambda b1,b2 : cmp(b1.name, b2.name))
         self.botmaster.prioritizeBuilders = prioritizeBuilders
+        self.botmaster.buildStartConcurrency = 1
         self.master = self.botmaster.master = mock.Mock(name='master')
         self.brd = botmaster.BuildRequestDistributor(self.botmaster)
         self.brd.startService()
@@ -65,6 +67,8 @@ class Test(unittest.TestCase):
                 return d
             bldr.maybeStartBuild = maybeStartBuild
             bldr.name = name
+            bldr.slavenames = []
+            bldr.locks = []
 
     def removeBuilder(self, name):
         del self.builders[name]
@@ -253,3 +257,139 @@ class Test(unittest.TestCase):
                     ['A', 'A-finished', '(stopped)'])
         self.quiet_deferred.addCallback(check)
         return self.quiet_deferred
+
+    # concurrency
+
+    def addSlowBuilders(self, slavenames, locks={}):
+        # add builders whose maybeStartBuild methods do not finish until
+        # self.finishBuilder is called
+        self.addBuilders(slavenames.keys())
+        self.running = {}
+        for name in slavenames:
+            bldr = self.builders[name]
+            bldr.slavenames = slavenames[name]
+            bldr.locks = locks.get(name, [])
+            def maybeStartBuild(n=name):
+                self.maybeStartBuild_calls.append(n)
+                d = self.running[n] = defer.Deferred()
+                return d
+            bldr.maybeStartBuild = maybeStartBuild
+
+    def finishBuilder(self, name):
+        self.running.pop(name).callback(None)
+
+    def startBuilders(self, names):
+        # start the builders, and then wait until the activity loop has had
+        # a chance to start as many as it can
+        self.brd.maybeStartBuildsOn(names)
+        d = defer.Deferred()
+        reactor.callLater(0, d.callback, None)
+        return d
+
+    def test_concurrency_disjoint(self):
+        self.botmaster.buildStartConcurrency = 3
+        self.addSlowBuilders(dict(A=['s1'], B=['s2'], C=['s3', 's4']))
+        d = self.startBuilders(['A', 'B', 'C'])
+        def check(_):
+            self.assertEqual(self.maybeStartBuild_calls, ['A', 'B', 'C'])
+            self.finishBuilder('B')
+            self.finishBuilder('A')
+            self.finishBuilder('C')
+        d.addCallback(check)
+        d.addCallback(lambda _ : self.quiet_deferred)
+        return d
+
+    def test_concurrency_limit(self):
+        self.botmaster.buildStartConcurrency = 2
+        self.addSlowBuilders(dict(A=['s1'], B=['s2'], C=['s3']))
+        d = self.startBuilders(['A', 'B', 'C'])
+        def check(_):
+            self.assertEqual(self.maybeStartBuild_calls, ['A', 'B'])
+            self.finishBuilder('B')
+            self.assertEqual(self.maybeStartBuild_calls, ['A', 'B', 'C'])
+            self.finishBuilder('A')
+            self.finishBuilder('C')
+        d.addCallback(check)
+        d.addCallback(lambda _ : self.quiet_deferred)
+        return d
+
+    def test_concurrency_shared_slave(self):
+        # B shares a slave with A, so it must wait; C is lower priority than
+        # B, but does not conflict with anything, so it can run
+        self.botmaster.buildStartConcurrency = 3
+        self.addSlowBuilders(dict(A=['s1', 's2'], B=['s2'], C=['s3']))
+        d = self.startBuilders(['A', 'B', 'C'])
+        def check(_):
+            self.assertEqual(self.maybeStartBuild_calls, ['A', 'C'])
+            self.finishBuilder('A')
+            self.assertEqual(self.maybeStartBuild_calls, ['A', 'C', 'B'])
+            self.finishBuilder('B')
+            self.finishBuilder('C')
+        d.addCallback(check)
+        d.addCallback(lambda _ : self.quiet_deferred)
+        return d
+
+    def test_concurrency_no_leapfrog(self):
+        # C shares a slave with B, which is waiting for A, so C must wait for
+        # B even though it does not conflict with A
+        self.botmaster.buildStartConcurrency = 3
+        self.addSlowBuilders(dict(A=['s1'], B=['s1', 's2'], C=['s2']))
+        d = self.startBuilders(['A', 'B', 'C'])
+        def check(_):
+            self.assertEqual(self.maybeStartBuild_calls, ['A'])
+            self.finishBuilder('A')
+            self.assertEqual(self.maybeStartBuild_calls, ['A', 'B'])
+            self.finishBuilder('B')
+            self.assertEqual(self.maybeStartBuild_calls, ['A', 'B', 'C'])
+            self.finishBuilder('C')
+        d.addCallback(check)
+        d.addCallback(lambda _ : self.quiet_deferred)
+        return d
+
+    def test_concurrency_shared_lock(self):
+        lock = locks.MasterLock('lock')
+        self.botmaster.buildStartConcurrency = 3
+        self.addSlowBuilders(dict(A=['s1'], B=['s2']),
+                locks=dict(A=[lock.access('counting')], B=[lock]))
+        d = self.startBuilders(['A', 'B'])
+        def check(_):
+            self.assertEqual(self.maybeStartBuild_calls, ['A'])
+            self.finishBuilder('A')
+            self.assertEqual(self.maybeStartBuild_calls, ['A', 'B'])
+            self.finishBuilder('B')
+        d.addCallback(check)
+        d.addCallback(lambda _ : self.quiet_deferred)
+        return d
+
+    def test_concurrency_same_builder(self):
+        # a builder is never run twice at once
+        self.botmaster.buildStartConcurrency = 3
+        self.addSlowBuilders(dict(A=['s1']))
+        d = self.startBuilders(['A'])
+        d.addCallback(lambda _ : self.startBuilders(['A']))
+        def check(_):
+            self.assertEqual(self.maybeStartBuild_calls, ['A'])
+            self.finishBuilder('A')
+            self.assertEqual(self.maybeStartBuild_calls, ['A', 'A'])
+            self.finishBuilder('A')
+        d.addCallback(check)
+        d.addCallback(lambda _ : self.quiet_deferred)
+        return d
+
+    def test_concurrency_timer(self):
+        events = []
+        self.patch(metrics.MetricTimeEvent, 'log',
+                classmethod(lambda cls, timer, elapsed :
+                                events.append(timer)))
+        self.botmaster.buildStartConcurrency = 3
+        self.addSlowBuilders(dict(A=['s1'], B=['s2']))
+        d = self.startBuilders(['A', 'B'])
+        def check(_):
+            self.finishBuilder('B')
+            self.finishBuilder('A')
+            self.assertEqual([ ev for ev in events if 'maybeStartBuild' in ev ],
+                [ 'BuildRequestDistributor.maybeStartBuild(B)',
+                  'BuildRequestDistributor.maybeStartBuild(A)' ])
+        d.addCallback(check)
+        d.addCallback(lambda _ : self.quiet_deferred)
+        return d
@@ -503,6 +503,57 @@ class TestBuilderBuildCreation(unittest.TestCase):
         yield wfd
         self.assertEqual(wfd.getResult(), [ brdicts[1] ])
 
+    @defer.deferredGenerator
+    def test_mergeRequests_default_skips_other_branches(self):
+        self.makeBuilder()
+        wfd = defer.waitForDeferred(
+            self.db.insertTestData([
+                fakedb.SourceStamp(id=234, branch='trunk'),
+                fakedb.SourceStamp(id=235, branch='trunk'),
+                fakedb.SourceStamp(id=236, branch='release'),
+                fakedb.Buildset(id=30, sourcestampid=234, reason='foo',
+                    submitted_at=1300305712, results=-1),
+                fakedb.Buildset(id=31, sourcestampid=235, reason='foo',
+                    submitted_at=1300305712, results=-1),
+                fakedb.Buildset(id=32, sourcestampid=236, reason='foo',
+                    submitted_at=1300305712, results=-1),
+                fakedb.BuildRequest(id=19, buildsetid=30, buildername='bldr',
+                    priority=13, submitted_at=1300305712, results=-1),
+                fakedb.BuildRequest(id=20, buildsetid=31, buildername='bldr',
+                    priority=13, submitted_at=1300305712, results=-1),
+                fakedb.BuildRequest(id=21, buildsetid=32, buildername='bldr',
+                    priority=13, submitted_at=1300305712, results=-1),
+            ]))
+        yield wfd
+        wfd.getResult()
+
+        wfd = defer.waitForDeferred(
+            defer.gatherResults([
+                self.db.buildrequests.getBuildRequest(id)
+                for id in (19, 20, 21)
+            ]))
+        yield wfd
+        brdicts = wfd.getResult()
+
+        wfd = defer.waitForDeferred(
+            self.bldr._mergeRequests(brdicts[0], brdicts,
+                                     builder.Builder._defaultMergeRequestFn))
+        yield wfd
+        self.assertEqual(wfd.getResult(), [ brdicts[0], brdicts[1] ])
+
+        # no BuildRequest was built for the request on the other branch
+        self.assertFalse('brobj' in brdicts[2])
+
+        # and a request alone on its branch is not converted at all
+        wfd = defer.waitForDeferred(
+            self.bldr._mergeRequests(brdicts[2], brdicts,
+                                     builder.Builder._defaultMergeRequestFn))
+        yield wfd
+        self.assertEqual(wfd.getResult(), [ brdicts[2] ])
+        self.assertFalse('brobj' in brdicts[2])
+
+        self.bldr._breakBrdictRefloops(brdicts)
+
     def test_mergeRequests_no_merging(self):
         self.makeBuilder()
         breq = dict(dummy=1)
@@ -593,6 +644,7 @@ class TestGetOldestRequestTime(unittest.TestCase):
         self.bldr = builder.Builder(config, self.bstatus)
         self.master.db = self.db = fakedb.FakeDBConnector(self)
         self.bldr.master = self.master
+        self.bldr.botmaster = self.master.botmaster
 
         # we don't want the reclaim service running during tests..
         self.bldr.reclaim_svc.disownServiceParent()
@@ -78,3 +78,57 @@ class TestBuildRequest(unittest.TestCase):
             self.assertEqual(br.submittedAt, None)
         d.addCallback(check)
         return d
+
+    def test_fromBrdicts(self):
+        master = fakemaster.make_master()
+        master.db = fakedb.FakeDBConnector(self)
+        master.db.insertTestData([
+            fakedb.Change(changeid=13, branch='trunk', revision='9283',
+                        repository='svn://...', project='world-domination'),
+            fakedb.SourceStamp(id=234, branch='trunk', revision='9284',
+                        repository='svn://...', project='world-domination'),
+            fakedb.SourceStampChange(sourcestampid=234, changeid=13),
+            fakedb.SourceStamp(id=235, branch='release', revision='9285'),
+            fakedb.Buildset(id=539, reason='triggered', sourcestampid=234),
+            fakedb.BuildsetProperty(buildsetid=539, property_name='x',
+                        property_value='[1, "X"]'),
+            fakedb.Buildset(id=540, reason='forced', sourcestampid=235),
+            fakedb.BuildRequest(id=288, buildsetid=539, buildername='bldr',
+                        priority=13, submitted_at=1200000000),
+            fakedb.BuildRequest(id=289, buildsetid=540, buildername='bldr',
+                        priority=14, submitted_at=1200000001),
+            fakedb.BuildRequest(id=290, buildsetid=539, buildername='bldr',
+                        priority=15, submitted_at=None),
+        ])
+        d = master.db.buildrequests.getBuildRequests(buildername='bldr')
+        d.addCallback(lambda brdicts : sorted(brdicts,
+                                        key=lambda brd : brd['brid']))
+        d.addCallback(lambda brdicts :
+                    buildrequest.BuildRequest.fromBrdicts(master, brdicts))
+        def check(brs):
+            self.assertEqual([ br.id for br in brs ], [288, 289, 290])
+            self.assertEqual([ br.bsid for br in brs ], [539, 540, 539])
+            self.assertEqual([ br.source.ssid for br in brs ],
+                             [234, 235, 234])
+            self.assertEqual([ ch.number for ch in brs[0].source.changes],
+                             [13])
+            self.assertEqual(brs[1].source.changes, ())
+            self.assertEqual([ br.reason for br in brs ],
+                             ['triggered', 'forced', 'triggered'])
+            self.assertEqual(brs[0].properties.getProperty('x'), 1)
+            self.assertEqual(brs[1].properties.getProperty('x'), None)
+            self.assertEqual([ br.submittedAt for br in brs ],
+                             [1200000000, 1200000001, None])
+            self.assertEqual([ br.priority for br in brs ], [13, 14, 15])
+            self.assertEqual(brs[2].buildername, 'bldr')
+        d.addCallback(check)
+        return d
+
+    def test_fromBrdicts_empty(self):
+        master = fakemaster.make_master()
+        master.db = fakedb.FakeDBConnector(self)
+        d = buildrequest.BuildRequest.fromBrdicts(master, [])
+        def check(brs):
+            self.assertEqual(brs, [])
+        d.addCallback(check)
+        return d
@@ -0,0 +1,188 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from twisted.trial import unittest
+from twisted.internet import task
+from buildbot.process import buildrequestqueue
+from buildbot.test.fake import fakedb, fakemaster
+from buildbot.util import epoch2datetime
+
+class TestBuildRequestQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.master = fakemaster.make_master()
+        self.master.db = self.db = fakedb.FakeDBConnector(self)
+        self.clock = task.Clock()
+        self.brqueue = buildrequestqueue.BuildRequestQueue(self.master,
+                                                _reactor=self.clock)
+
+        # count the queries made
+        self.queries = []
+        real_getBuildRequests = self.db.buildrequests.getBuildRequests
+        def getBuildRequests(**kwargs):
+            self.queries.append(kwargs)
+            return real_getBuildRequests(**kwargs)
+        self.db.buildrequests.getBuildRequests = getBuildRequests
+
+        self.db.insertTestData([
+            fakedb.SourceStamp(id=21),
+            fakedb.Buildset(id=11, sourcestampid=21),
+            fakedb.BuildRequest(id=1, buildsetid=11, buildername='bldr',
+                                submitted_at=300),
+            fakedb.BuildRequest(id=2, buildsetid=11, buildername='bldr',
+                                submitted_at=100),
+            fakedb.BuildRequest(id=3, buildsetid=11, buildername='other',
+                                submitted_at=200),
+        ])
+
+    def getBrids(self, buildername='bldr'):
+        d = self.brqueue.getUnclaimedRequests(buildername)
+        d.addCallback(lambda brdicts : [ brd['brid'] for brd in brdicts ])
+        return d
+
+    def test_getUnclaimedRequests_sorted(self):
+        d = self.getBrids()
+        def check(brids):
+            self.assertEqual(brids, [2, 1])
+        d.addCallback(check)
+        return d
+
+    def test_getUnclaimedRequests_uses_memory(self):
+        d = self.getBrids()
+        d.addCallback(lambda _ : self.getBrids())
+        d.addCallback(lambda _ : self.brqueue.getOldestRequestTime('bldr'))
+        def check(oldest):
+            self.assertEqual(oldest, epoch2datetime(100))
+            self.assertEqual(self.queries,
+                    [ dict(buildername='bldr', claimed=False) ])
+        d.addCallback(check)
+        return d
+
+    def test_getUnclaimedRequests_copies(self):
+        d = self.brqueue.getUnclaimedRequests('bldr')
+        def modify(brdicts):
+            brdicts[0]['brobj'] = 'x'
+            del brdicts[:]
+        d.addCallback(modify)
+        d.addCallback(lambda _ : self.brqueue.getUnclaimedRequests('bldr'))
+        def check(brdicts):
+            self.assertEqual(len(brdicts), 2)
+            self.assertFalse('brobj' in brdicts[0])
+        d.addCallback(check)
+        return d
+
+    def test_getOldestRequestTime_empty(self):
+        d = self.brqueue.getOldestRequestTime('nosuch')
+        def check(oldest):
+            self.assertEqual(oldest, None)
+        d.addCallback(check)
+        return d
+
+    def test_addRequests(self):
+        d = self.getBrids()
+        def add(_):
+            self.db.insertTestData([
+                fakedb.BuildRequest(id=4, buildsetid=11, buildername='bldr',
+                                    submitted_at=50),
+            ])
+            self.brqueue.addRequests('bldr', [4])
+        d.addCallback(add)
+        d.addCallback(lambda _ : self.getBrids())
+        def check(brids):
+            self.assertEqual(brids, [4, 2, 1])
+            self.assertEqual(self.queries, [
+                dict(buildername='bldr', claimed=False),
+                dict(buildername='bldr', claimed=False, brids=[4]),
+            ])
+        d.addCallback(check)
+        return d
+
+    def test_addRequests_not_loaded(self):
+        self.db.insertTestData([
+            fakedb.BuildRequest(id=4, buildsetid=11, buildername='bldr',
+                                submitted_at=50),
+        ])
+        self.brqueue.addRequests('bldr', [4])
+        d = self.getBrids()
+        def check(brids):
+            self.assertEqual(brids, [4, 2, 1])
+            # the load found the request, so it is not fetched again
+            self.assertEqual(self.queries,
+                    [ dict(buildername='bldr', claimed=False) ])
+        d.addCallback(check)
+        return d
+
+    def test_addRequests_during_load(self):
+        # a request announced after the load has read the database, but
+        # before it finishes, is not lost
+        real_getBuildRequests = self.db.buildrequests.getBuildRequests
+        def getBuildRequests(**kwargs):
+            d = real_getBuildRequests(**kwargs)
+            def announce(brdicts):
+                if 'brids' not in kwargs:
+                    self.db.insertTestData([
+                        fakedb.BuildRequest(id=5, buildsetid=11,
+                                buildername='bldr', submitted_at=50),
+                    ])
+                    self.brqueue.addRequests('bldr', [5])
+                return brdicts
+            d.addCallback(announce)
+            return d
+        self.db.buildrequests.getBuildRequests = getBuildRequests
+        d = self.getBrids()
+        def check(brids):
+            self.assertEqual(brids, [5, 2, 1])
+        d.addCallback(check)
+        return d
+
+    def test_addRequests_unknown_builder(self):
+        # requests for builders that are never loaded here are not kept
+        self.brqueue.addRequests('nosuch', [9])
+        self.assertEqual(self.brqueue._pending, {})
+
+    def test_removeRequests(self):
+        d = self.getBrids()
+        d.addCallback(lambda _ : self.brqueue.removeRequests('bldr', [2, 9]))
+        d.addCallback(lambda _ : self.getBrids())
+        def check(brids):
+            self.assertEqual(brids, [1])
+        d.addCallback(check)
+        return d
+
+    def test_invalidate(self):
+        d = self.getBrids()
+        def claim(_):
+            self.db.buildrequests.fakeClaimBuildRequest(2, objectid=999)
+            self.brqueue.invalidate('bldr')
+        d.addCallback(claim)
+        d.addCallback(lambda _ : self.getBrids())
+        def check(brids):
+            self.assertEqual(brids, [1])
+            self.assertEqual(len(self.queries), 2)
+        d.addCallback(check)
+        return d
+
+    def test_reconcile(self):
+        d = self.getBrids()
+        def claim(_):
+            self.db.buildrequests.fakeClaimBuildRequest(2, objectid=999)
+            self.clock.advance(self.brqueue.RECONCILE_INTERVAL)
+        d.addCallback(claim)
+        d.addCallback(lambda _ : self.getBrids())
+        def check(brids):
+            self.assertEqual(brids, [1])
+            self.assertEqual(len(self.queries), 2)
+        d.addCallback(check)
+        return d
@@ -14,6 +14,7 @@
 # Copyright Buildbot Team Members
 
 import re
+import zlib
 import mock
 from twisted.trial import unittest
 from buildbot.process import buildstep
@@ -109,3 +110,129 @@ class TestLoggingBuildStep(unittest.TestCase):
         lbs = buildstep.LoggingBuildStep(log_eval_func=eval)
         status = lbs.evaluateCommand(cmd)
         self.assertEqual(status, WARNINGS, "evaluateCommand didn't call log_eval_func or overrode its results")
+
+class TestLoggedRemoteCommand(unittest.TestCase):
+    def makeCommand(self):
+        cmd = buildstep.LoggedRemoteCommand('shell', {})
+        cmd.buildslave = mock.Mock()
+        cmd.active = True
+        cmd.logs = { 'stdio' : mock.Mock(), 'foo' : mock.Mock() }
+        cmd.updates = {}
+        return cmd
+
+    def test_remote_update_merges_runs(self):
+        cmd = self.makeCommand()
+        stdio = cmd.logs['stdio']
+        cmd.remote_update([
+            [{'stdout': 'a'}, 0], [{'stdout': 'b'}, 0],
+            [{'stderr': 'c'}, 0], [{'stderr': 'd'}, 0],
+            [{'stdout': 'e'}, 0],
+            [{'log': ('foo', 'f')}, 0], [{'log': ('foo', 'g')}, 0],
+            [{'rc': 0}, 0]])
+        self.assertEqual(stdio.method_calls, [
+            ('addStdout', ('ab',), {}),
+            ('addStderr', ('cd',), {}),
+            ('addStdout', ('e',), {}),
+            ('addHeader', ('program finished with exit code 0\n',), {}),
+            ])
+        self.assertEqual(cmd.logs['foo'].method_calls, [
+            ('addStdout', ('fg',), {}),
+            ])
+        self.assertEqual(cmd.rc, 0)
+
+    def test_mergeUpdates_other_updates(self):
+        cmd = self.makeCommand()
+        updates = [ [{'stdout': 'a', 'stderr': 'b'}, 1],
+                    [{'stdout': 'c', 'stderr': 'd'}, 2],
+                    [{'log': ('foo', 'x')}, 3],
+                    [{'log': ('bar', 'y')}, 4],
+                    [{'stdout': 'e'}, 5],
+                    [{'stdout': u'f'}, 6] ]
+        self.assertEqual(cmd.mergeUpdates(updates),
+                         [ tuple(u) for u in updates ])
+
+    def test_remote_update_compressed(self):
+        cmd = self.makeCommand()
+        cmd.decompressor = zlib.decompressobj()
+        compressor = zlib.compressobj()
+        def batch(data, templates):
+            zdata = compressor.compress(data) + \
+                    compressor.flush(zlib.Z_SYNC_FLUSH)
+            return [[{'compressed': (zdata, templates)}, 0]]
+
+        cmd.remote_update(batch('hello world\n',
+                [ [('stdout', None, 6)], [('stdout', None, 6)],
+                  [('log', 'foo', 0), ('elapsed', 2)] ]))
+        cmd.remote_update(batch('bar',
+                [ [('header', u'hdr')], [('log', 'foo', 3)] ]))
+        self.assertEqual(cmd.logs['stdio'].method_calls, [
+            ('addStdout', ('hello world\n',), {}),
+            ('addHeader', (u'hdr',), {}),
+            ])
+        self.assertEqual(cmd.logs['foo'].method_calls, [
+            ('addStdout', ('',), {}),
+            ('addStdout', ('bar',), {}),
+            ])
+        self.assertEqual(cmd._remoteElapsed, 2)
+        self.assertEqual(cmd.buildslave.compressedUpdateReceived.call_count,
+                         2)
+
+    def do_test_start(self, compress_updates, older):
+        cmd = self.makeCommand()
+        cmd.buildslave.compress_updates = compress_updates
+        cmd.step = mock.Mock()
+        cmd.step.slaveVersionIsOlderThan.return_value = older
+        cmd.remote = mock.Mock()
+        cmd.commandID = "1"
+        cmd.start()
+        return cmd, cmd.remote.callRemote.call_args[0][-1]
+
+    def test_start_compress_updates(self):
+        cmd, args = self.do_test_start(True, False)
+        self.assertEqual(args, {'compress_updates': True})
+        self.assertTrue(cmd.decompressor)
+
+    def test_start_compress_updates_oldSlave(self):
+        cmd, args = self.do_test_start(True, True)
+        self.assertEqual(args, {})
+        self.assertFalse(cmd.decompressor)
+
+    def test_start_compress_updates_disabled(self):
+        cmd, args = self.do_test_start(False, False)
+        self.assertEqual(args, {})
+        self.assertFalse(cmd.decompressor)
+
+class TestLogLineObserver(unittest.TestCase):
+
+    class Observer(buildstep.LogLineObserver):
+        def __init__(self):
+            buildstep.LogLineObserver.__init__(self)
+            self.batches = []
+            self.errLines = []
+        def outLinesReceived(self, lines):
+            self.batches.append(lines)
+        def errLineReceived(self, line):
+            self.errLines.append(line)
+
+    def test_batches(self):
+        obs = self.Observer()
+        obs.outReceived("one\ntwo\nthr")
+        obs.outReceived("ee")
+        obs.outReceived("\nfour\n")
+        self.assertEqual(obs.batches, [ ["one", "two"], ["three", "four"] ])
+
+    def test_lines(self):
+        # errLinesReceived is not overridden, so it calls errLineReceived
+        obs = self.Observer()
+        obs.errReceived("a\nb\nc")
+        obs.errReceived("\n")
+        self.assertEqual(obs.errLines, [ "a", "b", "c" ])
+
+    def test_maxLineLength(self):
+        obs = self.Observer()
+        obs.setMaxLineLength(5)
+        obs.outReceived("short\nmuch too long\nok\nalso too")
+        obs.outReceived(" long, and spread over")
+        obs.outReceived(" several chunks\nfine\n")
+        self.assertEqual(obs.batches, [ ["short", "ok"], ["fine"] ])
+        self.assertEqual(obs.stdoutSplitter.partial, "")
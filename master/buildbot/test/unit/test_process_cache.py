@@ -42,3 +42,23 @@ class CacheManager(unittest.TestCase):
         metric = self.caches.get_metrics()['foo']
         for k in 'hits', 'refhits', 'misses', 'max_size':
             self.assertIn(k, metric)
+
+    def test_get_sized_cache(self):
+        foo_cache = self.caches.get_sized_cache("foo", len, 100)
+        self.assertIdentical(self.caches.get_sized_cache("foo", len, 100),
+                             foo_cache)
+        self.assertEqual(foo_cache.max_size, 100)
+
+    def test_load_config_sized_cache(self):
+        foo_cache = self.caches.get_sized_cache("foo", len, 100)
+        self.caches.load_config({'foo' : 50})
+        self.assertEqual(foo_cache.max_size, 50)
+        # the default applies again when the cache is not configured
+        self.caches.load_config({})
+        self.assertEqual(foo_cache.max_size, 100)
+
+    def test_get_metrics_sized_cache(self):
+        self.caches.get_sized_cache("foo", len, 100)
+        metric = self.caches.get_metrics()['foo']
+        for k in 'hits', 'refhits', 'misses', 'max_size', 'evictions', 'size':
+            self.assertIn(k, metric)
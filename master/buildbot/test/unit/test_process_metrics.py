@@ -57,6 +57,12 @@ class TestMetricCountEvent(TestMetricBase):
         report = self.observer.asDict()
         self.assertEquals(report['counters']['num_widgets'], 10)
 
+    def testCaches(self):
+        self.observer.parent.caches.get_metrics.return_value = \
+                dict(Builds=dict(hits=1, evictions=2))
+        report = self.observer.asDict()
+        self.assertEquals(report['caches']['Builds']['evictions'], 2)
+
     def testCountMethod(self):
         @metrics.countMethod('foo_called')
         def foo():
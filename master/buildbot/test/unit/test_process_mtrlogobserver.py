@@ -0,0 +1,65 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+
+import mock
+from twisted.trial import unittest
+from buildbot.process import mtrlogobserver
+
+class MtrLogObserver(unittest.TestCase):
+
+    output = ("Logging: ./mysql-test-run.pl\n"
+              "main.alias      [ pass ]      12\n"
+              "main.bad 'innodb' w2 [ fail ]\n"
+              "Test ended at 2011-01-01\n"
+              "\r\n"
+              "mysqltest: At line 3: query failed\n"
+              "------------------------------------------------------------\n"
+              "main.after      [ pass ]      3\n"
+              "------------------------------------------------------------\n"
+              "***Warnings generated in error logs during shutdown after "
+                "running tests: main.alias main.after\n"
+              "The servers were restarted 3 times\n")
+
+    def setUp(self):
+        self.obs = mtrlogobserver.MtrLogObserver()
+        self.obs.step = mock.Mock()
+        self.fails = []
+        self.warnings = []
+        self.obs.collectTestFail = lambda *args : self.fails.append(args)
+        self.obs.collectWarningTests = self.warnings.append
+
+    def check(self):
+        self.assertEqual(self.obs.numTests, 3)
+        self.assertEqual(self.fails, [
+            ('main.bad', 'innodb', 'fail', '',
+             "main.bad 'innodb' w2 [ fail ]\n"
+             "Test ended at 2011-01-01\n"
+             "\n"
+             "mysqltest: At line 3: query failed\n") ])
+        self.assertEqual(self.warnings, [ ['main.alias', 'main.after'] ])
+        self.assertEqual(self.obs.makeText(True),
+                ['test', 'F:bad', 'W:after', 'W:alias'])
+
+    def test_chunks(self):
+        self.obs.outReceived(self.output[:100])
+        self.obs.outReceived(self.output[100:])
+        self.check()
+
+    def test_lines(self):
+        # the single-line interface is still available
+        for line in self.output.split("\n"):
+            self.obs.outLineReceived(line)
+        self.check()
@@ -0,0 +1,64 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+
+import os
+from twisted.trial import unittest
+from buildbot.status import builder
+from buildbot.util import lru
+
+class TestBuildCache(unittest.TestCase):
+
+    def setupBuilder(self, name):
+        b = builder.BuilderStatus(buildername=name)
+        b.basedir = os.path.abspath(self.mktemp())
+        os.mkdir(b.basedir)
+        b.determineNextBuildNumber()
+        return b
+
+    def test_estimateBuildSize(self):
+        b = self.setupBuilder('a')
+        bs = builder.BuildStatus(b, 0)
+        bs.addStepWithName('one')
+        step = bs.addStepWithName('two')
+        step.logs = [ object(), object() ]
+        self.assertEqual(builder.estimateBuildSize(bs),
+                builder.BUILD_SIZE_ESTIMATE + 2 * builder.STEP_SIZE_ESTIMATE
+                + 2 * builder.LOG_SIZE_ESTIMATE)
+
+    def test_shared_cache(self):
+        cache = lru.SizedLRUCache(builder.estimateBuildSize, 10**6)
+        a, b = self.setupBuilder('a'), self.setupBuilder('b')
+        a_build = a.touchBuildCache(builder.BuildStatus(a, 0))
+        a.setBuildCache(cache)
+        b.setBuildCache(cache)
+        b_build = b.touchBuildCache(builder.BuildStatus(b, 0))
+
+        # builds cached before the shared cache was set are carried over
+        self.assertIdentical(a.getBuildByNumber(0), a_build)
+        self.assertIdentical(b.getBuildByNumber(0), b_build)
+        self.assertEqual(a.getCachedBuilds(), [ a_build ])
+        self.assertEqual(sorted(cache.cache.keys()), [('a', 0), ('b', 0)])
+        self.assertEqual(a.asDict()['cachedBuilds'], [ 0 ])
+
+    def test_cache_budget(self):
+        b = self.setupBuilder('a')
+        b.setBuildCache(lru.SizedLRUCache(builder.estimateBuildSize,
+                                          2 * builder.BUILD_SIZE_ESTIMATE))
+        for i in range(3):
+            b.touchBuildCache(builder.BuildStatus(b, i))
+        self.assertEqual(sorted(b.buildCache.cache.keys()),
+                         [('a', 1), ('a', 2)])
+        self.assertEqual(b.buildCache.evictions, 1)
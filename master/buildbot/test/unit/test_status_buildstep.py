@@ -61,3 +61,13 @@ class TestBuildStepStatus(unittest.TestCase):
         bss1.addLog('log_1')
         self.assertEquals([['log_1', ('http://buildbot:8010/builders/builder_1/'
             'builds/0/steps/step_1/logs/log_1')]], bss1.asDict()['logs'])
+
+    def testGeneration(self):
+        b = self.setupBuilder('builder_1')
+        bs = b.newBuild()
+        bss = bs.addStepWithName('step_1')
+        generations = (b.generation, bs.generation, bss.generation)
+        bss.setText(['compiling'])
+        self.assertEqual(b.generation, generations[0] + 1)
+        self.assertEqual(bs.generation, generations[1] + 1)
+        self.assertEqual(bss.generation, generations[2] + 1)
@@ -0,0 +1,75 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+
+import threading
+from twisted.trial import unittest
+from twisted.internet import defer
+from buildbot.status import compression
+
+class TestCompressionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = compression.CompressionPool(maxthreads=1)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_compress(self):
+        d = self.pool.compress('log', 10, lambda x, y=0: x + y, 1, y=2)
+        def check(rv):
+            self.assertEqual(rv, 3)
+            self.assertEqual(self.pool.getMetrics(),
+                    dict(queued=0, active=0, completed=1, failed=0, bytes=10,
+                         elapsed=self.pool.elapsed))
+        d.addCallback(check)
+        return d
+
+    def test_bounded(self):
+        release = threading.Event()
+        d1 = self.pool.compress('one', 1, release.wait)
+        d2 = self.pool.compress('two', 1, lambda : None)
+        d3 = self.pool.compress('three', 1, lambda : None)
+        # only one job runs at a time; the others wait in order
+        self.assertEqual(self.pool.getActive(), ['one'])
+        self.assertEqual(self.pool.getQueue(), ['two', 'three'])
+        release.set()
+        d = defer.gatherResults([d1, d2, d3])
+        def check(_):
+            self.assertEqual(self.pool.getQueue(), [])
+            self.assertEqual(self.pool.completed, 3)
+        d.addCallback(check)
+        return d
+
+    def test_failure(self):
+        def fail():
+            raise RuntimeError("oops")
+        d = self.pool.compress('log', 10, fail)
+        def check(f):
+            f.trap(RuntimeError)
+            self.assertEqual((self.pool.completed, self.pool.failed,
+                              self.pool.bytes), (0, 1, 0))
+        d.addCallbacks(lambda _ : self.fail("should have failed"), check)
+        return d
+
+    def test_setMaxThreads(self):
+        release = threading.Event()
+        d1 = self.pool.compress('one', 1, release.wait)
+        d2 = self.pool.compress('two', 1, release.wait)
+        self.assertEqual(self.pool.getQueue(), ['two'])
+        self.pool.setMaxThreads(2)
+        self.assertEqual(self.pool.getActive(), ['one', 'two'])
+        release.set()
+        return defer.gatherResults([d1, d2])
@@ -0,0 +1,208 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import os
+from twisted.trial import unittest
+from buildbot.status import builder, history
+from buildbot.status.results import SUCCESS, FAILURE
+from buildbot.sourcestamp import SourceStamp
+
+class HistoryMixin(object):
+
+    def setupBuilder(self):
+        b = builder.BuilderStatus(buildername='bldr')
+        b.basedir = os.path.abspath(self.mktemp())
+        os.mkdir(b.basedir)
+        b.determineNextBuildNumber()
+        return b
+
+    def makeBuild(self, bldr, number=None, branch='br', results=SUCCESS,
+                  started=100, finished=200, save=True):
+        if number is None:
+            number = bldr.nextBuildNumber
+            bldr.nextBuildNumber += 1
+        bs = builder.BuildStatus(bldr, number)
+        bs.setSourceStamp(SourceStamp(branch=branch, revision='r%d' % number))
+        bs.setReason('because')
+        bs.setSlavename('sl')
+        step = bs.addStepWithName('compile')
+        step.started = started
+        step.finished = finished
+        step.setText(['compile', 'ok'])
+        step.results = results
+        bs.started = started
+        bs.finished = finished
+        bs.setText(['build', 'done'])
+        bs.setResults(results)
+        if save:
+            bs.saveYourself()
+        return bs
+
+
+class TestBuildHistory(HistoryMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.bldr = self.setupBuilder()
+        self.history = history.BuildHistory(self.bldr.basedir)
+
+    def test_empty(self):
+        self.assertEqual(self.history.getSummary(0), None)
+        self.assertEqual(self.history.getNumbers(), [])
+
+    def test_addBuild_getSummary(self):
+        self.history.addBuild(self.makeBuild(self.bldr, number=3,
+                                results=FAILURE, started=10, finished=20))
+        s = self.history.getSummary(3)
+        self.assertEqual((s.getNumber(), s.getTimes(), s.getResults()),
+                         (3, (10, 20), FAILURE))
+        self.assertEqual((s.getBranch(), s.getRevision(), s.getSlavename(),
+                          s.getReason(), s.getText()),
+                         ('br', 'r3', 'sl', 'because', ['build', 'done']))
+        self.assertEqual(s.getStepSummaries(), [
+            dict(name='compile', text=['compile', 'ok'], results=FAILURE,
+                 times=[10, 20]) ])
+        self.assertEqual(self.history.getSummary(2), None)
+        self.assertEqual(self.history.getNumbers(), [3])
+
+    def test_persistent(self):
+        self.history.addBuild(self.makeBuild(self.bldr, number=0))
+        self.history.addBuild(self.makeBuild(self.bldr, number=1,
+                                             branch='other'))
+        h = history.BuildHistory(self.bldr.basedir)
+        self.assertEqual(h.getNumbers(), [0, 1])
+        self.assertEqual(h.getSummary(1).getBranch(), 'other')
+
+    def test_addBuild_non_utf8(self):
+        bs = self.makeBuild(self.bldr, number=0)
+        bs.setText(['caf\xe9'])
+        self.history.addBuild(bs)
+        self.assertEqual(self.history.getSummary(0).getText(),
+                         [u'caf\xe9'])
+
+    def test_prune_compacts(self):
+        for i in range(10):
+            self.history.addBuild(self.makeBuild(self.bldr, number=i,
+                                                 branch='b%d' % i))
+        self.history.prune(8)
+        self.assertEqual(self.history.getNumbers(), [8, 9])
+        self.assertEqual(
+                os.path.getsize(self.history.data_filename),
+                sum([ self.history.getSummary(n).length for n in (8, 9) ]))
+        h = history.BuildHistory(self.bldr.basedir)
+        self.assertEqual([ h.getSummary(n).getBranch() for n in (8, 9) ],
+                         ['b8', 'b9'])
+
+    def test_generateNumbersFinishedBefore(self):
+        for number, finished in [ (0, 30), (1, 10), (2, 20), (3, 40) ]:
+            self.history.addBuild(self.makeBuild(self.bldr, number=number,
+                                                 finished=finished))
+        def numbers(finished_before=None):
+            return list(
+                self.history.generateNumbersFinishedBefore(finished_before))
+        self.assertEqual(numbers(), [3, 0, 2, 1])
+        self.assertEqual(numbers(30), [2, 1])
+        self.assertEqual(numbers(5), [])
+        # replacing a build moves it
+        self.history.addBuild(self.makeBuild(self.bldr, number=1,
+                                             finished=50))
+        self.assertEqual(numbers(45), [3, 0, 2])
+        self.history.prune(3)
+        self.assertEqual(numbers(), [3])
+
+    def test_upgradeBuilderDirectory(self):
+        for i in range(3):
+            self.makeBuild(self.bldr)
+        self.assertEqual(
+                history.upgradeBuilderDirectory(self.bldr.basedir, quiet=True),
+                3)
+        h = history.BuildHistory(self.bldr.basedir)
+        self.assertEqual(h.getNumbers(), [0, 1, 2])
+        self.assertEqual(h.getSummary(2).getRevision(), 'r2')
+        # a second run has nothing to do
+        self.assertEqual(
+                history.upgradeBuilderDirectory(self.bldr.basedir, quiet=True),
+                0)
+
+
+class TestBuilderStatusHistory(HistoryMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.bldr = self.setupBuilder()
+        self.loaded = []
+        getBuildByNumber = self.bldr.getBuildByNumber
+        def trackingGetBuildByNumber(number):
+            self.loaded.append(number)
+            return getBuildByNumber(number)
+        self.bldr.getBuildByNumber = trackingGetBuildByNumber
+
+    def test_loaded_builds_are_indexed(self):
+        self.makeBuild(self.bldr)
+        self.assertFalse(self.bldr.getBuildHistory().hasBuild(0))
+        self.bldr.getBuild(0)
+        self.assertTrue(self.bldr.getBuildHistory().hasBuild(0))
+
+    def test_generateFinishedBuilds_branches(self):
+        for i in range(6):
+            self.bldr._addToBuildHistory(
+                self.makeBuild(self.bldr, branch=['a', 'b'][i % 2]))
+        builds = list(self.bldr.generateFinishedBuilds(branches=['a']))
+        self.assertEqual([ b.getNumber() for b in builds ], [4, 2, 0])
+        # only the matching builds were loaded
+        self.assertEqual(self.loaded, [4, 2, 0])
+
+    def test_generateFinishedBuilds_finished_before(self):
+        for i in range(4):
+            self.bldr._addToBuildHistory(
+                self.makeBuild(self.bldr, finished=100 + i))
+        builds = list(self.bldr.generateFinishedBuilds(finished_before=102))
+        self.assertEqual([ b.getNumber() for b in builds ], [1, 0])
+        self.assertEqual(self.loaded, [1, 0])
+
+    def test_generateFinishedBuilds_finished_before_max_search(self):
+        for i in range(10):
+            self.bldr._addToBuildHistory(
+                self.makeBuild(self.bldr, finished=100 + i))
+        # the index leads straight to the older builds
+        builds = list(self.bldr.generateFinishedBuilds(finished_before=103,
+                                                       max_search=2))
+        self.assertEqual([ b.getNumber() for b in builds ], [2, 1])
+        self.assertEqual(self.loaded, [2, 1])
+
+    def test_generateFinishedBuilds_max_buildnum(self):
+        for i in range(10):
+            self.bldr._addToBuildHistory(self.makeBuild(self.bldr))
+        builds = list(self.bldr.generateFinishedBuilds(max_buildnum=4,
+                                                       max_search=2))
+        self.assertEqual([ b.getNumber() for b in builds ], [4, 3])
+        builds = list(self.bldr.generateFinishedBuilds(max_buildnum=-2,
+                                                       num_builds=1))
+        self.assertEqual([ b.getNumber() for b in builds ], [8])
+
+    def test_eventGenerator_minTime(self):
+        for i in range(4):
+            self.bldr._addToBuildHistory(
+                self.makeBuild(self.bldr, started=10 * i, finished=10 * i + 5))
+        events = list(self.bldr.eventGenerator(minTime=15))
+        self.assertEqual([ e.getNumber() for e in events
+                           if isinstance(e, builder.BuildStatus) ], [3, 2])
+        self.assertEqual(self.loaded, [3, 2])
+
+    def test_prune(self):
+        self.bldr.buildHorizon = 2
+        self.bldr.logHorizon = 2
+        for i in range(4):
+            self.bldr._addToBuildHistory(self.makeBuild(self.bldr))
+        self.bldr.prune()
+        self.assertEqual(self.bldr.getBuildHistory().getNumbers(), [2, 3])
@@ -20,6 +20,7 @@ from twisted.trial import unittest
 from twisted.internet import defer
 from buildbot.status import logfile
 from buildbot.test.util import dirs
+from buildbot.util import eventual
 
 class TestLogFileProducer(unittest.TestCase):
     def make_static_logfile(self, contents):
@@ -300,6 +301,31 @@ class TestLogFile(unittest.TestCase, dirs.DirsMixin):
         self.logfile.addHeader('hed')
         addEntry.assert_called_with(2, 'hed')
 
+    def test_iterLines(self):
+        self.logfile.addHeader('header\n')
+        self.logfile.addStdout('one\ntw')
+        self.logfile.addStderr('o\nthr')
+        self.logfile.addStdout('ee')
+        self.assertEqual(list(self.logfile.iterLines()),
+                         ['one\n', 'two\n', 'three'])
+
+    def test_iterLines_channels(self):
+        self.logfile.addStdout('out\n')
+        self.logfile.addStderr('err\n')
+        self.logfile.addStdout('out2\n')
+        self.logfile.finish()
+        self.assertEqual(list(self.logfile.iterLines([logfile.STDERR])),
+                         ['err\n'])
+        self.assertEqual(list(self.logfile.readlines()),
+                         ['out\n', 'out2\n'])
+
+    def test_iterLines_long_lines(self):
+        self.logfile.MAX_LINE_LENGTH = 4
+        self.logfile.chunkSize = 3
+        self.logfile.addStdout('abcdefghij\nxy\n')
+        self.assertEqual(list(self.logfile.iterLines()),
+                         ['abcd', 'efgh', 'ij\n', 'xy\n'])
+
     def do_test_compressLog(self, ext, expect_comp=True):
         self.logfile.openfile.write('xyz' * 1000)
         self.logfile.finish()
@@ -325,3 +351,178 @@ class TestLogFile(unittest.TestCase, dirs.DirsMixin):
         self.logfile.compressMethod = None
         return self.do_test_compressLog('', expect_comp=False)
 
+
+class TestLogFileIndex(unittest.TestCase, dirs.DirsMixin):
+
+    def setUp(self):
+        step = self.build_step_status = mock.Mock(name='build_step_status')
+        self.basedir = step.build.builder.basedir = os.path.abspath('basedir')
+        self.setUpDirs(self.basedir)
+        self.logfile = logfile.LogFile(step, 'testlf', '123-stdio')
+        self.logfile.chunkSize = 10
+
+    def tearDown(self):
+        self.tearDownDirs()
+
+    def add_lines(self, count, header_every=None):
+        text = ''
+        for i in range(count):
+            if header_every and i % header_every == 0:
+                self.logfile.addHeader('header %d\n' % i)
+            line = 'line %d\n' % i
+            self.logfile.addEntry(i % 2, line)
+            text += line
+        return text
+
+    def compress(self, method):
+        self.logfile.compressMethod = method
+        self.logfile.compressBlockSize = 50
+        return self.logfile.compressLog()
+
+    def check_ranges(self, text):
+        lf = self.logfile
+        self.assertEqual(lf.getTextLength(), len(text))
+        for start, end in [ (0, None), (5, None), (33, 34), (100, 250),
+                            (len(text) - 3, None), (len(text), None) ]:
+            got = ''.join(lf.getChunksFrom(start, end, onlyText=True,
+                            channels=[logfile.STDOUT, logfile.STDERR]))
+            self.assertEqual(got, text[start:end], (start, end))
+        lines = text.splitlines(True)
+        for numLines in 1, 7, 200:
+            offset = lf.getTailOffset(numLines)
+            self.assertEqual(text[offset:], ''.join(lines[-numLines:]),
+                             numLines)
+        self.assertEqual(lf.getTailOffset(0), len(text))
+
+    # tests
+
+    def test_index_records(self):
+        self.logfile.addStdout('hello\nworld')
+        self.logfile.addHeader('hdr')
+        self.logfile.addStderr('\n!')
+        self.logfile.finish()
+        index = self.logfile.getIndex()
+        records = [ index[i] for i in range(len(index)) ]
+        R = logfile.LogFileIndex
+        self.assertEqual([ (r[R.TEXTPOS], r[R.LINES], r[R.SIZE], r[R.CHANNEL])
+                           for r in records ],
+                         [ (0, 0, 10, 0), (10, 1, 1, 0), (11, 1, 3, 2),
+                           (11, 1, 2, 1) ])
+        fp = self.logfile.getFile()
+        fp.seek(records[2][R.POS])
+        self.assertEqual(fp.read(6), '4:2hdr')
+
+    def test_ranges(self):
+        text = self.add_lines(100, header_every=10)
+        self.logfile.finish()
+        self.check_ranges(text)
+
+    def test_ranges_unfinished(self):
+        text = self.add_lines(99)
+        self.logfile.addStdout('partial')
+        self.check_ranges(text + 'partial')
+
+    def test_ranges_no_index(self):
+        text = self.add_lines(100)
+        self.logfile.finish()
+        os.unlink(self.logfile.getFilename() + '.idx')
+        self.assertEqual(self.logfile.getIndex(), None)
+        self.check_ranges(text)
+
+    def test_getChunksFrom_headers(self):
+        self.logfile.addStdout('abc')
+        self.logfile.addHeader('HDR')
+        self.logfile.addStdout('def')
+        self.logfile.finish()
+        self.assertEqual(list(self.logfile.getChunksFrom(1, 5)),
+                         [ (0, 'bc'), (2, 'HDR'), (0, 'de') ])
+
+    def do_test_compressed(self, method):
+        text = self.add_lines(100, header_every=10)
+        self.logfile.finish()
+        d = self.compress(method)
+        def check(_):
+            self.assertFalse(os.path.exists(self.logfile.getFilename()))
+            R = logfile.LogFileIndex
+            index = self.logfile.getIndex()
+            blocks = set([ index[i][R.BLOCK_OFFSET]
+                           for i in range(len(index)) ])
+            self.assertTrue(len(blocks) > 1)
+            self.check_ranges(text)
+            self.assertEqual(self.logfile.getText(), text)
+        d.addCallback(check)
+        return d
+
+    def test_compressed_bz2(self):
+        return self.do_test_compressed('bz2')
+
+    def test_compressed_gz(self):
+        return self.do_test_compressed('gz')
+
+    def do_test_streamed(self, method):
+        lf = self.logfile
+        lf.compressMethod = method
+        lf.compressBlockSize = 50
+        lf.streamCompressionLimit = 100
+        text = self.add_lines(100, header_every=10)
+        self.assertTrue(lf.writtenCompressed)
+        self.assertFalse(os.path.exists(lf.getFilename()))
+        self.assertTrue(os.path.exists(lf.getFilename() + '.' + method))
+        # the log can be read while it is still being written
+        self.check_ranges(text)
+        text += self.add_lines(10)
+        self.check_ranges(text)
+        lf.finish()
+        self.check_ranges(text)
+        self.assertEqual(lf.getText(), text)
+        R = logfile.LogFileIndex
+        index = lf.getIndex()
+        blocks = set([ index[i][R.BLOCK_OFFSET] for i in range(len(index)) ])
+        self.assertTrue(len(blocks) > 1)
+        # there is nothing left to compress
+        d = lf.compressLog()
+        d.addCallback(lambda _ : self.assertEqual(lf.getText(), text))
+        return d
+
+    def test_streamed_bz2(self):
+        return self.do_test_streamed('bz2')
+
+    def test_streamed_gz(self):
+        return self.do_test_streamed('gz')
+
+    def test_streamed_below_limit(self):
+        self.logfile.streamCompressionLimit = 10000
+        text = self.add_lines(10)
+        self.logfile.finish()
+        self.assertFalse(self.logfile.writtenCompressed)
+        self.assertEqual(open(self.logfile.getFilename()).read().count('line'),
+                         10)
+        self.assertEqual(self.logfile.getText(), text)
+
+    def test_CompressedLogReader_seek(self):
+        self.add_lines(100)
+        self.logfile.finish()
+        d = self.compress('bz2')
+        def check(_):
+            fp = self.logfile.getFile()
+            for pos in 500, 20, 900, 0:
+                fp.seek(pos)
+                self.assertEqual(fp.tell(), pos)
+                self.assertEqual(fp.read(10), raw[pos:pos+10])
+        raw = open(self.logfile.getFilename()).read()
+        d.addCallback(check)
+        return d
+
+    def test_subscribeConsumer_range(self):
+        text = self.add_lines(100)
+        self.logfile.finish()
+        consumer = mock.Mock()
+        self.logfile.subscribeConsumer(consumer, 50, 120)
+        d = eventual.flushEventualQueue()
+        def check(_):
+            written = ''.join([ c[0][0][1]
+                                for c in consumer.writeChunk.call_args_list ])
+            self.assertEqual(written, text[50:120])
+            consumer.finish.assert_called_with()
+        d.addCallback(check)
+        return d
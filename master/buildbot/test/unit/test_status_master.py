@@ -17,6 +17,7 @@ import mock
 from twisted.trial import unittest
 from buildbot.status import master
 from buildbot.test.fake import fakedb
+from buildbot.test.unit.test_status_history import HistoryMixin
 
 class TestStatus(unittest.TestCase):
 
@@ -43,3 +44,35 @@ class TestStatus(unittest.TestCase):
             self.assertEqual([ bs.id for bs in bslist ], [ 91 ])
         d.addCallback(check)
         return d
+
+class TestGenerateFinishedBuilds(HistoryMixin, unittest.TestCase):
+
+    def setUp(self):
+        m = mock.Mock(name='master')
+        m.db = fakedb.FakeDBConnector(self)
+        self.status = master.Status(m)
+        self.builders = {}
+        for name, times in [ ('a', [10, 40, 50]), ('b', [20, 30, 60]),
+                             ('c', []) ]:
+            bldr = self.setupBuilder()
+            bldr.name = name
+            for finished in times:
+                bldr._addToBuildHistory(self.makeBuild(bldr, started=0,
+                                                       finished=finished))
+            self.builders[name] = bldr
+        self.status.getBuilderNames = lambda : [ 'a', 'b', 'c' ]
+        self.status.getBuilder = lambda name : self.builders[name]
+
+    def finishTimes(self, **kwargs):
+        return [ b.getTimes()[1]
+                 for b in self.status.generateFinishedBuilds(**kwargs) ]
+
+    def test_merged(self):
+        self.assertEqual(self.finishTimes(), [60, 50, 40, 30, 20, 10])
+
+    def test_num_builds_finished_before(self):
+        self.assertEqual(self.finishTimes(num_builds=2, finished_before=45),
+                         [40, 30])
+
+    def test_builders(self):
+        self.assertEqual(self.finishTimes(builders=['b', 'c']), [60, 30, 20])
@@ -0,0 +1,194 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+
+import os
+import mock
+from twisted.trial import unittest
+from buildbot.status import builder
+from buildbot.status.web import console
+
+class ConsoleModel(unittest.TestCase):
+
+    def setUp(self):
+        self.status = mock.Mock()
+        self.model = console.ConsoleModel(self.status,
+                                    console.IntegerRevisionComparator())
+        self.bstatus = builder.BuilderStatus(buildername='bldr')
+        self.bstatus.basedir = os.path.abspath(self.mktemp())
+        os.mkdir(self.bstatus.basedir)
+        self.bstatus.determineNextBuildNumber()
+        self.bstatus.status = mock.Mock()
+        self.debugInfo = dict(builds_scanned=0)
+
+    def addBuilder(self):
+        # as Status.announceNewBuilder does; the builds added before this are
+        # the builder's history
+        receiver = self.model.builderAdded('bldr', self.bstatus)
+        self.assertIdentical(receiver, self.model)
+        self.bstatus.subscribe(receiver)
+
+        # count the builds loaded by the builder itself
+        self.bstatus.getBuild = mock.Mock(side_effect=self.bstatus.getBuild)
+
+    def addBuild(self, number, revision, results=builder.SUCCESS,
+                 finished=True):
+        b = builder.BuildStatus(self.bstatus, number)
+        b.started = 1000 + number * 10
+        if finished:
+            b.finished = b.started + 5
+            b.results = results
+        if revision is not None:
+            b.setProperty('got_revision', revision, 'test')
+        self.bstatus.nextBuildNumber = number + 1
+        self.bstatus.touchBuildCache(b)
+        return b
+
+    def addFailedStep(self, build):
+        step = mock.Mock()
+        step.getName.return_value = 'compile'
+        step.getResults.return_value = (builder.FAILURE, [])
+        step.getText.return_value = ['<b>compile</b>', 'failed']
+        step.text2 = []
+        log = mock.Mock()
+        log.getName.return_value = 'stdio'
+        step.getLogs.return_value = [ log ]
+        build.steps.append(step)
+
+    def revision(self, revision):
+        change = mock.Mock()
+        change.revision = revision
+        change.when = 0
+        return console.DevRevision(change)
+
+    def cell(self, revision):
+        return [ b and b.number
+                 for b in self.model.getCell('bldr', self.revision(revision)) ]
+
+    def load(self, lastRevision, numBuilds=40):
+        self.model.loadBuilds(self.bstatus, self.revision(lastRevision),
+                              numBuilds, self.debugInfo)
+
+    def test_subscribed(self):
+        self.addBuilder()
+        self.status.subscribe.assert_called_with(self.model)
+        self.model.stop()
+        self.status.unsubscribe.assert_called_with(self.model)
+        self.assertEqual(self.bstatus.watchers, [])
+
+    def test_loadBuilds(self):
+        for n, rev in enumerate([ '8', '10', None, '12' ]):
+            self.addBuild(n, rev)
+        self.addBuilder()
+        self.load('10')
+        # builds are looked at until one without revision 10
+        self.assertEqual(self.bstatus.getBuild.call_count, 4)
+        self.assertEqual(self.debugInfo['builds_scanned'], 4)
+        self.assertEqual(self.cell('12'), [3, 1])
+        self.assertEqual(self.cell('10'), [1, 0])
+        self.assertEqual(self.cell('11'), [3, 1])
+
+        # the second time, the builds are already held
+        self.load('10')
+        self.assertEqual(self.bstatus.getBuild.call_count, 4)
+
+    def test_loadBuilds_numBuilds(self):
+        for n in range(5):
+            self.addBuild(n, str(10 + n))
+        self.addBuilder()
+        self.load('10', numBuilds=2)
+        self.assertEqual(self.bstatus.getBuild.call_count, 2)
+        self.assertEqual(self.cell('14'), [4, 3])
+        self.assertEqual(self.cell('10'), [3, None])
+
+        # looking further back loads the older builds only
+        self.load('10', numBuilds=10)
+        self.assertEqual(self.bstatus.getBuild.call_count, 5)
+        self.assertEqual(self.cell('10'), [0, None])
+
+    def test_getCell_reused(self):
+        self.addBuild(0, '10')
+        self.addBuilder()
+        self.load('10')
+        self.assertEqual(self.cell('10'), [0, None])
+        self.model.getBuilds = mock.Mock()
+        self.assertEqual(self.cell('10'), [0, None])
+        self.assertFalse(self.model.getBuilds.called)
+
+    def test_buildStarted(self):
+        self.addBuild(0, '10')
+        self.addBuilder()
+        self.load('10')
+        b1 = self.addBuild(1, None, finished=False)
+        self.assertEqual(self.model.buildStarted('bldr', b1), None)
+        self.assertEqual(self.cell('11'), [None, 0])
+
+        # the revision is found on the next request, and the build then
+        # shows as running
+        b1.setProperty('got_revision', '11', 'test')
+        self.load('10')
+        self.assertEqual(self.cell('11'), [1, 0])
+        introducedIn = self.model.getCell('bldr', self.revision('11'))[0]
+        self.assertFalse(introducedIn.isFinished)
+
+        b1.finished = b1.started + 5
+        b1.results = builder.FAILURE
+        self.model.buildFinished('bldr', b1, builder.FAILURE)
+        introducedIn = self.model.getCell('bldr', self.revision('11'))[0]
+        self.assertTrue(introducedIn.isFinished)
+        self.assertEqual(introducedIn.results, builder.FAILURE)
+        self.assertEqual(self.model.getLastResults(self.bstatus),
+                         builder.FAILURE)
+        self.assertEqual(self.bstatus.getBuild.call_count, 1)
+
+    def test_maxBuilds(self):
+        self.model.MAX_BUILDS = 2
+        self.addBuilder()
+        for n in range(3):
+            self.model.buildStarted('bldr', self.addBuild(n, str(10 + n)))
+        self.assertEqual(sorted(self.model.builds['bldr'].keys()), [1, 2])
+        self.load('10')
+        self.assertEqual(self.bstatus.getBuild.call_count, 0)
+        self.assertEqual(self.cell('10'), [1, None])
+
+    def test_getLastResults(self):
+        self.addBuild(0, '10', results=builder.WARNINGS)
+        self.addBuild(1, '11', finished=False)
+        self.addBuilder()
+        self.assertEqual(self.model.getLastResults(self.bstatus),
+                         builder.WARNINGS)
+        self.assertEqual(self.bstatus.getBuild.call_count, 2)
+        self.model.getLastResults(self.bstatus)
+        self.assertEqual(self.bstatus.getBuild.call_count, 2)
+
+    def test_details(self):
+        b0 = self.addBuild(0, '10', results=builder.FAILURE)
+        self.addFailedStep(b0)
+        self.addBuilder()
+        self.load('10')
+        introducedIn = self.model.getCell('bldr', self.revision('10'))[0]
+        self.assertEqual(introducedIn.details, dict(buildername='bldr',
+                status='compile failed', reason=[],
+                logs=[ dict(name='stdio',
+                    path='builders/bldr/builds/0/steps/compile/logs/stdio') ]))
+
+        request = mock.Mock()
+        request.childLink = lambda path : 'console/' + path
+        res = console.ConsoleStatusResource()
+        details = res.linkDetails(request, introducedIn.details)
+        self.assertEqual(details['logs'], [ dict(name='stdio',
+            url='console/../builders/bldr/builds/0/steps/compile/logs/stdio') ])
+        # the held details are left as they were
+        self.assertTrue('path' in introducedIn.details['logs'][0])
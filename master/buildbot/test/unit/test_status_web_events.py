@@ -0,0 +1,182 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+
+import mock
+from twisted.trial import unittest
+from twisted.internet import task
+from twisted.web import server
+from twisted.web.test.test_web import DummyRequest
+from buildbot.status import builder
+from buildbot.status.results import SUCCESS
+from buildbot.status.web import events
+from buildbot.util import json
+
+class FakeRequest(DummyRequest):
+
+    def __init__(self, args={}):
+        DummyRequest.__init__(self, [])
+        self.args = dict([ (k, v[:]) for (k, v) in args.items() ])
+        self.producer = None
+
+    def registerProducer(self, producer, streaming):
+        self.producer = producer
+
+    def unregisterProducer(self):
+        self.producer = None
+
+class Events(unittest.TestCase):
+
+    def setUp(self):
+        self.status = mock.Mock()
+        self.clock = task.Clock()
+        self.hub = events.StatusEventHub(self.status)
+        self.hub._reactor = self.clock
+        for name, category in [ ('a', 'fast'), ('b', 'slow') ]:
+            bldr = mock.Mock()
+            bldr.getCategory.return_value = category
+            bldr.asDict.return_value = dict(name=name)
+            self.hub.builderAdded(name, bldr)
+        self.rsrc = events.EventsResource()
+        self.rsrc.model = self.hub
+
+    def makeChange(self):
+        change = mock.Mock()
+        change.asDict.return_value = dict(who='me')
+        return change
+
+    def render(self, **args):
+        request = FakeRequest(args)
+        self.assertEqual(self.rsrc.render_GET(request), server.NOT_DONE_YET)
+        return request
+
+    def getEvents(self, request):
+        data = "".join(request.written)
+        return [ json.loads(line[len("data: "):])
+                 for line in data.split("\n") if line.startswith("data: ") ]
+
+    def test_sse_filters(self):
+        request = self.render(category=['slow'])
+        self.hub.builderChangedState('a', 'building')
+        self.hub.builderChangedState('b', 'idle')
+        self.hub.changeAdded(self.makeChange())
+        self.clock.advance(1)
+        self.assertEqual(request.outgoingHeaders['content-type'],
+                         'text/event-stream')
+        packets = self.getEvents(request)
+        self.assertEqual([ (p['event'], p['payload']) for p in packets ],
+                [ ('builderChangedState',
+                   dict(builderName='b', state='idle')) ])
+        self.assertTrue("id: 4\nevent: builderChangedState\n"
+                        in "".join(request.written))
+
+    def test_sse_coalesces(self):
+        request = self.render(event=['builderChangedState'])
+        for state in [ 'idle', 'building', 'idle' ]:
+            self.hub.builderChangedState('a', state)
+        self.hub.builderChangedState('b', 'offline')
+        self.clock.advance(1)
+        packets = self.getEvents(request)
+        self.assertEqual([ p['payload']['state'] for p in packets ],
+                         [ 'idle', 'offline' ])
+
+    def test_sse_step_text(self):
+        request = self.render(event=['stepTextChanged'])
+        bldr = builder.BuilderStatus(buildername='a')
+        build = builder.BuildStatus(bldr, 3)
+        build.subscribe(self.hub)
+        step = build.addStepWithName('compile')
+        step.stepStarted()
+        step.setText(['compiling'])
+        step.setText(['compiled'])
+        step.stepFinished(SUCCESS)
+        self.clock.advance(1)
+        packets = self.getEvents(request)
+        self.assertEqual([ (p['payload']['buildNumber'],
+                            p['payload']['step']['text']) for p in packets ],
+                         [ (3, ['compiled']) ])
+
+    def test_sse_paused_overflows(self):
+        self.patch(events.EventClient, 'MAX_QUEUE', 3)
+        request = self.render(event=['changeAdded'])
+        client, = self.hub.clients
+        client.pauseProducing()
+        for i in range(5):
+            self.hub.changeAdded(self.makeChange())
+        self.clock.advance(1)
+        self.assertEqual(self.getEvents(request), [])
+        client.resumeProducing()
+        self.clock.advance(1)
+        data = "".join(request.written)
+        self.assertTrue("event: reset\n" in data)
+        self.assertEqual([ p['id'] for p in self.getEvents(request)
+                           if 'id' in p ],
+                         [ 5, 6, 7 ])
+
+    def test_sse_reconnect(self):
+        self.hub.changeAdded(self.makeChange())
+        self.hub.changeAdded(self.makeChange())
+        request = FakeRequest()
+        request.headers['last-event-id'] = '3'
+        self.rsrc.render_GET(request)
+        self.clock.advance(1)
+        self.assertEqual([ p['id'] for p in self.getEvents(request) ], [ 4 ])
+
+    def test_poll(self):
+        self.hub.changeAdded(self.makeChange())
+        request = self.render(mode=['poll'], since=['2'])
+        self.clock.advance(1)
+        self.assertEqual(request.finished, 1)
+        batch = json.loads("".join(request.written))
+        self.assertEqual([ e['id'] for e in batch['events'] ], [ 3 ])
+        self.assertEqual((batch['last'], batch['reset']), (3, False))
+
+    def test_poll_waits(self):
+        request = self.render(mode=['poll'], builder=['a'])
+        self.hub.builderChangedState('b', 'idle')
+        self.clock.advance(1)
+        self.assertEqual(request.finished, 0)
+        self.hub.builderChangedState('a', 'idle')
+        self.clock.advance(1)
+        self.assertEqual(request.finished, 1)
+        batch = json.loads("".join(request.written))
+        self.assertEqual([ e['id'] for e in batch['events'] ], [ 4 ])
+        self.assertEqual(self.hub.clients, set())
+        # the timeout was cancelled
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_poll_timeout(self):
+        request = self.render(mode=['poll'])
+        self.clock.advance(events.LongPollClient.TIMEOUT)
+        self.assertEqual(request.finished, 1)
+        self.assertEqual(json.loads("".join(request.written)),
+                         dict(events=[], last=2, reset=False))
+
+    def test_poll_forgotten(self):
+        self.patch(events.StatusEventHub, 'MAX_HISTORY', 2)
+        for i in range(3):
+            self.hub.changeAdded(self.makeChange())
+        request = self.render(mode=['poll'], since=['1'])
+        self.clock.advance(1)
+        batch = json.loads("".join(request.written))
+        self.assertEqual([ e['id'] for e in batch['events'] ], [ 4, 5 ])
+        self.assertTrue(batch['reset'])
+
+    def test_stop(self):
+        sse = self.render()
+        poll = self.render(mode=['poll'])
+        self.rsrc.stopModel()
+        self.assertEqual((sse.finished, poll.finished), (1, 1))
+        self.status.unsubscribe.assert_called_with(self.hub)
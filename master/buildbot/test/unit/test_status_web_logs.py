@@ -0,0 +1,93 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+
+import mock
+from twisted.trial import unittest
+from twisted.web import server
+from buildbot.status.web import logs
+
+class TestTextLog(unittest.TestCase):
+
+    def setUp(self):
+        self.log = mock.Mock()
+        self.log.isFinished.return_value = True
+        self.log.getTextLength.return_value = 100
+        self.log.getTailOffset.return_value = 80
+        self.textlog = logs.TextLog(self.log)
+        self.textlog.asText = True
+
+    def render(self, range=None, **args):
+        req = mock.Mock()
+        req.args = dict([ (k, [v]) for k, v in args.items() ])
+        req.getHeader = lambda name : name == 'range' and range or None
+        self.result = self.textlog.render_GET(req)
+        return req
+
+    def assertSubscribed(self, start, end):
+        self.assertEqual(self.result, server.NOT_DONE_YET)
+        args = self.log.subscribeConsumer.call_args[0]
+        self.assertEqual(args[1:], (start, end))
+
+    def test_whole(self):
+        self.render()
+        self.assertSubscribed(0, None)
+
+    def test_tail(self):
+        self.render(tail='5')
+        self.log.getTailOffset.assert_called_with(5)
+        self.assertSubscribed(80, None)
+
+    def test_offset(self):
+        self.render(offset='17')
+        self.assertSubscribed(17, None)
+
+    def test_offset_invalid(self):
+        self.render(offset='x')
+        self.assertSubscribed(0, None)
+
+    def test_range(self):
+        req = self.render(range='bytes=10-19')
+        req.setResponseCode.assert_called_with(206)
+        req.setHeader.assert_any_call('content-range', 'bytes 10-19/100')
+        self.assertSubscribed(10, 20)
+
+    def test_range_open(self):
+        self.render(range='bytes=90-')
+        self.assertSubscribed(90, 100)
+
+    def test_range_suffix(self):
+        self.render(range='bytes=-30')
+        self.assertSubscribed(70, 100)
+
+    def test_range_past_end(self):
+        self.render(range='bytes=5-500')
+        self.assertSubscribed(5, 100)
+
+    def test_range_unsatisfiable(self):
+        req = self.render(range='bytes=100-')
+        req.setResponseCode.assert_called_with(416)
+        req.setHeader.assert_any_call('content-range', 'bytes */100')
+        self.assertEqual(self.result, '')
+        self.assertFalse(self.log.subscribeConsumer.called)
+
+    def test_range_multiple_ignored(self):
+        self.render(range='bytes=1-2,5-6')
+        self.assertSubscribed(0, None)
+
+    def test_range_unfinished_ignored(self):
+        self.log.isFinished.return_value = False
+        self.render(range='bytes=10-19')
+        self.assertSubscribed(0, None)
@@ -0,0 +1,140 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+
+import os
+import mock
+from twisted.trial import unittest
+from twisted.internet import defer
+from twisted.web import http
+from twisted.web.test.test_web import DummyRequest
+from buildbot.process import cache
+from buildbot.status import builder
+from buildbot.status.web import status_json
+from buildbot.test.unit.test_status_history import HistoryMixin
+from buildbot.util import json
+
+class FakeRequest(DummyRequest):
+    # use the real conditional request handling
+    setETag = http.Request.setETag.im_func
+    etag = None
+
+    def __init__(self, path, args={}, etag=None):
+        DummyRequest.__init__(self, [])
+        self.path = path
+        self.args = dict([ (k, v[:]) for (k, v) in args.items() ])
+        if etag:
+            self.headers['if-none-match'] = etag
+
+class JsonResponses(HistoryMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.status = mock.Mock()
+        self.status.getBuilderNames.return_value = [ 'bldr' ]
+        self.status.getSlaveNames.return_value = []
+        self.status.master.caches = cache.CacheManager()
+        self.status.master.db.buildrequests.getBuildRequests = \
+                lambda **kwargs : defer.succeed([])
+        self.status.getMetrics.return_value = None
+        self.status.getChangeSources.return_value = []
+        self.status.asDict.return_value = {}
+
+        self.bstatus = builder.BuilderStatus(buildername='bldr')
+        self.bstatus.basedir = os.path.abspath(self.mktemp())
+        os.mkdir(self.bstatus.basedir)
+        self.bstatus.determineNextBuildNumber()
+        self.bstatus.status = self.status
+        self.status.getBuilder.return_value = self.bstatus
+        # count the times the builder is rendered
+        self.bstatus.asDict = mock.Mock(side_effect=self.bstatus.asDict)
+
+        self.root = status_json.JsonStatusResource(self.status)
+        self.builders = self.root.getChildWithDefault('builders', None)
+
+    def render(self, resource, path, args={}, etag=None):
+        request = FakeRequest(path, args, etag)
+        resource.render_GET(request)
+        self.assertTrue(request.finished)
+        return request
+
+    def test_cached(self):
+        bldr = self.builders.getChildWithDefault('bldr', None)
+        request = self.render(bldr, '/json/builders/bldr')
+        self.assertEqual(json.loads(''.join(request.written))['state'],
+                         'offline')
+        etag = request.etag
+        self.assertTrue(etag)
+
+        request = self.render(bldr, '/json/builders/bldr')
+        self.assertEqual(request.etag, etag)
+        self.assertEqual(self.bstatus.asDict.call_count, 1)
+
+        # another request, or other arguments, are another response
+        request = self.render(bldr, '/json/builders/bldr',
+                              args=dict(as_text=['1']))
+        self.assertNotEqual(request.etag, etag)
+        self.assertEqual(self.bstatus.asDict.call_count, 2)
+
+    def test_notModified(self):
+        bldr = self.builders.getChildWithDefault('bldr', None)
+        etag = self.render(bldr, '/json/builders/bldr').etag
+        request = self.render(bldr, '/json/builders/bldr', etag=etag)
+        self.assertEqual(request.responseCode, http.NOT_MODIFIED)
+        self.assertEqual(''.join(request.written), '')
+        self.assertEqual(self.bstatus.asDict.call_count, 1)
+
+    def test_changed(self):
+        bldr = self.builders.getChildWithDefault('bldr', None)
+        etag = self.render(bldr, '/json/builders/bldr').etag
+        self.bstatus.setBigState('idle')
+        request = self.render(bldr, '/json/builders/bldr', etag=etag)
+        self.assertNotEqual(request.responseCode, http.NOT_MODIFIED)
+        self.assertNotEqual(request.etag, etag)
+        self.assertEqual(json.loads(''.join(request.written))['state'],
+                         'idle')
+        self.assertEqual(self.bstatus.asDict.call_count, 2)
+
+    def test_select(self):
+        args = dict(select=['bldr'])
+        request = self.render(self.builders, '/json/builders', args)
+        self.assertTrue('bldr' in json.loads(''.join(request.written)))
+        etag = request.etag
+        self.assertTrue(etag)
+        request = self.render(self.builders, '/json/builders', args, etag)
+        self.assertEqual(request.responseCode, http.NOT_MODIFIED)
+        self.assertEqual(self.bstatus.asDict.call_count, 1)
+
+    def test_uncacheable(self):
+        # the root includes the metrics, which change all the time
+        request = self.render(self.root, '/json')
+        self.assertEqual(request.etag, None)
+        self.render(self.root, '/json')
+        self.assertEqual(self.bstatus.asDict.call_count, 2)
+
+    def test_builds_pages(self):
+        for i in range(5):
+            self.bstatus._addToBuildHistory(
+                self.makeBuild(self.bstatus, finished=100 + i))
+        builds = self.builders.getChildWithDefault('bldr', None) \
+                .getChildWithDefault('builds', None) \
+                .getChildWithDefault('_all', None)
+        def numbers(**args):
+            request = self.render(builds, '/json/builders/bldr/builds/_all',
+                                  args=args)
+            return sorted(map(int, json.loads(''.join(request.written))))
+        self.assertEqual(numbers(limit=['2']), [3, 4])
+        self.assertEqual(numbers(before=['3'], limit=['2']), [1, 2])
+        self.assertEqual(numbers(before=['102.0'], limit=['10']), [0, 1])
+        self.assertEqual(numbers(before=['0']), [])
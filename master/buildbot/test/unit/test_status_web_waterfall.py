@@ -0,0 +1,198 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+
+import os
+import mock
+from twisted.trial import unittest
+from buildbot.status import builder
+from buildbot.changes import changes
+from buildbot import sourcestamp
+from buildbot.status.web import waterfall
+
+class WaterfallModel(unittest.TestCase):
+
+    def setUp(self):
+        self.status = mock.Mock()
+        self.model = waterfall.WaterfallModel(self.status)
+        self.bstatus = self.addBuilder('bldr')
+
+    def addBuilder(self, name):
+        bstatus = builder.BuilderStatus(buildername=name)
+        bstatus.basedir = os.path.abspath(self.mktemp())
+        os.mkdir(bstatus.basedir)
+        bstatus.determineNextBuildNumber()
+        bstatus.status = mock.Mock()
+        # as Status.announceNewBuilder does
+        receiver = self.model.builderAdded(name, bstatus)
+        self.assertIdentical(receiver, self.model)
+        bstatus.subscribe(receiver)
+        return bstatus
+
+    def addBuild(self, number, bstatus=None, branch=None, changes=()):
+        bstatus = bstatus or self.bstatus
+        b = builder.BuildStatus(bstatus, number)
+        b.setSourceStamp(sourcestamp.SourceStamp(branch=branch,
+                                                 changes=changes))
+        b.started = 1000 + number * 10
+        b.finished = b.started + 5
+        bstatus.nextBuildNumber = number + 1
+        bstatus.touchBuildCache(b)
+        return b
+
+    def addStep(self, b):
+        step = b.addStepWithName('step%d' % len(b.getSteps()))
+        step.started = b.started + len(b.getSteps())
+        step.finished = step.started
+        return step
+
+    def getEvents(self, column, branches=[], categories=[], committers=[],
+                  minTime=0):
+        return list(column.eventGenerator(branches, categories, committers,
+                                          minTime))
+
+    def test_subscribed(self):
+        self.status.subscribe.assert_called_with(self.model)
+        self.model.stop()
+        self.status.unsubscribe.assert_called_with(self.model)
+        self.assertEqual(self.bstatus.watchers, [])
+
+    def test_buildStarted(self):
+        other = self.addBuilder('other')
+        column = self.model.getColumn(self.bstatus)
+        otherColumn = self.model.getColumn(other)
+        b0 = self.addBuild(0)
+        self.assertIdentical(self.model.buildStarted('bldr', b0), self.model)
+        # only the column of the builder that changed is read again
+        self.assertEqual(column.dirtyFrom, 0)
+        self.assertEqual(otherColumn.dirtyFrom, None)
+
+    def test_builderRemoved(self):
+        self.model.getColumn(self.bstatus)
+        self.model.builderRemoved('bldr')
+        self.assertFalse('bldr' in self.model.builderStatuses)
+        self.assertFalse('bldr' in self.model.columns)
+
+    def test_column(self):
+        column = self.model.getColumn(self.bstatus)
+        b0 = self.addBuild(0)
+        self.addStep(b0)
+        self.model.buildFinished('bldr', b0, None)
+        b1 = self.addBuild(1)
+        self.addStep(b1)
+        self.model.buildStarted('bldr', b1)
+        events = self.getEvents(column)
+        self.assertEqual([ e.key for e in events ],
+            [ ('build', 1, 0), ('build', 1, None),
+              ('build', 0, 0), ('build', 0, None) ])
+        self.assertIdentical(events[0].resolve(), b1.getSteps()[0])
+        self.assertIdentical(events[1].resolve(), b1)
+
+        # a new step only reads the events of its own build again
+        self.addStep(b1)
+        self.model.stepStarted(b1, None)
+        newEvents = self.getEvents(column)
+        self.assertEqual([ e.key for e in newEvents ][:3],
+            [ ('build', 1, 1), ('build', 1, 0), ('build', 1, None) ])
+        self.assertEqual(newEvents[3:], events[2:])
+        for old, new in zip(events[2:], newEvents[3:]):
+            self.assertIdentical(old, new)
+
+    def test_column_builder_events(self):
+        column = self.model.getColumn(self.bstatus)
+        self.assertEqual(self.getEvents(column), [])
+        # builder Events arrive without a status event
+        e = self.bstatus.addEvent(['idle'])
+        events = self.getEvents(column)
+        self.assertEqual(len(events), 1)
+        self.assertIdentical(events[0].resolve(), e)
+        self.assertTrue(waterfall.isBuilderEvent(events[0]))
+
+    def test_column_filters(self):
+        column = self.model.getColumn(self.bstatus)
+        self.addBuild(0, branch='a')
+        self.addBuild(1, branch='b',
+                      changes=[ changes.Change('me', [], 'fix') ])
+        self.addBuild(2, branch='a')
+        self.model.buildStarted('bldr', self.addBuild(3, branch='b'))
+        def numbers(**filters):
+            return [ e.number for e in self.getEvents(column, **filters) ]
+        self.assertEqual(numbers(), [ 3, 2, 1, 0 ])
+        self.assertEqual(numbers(branches=['a']), [ 2, 0 ])
+        self.assertEqual(numbers(committers=['me']), [ 1 ])
+        self.assertEqual(numbers(minTime=1015), [ 3, 2 ])
+        self.assertEqual(numbers(categories=['other']), [])
+        # the filtered views share the same events
+        self.assertEqual(column.dirtyFrom, None)
+
+    def test_changes(self):
+        self.model.MAX_CHANGES = 3
+        # changes are ignored until the recent changes have been loaded
+        self.model.changeAdded('a')
+        self.assertEqual(self.model.changes, None)
+        self.model.setChanges([ 'b', 'c', 'd', 'e' ])
+        self.assertEqual(self.model.changes, [ 'c', 'd', 'e' ])
+        self.model.changeAdded('f')
+        self.assertEqual(self.model.changes, [ 'd', 'e', 'f' ])
+
+class WaterfallStatusResource(unittest.TestCase):
+
+    def setUp(self):
+        self.resource = waterfall.WaterfallStatusResource()
+        self.resource.model = waterfall.WaterfallModel(mock.Mock())
+        self.bstatus = builder.BuilderStatus(buildername='bldr')
+        self.bstatus.basedir = os.path.abspath(self.mktemp())
+        os.mkdir(self.bstatus.basedir)
+        self.bstatus.determineNextBuildNumber()
+        self.resource.model.builderAdded('bldr', self.bstatus)
+        for number in range(2):
+            b = builder.BuildStatus(self.bstatus, number)
+            b.setSourceStamp(sourcestamp.SourceStamp())
+            b.started = 1000 + number * 100
+            b.finished = b.started + 50
+            step = b.addStepWithName('compile')
+            step.started = b.started + 10
+            step.finished = b.started + 40
+            self.bstatus.nextBuildNumber = number + 1
+            self.bstatus.touchBuildCache(b)
+            self.resource.model.buildStarted('bldr', b)
+        self.build = b
+
+    def buildGrid(self, **args):
+        request = mock.Mock()
+        request.args = args
+        return self.resource.buildGrid(request, [ self.bstatus ], [])
+
+    def test_buildGrid(self):
+        changeNames, builderNames, timestamps, eventGrid, sourceEvents = \
+                self.buildGrid()
+        self.assertEqual(builderNames, [ 'bldr' ])
+        # each build and step starts a span, as does the idle time after
+        # each step
+        self.assertEqual(timestamps, [ 1140, 1110, 1100, 1040, 1010, 1000 ])
+        self.assertEqual(len(eventGrid), len(timestamps))
+
+    def test_buildGrid_updated(self):
+        self.buildGrid()
+        step = self.build.addStepWithName('test')
+        step.started = 1145
+        step.finished = 1148
+        self.resource.model.stepStarted(self.build, step)
+        eventGrid = self.buildGrid()[3]
+        self.assertTrue(step in [ e.resolve() for e in eventGrid[0][1]
+                                  if isinstance(e, waterfall.WaterfallEvent) ])
+        # and a different view of the same column
+        eventGrid = self.buildGrid(branch=['other'])[3]
+        self.assertEqual(eventGrid, [])
@@ -114,3 +114,20 @@ class Trial(steps.BuildStepMixin, unittest.TestCase):
         self.expectOutcome(result=SUCCESS, status_text=['2 tests', 'passed'])
         return self.runStep()
 
+    def test_run_header_ignored(self):
+        self.setupStep(
+                python_twisted.Trial(workdir='build',
+                                     tests = 'testname',
+                                     testpath=None))
+        self.expectCommands(
+            ExpectShell(workdir='build',
+                        command=['trial', '--reporter=bwverbose', 'testname'],
+                        usePTY="slave-config",
+                        logfiles={'test.log': '_trial_temp/test.log'})
+            + ExpectShell.log('stdio', stdout="Ran 2 tests\n")
+            + ExpectShell.log('stdio', header="echo Ran 3 tests\n")
+            + 0
+        )
+        self.expectOutcome(result=SUCCESS, status_text=['2 tests', 'passed'])
+        return self.runStep()
+
@@ -13,15 +13,19 @@
 #
 # Copyright Buildbot Team Members
 
-import tempfile, os
+import tempfile, os, shutil, tarfile, threading
+from cStringIO import StringIO
 from twisted.trial import unittest
+from twisted.internet import defer
 
 from mock import Mock
 
 from buildbot.process.properties import Properties
+from buildbot.status.results import SUCCESS, FAILURE
 from buildbot.util import json
+from buildbot.steps import transfer
 from buildbot.steps.transfer import StringDownload, JSONStringDownload, JSONPropertiesDownload, \
-    FileUpload
+    FileUpload, DirectoryUpload, _DirectoryStreamWriter
 
 class TestFileUpload(unittest.TestCase):
     def setUp(self):
@@ -36,7 +40,7 @@ class TestFileUpload(unittest.TestCase):
         s = FileUpload(slavesrc=__file__, masterdest=self.destfile)
         s.build = Mock()
         s.build.getProperties.return_value = Properties()
-        s.build.getSlaveCommandVersion.return_value = 1
+        s.build.getSlaveCommandVersion.return_value = "1"
 
         s.step_status = Mock()
         s.buildslave = Mock()
@@ -94,12 +98,206 @@ class TestFileUpload(unittest.TestCase):
         self.assertAlmostEquals(timestamp[0],desttimestamp[0],places=5)
         self.assertAlmostEquals(timestamp[1],desttimestamp[1],places=5)
 
+    def getUploadArgs(self, version, **kwargs):
+        s = FileUpload(slavesrc=__file__, masterdest=self.destfile, **kwargs)
+        s.build = Mock()
+        s.build.getProperties.return_value = Properties()
+        s.build.getSlaveCommandVersion.return_value = version
+
+        s.step_status = Mock()
+        s.buildslave = Mock()
+        s.remote = Mock()
+        s.start()
+
+        for c in s.remote.method_calls:
+            name, command, args = c
+            if command[3] == 'uploadFile':
+                return command[-1]
+        self.fail("No uploadFile command found")
+
+    def testWindow(self):
+        kwargs = self.getUploadArgs("2.15", window=3)
+        self.assertEqual(kwargs['window'], 3)
+        writer = kwargs['writer']
+        contents = "0123456789" * 20
+        # blocks may arrive in any order
+        writer.remote_writeAt(100, contents[100:])
+        writer.remote_writeAt(0, contents[:100])
+        writer.remote_close()
+        self.assertEquals(open(self.destfile, "rb").read(), contents)
+
+    def testWindow_oldSlave(self):
+        kwargs = self.getUploadArgs("2.14", window=3)
+        self.assertFalse('window' in kwargs)
+        kwargs['writer'].remote_close()
+
+    def testWindow_maxsize(self):
+        kwargs = self.getUploadArgs("2.15", maxsize=150)
+        writer = kwargs['writer']
+        writer.remote_writeAt(100, 'x' * 100)
+        writer.remote_writeAt(0, 'y' * 100)
+        writer.remote_writeAt(200, 'z' * 100)
+        writer.remote_close()
+        self.assertEquals(open(self.destfile, "rb").read(),
+                          'y' * 100 + 'x' * 50)
+
+class TestDirectoryUpload(unittest.TestCase):
+    def setUp(self):
+        self.destdir = os.path.abspath('destdir')
+        if os.path.exists(self.destdir):
+            shutil.rmtree(self.destdir)
+
+    def tearDown(self):
+        transfer._unpackPool.shutdown()
+        if os.path.exists(self.destdir):
+            shutil.rmtree(self.destdir)
+
+    def getUploadArgs(self, version, **kwargs):
+        s = DirectoryUpload(slavesrc="srcdir", masterdest=self.destdir,
+                            **kwargs)
+        s.build = Mock()
+        s.build.getProperties.return_value = Properties()
+        s.build.getSlaveCommandVersion.return_value = version
+
+        s.step_status = Mock()
+        s.buildslave = Mock()
+        s.remote = Mock()
+        s.start()
+        self.step = s
+
+        for c in s.remote.method_calls:
+            name, command, args = c
+            if command[3] == 'uploadDirectory':
+                return command[-1]
+        self.fail("No uploadDirectory command found")
+
+    def makeArchive(self, compress=None):
+        f = StringIO()
+        archive = tarfile.open(mode='w|' + (compress or ''), fileobj=f)
+        for name, data in [ ('aa', 'lots of a' * 1000),
+                            ('sub/bb', 'and a little b' * 17) ]:
+            tarinfo = tarfile.TarInfo(name)
+            tarinfo.size = len(data)
+            archive.addfile(tarinfo, StringIO(data))
+        archive.close()
+        return f.getvalue()
+
+    def testStream(self, compress=None):
+        kwargs = self.getUploadArgs("2.16", compress=compress)
+        self.assertTrue(kwargs['stream'])
+        writer = kwargs['writer']
+        self.assertTrue(isinstance(writer, _DirectoryStreamWriter))
+
+        # blocks may arrive out of order, but are unpacked in order
+        data = self.makeArchive(compress)
+        blocks = [ (i, data[i:i+100]) for i in range(0, len(data), 100) ]
+        blocks[0], blocks[1] = blocks[1], blocks[0]
+        for offset, block in blocks:
+            writer.remote_writeAt(offset, block)
+
+        d = writer.remote_unpack()
+        def check(_):
+            self.assertEqual(open(os.path.join(self.destdir, 'aa')).read(),
+                             'lots of a' * 1000)
+            self.assertEqual(
+                open(os.path.join(self.destdir, 'sub', 'bb')).read(),
+                'and a little b' * 17)
+        d.addCallback(check)
+        return d
+
+    def testStream_gz(self):
+        return self.testStream('gz')
+
+    def testStream_oldSlave(self):
+        kwargs = self.getUploadArgs("2.15")
+        self.assertFalse('stream' in kwargs)
+        self.assertFalse(isinstance(kwargs['writer'], _DirectoryStreamWriter))
+
+    def testStream_corrupt(self):
+        writer = self.getUploadArgs("2.16")['writer']
+        writer.remote_write('not a tarfile' * 100)
+        d = writer.remote_unpack()
+        def check(f):
+            f.trap(tarfile.ReadError)
+            self.flushLoggedErrors(tarfile.ReadError)
+            # further writes fail, so the slave stops sending
+            return self.assertFailure(defer.maybeDeferred(
+                    writer.remote_write, 'more'), tarfile.ReadError)
+        d.addCallbacks(lambda _ : self.fail("should have failed"), check)
+        return d
+
+    def testStream_corrupt_fails_step(self):
+        writer = self.getUploadArgs("2.16")['writer']
+        writer.remote_write('not a tarfile' * 100)
+        d = writer.remote_unpack()
+        def finish(f):
+            f.trap(tarfile.ReadError)
+            self.flushLoggedErrors(tarfile.ReadError)
+            # the slave's error from unpack is only logged, and it reports
+            # success; the step fails all the same
+            self.step.cmd.rc = 0
+            self.step.addCompleteLog = Mock()
+            self.step.deferred = defer.Deferred()
+            self.step.finished(SUCCESS)
+            return self.step.deferred
+        d.addCallbacks(lambda _ : self.fail("should have failed"), finish)
+        def check(results):
+            self.assertEqual(results, FAILURE)
+            self.assertEqual(self.step.addCompleteLog.call_args[0][0],
+                             'unpack')
+        d.addCallback(check)
+        return d
+
+class TestUnpackPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = transfer._UnpackPool(maxthreads=1)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_bounded(self):
+        release = threading.Event()
+        started = []
+        class Writer:
+            def __init__(self, name, wait=False):
+                self.name = name
+                self.wait = wait
+            def _unpack(self):
+                started.append(self.name)
+                if self.wait:
+                    release.wait()
+        d1 = self.pool.unpack(Writer('one', wait=True))
+        d2 = self.pool.unpack(Writer('two'))
+        # the second upload waits for the only thread
+        self.assertEqual(len(self.pool.threadpool.threads), 1)
+        release.set()
+        d = defer.gatherResults([d1, d2])
+        def check(_):
+            self.assertEqual(started, [ 'one', 'two' ])
+            self.assertEqual(self.pool.writers, set())
+        d.addCallback(check)
+        return d
+
+    def test_stop_ends_archives(self):
+        destdir = os.path.abspath('destdir')
+        self.addCleanup(shutil.rmtree, destdir, True)
+        writer = _DirectoryStreamWriter(destdir, None, None, 0600)
+        self.patch(transfer, '_unpackPool', self.pool)
+        writer.remote_write('x' * 100)
+        # the slave never finishes; stopping the pool must not wait for it
+        self.pool.shutdown()
+        self.assertEqual(self.pool.threadpool, None)
+        d = self.assertFailure(writer.remote_unpack(), tarfile.ReadError)
+        d.addCallback(lambda _ : self.flushLoggedErrors(tarfile.ReadError))
+        return d
+
 class TestStringDownload(unittest.TestCase):
     def testBasic(self):
         s = StringDownload("Hello World", "hello.txt")
         s.build = Mock()
         s.build.getProperties.return_value = Properties()
-        s.build.getSlaveCommandVersion.return_value = 1
+        s.build.getSlaveCommandVersion.return_value = "1"
 
         s.step_status = Mock()
         s.buildslave = Mock()
@@ -116,6 +314,9 @@ class TestStringDownload(unittest.TestCase):
                 reader = kwargs['reader']
                 data = reader.remote_read(100)
                 self.assertEquals(data, "Hello World")
+                self.assertEquals(reader.remote_readAt(6, 3), "Wor")
+                self.assertEquals(reader.remote_readAt(0, 5), "Hello")
+                self.assertFalse('window' in kwargs)
                 break
         else:
             self.assert_(False, "No downloadFile command found")
@@ -126,7 +327,7 @@ class TestJSONStringDownload(unittest.TestCase):
         s = JSONStringDownload(msg, "hello.json")
         s.build = Mock()
         s.build.getProperties.return_value = Properties()
-        s.build.getSlaveCommandVersion.return_value = 1
+        s.build.getSlaveCommandVersion.return_value = "1"
 
         s.step_status = Mock()
         s.buildslave = Mock()
@@ -154,7 +355,7 @@ class TestJSONPropertiesDownload(unittest.TestCase):
         props = Properties()
         props.setProperty('key1', 'value1', 'test')
         s.build.getProperties.return_value = props
-        s.build.getSlaveCommandVersion.return_value = 1
+        s.build.getSlaveCommandVersion.return_value = "1"
         ss = Mock()
         ss.asDict.return_value = dict(revision="12345")
         s.build.getSourceStamp.return_value = ss
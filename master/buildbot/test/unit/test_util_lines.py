@@ -0,0 +1,92 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+
+import re
+from twisted.trial import unittest
+from buildbot.util import lines
+
+class LineSplitter(unittest.TestCase):
+
+    def test_split(self):
+        s = lines.LineSplitter()
+        self.assertEqual(s.split("a\nb"), [ "a" ])
+        self.assertEqual(s.split("c\n\nd\n"), [ "bc", "", "d" ])
+        self.assertEqual(s.split("e"), [])
+        self.assertEqual(s.flush(), [ "e" ])
+        self.assertEqual(s.flush(), [])
+
+    def test_max_length(self):
+        s = lines.LineSplitter(max_length=3)
+        self.assertEqual(s.split("abc\nabcd\nab"), [ "abc" ])
+        self.assertEqual(s.split("cd"), [])
+        self.assertEqual(s.split("e\nf\n"), [ "f" ])
+        self.assertEqual(s.split("xyzzy"), [])
+        self.assertEqual(s.flush(), [])
+
+    def test_unlimited(self):
+        s = lines.LineSplitter(max_length=None)
+        self.assertEqual(s.split("x" * 100000), [])
+        self.assertEqual(s.split("\n"), [ "x" * 100000 ])
+
+class LineMatcher(unittest.TestCase):
+
+    lines = [ "nothing here",
+              "warning: foo.c:12: unused",
+              "entering dir1",
+              "warning and entering",
+              "error: bad",
+              "a warning: in the middle" ]
+
+    def check(self, matcher, combined=True):
+        self.assertEqual(matcher.combined is not None, combined)
+        results = [ (n, i, m.group(0), m.groups())
+                    for n, i, m in matcher.matchLines(self.lines) ]
+        self.assertEqual(results, [
+            (1, 1, "warning: foo.c:12:", ("foo.c", "12")),
+            (2, 0, "entering dir1", ("dir1",)),
+            (3, 0, "entering", (None,)),
+            (4, 2, "error", ("r",)),
+        ])
+
+    def test_combined(self):
+        self.check(lines.LineMatcher(
+            [ r"entering ?(\w+)?", r"warning: (\w+\.c):(\d+):", "^e(r)ror" ],
+            anchored=[1]))
+
+    def test_compiled(self):
+        self.check(lines.LineMatcher(
+            [ re.compile(r"entering ?(\w+)?"),
+              re.compile(r"warning: (\w+\.c):(\d+):"),
+              re.compile("^e(r)ror") ], anchored=[1]))
+
+    def test_uncombinable(self):
+        # a backreference can't be combined..
+        self.check(lines.LineMatcher(
+            [ r"entering ?(\w+)?", r"warning: (\w+\.c):(\d+):", r"^e(r)\1or" ],
+            anchored=[1]), combined=False)
+        # ..nor can differing flags
+        self.check(lines.LineMatcher(
+            [ r"entering ?(\w+)?", r"warning: (\w+\.c):(\d+):",
+              re.compile("^E(R)ROR", re.I) ], anchored=[1]), combined=False)
+
+    def test_matchLine(self):
+        matcher = lines.LineMatcher([ "b+", "a(b)" ])
+        i, m = matcher.matchLine("xabb")
+        self.assertEqual((i, m.group(0), m.start()), (0, "bb", 2))
+        self.assertEqual(matcher.matchLine("xyz"), None)
+
+    def test_empty(self):
+        self.assertEqual(lines.LineMatcher([]).matchLines(self.lines), [])
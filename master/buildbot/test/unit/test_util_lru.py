@@ -26,6 +26,12 @@ def short(k):
 def long(k):
     return set([k.upper() * 6])
 
+# construct weakref-able objects of a particular length
+class SizedList(list):
+    pass
+def sized(n):
+    return SizedList(['x'] * n)
+
 class LRUCache(unittest.TestCase):
 
     def setUp(self):
@@ -407,3 +413,118 @@ class LRUCache(unittest.TestCase):
                 self.lru.get('p'))
         yield wfd
         self.check_result(wfd.getResult(), set(['P2P2']))
+
+    @defer.deferredGenerator
+    def test_contains(self):
+        self.assertFalse('a' in self.lru)
+
+        wfd = defer.waitForDeferred(
+                self.lru.get('a'))
+        yield wfd
+        wfd.getResult()
+
+        self.assertTrue('a' in self.lru)
+        self.assertEqual(self.lru.hits, 0)
+
+    @defer.deferredGenerator
+    def test_prime(self):
+        p = set(['P2P2'])
+        self.assertEqual(self.lru.prime('p', p), p)
+
+        # the primed value is returned without calling the miss_fn
+        wfd = defer.waitForDeferred(
+                self.lru.get('p'))
+        yield wfd
+        self.check_result(wfd.getResult(), p, 1, 0)
+
+    @defer.deferredGenerator
+    def test_prime_existing(self):
+        wfd = defer.waitForDeferred(
+                self.lru.get('p'))
+        yield wfd
+        p = wfd.getResult()
+
+        # priming an existing key keeps the existing value
+        self.assertIdentical(self.lru.prime('p', set(['P2P2'])), p)
+
+    def test_prime_none(self):
+        self.assertEqual(self.lru.prime('p', None), None)
+        self.assertFalse('p' in self.lru)
+
+    def test_prime_expulsion(self):
+        values = [ self.lru.prime(k, short(k)) for k in 'abcd' ]
+        self.assertEqual(sorted(self.lru.cache.keys()), ['b', 'c', 'd'])
+        self.assertEqual(values[0], short('a'))
+
+
+class SizedLRUCache(unittest.TestCase):
+
+    def setUp(self):
+        # the size of each value is its length
+        self.lru = lru.SizedLRUCache(len, 10)
+
+    def test_get_miss(self):
+        self.assertEqual(self.lru.get('a'), None)
+        self.assertEqual(self.lru.get('a', 'dflt'), 'dflt')
+        self.assertEqual(self.lru.misses, 2)
+
+    def test_put_get(self):
+        a = short('a')
+        self.lru.put('a', a)
+        self.assertIdentical(self.lru.get('a'), a)
+        self.assertEqual((self.lru.hits, self.lru.misses, self.lru.size),
+                         (1, 0, 1))
+
+    def test_expulsion_by_size(self):
+        values = dict([ (k, sized(4)) for k in 'abc' ])
+        self.lru.put('a', values['a'])
+        self.lru.put('b', values['b'])
+        self.lru.get('a')
+        # adding c exceeds the size limit, so the least recently used value,
+        # b, is expelled
+        self.lru.put('c', values['c'])
+        self.assertEqual(sorted(self.lru.cache.keys()), ['a', 'c'])
+        self.assertEqual((self.lru.size, self.lru.evictions), (8, 1))
+
+    def test_oversized_value_kept(self):
+        self.lru.put('a', sized(4))
+        self.lru.put('big', sized(20))
+        self.assertEqual(self.lru.cache.keys(), ['big'])
+        self.assertEqual(self.lru.size, 20)
+
+    def test_put_resizes(self):
+        v = sized(4)
+        self.lru.put('a', v)
+        v.extend(['x'] * 4)
+        self.lru.put('a', v)
+        self.assertEqual(self.lru.size, 8)
+
+    def test_weakrefs(self):
+        a = short('a')
+        self.lru.put('a', a)
+        self.lru.put('b', sized(10))
+        self.assertFalse('a' in self.lru.cache)
+        # a is still referenced, so it can be found, and is re-added
+        self.assertTrue('a' in self.lru)
+        self.assertIdentical(self.lru.get('a'), a)
+        self.assertEqual(self.lru.refhits, 1)
+        self.assertEqual(self.lru.cache.keys(), ['a'])
+
+    def test_items(self):
+        a, b = short('a'), short('b')
+        self.lru.put('a', a)
+        self.lru.put('b', b)
+        self.assertEqual(sorted(self.lru.items()), [('a', a), ('b', b)])
+
+    def test_set_max_size(self):
+        for k in 'abcde':
+            self.lru.put(k, sized(2))
+        self.lru.set_max_size(4)
+        self.assertEqual(sorted(self.lru.cache.keys()), ['d', 'e'])
+
+    def test_queue_collapsing(self):
+        self.lru.put('a', sized(1))
+        for i in range(100):
+            self.lru.get('a')
+        self.assertTrue(len(self.lru.queue) <= 20)
+        self.assertEqual(self.lru.refcount['a'], len(self.lru.queue))
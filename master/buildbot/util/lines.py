@@ -0,0 +1,187 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+
+import re
+
+class LineSplitter(object):
+    """
+    Splits arbitrarily-sized blocks of text into lists of complete lines,
+    with a single C{split} for each block.  At most one partial line is held
+    between blocks, and it is bounded by C{max_length}: lines longer than
+    that are dropped, in their entirety.
+
+    @ivar max_length: the length of the longest line to return, or None for
+    no limit
+    """
+
+    def __init__(self, max_length=16384):
+        self.max_length = max_length
+        self.partial = ""
+        self.discarding = False
+
+    def split(self, data):
+        """
+        Add C{data} to the partial line, and return a list of the lines it
+        completes, without their newlines.
+        """
+        if self.partial:
+            data = self.partial + data
+        lines = data.split("\n")
+        self.partial = lines.pop()
+        max_length = self.max_length
+        if max_length is None:
+            return lines
+        if self.discarding and lines:
+            # this is the end of a line that was too long
+            del lines[0]
+            self.discarding = False
+        if len(self.partial) > max_length:
+            self.partial = ""
+            self.discarding = True
+        if len(data) > max_length:
+            lines = [ l for l in lines if len(l) <= max_length ]
+        return lines
+
+    def flush(self):
+        """
+        Return the partial line, if any, as a list of lines, at the end of the
+        text.
+        """
+        partial, self.partial = self.partial, ""
+        discarding, self.discarding = self.discarding, False
+        if partial and not discarding:
+            return [ partial ]
+        return []
+
+# numbered backreferences change meaning when patterns are combined, and
+# inline flags apply to the whole combined pattern
+_uncombinable_re = re.compile(r"\\[1-9]|\(\?[iLmsux]+\)")
+
+class LineMatcher(object):
+    """
+    Matches lines against a list of regular expressions, returning the first
+    (in list order) that matches each line.
+
+    Each expression is either a string or a compiled regular expression.  An
+    expression is searched for anywhere in the line, as with C{re.search},
+    unless its index is in C{anchored} or it begins with C{^}, in which case
+    it must match at the start of the line, as with C{re.match}.
+
+    Each expression is applied to the whole batch of lines with a single
+    C{map}, so that lines are only examined one at a time in Python if one of
+    the expressions matches them.  The anchored expressions are also combined
+    into a single alternation, so that a line that matches none of them costs
+    a single call into the regular expression engine.  (Searches are left
+    alone, as the engine finds a literal prefix much faster on its own than
+    as part of an alternation.)  Expressions that cannot be combined (because
+    their flags differ, they contain numbered backreferences, inline flags or
+    conflicting group names, or there are too many groups) are matched one at
+    a time instead, with the same results.
+
+    @ivar combined: the combined alternation, or None
+    """
+
+    def __init__(self, patterns, anchored=()):
+        self.regexps = []
+        for pattern in patterns:
+            if isinstance(pattern, basestring):
+                pattern = re.compile(pattern)
+            self.regexps.append(pattern)
+        self.anchored = []
+        for i, regexp in enumerate(self.regexps):
+            self.anchored.append(i in anchored or
+                    (regexp.pattern.startswith("^")
+                     and not regexp.flags & re.MULTILINE))
+
+        # (function, index) pairs to apply to each line, where index is the
+        # index of the expression, or None for the combined alternation
+        self.matchers = []
+        combine = [ i for i in range(len(self.regexps)) if self.anchored[i] ]
+        self.combined = None
+        if len(combine) > 1:
+            self.combined = self._combine(combine)
+        if self.combined is not None:
+            self.matchers.append((self.combined.match, None))
+        else:
+            combine = []
+        for i, regexp in enumerate(self.regexps):
+            if i in combine:
+                continue
+            if self.anchored[i]:
+                self.matchers.append((regexp.match, i))
+            else:
+                self.matchers.append((regexp.search, i))
+
+    def _combine(self, indexes):
+        regexps = [ self.regexps[i] for i in indexes ]
+        flags = set([ r.flags for r in regexps ])
+        if len(flags) != 1:
+            return None
+        alternatives = []
+        for i, regexp in zip(indexes, regexps):
+            if _uncombinable_re.search(regexp.pattern):
+                return None
+            alternatives.append("(?P<_lm%d>%s)" % (i, regexp.pattern))
+        try:
+            return re.compile("|".join(alternatives), flags.pop())
+        except (re.error, AssertionError, UnicodeError):
+            # AssertionError is raised by sre for too many groups
+            return None
+
+    def matchLine(self, line):
+        """
+        Return (index, match) for the first expression that matches C{line},
+        or None if none of them match.  The match object is that of the
+        expression itself, so its groups are numbered as usual.
+        """
+        results = self.matchLines([ line ])
+        if results:
+            return results[0][1:]
+        return None
+
+    def matchLines(self, lines):
+        """
+        Match each of C{lines}, returning a list of (lineIndex, index, match)
+        for the lines that match one of the expressions, in order.
+        """
+        nlines = len(lines)
+        columns = []
+        for fn, index in self.matchers:
+            column = map(fn, lines)
+            if column.count(None) != nlines:
+                columns.append((column, index))
+        if not columns:
+            return []
+
+        results = []
+        for n in xrange(nlines):
+            best = None
+            for column, index in columns:
+                m = column[n]
+                if m is None:
+                    continue
+                if index is None:
+                    index = int(m.lastgroup[3:])
+                if best is None or index < best[0]:
+                    best = (index, m)
+            if best is None:
+                continue
+            index, m = best
+            if m.re is not self.regexps[index]:
+                # a match of the combined alternation
+                m = self.regexps[index].match(lines[n])
+            results.append((n, index, m))
+        return results
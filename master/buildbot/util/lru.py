@@ -93,39 +93,19 @@ class AsyncLRUCache(object):
         """
         cache = self.cache
         weakrefs = self.weakrefs
-        refcount = self.refcount
         concurrent = self.concurrent
-        queue = self.queue
-
-        # utility function to record recent use of this key
-        def ref_key():
-            queue.append(key)
-            refcount[key] = refcount[key] + 1
-
-            # periodically compact the queue by eliminating duplicate keys
-            # while preserving order of most recent access.  Note that this
-            # is only required when the cache does not exceed its maximum
-            # size
-            if len(queue) > self.max_queue:
-                refcount.clear()
-                queue_appendleft = queue.appendleft
-                queue_appendleft(self.sentinel)
-                for k in ifilterfalse(refcount.__contains__,
-                                        iter(queue.pop, self.sentinel)):
-                    queue_appendleft(k)
-                    refcount[k] = 1
 
         try:
             result = cache[key]
             self.hits += 1
-            ref_key()
+            self._ref_key(key)
             return defer.succeed(result)
         except KeyError:
             try:
                 result = weakrefs[key]
                 self.refhits += 1
                 cache[key] = result
-                ref_key()
+                self._ref_key(key)
                 return defer.succeed(result)
             except KeyError:
                 # if there's already a fetch going on, add
@@ -154,7 +134,7 @@ class AsyncLRUCache(object):
 
                 # reference the key once, possibly standing in for multiple
                 # concurrent accesses
-                ref_key()
+                self._ref_key(key)
 
             self.inv()
             self._purge()
@@ -175,6 +155,27 @@ class AsyncLRUCache(object):
 
         return d
 
+    def _ref_key(self, key):
+        # record recent use of this key
+        queue = self.queue
+        refcount = self.refcount
+
+        queue.append(key)
+        refcount[key] = refcount[key] + 1
+
+        # periodically compact the queue by eliminating duplicate keys
+        # while preserving order of most recent access.  Note that this
+        # is only required when the cache does not exceed its maximum
+        # size
+        if len(queue) > self.max_queue:
+            refcount.clear()
+            queue_appendleft = queue.appendleft
+            queue_appendleft(self.sentinel)
+            for k in ifilterfalse(refcount.__contains__,
+                                    iter(queue.pop, self.sentinel)):
+                queue_appendleft(k)
+                refcount[k] = 1
+
     def _purge(self):
         if len(self.cache) <= self.max_size:
             return
@@ -211,6 +212,40 @@ class AsyncLRUCache(object):
         elif key in self.weakrefs:
             self.weakrefs[key] = value
 
+    def __contains__(self, key):
+        """
+        Return true if the key can be satisfied without invoking the miss
+        function, either from the cache or from the weak-valued dictionary.
+        This does not record a reference to the key.
+        """
+        return key in self.cache or key in self.weakrefs
+
+    def prime(self, key, value):
+        """
+        Add a value that was fetched by some other means, such as a bulk
+        query, to the cache and record a reference to the key.  If the key is
+        already present, the existing value is kept, so that all users of the
+        cache continue to share the same object.  As with the miss function,
+        a C{None} value is not cached.
+
+        @param key: key to add
+        @param value: value fetched for that key
+        @returns: the value now associated with the key
+        """
+        if value is None:
+            return None
+        try:
+            value = self.cache[key]
+        except KeyError:
+            try:
+                value = self.weakrefs[key]
+            except KeyError:
+                self.weakrefs[key] = value
+            self.cache[key] = value
+        self._ref_key(key)
+        self._purge()
+        return value
+
     def set_max_size(self, max_size):
         if self.max_size == max_size:
             return
@@ -244,5 +279,156 @@ class AsyncLRUCache(object):
             log.msg("      got:", sorted(self.refcount.items()))
             inv_failed = True
 
+class SizedLRUCache(object):
+    """
+
+    A synchronous least-recently-used cache whose capacity is measured by the
+    total size of its values, rather than by their number.  The size of each
+    value is determined by calling C{size_fn} when it is added; the units are
+    up to the caller, but are usually an estimate of memory use in bytes.
+
+    When the total size exceeds C{max_size}, the least recently used values
+    are expelled until it no longer does, although the most recently used
+    value is always kept.  Like L{AsyncLRUCache}, values are also kept in a
+    weak valued dictionary, so values that are referenced elsewhere can be
+    found even after they have been expelled.
+
+    Recording a use of a key and expelling an entry both take constant
+    amortized time.
+
+    @ivar hits: cache hits so far
+    @ivar refhits: cache misses found in the weak ref dictionary, so far
+    @ivar misses: cache misses so far
+    @ivar evictions: entries expelled to respect C{max_size}, so far
+    @ivar size: current total size of the cached values
+    @ivar max_size: maximum allowed total size of the cached values
+    """
+
+    __slots__ = ('max_size size_fn queue cache sizes size weakrefs refcount '
+                 'hits refhits misses evictions'.split())
+    sentinel = object()
+    QUEUE_SIZE_FACTOR = 10
+
+    def __init__(self, size_fn, max_size):
+        """
+        Constructor.
+
+        @param size_fn: function to call, with a value as parameter, to
+        determine the size of that value
+
+        @param max_size: maximum total size of the values in the cache
+        """
+        self.size_fn = size_fn
+        self.max_size = max_size
+        self.queue = deque()
+        self.cache = {}
+        self.sizes = {}
+        self.size = 0
+        self.weakrefs = WeakValueDictionary()
+        self.hits = self.misses = self.refhits = self.evictions = 0
+        self.refcount = defaultdict(lambda : 0)
+
+    def get(self, key, default=None):
+        """
+        Fetch a value from the cache by key, recording a use of the key.
+
+        @param key: cache key
+        @param default: value to return if the key is not in the cache
+        @returns: the cached value, or C{default}
+        """
+        try:
+            result = self.cache[key]
+            self.hits += 1
+            self._ref_key(key)
+            return result
+        except KeyError:
+            try:
+                result = self.weakrefs[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.refhits += 1
+            self._add(key, result)
+            return result
+
+    def put(self, key, value):
+        """
+        Add the given value to the cache, or replace the existing value for
+        the key, and record a use of the key.  Because the value's size is
+        calculated here, this should also be called when an existing value has
+        grown significantly.
+
+        @param key: key to add
+        @param value: value for that key
+        @returns: nothing
+        """
+        self.weakrefs[key] = value
+        self._add(key, value)
+
+    def _add(self, key, value):
+        self.size -= self.sizes.get(key, 0)
+        size = self.sizes[key] = self.size_fn(value)
+        self.size += size
+        self.cache[key] = value
+        self._ref_key(key)
+        self._purge()
+
+    def _ref_key(self, key):
+        # record recent use of this key; see AsyncLRUCache._ref_key
+        queue = self.queue
+        refcount = self.refcount
+
+        queue.append(key)
+        refcount[key] = refcount[key] + 1
+
+        if len(queue) > self.QUEUE_SIZE_FACTOR * (len(self.cache) + 1):
+            refcount.clear()
+            queue_appendleft = queue.appendleft
+            queue_appendleft(self.sentinel)
+            for k in ifilterfalse(refcount.__contains__,
+                                    iter(queue.pop, self.sentinel)):
+                queue_appendleft(k)
+                refcount[k] = 1
+
+    def _purge(self):
+        cache = self.cache
+        sizes = self.sizes
+        refcount = self.refcount
+        queue = self.queue
+
+        # purge least recently used entries, using refcount to count entries
+        # that appear multiple times in the queue
+        while self.size > self.max_size and len(cache) > 1:
+            refc = 1
+            while refc:
+                k = queue.popleft()
+                refc = refcount[k] = refcount[k] - 1
+            del cache[k]
+            del refcount[k]
+            self.size -= sizes.pop(k)
+            self.evictions += 1
+
+    def __contains__(self, key):
+        """
+        Return true if the key is in the cache or in the weak-valued
+        dictionary.  This does not record a use of the key.
+        """
+        return key in self.cache or key in self.weakrefs
+
+    def items(self):
+        """
+        Return a list of (key, value) pairs for all values that can be found
+        in the cache, including those in the weak-valued dictionary.  This
+        does not record a use of any key.
+        """
+        return self.weakrefs.items()
+
+    def set_max_size(self, max_size):
+        if self.max_size == max_size:
+            return
+
+        self.max_size = max_size
+        self._purge()
+
 # for tests
 inv_failed = False
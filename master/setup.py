@@ -225,6 +225,7 @@ setup_args = {
               "buildbot.db.migrate.versions",
               "buildbot.util",
               "buildbot.test",
+              "buildbot.test.benchmark",
               "buildbot.test.fake",
               "buildbot.test.unit",
               "buildbot.test.util",
@@ -15,6 +15,7 @@
 
 import os.path
 import socket
+import zlib
 import sys
 import signal
 
@@ -54,9 +55,23 @@ class SlaveBuilder(pb.Referenceable, service.Service):
     # when the step is started
     remoteStep = None
 
+    # status updates are sent to the master in batches: an update waits up
+    # to UPDATE_LATENCY seconds for others to join it, unless the batch
+    # already holds UPDATE_BATCH_SIZE bytes of data.  No more than
+    # MAX_UNACKED_UPDATES batches are sent before the master acknowledges
+    # them; until then, further updates are held on the slave.
+    UPDATE_LATENCY = 0.2
+    UPDATE_BATCH_SIZE = 128*1024
+    MAX_UNACKED_UPDATES = 4
+
     def __init__(self, name):
         #service.Service.__init__(self) # Service has no __init__ method
         self.setName(name)
+        self.updates = []
+        self.updatesSize = 0
+        self.unackedUpdates = 0
+        self.updateTimer = None
+        self.updateCompressor = None
 
     def __repr__(self):
         return "<SlaveBuilder '%s' at %d>" % (self.name, id(self))
@@ -80,6 +95,9 @@ class SlaveBuilder(pb.Referenceable, service.Service):
         service.Service.stopService(self)
         if self.stopCommandOnShutdown:
             self.stopCommand()
+        if self.updateTimer:
+            self.updateTimer.cancel()
+            self.updateTimer = None
 
     def activity(self):
         bot = self.parent
@@ -104,6 +122,8 @@ class SlaveBuilder(pb.Referenceable, service.Service):
     def lostRemoteStep(self, remotestep):
         log.msg("lost remote step")
         self.remoteStep = None
+        self.updates = []
+        self.updatesSize = 0
         if self.stopCommandOnShutdown:
             self.stopCommand()
 
@@ -129,6 +149,10 @@ class SlaveBuilder(pb.Referenceable, service.Service):
             log.msg("leftover command, dropping it")
             self.stopCommand()
 
+        # the master may ask for the log data in this command's updates to
+        # be compressed; this is not an argument for the command itself
+        compress_updates = args.pop('compress_updates', False)
+
         try:
             factory = registry.getFactory(command)
         except KeyError:
@@ -136,7 +160,13 @@ class SlaveBuilder(pb.Referenceable, service.Service):
         self.command = factory(self, stepId, args)
 
         log.msg(" startCommand:%s [id %s]" % (command,stepId))
+        # anything left over from the previous command goes to its step
+        self._sendUpdates(force=True)
         self.remoteStep = stepref
+        if compress_updates:
+            self.updateCompressor = zlib.compressobj()
+        else:
+            self.updateCompressor = None
         self.remoteStep.notifyOnDisconnect(self.lostRemoteStep)
         d = self.command.doStart()
         d.addCallback(lambda res: None)
@@ -169,10 +199,10 @@ class SlaveBuilder(pb.Referenceable, service.Service):
     # sendUpdate is invoked by the Commands we spawn
     def sendUpdate(self, data):
         """This sends the status update to the master-side
-        L{buildbot.process.step.RemoteCommand} object, giving it a sequence
-        number in the process. It adds the update to a queue, and asks the
-        master to acknowledge the update so it can be removed from that
-        queue."""
+        L{buildbot.process.step.RemoteCommand} object. It adds the update to
+        the current batch, which is sent once it is full or UPDATE_LATENCY
+        seconds have passed, and the master acknowledges each batch. Updates
+        keep their order, both within and across batches."""
 
         if not self.running:
             # .running comes from service.Service, and says whether the
@@ -183,11 +213,80 @@ class SlaveBuilder(pb.Referenceable, service.Service):
         # master still expects to receive. Provide it to avoid significant
         # interoperability issues between new slaves and old masters.
         if self.remoteStep:
-            update = [data, 0]
-            updates = [update]
-            d = self.remoteStep.callRemote("update", updates)
-            d.addCallback(self.ackUpdate)
-            d.addErrback(self._ackFailed, "SlaveBuilder.sendUpdate")
+            self.updates.append([data, 0])
+            self.updatesSize += self._updateSize(data)
+            if self.updatesSize >= self.UPDATE_BATCH_SIZE:
+                self._sendUpdates()
+            elif not self.updateTimer:
+                self.updateTimer = reactor.callLater(self.UPDATE_LATENCY,
+                                                     self._updateTimeout)
+
+    def _updateSize(self, data):
+        size = 0
+        for v in data.values():
+            if isinstance(v, (tuple, list)) and v:
+                # 'log': (logname, data)
+                v = v[-1]
+            if isinstance(v, basestring):
+                size += len(v)
+        return size
+
+    def _updateTimeout(self):
+        self.updateTimer = None
+        self._sendUpdates()
+
+    def _sendUpdates(self, force=False):
+        """Send the current batch of updates, unless too many batches are
+        already awaiting acknowledgement and C{force} is false"""
+        if not self.updates or not self.remoteStep:
+            return
+        if self.unackedUpdates >= self.MAX_UNACKED_UPDATES and not force:
+            # sent once a batch is acknowledged
+            return
+        if self.updateTimer:
+            self.updateTimer.cancel()
+            self.updateTimer = None
+
+        updates, self.updates = self.updates, []
+        self.updatesSize = 0
+        if self.updateCompressor:
+            updates = self._compressUpdates(updates)
+        self.unackedUpdates += 1
+        d = self.remoteStep.callRemote("update", updates)
+        d.addCallback(self.ackUpdate)
+        d.addErrback(self._ackFailed, "SlaveBuilder.sendUpdate")
+        d.addBoth(self._updatesAcked)
+
+    def _compressUpdates(self, updates):
+        """Replace a batch of updates with a single update carrying their log
+        data as a piece of the command's zlib stream, ending with a sync
+        flush so that the master can decompress the batch as it arrives"""
+        pieces = []
+        templates = []
+        for data, num in updates:
+            # each update becomes a list of entries, which are (key, value),
+            # or (key, logname, length) for log data found in the stream
+            template = []
+            for k, v in data.items():
+                if k in ('stdout', 'stderr', 'header') and type(v) is str:
+                    template.append((k, None, len(v)))
+                    pieces.append(v)
+                elif k == 'log' and type(v[1]) is str:
+                    template.append((k, v[0], len(v[1])))
+                    pieces.append(v[1])
+                else:
+                    template.append((k, v))
+            templates.append(template)
+        zdata = (self.updateCompressor.compress("".join(pieces))
+                 + self.updateCompressor.flush(zlib.Z_SYNC_FLUSH))
+        return [[{'compressed': (zdata, templates)}, 0]]
+
+    def _updatesAcked(self, res):
+        self.unackedUpdates -= 1
+        # send anything that was held back while waiting for this ack
+        if self.updates and (not self.updateTimer
+                             or self.updatesSize >= self.UPDATE_BATCH_SIZE):
+            self._sendUpdates()
 
     def ackUpdate(self, acknum):
         self.activity() # update the "last activity" timer
@@ -217,6 +316,8 @@ class SlaveBuilder(pb.Referenceable, service.Service):
             log.msg(" but we weren't running, quitting silently")
             return
         if self.remoteStep:
+            # the last updates must arrive before the completion
+            self._sendUpdates(force=True)
             self.remoteStep.dontNotifyOnDisconnect(self.lostRemoteStep)
             d = self.remoteStep.callRemote("complete", failure)
             d.addCallback(self.ackComplete)
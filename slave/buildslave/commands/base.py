@@ -32,7 +32,7 @@ from buildslave import util
 # this used to be a CVS $-style "Revision" auto-updated keyword, but since I
 # moved to Darcs as the primary repository, this is updated manually each
 # time this file is changed. The last cvs_ver that was here was 1.51 .
-command_version = "2.14"
+command_version = "2.17"
 
 # version history:
 #  >=1.17: commands are interruptable
@@ -63,6 +63,12 @@ command_version = "2.14"
 #  >= 2.12: SlaveShellCommand no longer accepts 'keep_stdin_open'
 #  >= 2.13: SlaveFileUploadCommand supports option 'keepstamp'
 #  >= 2.14: RemoveDirectory can delete multiple directories
+#  >= 2.15: uploadFile, uploadDirectory, and downloadFile accept 'window',
+#           and then use the writer's writeAt or the reader's readAt
+#  >= 2.16: uploadDirectory accepts 'stream', to archive the directory as it
+#           is sent
+#  >= 2.17: all commands accept 'compress_updates', to compress the log data
+#           in their updates
 
 class Command:
     implements(ISlaveCommand)
@@ -15,13 +15,186 @@
 
 import os, tarfile, tempfile
 
-from twisted.python import log
+from twisted.python import log, failure
 from twisted.internet import defer
 
 from buildslave.commands.base import Command
+from buildslave import util
+
+class _TarStream:
+    """
+    A file-like object from which a tar archive of a directory can be read,
+    produced a piece at a time as it is read.  Only the data not yet read is
+    held in memory, so no temporary archive is needed.
+    """
+
+    chunksize = 16*1024
+
+    def __init__(self, path, compress=None):
+        self.path = path
+        self.buffer = []
+        self.buffered = 0
+        self.error = None
+        mode = 'w|'
+        if compress:
+            mode = 'w|' + compress
+        self.archive = tarfile.open(mode=mode, fileobj=self)
+        self.members = self._generateMembers()
+
+    def write(self, data):
+        # called by the tarfile as it writes (and compresses) the archive
+        self.buffer.append(data)
+        self.buffered += len(data)
+
+    def read(self, size):
+        if self.error is not None:
+            raise self.error
+        while self.buffered < size and self.members is not None:
+            try:
+                self.members.next()
+            except StopIteration:
+                self.members = None
+                self.archive.close()
+            except Exception, e:
+                # the archive cannot be completed, so it must not be ended
+                # as though it were
+                self.close()
+                self.error = e
+                raise
+        data = "".join(self.buffer)
+        self.buffer = [ data[size:] ]
+        self.buffered = len(self.buffer[0])
+        return data[:size]
+
+    def close(self):
+        self.members = None
+        self.buffer = []
+        self.buffered = 0
+
+    def _generateMembers(self):
+        # this does what TarFile.add does for a directory, but yields after
+        # each header and each chunk of file data, so that the reader
+        # determines how much of the archive is produced at once
+        pending = [ (self.path, '') ]
+        while pending:
+            name, arcname = pending.pop()
+            tarinfo = self.archive.gettarinfo(name, arcname)
+            if tarinfo is None:
+                # sockets and other unsupported file types
+                continue
+            if not tarinfo.isreg():
+                self.archive.addfile(tarinfo)
+                yield None
+                if tarinfo.isdir():
+                    children = os.listdir(name)
+                    children.sort()
+                    children.reverse()
+                    for f in children:
+                        pending.append((os.path.join(name, f),
+                                        os.path.join(arcname, f)))
+                continue
+
+            f = open(name, 'rb')
+            try:
+                self.archive.addfile(tarinfo)
+                yield None
+                remaining = tarinfo.size
+                while remaining > 0:
+                    data = f.read(min(self.chunksize, remaining))
+                    if not data:
+                        raise IOError("end of file reached")
+                    self.archive.fileobj.write(data)
+                    remaining -= len(data)
+                    yield None
+            finally:
+                f.close()
+
+            blocks, remainder = divmod(tarinfo.size, tarfile.BLOCKSIZE)
+            if remainder > 0:
+                self.archive.fileobj.write(
+                        tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+                blocks += 1
+            self.archive.offset += blocks * tarfile.BLOCKSIZE
+
 
 class TransferCommand(Command):
 
+    # When the master allows more than one block in flight (the 'window'
+    # argument), the block size adapts to the connection: it is doubled, up
+    # to MAX_BLOCKSIZE, each time a block completes within FAST_BLOCK_TIME
+    # seconds, and halved, down to the requested size, each time one takes
+    # longer than SLOW_BLOCK_TIME.
+    MAX_BLOCKSIZE = 256*1024
+    FAST_BLOCK_TIME = 0.5
+    SLOW_BLOCK_TIME = 2.0
+
+    window = 1
+    filling = False
+
+    def _adaptBlocksize(self, elapsed):
+        if elapsed < self.FAST_BLOCK_TIME:
+            maximum = max(self.MAX_BLOCKSIZE, self.min_blocksize)
+            self.blocksize = min(self.blocksize * 2, maximum)
+        elif elapsed > self.SLOW_BLOCK_TIME:
+            self.blocksize = max(self.blocksize // 2, self.min_blocksize)
+
+    def _pipelinedLoop(self, fire_when_done):
+        # keep up to self.window blocks in flight at once, so that the
+        # transfer rate is not limited to one block per round trip
+        self.offset = 0
+        self.outstanding = 0
+        self.eof = False
+        self.failure = None
+        self.fire_when_done = fire_when_done
+        self._fillWindow()
+
+    def _fillWindow(self):
+        if self.filling:
+            # a block completed synchronously; the loop below will continue
+            return
+        self.filling = True
+        try:
+            while (not self.eof and self.failure is None
+                   and self.outstanding < self.window):
+                try:
+                    d = self._sendBlock()
+                except:
+                    # as with maybeDeferred in the unwindowed loop
+                    self.failure = failure.Failure()
+                    break
+                if d is None:
+                    self.eof = True
+                    break
+                self.outstanding += 1
+                d.addCallbacks(self._blockDone, self._blockFailed,
+                               callbackArgs=(util.now(self._reactor),))
+        finally:
+            self.filling = False
+
+        if not self.outstanding and (self.eof or self.failure):
+            d, self.fire_when_done = self.fire_when_done, None
+            if d is None:
+                return
+            self._windowFinished()
+            if self.failure:
+                d.errback(self.failure)
+            else:
+                d.callback(None)
+
+    def _blockDone(self, res, started):
+        self.outstanding -= 1
+        self._adaptBlocksize(util.now(self._reactor) - started)
+        self._fillWindow()
+
+    def _blockFailed(self, why):
+        self.outstanding -= 1
+        if self.failure is None:
+            self.failure = why
+        self._fillWindow()
+
+    def _windowFinished(self):
+        pass
+
     def finished(self, res):
         if self.debug:
             log.msg('finished: stderr=%r, rc=%r' % (self.stderr, self.rc))
@@ -56,6 +229,9 @@ class SlaveFileUploadCommand(TransferCommand):
         - ['maxsize']:   max size (in bytes) of file to write
         - ['blocksize']: max size for each data block
         - ['keepstamp']: whether to preserve file modified and accessed times
+        - ['window']:    number of blocks to send before waiting for the
+                         first to be written (optional; requires a writer
+                         with writeAt)
     """
     debug = False
 
@@ -64,8 +240,9 @@ class SlaveFileUploadCommand(TransferCommand):
         self.filename = args['slavesrc']
         self.writer = args['writer']
         self.remaining = args['maxsize']
-        self.blocksize = args['blocksize']
+        self.blocksize = self.min_blocksize = args['blocksize']
         self.keepstamp = args.get('keepstamp', False)
+        self.window = args.get('window') or 1
         self.stderr = None
         self.rc = 0
 
@@ -121,6 +298,8 @@ class SlaveFileUploadCommand(TransferCommand):
         return d
 
     def _loop(self, fire_when_done):
+        if self.window > 1:
+            return self._pipelinedLoop(fire_when_done)
         d = defer.maybeDeferred(self._writeBlock)
         def _done(finished):
             if finished:
@@ -134,11 +313,30 @@ class SlaveFileUploadCommand(TransferCommand):
 
     def _writeBlock(self):
         """Write a block of data to the remote writer"""
+        data = self._nextBlock()
+        if data is None:
+            return True
+        d = self.writer.callRemote('write', data)
+        d.addCallback(lambda res: False)
+        return d
+
+    def _sendBlock(self):
+        """Write the next block of data to the remote writer at its offset,
+        returning a Deferred, or None if there is nothing left to send"""
+        data = self._nextBlock()
+        if data is None:
+            return None
+        d = self.writer.callRemote('writeAt', self.offset, data)
+        self.offset += len(data)
+        return d
+
+    def _nextBlock(self):
+        """Read the next block of the file, or return None at the end"""
 
         if self.interrupted or self.fp is None:
             if self.debug:
-                log.msg('SlaveFileUploadCommand._writeBlock(): end')
-            return True
+                log.msg('SlaveFileUploadCommand._nextBlock(): end')
+            return None
 
         length = self.blocksize
         if self.remaining is not None and length > self.remaining:
@@ -154,18 +352,16 @@ class SlaveFileUploadCommand(TransferCommand):
             data = self.fp.read(length)
 
         if self.debug:
-            log.msg('SlaveFileUploadCommand._writeBlock(): '+
+            log.msg('SlaveFileUploadCommand._nextBlock(): '+
                     'allowed=%d readlen=%d' % (length, len(data)))
         if len(data) == 0:
             log.msg("EOF: callRemote(close)")
-            return True
+            return None
 
         if self.remaining is not None:
             self.remaining = self.remaining - len(data)
             assert self.remaining >= 0
-        d = self.writer.callRemote('write', data)
-        d.addCallback(lambda res: False)
-        return d
+        return data
 
 
 class SlaveDirectoryUploadCommand(SlaveFileUploadCommand):
@@ -179,6 +375,10 @@ class SlaveDirectoryUploadCommand(SlaveFileUploadCommand):
         - ['maxsize']:   max size (in bytes) of file to write
         - ['blocksize']: max size for each data block
         - ['compress']:  one of [None, 'bz2', 'gz']
+        - ['window']:    number of blocks to send before waiting for the
+                         first to be written (optional)
+        - ['stream']:    if true, produce the archive as it is sent rather
+                         than in a temporary file (optional)
     """
     debug = False
 
@@ -187,8 +387,11 @@ class SlaveDirectoryUploadCommand(SlaveFileUploadCommand):
         self.dirname = args['slavesrc']
         self.writer = args['writer']
         self.remaining = args['maxsize']
-        self.blocksize = args['blocksize']
+        self.blocksize = self.min_blocksize = args['blocksize']
         self.compress = args['compress']
+        self.window = args.get('window') or 1
+        self.stream = args.get('stream', False)
+        self.tarname = None
         self.stderr = None
         self.rc = 0
 
@@ -202,22 +405,26 @@ class SlaveDirectoryUploadCommand(SlaveFileUploadCommand):
         if self.debug:
             log.msg("path: %r" % self.path)
 
-        # Create temporary archive
-        fd, self.tarname = tempfile.mkstemp()
-        fileobj = os.fdopen(fd, 'w')
-        if self.compress == 'bz2':
-            mode='w|bz2'
-        elif self.compress == 'gz':
-            mode='w|gz'
+        if self.stream:
+            # Archive the directory as it is transferred
+            self.fp = _TarStream(self.path, self.compress)
         else:
-            mode = 'w'
-        archive = tarfile.open(name=self.tarname, mode=mode, fileobj=fileobj)
-        archive.add(self.path, '')
-        archive.close()
-        fileobj.close()
+            # Create temporary archive
+            fd, self.tarname = tempfile.mkstemp()
+            fileobj = os.fdopen(fd, 'w')
+            if self.compress == 'bz2':
+                mode='w|bz2'
+            elif self.compress == 'gz':
+                mode='w|gz'
+            else:
+                mode = 'w'
+            archive = tarfile.open(name=self.tarname, mode=mode, fileobj=fileobj)
+            archive.add(self.path, '')
+            archive.close()
+            fileobj.close()
 
-        # Transfer it
-        self.fp = open(self.tarname, 'rb')
+            # Transfer it
+            self.fp = open(self.tarname, 'rb')
 
         self.sendStatus({'header': "sending %s" % self.path})
 
@@ -233,9 +440,21 @@ class SlaveDirectoryUploadCommand(SlaveFileUploadCommand):
         d.addBoth(self.finished)
         return d
 
+    def _nextBlock(self):
+        try:
+            return SlaveFileUploadCommand._nextBlock(self)
+        except Exception, e:
+            # the rest of the archive cannot be read, so the master is not
+            # asked to unpack what has been sent
+            self.stderr = "Cannot read directory '%s' for upload: %s" \
+                            % (self.path, e)
+            self.rc = 1
+            raise
+
     def finished(self, res):
         self.fp.close()
-        os.remove(self.tarname)
+        if self.tarname:
+            os.remove(self.tarname)
         return TransferCommand.finished(self, res)
 
 
@@ -250,6 +469,9 @@ class SlaveFileDownloadCommand(TransferCommand):
         - ['maxsize']:   max size (in bytes) of file to write
         - ['blocksize']: max size for each data block
         - ['mode']:      access mode for the new file
+        - ['window']:    number of blocks to request before waiting for the
+                         first to arrive (optional; requires a reader with
+                         readAt)
     """
     debug = False
 
@@ -258,8 +480,9 @@ class SlaveFileDownloadCommand(TransferCommand):
         self.filename = args['slavedest']
         self.reader = args['reader']
         self.bytes_remaining = args['maxsize']
-        self.blocksize = args['blocksize']
+        self.blocksize = self.min_blocksize = args['blocksize']
         self.mode = args['mode']
+        self.window = args.get('window') or 1
         self.stderr = None
         self.rc = 0
 
@@ -310,6 +533,10 @@ class SlaveFileDownloadCommand(TransferCommand):
         return d
 
     def _loop(self, fire_when_done):
+        if self.window > 1:
+            self.truncated = False
+            self.short_read = False
+            return self._pipelinedLoop(fire_when_done)
         d = defer.maybeDeferred(self._readBlock)
         def _done(finished):
             if finished:
@@ -344,6 +571,50 @@ class SlaveFileDownloadCommand(TransferCommand):
             d.addCallback(self._writeData)
             return d
 
+    def _sendBlock(self):
+        """Request the next block of data from the remote reader, returning
+        a Deferred, or None if no more data is wanted"""
+
+        if self.interrupted or self.fp is None:
+            if self.debug:
+                log.msg('SlaveFileDownloadCommand._sendBlock(): end')
+            return None
+
+        length = self.blocksize
+        if self.bytes_remaining is not None and length > self.bytes_remaining:
+            length = self.bytes_remaining
+        if length <= 0:
+            # report this once the outstanding reads show whether there was
+            # more data
+            self.truncated = True
+            return None
+
+        offset = self.offset
+        self.offset += length
+        if self.bytes_remaining is not None:
+            self.bytes_remaining -= length
+        d = self.reader.callRemote('readAt', offset, length)
+        d.addCallback(self._writeDataAt, offset, length)
+        return d
+
+    def _writeDataAt(self, data, offset, length):
+        if self.debug:
+            log.msg('SlaveFileDownloadCommand._writeDataAt(%d): readlen=%d' %
+                    (offset, len(data)))
+        if data:
+            self.fp.seek(offset)
+            self.fp.write(data)
+        if len(data) < length:
+            # the end of the file
+            self.short_read = True
+            self.eof = True
+
+    def _windowFinished(self):
+        if self.truncated and not self.short_read and self.stderr is None:
+            self.stderr = "Maximum filesize reached, truncating file '%s'" \
+                            % self.path
+            self.rc = 1
+
     def _writeData(self, data):
         if self.debug:
             log.msg('SlaveFileDownloadCommand._readBlock(): readlen=%d' %
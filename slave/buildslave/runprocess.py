@@ -33,6 +33,13 @@ from twisted.internet import reactor, defer, protocol, task, error
 from buildslave import util
 from buildslave.exceptions import AbandonChain
 
+try:
+    # only available on Linux, and with newer Twisted
+    from twisted.internet import inotify
+    from twisted.python import filepath
+except ImportError:
+    inotify = None
+
 if runtime.platformType == 'posix':
     from twisted.internet.process import Process
 
@@ -58,9 +65,91 @@ def shell_quote(cmd_list):
             return pipes.quote(e)
         return " ".join([ quote(e) for e in cmd_list ])
 
+class DirectoryNotifier:
+    """
+    One inotify instance, shared by all of the L{LogFileWatcher}s, with one
+    watch for each directory they are watching.  If a watched directory is
+    removed or moved away, its watch is lost, and its watchers are told so
+    that they can poll instead.
+    """
+
+    def __init__(self):
+        self.notifier = None
+        # FilePath of directory : list of LogFileWatchers
+        self.watchers = {}
+
+    def add(self, dirpath, watcher):
+        """Start passing events in DIRPATH to WATCHER; this raises an
+        exception if the directory cannot be watched"""
+        if self.notifier is None:
+            notifier = inotify.INotify()
+            notifier.startReading()
+            self.notifier = notifier
+        if dirpath not in self.watchers:
+            mask = (inotify.IN_MODIFY | inotify.IN_CREATE | inotify.IN_DELETE
+                    | inotify.IN_MOVED_TO | inotify.IN_MOVED_FROM
+                    | inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF)
+            try:
+                self.notifier.watch(dirpath, mask=mask,
+                                    callbacks=[self._notified])
+            except:
+                self._closeIfUnused()
+                raise
+            self.watchers[dirpath] = []
+        self.watchers[dirpath].append(watcher)
+
+    def remove(self, dirpath, watcher):
+        watchers = self.watchers.get(dirpath)
+        if watchers and watcher in watchers:
+            watchers.remove(watcher)
+            if not watchers:
+                del self.watchers[dirpath]
+                self._ignore(dirpath)
+        self._closeIfUnused()
+
+    def _ignore(self, dirpath):
+        try:
+            self.notifier.ignore(dirpath)
+        except Exception:
+            # the kernel has already dropped the watch
+            pass
+
+    def _closeIfUnused(self):
+        if not self.watchers and self.notifier is not None:
+            self.notifier.loseConnection()
+            self.notifier = None
+
+    def _notified(self, watch, path, mask):
+        dirpath = watch.path
+        if path == dirpath and mask & (inotify.IN_DELETE_SELF
+                                      | inotify.IN_MOVE_SELF
+                                      | inotify.IN_IGNORED):
+            # the directory is gone, and its watch with it
+            watchers = self.watchers.pop(dirpath, [])
+            if not mask & inotify.IN_DELETE_SELF:
+                self._ignore(dirpath)
+            self._closeIfUnused()
+            for watcher in watchers:
+                watcher._watchLost()
+            return
+        for watcher in self.watchers.get(dirpath, [])[:]:
+            watcher._notified(path)
+
+directoryNotifier = DirectoryNotifier()
+
+
 class LogFileWatcher:
     POLL_INTERVAL = 2
 
+    # where inotify is available, the file's directory is watched instead of
+    # polling the file, and the file is read NOTIFY_DELAY seconds after it
+    # changes, so that a burst of writes is read at once.  If the directory
+    # is removed, the watcher falls back to polling.
+    useINotify = True
+    NOTIFY_DELAY = 0.05
+
+    READ_SIZE = 256*1024
+
     def __init__(self, command, name, logfile, follow=False):
         self.command = command
         self.name = name
@@ -80,15 +169,70 @@ class LogFileWatcher:
         # every 2 seconds we check on the file again
         self.poller = task.LoopingCall(self.poll)
 
+        self.notifier = None
+        self.watchedDir = None
+        self.notifyCall = None
+
     def start(self):
+        if self.useINotify and self._startNotifier():
+            return
         self.poller.start(self.POLL_INTERVAL).addErrback(self._cleanupPoll)
 
     def _cleanupPoll(self, err):
         log.err(err, msg="Polling error")
         self.poller = None
 
+    def _startNotifier(self):
+        """Watch the logfile's directory with inotify, returning False if
+        that is not possible here"""
+        if inotify is None:
+            return False
+        dirpath = filepath.FilePath(
+                os.path.dirname(os.path.abspath(self.logfile)))
+        try:
+            directoryNotifier.add(dirpath, self)
+        except Exception, e:
+            log.msg("LogFileWatcher: cannot watch %s with inotify (%s); "
+                    "polling instead" % (self.logfile, e))
+            return False
+        self.notifier = directoryNotifier
+        self.watchedDir = dirpath
+        self.poller = None
+        return True
+
+    def _notified(self, path):
+        if path.basename() != os.path.basename(self.logfile):
+            return
+        if not self.notifyCall:
+            self.notifyCall = reactor.callLater(
+                    self.NOTIFY_DELAY, self._notifiedPoll)
+
+    def _watchLost(self):
+        # the directory was removed or moved (as trial does with _trial_temp),
+        # so it may be recreated without our knowing; poll instead
+        log.msg("LogFileWatcher: lost the inotify watch for %s; "
+                "polling instead" % (self.logfile,))
+        self.notifier = None
+        self.watchedDir = None
+        self.poller = task.LoopingCall(self.poll)
+        self.poller.start(self.POLL_INTERVAL).addErrback(self._cleanupPoll)
+
+    def _notifiedPoll(self):
+        self.notifyCall = None
+        try:
+            self.poll()
+        except:
+            log.err(None, "Polling error")
+
     def stop(self):
         self.poll()
+        if self.notifyCall:
+            self.notifyCall.cancel()
+            self.notifyCall = None
+        if self.notifier is not None:
+            self.notifier.remove(self.watchedDir, self)
+            self.notifier = None
+            self.watchedDir = None
         if self.poller is not None:
             self.poller.stop()
         if self.started:
@@ -120,7 +264,7 @@ class LogFileWatcher:
             self.started = True
         self.f.seek(self.f.tell(), 0)
         while True:
-            data = self.f.read(10000)
+            data = self.f.read(self.READ_SIZE)
             if not data:
                 return
             self.command.addLogfile(self.name, data)
@@ -571,13 +715,12 @@ class RunProcess:
             # Grab the next bits from the buffer
             logname, data = self.buffered.popleft()
 
-            # If this log is different than the last one, then we have to send
-            # out the message so far.  This is because the message is
-            # transferred as a dictionary, which makes the ordering of keys
-            # unspecified, and makes it impossible to interleave data from
-            # different logs.  A future enhancement could be to change the
-            # master to support a list of (logname, data) tuples instead of a
-            # dictionary.
+            # If this log is different than the last one, then we have to
+            # start a new message.  This is because the message is a
+            # dictionary, which makes the ordering of keys unspecified, and
+            # makes it impossible to interleave data from different logs.
+            # The messages are batched by the SlaveBuilder, so this does not
+            # cost a round trip to the master.
             # On our first pass through this loop lastlog is None
             if lastlog is None:
                 lastlog = logname
@@ -15,6 +15,7 @@
 
 import os
 import shutil
+import zlib
 import mock
 
 from twisted.trial import unittest
@@ -255,10 +256,10 @@ class TestSlaveBuilder(command.CommandTestMixin, unittest.TestCase):
         d.addCallback(lambda _ : st.wait_for_finish())
         def check(_):
             self.assertEqual(st.actions, [
-                         ['update', [[{'hdr': 'headers'}, 0]]],
-                         ['update', [[{'stdout': 'hello\n'}, 0]]],
-                         ['update', [[{'rc': 0}, 0]]],
-                         ['update', [[{'elapsed': 1}, 0]]],
+                         ['update', [[{'hdr': 'headers'}, 0],
+                                     [{'stdout': 'hello\n'}, 0],
+                                     [{'rc': 0}, 0],
+                                     [{'elapsed': 1}, 0]]],
                          ['complete', None],
                     ])
         d.addCallback(check)
@@ -300,9 +301,9 @@ class TestSlaveBuilder(command.CommandTestMixin, unittest.TestCase):
         d.addCallback(lambda _ : st.wait_for_finish())
         def check(_):
             self.assertEqual(st.actions, [
-                         ['update', [[{'hdr': 'headers'}, 0]]],
-                         ['update', [[{'hdr': 'killing'}, 0]]],
-                         ['update', [[{'rc': -1}, 0]]],
+                         ['update', [[{'hdr': 'headers'}, 0],
+                                     [{'hdr': 'killing'}, 0],
+                                     [{'rc': -1}, 0]]],
                          ['complete', None],
                     ])
         d.addCallback(check)
@@ -332,6 +333,69 @@ class TestSlaveBuilder(command.CommandTestMixin, unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_sendUpdate_batches(self):
+        sb = self.sb.original
+        sb.UPDATE_BATCH_SIZE = 10
+        sb.MAX_UNACKED_UPDATES = 1
+        sent = []
+        def callRemote(method, updates):
+            d = defer.Deferred()
+            sent.append((updates, d))
+            return d
+        sb.remoteStep = mock.Mock()
+        sb.remoteStep.callRemote = callRemote
+
+        # a full batch is sent at once
+        sb.sendUpdate({'stdout': 'x' * 6})
+        self.assertEqual(sent, [])
+        sb.sendUpdate({'stderr': 'y' * 6})
+        self.assertEqual([ u for u, d in sent ],
+                [ [[{'stdout': 'xxxxxx'}, 0], [{'stderr': 'yyyyyy'}, 0]] ])
+
+        # but the next waits for the first to be acknowledged
+        sb.sendUpdate({'stdout': 'z' * 20})
+        sb.sendUpdate({'log': ('l', 'w' * 20)})
+        self.assertEqual(len(sent), 1)
+        sent[0][1].callback(0)
+        self.assertEqual([ u for u, d in sent[1:] ],
+                [ [[{'stdout': 'z' * 20}, 0], [{'log': ('l', 'w' * 20)}, 0]] ])
+        sent[1][1].callback(0)
+
+    def test_sendUpdate_latency(self):
+        sb = self.sb.original
+        clock = task.Clock()
+        self.patch(bot, 'reactor', clock)
+        sb.remoteStep = mock.Mock()
+        sb.remoteStep.callRemote.return_value = defer.succeed(0)
+
+        sb.sendUpdate({'stdout': 'hello'})
+        sb.sendUpdate({'rc': 0})
+        self.assertFalse(sb.remoteStep.callRemote.called)
+        clock.advance(sb.UPDATE_LATENCY)
+        sb.remoteStep.callRemote.assert_called_with("update",
+                [[{'stdout': 'hello'}, 0], [{'rc': 0}, 0]])
+
+    def test_sendUpdate_compressed(self):
+        sb = self.sb.original
+        sb.updateCompressor = zlib.compressobj()
+        sb.remoteStep = mock.Mock()
+        sb.remoteStep.callRemote.return_value = defer.succeed(0)
+
+        sb.sendUpdate({'stdout': 'hello\n'})
+        sb.sendUpdate({'log': ('foo', 'bar')})
+        sb.sendUpdate({'header': u'unicode', 'rc': 0})
+        sb._sendUpdates(force=True)
+
+        method, updates = sb.remoteStep.callRemote.call_args[0]
+        self.assertEqual(method, "update")
+        self.assertEqual(len(updates), 1)
+        zdata, templates = updates[0][0]['compressed']
+        self.assertEqual(zlib.decompressobj().decompress(zdata), 'hello\nbar')
+        self.assertEqual(templates[:2], [ [('stdout', None, 6)],
+                                          [('log', 'foo', 3)] ])
+        self.assertEqual(sorted(templates[2]),
+                         [ ('header', u'unicode'), ('rc', 0) ])
+
 class TestBotFactory(unittest.TestCase):
 
     def setUp(self):
@@ -79,6 +79,37 @@ class FakeMasterMethods(object):
         else:
             return slice
 
+    def remote_writeAt(self, offset, data):
+        if self.count_writes:
+            self.add_update('writeAt %d %d' % (offset, len(data)))
+        elif not self.written:
+            self.add_update('write(s)')
+            self.written = True
+
+        if self.keep_data:
+            self.data = (self.data[:offset].ljust(offset, '\0') + data +
+                         self.data[offset+len(data):])
+
+        if self.delay_write:
+            d = defer.Deferred()
+            reactor.callLater(0.01, d.callback, None)
+            return d
+
+    def remote_readAt(self, offset, length):
+        if self.count_reads:
+            self.add_update('readAt %d %d' % (offset, length))
+        elif not self.read:
+            self.add_update('read(s)')
+            self.read = True
+
+        slice = self.data[offset:offset+length]
+        if self.delay_read:
+            d = defer.Deferred()
+            reactor.callLater(0.01, d.callback, slice)
+            return d
+        else:
+            return slice
+
     def remote_unpack(self):
         self.add_update('unpack')
 
@@ -239,6 +270,121 @@ class TestUploadFile(CommandTestMixin, unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_windowed(self):
+        self.fakemaster.count_writes = True    # get actual byte counts
+        self.fakemaster.keep_data = True
+
+        self.make_command(transfer.SlaveFileUploadCommand, dict(
+            workdir='workdir',
+            slavesrc='data',
+            writer=FakeRemote(self.fakemaster),
+            maxsize=1000,
+            blocksize=64,
+            keepstamp=False,
+            window=3,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            # the blocks are written quickly, so the block size grows
+            self.assertUpdates([
+                    {'header': 'sending %s' % self.datafile},
+                    'writeAt 0 64', 'writeAt 64 116', 'close',
+                    {'rc': 0}
+                ])
+            self.assertEqual(self.fakemaster.data,
+                             open(self.datafile, "rb").read())
+        d.addCallback(check)
+        return d
+
+    def test_windowed_delayed(self):
+        self.fakemaster.delay_write = True
+        self.fakemaster.keep_data = True
+
+        self.make_command(transfer.SlaveFileUploadCommand, dict(
+            workdir='workdir',
+            slavesrc='data',
+            writer=FakeRemote(self.fakemaster),
+            maxsize=1000,
+            blocksize=16,
+            keepstamp=False,
+            window=4,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                    {'header': 'sending %s' % self.datafile},
+                    'write(s)', 'close',
+                    {'rc': 0}
+                ])
+            self.assertEqual(self.fakemaster.data,
+                             open(self.datafile, "rb").read())
+        d.addCallback(check)
+        return d
+
+    def test_windowed_truncated(self):
+        self.fakemaster.count_writes = True    # get actual byte counts
+
+        self.make_command(transfer.SlaveFileUploadCommand, dict(
+            workdir='workdir',
+            slavesrc='data',
+            writer=FakeRemote(self.fakemaster),
+            maxsize=100,
+            blocksize=64,
+            keepstamp=False,
+            window=3,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                    {'header': 'sending %s' % self.datafile},
+                    'writeAt 0 64', 'writeAt 64 36', 'close',
+                    {'rc': 1,
+                     'stderr': "Maximum filesize reached, truncating file '%s'" % self.datafile}
+                ])
+        d.addCallback(check)
+        return d
+
+    def test_windowed_read_error(self):
+        self.fakemaster.count_writes = True    # get actual byte counts
+
+        self.make_command(transfer.SlaveFileUploadCommand, dict(
+            workdir='workdir',
+            slavesrc='data',
+            writer=FakeRemote(self.fakemaster),
+            maxsize=1000,
+            blocksize=64,
+            keepstamp=False,
+            window=3,
+        ))
+
+        # fail to read the second block
+        nextBlock = self.cmd._nextBlock
+        blocks = []
+        def _nextBlock():
+            if blocks:
+                raise IOError("read error")
+            blocks.append(nextBlock())
+            return blocks[-1]
+        self.cmd._nextBlock = _nextBlock
+
+        d = self.run_command()
+        self.assertFailure(d, IOError)
+
+        def check(_):
+            self.assertUpdates([
+                    {'header': 'sending %s' % self.datafile},
+                    'writeAt 0 64', 'close',
+                    {'rc': 0}
+                ])
+        d.addCallback(check)
+        return d
+
 class TestSlaveDirectoryUpload(CommandTestMixin, unittest.TestCase):
 
     def setUp(self):
@@ -260,7 +406,7 @@ class TestSlaveDirectoryUpload(CommandTestMixin, unittest.TestCase):
         if os.path.exists(self.datadir):
             shutil.rmtree(self.datadir)
 
-    def test_simple(self, compress=None):
+    def test_simple(self, compress=None, window=None, stream=False):
         self.fakemaster.keep_data = True 
 
         self.make_command(transfer.SlaveDirectoryUploadCommand, dict(
@@ -270,6 +416,8 @@ class TestSlaveDirectoryUpload(CommandTestMixin, unittest.TestCase):
             maxsize=None,
             blocksize=512,
             compress=compress,
+            window=window,
+            stream=stream,
         ))
 
         d = self.run_command()
@@ -289,6 +437,7 @@ class TestSlaveDirectoryUpload(CommandTestMixin, unittest.TestCase):
             got_names = [ n.rstrip('/') for n in a.getnames() ]
             got_names = sorted([ n or '.' for n in got_names ]) # py27 uses '' instead of '.'
             self.assertEqual(got_names, exp_names, "expected archive contents")
+            self.assertEqual(a.extractfile('aa').read(), "lots of a" * 100)
             a.close()
             f.close()
         d.addCallback(check_tarfile)
@@ -300,10 +449,58 @@ class TestSlaveDirectoryUpload(CommandTestMixin, unittest.TestCase):
         return self.test_simple('bz2')
     def test_simple_gz(self):
         return self.test_simple('gz')
+    def test_simple_windowed(self):
+        return self.test_simple(window=4)
+
+    # and again, archiving the directory as it is sent
+    def test_stream(self):
+        return self.test_simple(stream=True)
+    def test_stream_bz2(self):
+        return self.test_simple('bz2', stream=True)
+    def test_stream_gz(self):
+        return self.test_simple('gz', stream=True)
+    def test_stream_windowed(self):
+        return self.test_simple(window=4, stream=True)
+
+    def test_stream_windowed_read_error(self):
+        # fail partway through the archive, as when a file shrinks
+        generateMembers = transfer._TarStream._generateMembers
+        def _generateMembers(stream):
+            for i, member in enumerate(generateMembers(stream)):
+                if i == 3:
+                    raise IOError("end of file reached")
+                yield member
+        self.patch(transfer._TarStream, '_generateMembers', _generateMembers)
+
+        self.make_command(transfer.SlaveDirectoryUploadCommand, dict(
+            workdir='workdir',
+            slavesrc='data',
+            writer=FakeRemote(self.fakemaster),
+            maxsize=None,
+            blocksize=512,
+            compress=None,
+            window=4,
+            stream=True,
+        ))
+
+        d = self.run_command()
+        self.assertFailure(d, IOError)
+
+        def check(_):
+            # the truncated archive is not unpacked
+            self.assertUpdates([
+                    {'header': 'sending %s' % self.datadir},
+                    {'rc': 1,
+                     'stderr': "Cannot read directory '%s' for upload: "
+                               "end of file reached" % self.datadir}
+                ])
+        d.addCallback(check)
+        return d
 
     # except bz2 can't operate in stream mode on py24
     if sys.version_info[:2] <= (2,4):
         test_simple_bz2.skip = "bz2 stream decompression not supported on Python-2.4"
+        test_stream_bz2.skip = test_simple_bz2.skip
 
     # this is just a subclass of SlaveUpload, so the remaining permutations
     # are already tested
@@ -465,3 +662,85 @@ class TestDownloadFile(CommandTestMixin, unittest.TestCase):
         dl.addCallback(check)
         return dl
 
+    def test_windowed(self):
+        self.fakemaster.count_reads = True    # get actual byte counts
+        self.fakemaster.data = test_data = '1234' * 13
+
+        self.make_command(transfer.SlaveFileDownloadCommand, dict(
+            workdir='.',
+            slavedest='data',
+            reader=FakeRemote(self.fakemaster),
+            maxsize=None,
+            blocksize=32,
+            mode=0777,
+            window=4,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            # the first block arrives quickly, so the next is larger, and
+            # its short read ends the transfer
+            self.assertUpdates([
+                    'readAt 0 32', 'readAt 32 64', 'close',
+                    {'rc': 0}
+                ])
+            datafile = os.path.join(self.basedir, 'data')
+            self.assertEqual(open(datafile).read(), test_data)
+        d.addCallback(check)
+        return d
+
+    def test_windowed_delayed(self):
+        self.fakemaster.count_reads = True    # get actual byte counts
+        self.fakemaster.data = test_data = '1234' * 13
+        self.fakemaster.delay_read = True
+
+        self.make_command(transfer.SlaveFileDownloadCommand, dict(
+            workdir='.',
+            slavedest='data',
+            reader=FakeRemote(self.fakemaster),
+            maxsize=1000,
+            blocksize=16,
+            mode=0777,
+            window=4,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            # four blocks are requested before any arrive
+            updates = self.get_updates()
+            self.assertEqual(updates[:4], [ 'readAt 0 16', 'readAt 16 16',
+                                            'readAt 32 16', 'readAt 48 16' ])
+            self.assertTrue({'rc': 0} in updates)
+            datafile = os.path.join(self.basedir, 'data')
+            self.assertEqual(open(datafile).read(), test_data)
+        d.addCallback(check)
+        return d
+
+    def test_windowed_truncated(self):
+        self.fakemaster.data = test_data = 'tenchars--' * 10
+
+        self.make_command(transfer.SlaveFileDownloadCommand, dict(
+            workdir='.',
+            slavedest='data',
+            reader=FakeRemote(self.fakemaster),
+            maxsize=50,
+            blocksize=32,
+            mode=0777,
+            window=4,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                    'read(s)', 'close',
+                    {'rc': 1,
+                     'stderr': "Maximum filesize reached, truncating file '%s'"
+                                % os.path.join(self.basedir, '.', 'data')}
+                ])
+            datafile = os.path.join(self.basedir, 'data')
+            self.assertEqual(open(datafile).read(), test_data[:50])
+        d.addCallback(check)
+        return d
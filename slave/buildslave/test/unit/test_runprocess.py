@@ -16,6 +16,7 @@
 import sys
 import re
 import os
+import shutil
 import time
 import signal
 
@@ -538,3 +539,102 @@ class TestLogFileWatcher(BasedirMixin, unittest.TestCase):
         st = lf.statFile()
         self.assertEqual(st and st[2], 2, "statfile.log exists and size is correct")
         os.remove('statfile.log')
+
+    def makeWatcher(self, useINotify):
+        rp = self.makeRP()
+        rp.logdata = []
+        rp.addLogfile = lambda name, data : rp.logdata.append((name, data))
+        logfile = os.path.join(self.basedir, 'watched.log')
+        lf = runprocess.LogFileWatcher(rp, 'test', logfile, False)
+        lf.useINotify = useINotify
+        return rp, lf, logfile
+
+    def test_poll(self):
+        rp, lf, logfile = self.makeWatcher(False)
+        clock = task.Clock()
+        lf.poller.clock = clock
+        lf.start()
+
+        open(logfile, 'w').write('hello\n')
+        clock.advance(lf.POLL_INTERVAL)
+        self.assertEqual(rp.logdata, [('test', 'hello\n')])
+        lf.stop()
+
+    def test_notify(self):
+        rp, lf, logfile = self.makeWatcher(True)
+        lf.start()
+        self.assertTrue(lf.notifier, "inotify is in use")
+        self.assertEqual(lf.poller, None)
+
+        f = open(logfile, 'w')
+        f.write('hello\n')
+        f.flush()
+        f.write('world\n')
+        f.close()
+
+        # the writes are read at once, shortly after they happen
+        d = defer.Deferred()
+        def check():
+            try:
+                self.assertEqual(rp.logdata, [('test', 'hello\nworld\n')])
+            finally:
+                lf.stop()
+            self.assertEqual(lf.notifier, None)
+        d.addCallback(lambda _ : check())
+        reactor.callLater(lf.NOTIFY_DELAY * 4, d.callback, None)
+        return d
+
+    def test_notify_directory_removed(self):
+        # trial removes and recreates _trial_temp, and the inotify watch on
+        # the old directory is lost with it
+        rp, lf, logfile = self.makeWatcher(True)
+        logdir = os.path.join(self.basedir, 'logs')
+        os.makedirs(logdir)
+        lf.logfile = logfile = os.path.join(logdir, 'watched.log')
+        lf.POLL_INTERVAL = 0.1
+        lf.start()
+        self.assertTrue(lf.notifier, "inotify is in use")
+
+        shutil.rmtree(logdir)
+        d = defer.Deferred()
+        reactor.callLater(lf.NOTIFY_DELAY * 4, d.callback, None)
+        def recreate(_):
+            self.assertNotEqual(lf.poller, None)
+            os.makedirs(logdir)
+            open(logfile, 'w').write('hello\n')
+            d = defer.Deferred()
+            reactor.callLater(lf.POLL_INTERVAL * 4, d.callback, None)
+            return d
+        d.addCallback(recreate)
+        def check(_):
+            try:
+                self.assertEqual(rp.logdata, [('test', 'hello\n')])
+            finally:
+                lf.stop()
+        d.addCallback(check)
+        return d
+
+    def test_notify_shared(self):
+        rp1, lf1, logfile = self.makeWatcher(True)
+        rp2, lf2, logfile = self.makeWatcher(True)
+        lf1.start()
+        lf2.start()
+        self.assertIdentical(lf1.notifier, lf2.notifier)
+        inotifier = lf1.notifier.notifier
+        open(logfile, 'w').write('hello\n')
+        d = defer.Deferred()
+        reactor.callLater(lf1.NOTIFY_DELAY * 4, d.callback, None)
+        def check(_):
+            self.assertEqual(rp1.logdata, [('test', 'hello\n')])
+            self.assertEqual(rp2.logdata, [('test', 'hello\n')])
+            lf1.stop()
+            self.assertIdentical(lf2.notifier.notifier, inotifier)
+            lf2.stop()
+            self.assertEqual(runprocess.directoryNotifier.notifier, None)
+        d.addCallback(check)
+        return d
+
+    if runprocess.inotify is None:
+        test_notify.skip = "inotify is not available"
+        test_notify_directory_removed.skip = "inotify is not available"
+        test_notify_shared.skip = "inotify is not available"